@@ -19,16 +19,8 @@ from .lang.python import python_to_ir, ir_to_python
 from .wasm import wasm_to_ir, read_wasm
 from .irutils import verify_module
 from .utils.reporting import DummyReportGenerator, HtmlReportGenerator
-from .opt.transform import DeleteUnusedInstructionsPass
-from .opt.transform import RemoveAddZeroPass
-from .opt import CommonSubexpressionEliminationPass
-from .opt import ConstantFolder
-from .opt import LoadAfterStorePass
-from .opt import CleanPass
-from .opt.mem2reg import Mem2RegPromotor
-from .opt.cjmp import CJumpPass
-from .opt.tailcall import TailCallOptimization
-from .codegen import CodeGenerator
+from .opt.pass_manager import PassManager, create_pipeline
+from .codegen import CodeGenerator, burg_system_cache
 from .binutils.linker import link
 from .binutils.archive import archive
 from .binutils.outstream import BinaryOutputStream, TextOutputStream
@@ -42,6 +34,7 @@ from .format.exefile import ExeWriter
 from .format import uboot_image
 from .format.ldb import write_ldb
 from .build.tasks import TaskError, TaskRunner
+from .build.builddb import BuildDatabase
 from .build.recipe import RecipeLoader
 from .common import CompilerError, DiagnosticsManager, get_file
 from .arch import get_arch, get_current_arch
@@ -91,10 +84,19 @@ def is_platform_supported():
     return get_current_arch() is not None
 
 
-def construct(buildfile, targets=()):
+def construct(buildfile, targets=(), jobs=1, build_db=None):
     """ Construct the given buildfile.
 
     Raise task error if something goes wrong.
+
+    Args:
+        buildfile: the build file or its filename.
+        targets: the targets to construct, the default target is used
+            when no targets are given.
+        jobs: the number of targets and compilations to run in parallel.
+        build_db: the directory of the build database, or a
+            :class:`ppci.build.builddb.BuildDatabase`. When given,
+            compilations are skipped when their inputs did not change.
     """
     # Ensure file:
     buildfile = get_file(buildfile)
@@ -111,7 +113,10 @@ def construct(buildfile, targets=()):
     if not project:
         raise TaskError("No project loaded")
 
-    runner = TaskRunner()
+    if isinstance(build_db, str):
+        build_db = BuildDatabase(build_db)
+
+    runner = TaskRunner(jobs=jobs, build_db=build_db)
     runner.run(project, list(targets))
 
 
@@ -184,7 +189,7 @@ def disasm(data, march):
 OPT_LEVELS = ("0", "1", "2", "s")
 
 
-def optimize(ir_module, level=0, reporter=None):
+def optimize(ir_module, level=0, reporter=None, jobs=1):
     """ Run a bag of tricks against the :doc:`ir-code<ir/index>`.
 
     This is an in-place operation!
@@ -197,6 +202,9 @@ def optimize(ir_module, level=0, reporter=None):
             2: more optimization
             s: optimize for size
         reporter: Report detailed log to this reporter
+        jobs (int): the number of processes used to optimize the
+            functions of the module. The result is the same for any
+            number of jobs.
     """
     logger = logging.getLogger("optimize")
     level = str(level)
@@ -212,41 +220,33 @@ def optimize(ir_module, level=0, reporter=None):
     if level == "0":
         return
 
-    # TODO: differentiate between optimization levels!
-
-    # Optimization passes (bag of tricks) run them three times:
-    opt_passes = [
-        Mem2RegPromotor(),
-        RemoveAddZeroPass(),
-        ConstantFolder(),
-        CommonSubexpressionEliminationPass(),
-        TailCallOptimization(),
-        LoadAfterStorePass(),
-        DeleteUnusedInstructionsPass(),
-        CleanPass(),
-    ] * 3
-
-    if level == "3":
-        opt_passes.append(CJumpPass())
-
-    # Run the passes over the module:
+    # Run the passes of the level over the module, until the functions
+    # do not change anymore:
     verify_module(ir_module)
-    for opt_pass in opt_passes:
-        opt_pass.run(ir_module)
-        # reporter.message('{} after {}:'.format(ir_module, opt_pass))
-        # reporter.dump_ir(ir_module)
+    pass_manager = PassManager(create_pipeline(level))
+    pass_manager.run(ir_module, jobs=jobs)
+    for line in pass_manager.report():
+        logger.debug(line)
 
     if reporter:
         # Dump report:
         reporter.message("{} after optimization:".format(ir_module))
         reporter.message("{} {}".format(ir_module, ir_module.stats()))
+        for line in pass_manager.report():
+            reporter.message(line)
         reporter.dump_ir(ir_module)
 
     verify_module(ir_module)
 
 
 def ir_to_stream(
-    ir_module, march, output_stream, reporter=None, debug=False, opt="speed"
+    ir_module,
+    march,
+    output_stream,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    jobs=1,
 ):
     """ Translate IR module to output stream.
     """
@@ -260,7 +260,7 @@ def ir_to_stream(
 
     # Code generation:
     code_generator.generate(
-        ir_module, output_stream, reporter=reporter, debug=debug
+        ir_module, output_stream, reporter=reporter, debug=debug, jobs=jobs
     )
 
 
@@ -275,7 +275,13 @@ def ir_to_assembly(ir_modules, march, add_binary=False):
 
 
 def ir_to_object(
-    ir_modules, march, reporter=None, debug=False, opt="speed", outstream=None
+    ir_modules,
+    march,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    outstream=None,
+    jobs=1,
 ):
     """ Translate IR-modules into code for the given architecture.
 
@@ -287,6 +293,9 @@ def ir_to_object(
         debug (bool): include debugging information
         opt (str): optimization goal. Can be 'speed', 'size' or 'co2'.
         outstream: instruction stream to write instructions to
+        jobs (int): the number of processes used to generate the
+            functions in parallel. The resulting object is the same for
+            any number of jobs.
 
     Returns:
         ObjectFile: An object file
@@ -321,9 +330,11 @@ def ir_to_object(
             reporter=reporter,
             debug=debug,
             opt=opt,
+            jobs=jobs,
         )
 
     reporter.message("All modules generated!")
+    reporter.message(burg_system_cache.statistics())
     reporter.dump_instructions(instruction_list, march)
     return obj
 
@@ -514,7 +525,7 @@ def fortrancompile(sources, target, reporter=DummyReportGenerator()):
 
 def objcopy(obj: ObjectFile, image_name: str, fmt: str, output_filename):
     """ Copy some parts of an object file to an output """
-    fmts = ["bin", "hex", "elf", "exe", "ldb", "uimage"]
+    fmts = ["bin", "hex", "elf", "exe", "json", "ldb", "uimage"]
     if fmt not in fmts:
         formats = ", ".join(fmts[:-1]) + " and " + fmts[-1]
         raise TaskError("Only {} are supported".format(formats))
@@ -538,6 +549,9 @@ def objcopy(obj: ObjectFile, image_name: str, fmt: str, output_filename):
         hexfile.add_region(image.address, image.data)
         with open(output_filename, "wt", encoding="utf8") as output_file:
             hexfile.save(output_file)
+    elif fmt == "json":
+        with open(output_filename, "wt", encoding="utf8") as output_file:
+            obj.save(output_file)
     elif fmt == "ldb":
         # TODO: fix this some other way to extract debug info
         with open(output_filename, "wt", encoding="utf8") as output_file:
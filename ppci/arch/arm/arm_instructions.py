@@ -3,11 +3,14 @@
 # pylint: disable=no-member,invalid-name
 
 from .isa import arm_isa, ArmToken, ArmImmToken, Isa
+from .isa import ArmMulToken, ArmBranchToken, ArmMemToken, ArmCoprocToken
 from ..encoding import Instruction, Constructor, Syntax, Operand, Transform
+from ..encoding import relative_target, target_offset
 from ..generic_instructions import RegisterUseDef, Global
-from ...utils.bitfun import encode_imm32
+from ...utils.bitfun import encode_imm32, rotate_right
 from ...utils.tree import Tree
 from .registers import ArmRegister, Coreg, Coproc, RegisterSet, R11
+from .registers import num2regmap
 from .registers import R0, R1, R2
 from .arm_relocations import Imm24Relocation
 from .arm_relocations import LdrImm12Relocation, AdrImm12Relocation
@@ -97,6 +100,12 @@ class ArmExpand(Transform):
     def forwards(self, value):
         return encode_imm32(value)
 
+    def backwards(self, value):
+        rotation, val = value >> 8, value & 0xFF
+        if rotation:
+            val = rotate_right(val, rotation * 2)
+        return val
+
 
 class Mov1(ArmInstruction):
     """ Mov Rd, imm16 """
@@ -177,17 +186,17 @@ class Mul1(ArmInstruction):
     rd = Operand("rd", ArmRegister, write=True)
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ArmMulToken]
     syntax = Syntax(["mul", " ", rd, ",", " ", rn, ",", " ", rm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:4] = self.rn.num
-        tokens[0][4:8] = 0b1001
-        tokens[0][8:12] = self.rm.num
-        tokens[0][16:20] = self.rd.num
-        tokens[0].S = 0
-        tokens[0].cond = AL
-        return tokens[0].encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "rd": rd,
+        "ra": 0,
+        "rm": rm,
+        "op2": 0b1001,
+        "rn": rn,
+    }
 
 
 class Sdiv(ArmInstruction):
@@ -200,18 +209,17 @@ class Sdiv(ArmInstruction):
     rd = Operand("rd", ArmRegister, write=True)
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ArmMulToken]
     syntax = Syntax(["sdiv", rd, ",", rn, ",", rm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:4] = self.rn.num
-        tokens[0][4:8] = 0b0001
-        tokens[0][8:12] = self.rm.num
-        tokens[0][12:16] = 0b1111
-        tokens[0][16:20] = self.rd.num
-        tokens[0][20:28] = 0b1110001
-        tokens[0].cond = AL
-        return tokens[0].encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0b1110001,
+        "rd": rd,
+        "ra": 0b1111,
+        "rm": rm,
+        "op2": 0b0001,
+        "rn": rn,
+    }
 
 
 class Udiv(ArmInstruction):
@@ -222,19 +230,17 @@ class Udiv(ArmInstruction):
     rd = Operand("rd", ArmRegister, write=True)
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ArmMulToken]
     syntax = Syntax(["udiv", rd, ",", rn, ",", rm])
-    patterns = {"cond": AL}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0][0:4] = self.rn.num
-        tokens[0][4:8] = 0b0001
-        tokens[0][8:12] = self.rm.num
-        tokens[0][12:16] = 0b1111
-        tokens[0][16:20] = self.rd.num
-        tokens[0][20:28] = 0b1110011
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0b1110011,
+        "rd": rd,
+        "ra": 0b1111,
+        "rm": rm,
+        "op2": 0b0001,
+        "rn": rn,
+    }
 
 
 class Mls(ArmInstruction):
@@ -247,19 +253,17 @@ class Mls(ArmInstruction):
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
     ra = Operand("ra", ArmRegister, read=True)
+    tokens = [ArmMulToken]
     syntax = Syntax(["mls", rd, ",", rn, ",", rm, ",", ra])
-    patterns = {"cond": AL}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0][0:4] = self.rn.num
-        tokens[0][4:8] = 0b1001
-        tokens[0][8:12] = self.rm.num
-        tokens[0][12:16] = self.ra.num
-        tokens[0][16:20] = self.rd.num
-        tokens[0][20:28] = 0b00000110
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0b00000110,
+        "rd": rd,
+        "ra": ra,
+        "rm": rm,
+        "op2": 0b1001,
+        "rn": rn,
+    }
 
 
 def make_regregreg(mnemonic, opcode):
@@ -308,21 +312,23 @@ class ShiftBase(ArmInstruction):
     rd = Operand("rd", ArmRegister, write=True)
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
-    patterns = {"cond": AL, "S": 0}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0][0:4] = self.rn.num
-        tokens[0][4:8] = self.opcode
-        tokens[0][8:12] = self.rm.num
-        tokens[0][12:16] = self.rd.num
-        tokens[0][21:28] = 0b1101
-        return tokens[0].encode()
+    # The shifted register rn is in the rm field, the shift amount rm
+    # in the rs field:
+    patterns = {
+        "cond": AL,
+        "opcode": 0b1101,
+        "S": 0,
+        "rn": 0,
+        "rd": rd,
+        "rs": rm,
+        "b7": 0,
+        "b4": 1,
+        "rm": rn,
+    }
 
 
 class Lsr1(ShiftBase):
-    opcode = 0b0011
+    patterns = dict(ShiftBase.patterns, shift_typ=1)
     syntax = Syntax(
         [
             "lsr",
@@ -342,7 +348,7 @@ Lsr = Lsr1
 
 
 class Lsl1(ShiftBase):
-    opcode = 0b0001
+    patterns = dict(ShiftBase.patterns, shift_typ=0)
     syntax = Syntax(
         ["lsl", " ", ShiftBase.rd, ",", ShiftBase.rn, ",", ShiftBase.rm]
     )
@@ -352,7 +358,7 @@ Lsl = Lsl1
 
 
 class Asr(ShiftBase):
-    opcode = 0b0101
+    patterns = dict(ShiftBase.patterns, shift_typ=2)
     syntax = Syntax(
         ["asr", " ", ShiftBase.rd, ",", ShiftBase.rn, ",", ShiftBase.rm]
     )
@@ -361,15 +367,7 @@ class Asr(ShiftBase):
 class OpRegRegImm(ArmInstruction):
     """ add rd, rn, imm12 """
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:12] = encode_imm32(self.imm)
-        tokens[0].rd = self.rd.num
-        tokens[0].rn = self.rn.num
-        tokens[0].S = 0  # Set flags
-        tokens[0][21:28] = self.opcode
-        tokens[0].cond = AL
-        return tokens[0].encode()
+    tokens = [ArmImmToken]
 
 
 def make_regregimm(mnemonic, opcode):
@@ -377,8 +375,17 @@ def make_regregimm(mnemonic, opcode):
     rn = Operand("rn", ArmRegister, read=True)
     imm = Operand("imm", int)
     syntax = Syntax([mnemonic, " ", rd, ",", " ", rn, ",", " ", imm])
+    patterns = {
+        "cond": AL,
+        "opcode": opcode,
+        "s": 0,
+        "rn": rn,
+        "rd": rd,
+        "imm12": ArmExpand(imm),
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "rd": rd,
         "rn": rn,
         "imm": imm,
@@ -402,36 +409,44 @@ SubImm = make_regregimm("sub", 0b0010010)
 
 
 class BranchBaseRoot(ArmInstruction):
-    target = Operand("target", str)
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = self.cond
-        tokens[0][24:28] = self.opcode
-        return tokens[0].encode()
-
-    def relocations(self):
-        return [Imm24Relocation(self.target)]
+    """ Branch to a label, or to an offset when decoded """
 
+    target = Operand("target", str)
+    tokens = [ArmBranchToken]
 
-class BranchBase(BranchBaseRoot):
-    opcode = 0b1010
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            tokens.set_field("imm24", ((offset - 8) >> 2) & 0xFFFFFF)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        offset = tokens.get_field("imm24") * 4 + 8
+        return {cls.target: relative_target(offset)}
 
-class BranchLinkBase(BranchBaseRoot):
-    opcode = 0b1011
+    def relocations(self):
+        if target_offset(self.target) is None:
+            return [Imm24Relocation(self.target)]
+        return []
 
 
-class Bl(BranchLinkBase):
+class Bl(BranchBaseRoot):
     cond = AL
     syntax = Syntax(["bl", " ", BranchBaseRoot.target])
+    patterns = {"cond": AL, "opcode": 0b101, "link": 1}
 
 
 def make_branch(mnemonic, cond):
     target = Operand("target", str)
     syntax = Syntax([mnemonic, " ", target])
-    members = {"syntax": syntax, "target": target, "cond": cond}
-    return type(mnemonic + "_ins", (BranchBase,), members)
+    patterns = {"cond": cond, "opcode": 0b101, "link": 0}
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "target": target,
+        "cond": cond,
+    }
+    return type(mnemonic + "_ins", (BranchBaseRoot,), members)
 
 
 B = make_branch("b", AL)
@@ -451,13 +466,18 @@ class Blx(ArmInstruction):
 
     rm = Operand("rm", ArmRegister, read=True)
     syntax = Syntax(["blx", " ", rm])
-    patterns = {"cond": AL, "rm": rm}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0][4:28] = 0x12FFF3
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0b0001001,
+        "S": 0,
+        "rn": 0b1111,
+        "rd": 0b1111,
+        "rs": 0b1111,
+        "b7": 0,
+        "shift_typ": 0b01,
+        "b4": 1,
+        "rm": rm,
+    }
 
 
 def reg_list_to_mask(reg_list):
@@ -467,28 +487,50 @@ def reg_list_to_mask(reg_list):
     return mask
 
 
-class Push(ArmInstruction):
-    reg_list = Operand("reg_list", RegisterSet)
-    syntax = Syntax(["push", " ", reg_list])
+def mask_to_reg_list(mask):
+    return RegisterSet(num2regmap[n] for n in range(16) if mask & (1 << n))
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][16:28] = 0b100100101101
-        tokens[0][0:16] = reg_list_to_mask(self.reg_list)
-        return tokens[0].encode()
 
+class PushPopBase(ArmInstruction):
+    """ Store or load multiple registers on the stack """
 
-class Pop(ArmInstruction):
     reg_list = Operand("reg_list", RegisterSet)
-    syntax = Syntax(["pop", " ", reg_list])
+    tokens = [ArmMemToken]
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][16:28] = 0b100010111101
-        tokens[0][0:16] = reg_list_to_mask(self.reg_list)
-        return tokens[0].encode()
+    def set_user_patterns(self, tokens):
+        tokens.set_field("reg_list", reg_list_to_mask(self.reg_list))
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg_list: mask_to_reg_list(tokens.get_field("reg_list"))}
+
+
+class Push(PushPopBase):
+    syntax = Syntax(["push", " ", PushPopBase.reg_list])
+    patterns = {
+        "cond": AL,
+        "opcode": 0b100,
+        "p": 1,
+        "u": 0,
+        "b": 0,
+        "w": 1,
+        "l": 0,
+        "rn": 13,
+    }
+
+
+class Pop(PushPopBase):
+    syntax = Syntax(["pop", " ", PushPopBase.reg_list])
+    patterns = {
+        "cond": AL,
+        "opcode": 0b100,
+        "p": 0,
+        "u": 1,
+        "b": 0,
+        "w": 1,
+        "l": 1,
+        "rn": 13,
+    }
 
 
 def LdrPseudo(rt, lab, add_lit):
@@ -500,30 +542,29 @@ def LdrPseudo(rt, lab, add_lit):
 class LdrStrBase(ArmInstruction):
     rn = Operand("rn", ArmRegister, read=True)
     offset = Operand("offset", int)
+    tokens = [ArmMemToken]
+    offset_field = "imm12"
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0].rn = self.rn.num
-        tokens[0][25:28] = self.opcode
-        tokens[0][22] = self.bit22
-        tokens[0][20] = self.bit20
-        tokens[0][12:16] = self.rt.num
-        tokens[0][24] = 1  # Index
-        if self.offset >= 0:
-            tokens[0][23] = 1  # U == 1 'add'
-            tokens[0][0:12] = self.offset
-        else:
-            tokens[0][23] = 0
-            tokens[0][0:12] = -self.offset
-        return tokens.encode()
+    def set_user_patterns(self, tokens):
+        tokens.set_field("u", int(self.offset >= 0))  # U == 1 'add'
+        tokens.set_field(self.offset_field, abs(self.offset))
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        offset = tokens.get_field(cls.offset_field)
+        if not tokens.get_field("u"):
+            offset = -offset
+        return {cls.offset: offset}
+
+
+class LdrStrExtraBase(LdrStrBase):
+    """ Load or store half words or signed bytes """
+
+    offset_field = "imm4h_imm4l"
 
 
 class Str1(LdrStrBase):
     rt = Operand("rt", ArmRegister, read=True)
-    opcode = 0b010
-    bit20 = 0
-    bit22 = 0
     syntax = Syntax(
         [
             "str",
@@ -539,13 +580,20 @@ class Str1(LdrStrBase):
             "]",
         ]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b010,
+        "p": 1,  # Index
+        "b": 0,
+        "w": 0,
+        "l": 0,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+    }
 
 
 class Ldr1(LdrStrBase):
     rt = Operand("rt", ArmRegister, write=True)
-    opcode = 0b010
-    bit20 = 1
-    bit22 = 0
     syntax = Syntax(
         [
             "ldr",
@@ -562,44 +610,55 @@ class Ldr1(LdrStrBase):
             "]",
         ]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b010,
+        "p": 1,  # Index
+        "b": 0,
+        "w": 0,
+        "l": 1,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+    }
 
 
-class Strh(ArmInstruction):
+class Strh(LdrStrExtraBase):
     """ Store half word at register + immediate """
 
     rd = Operand("rd", ArmRegister, write=True)
-    rn = Operand("rn", ArmRegister, read=True)
-    imm = Operand("imm", int)
     syntax = Syntax(
-        ["strh", " ", rd, ",", " ", "[", rn, ",", " ", "#", imm, "]"]
+        [
+            "strh",
+            " ",
+            rd,
+            ",",
+            " ",
+            "[",
+            LdrStrBase.rn,
+            ",",
+            " ",
+            "#",
+            LdrStrBase.offset,
+            "]",
+        ]
     )
-    patterns = {"rn": rn, "rd": rd, "cond": AL}
-
-    def set_user_patterns(self, tokens):
-        if self.imm < 0:
-            offset = -self.imm
-            u = 0
-        else:
-            offset = self.imm
-            u = 1
-
-        tokens[0][0:4] = offset & 0xF
-        tokens[0][4:8] = 0b1011
-        tokens[0][8:12] = (offset >> 4) & 0xF
-        tokens[0][20] = 0
-        tokens[0][21] = 0  # W
-        tokens[0][22] = 1
-        tokens[0][23] = u
-        tokens[0][24] = 1  # P
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "p": 1,
+        "b": 1,
+        "w": 0,
+        "l": 0,
+        "rn": LdrStrBase.rn,
+        "rt": rd,
+        "op2": 0b1011,
+    }
 
 
 class Strb(LdrStrBase):
     """ ldrb rt, [rn, offset] # Store byte at address """
 
     rt = Operand("rt", ArmRegister, read=True)
-    opcode = 0b010
-    bit20 = 0
-    bit22 = 1
     syntax = Syntax(
         [
             "strb",
@@ -616,15 +675,22 @@ class Strb(LdrStrBase):
             "]",
         ]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b010,
+        "p": 1,  # Index
+        "b": 1,
+        "w": 0,
+        "l": 0,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+    }
 
 
 class Ldrb(LdrStrBase):
     """ ldrb rt, [rn, offset] """
 
     rt = Operand("rt", ArmRegister, write=True)
-    opcode = 0b010
-    bit20 = 1
-    bit22 = 1
     syntax = Syntax(
         [
             "ldrb",
@@ -641,108 +707,124 @@ class Ldrb(LdrStrBase):
             "]",
         ]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b010,
+        "p": 1,  # Index
+        "b": 1,
+        "w": 0,
+        "l": 1,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+    }
 
 
-class Ldrsb(ArmInstruction):
+class Ldrsb(LdrStrExtraBase):
     """ ldrsb rt, [rn, offset].
 
     Load byte and sign extend.
     """
 
     rt = Operand("rt", ArmRegister, write=True)
-    rn = Operand("rn", ArmRegister, read=True)
-    offset = Operand("offset", int)
     syntax = Syntax(
-        ["ldrsb", " ", rt, ",", " ", "[", rn, ",", " ", "#", offset, "]"]
+        [
+            "ldrsb",
+            " ",
+            rt,
+            ",",
+            " ",
+            "[",
+            LdrStrBase.rn,
+            ",",
+            " ",
+            "#",
+            LdrStrBase.offset,
+            "]",
+        ]
     )
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][25:28] = 0
-        tokens[0][24] = 1  # Index
-        tokens[0][22] = 1
-        tokens[0][21] = 0  # W?
-        tokens[0][20] = 1
-        tokens[0].rn = self.rn.num
-        tokens[0][12:16] = self.rt.num
-        tokens[0][4:8] = 0b1101
-        if self.offset >= 0:
-            tokens[0][23] = 1  # U == 1 'add'
-            offset = self.offset
-        else:
-            tokens[0][23] = 0
-            offset = -self.offset
-        tokens[0].imm4h_imm4l = offset
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "p": 1,  # Index
+        "b": 1,
+        "w": 0,
+        "l": 1,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+        "op2": 0b1101,
+    }
 
 
-class Ldrh_imm(ArmInstruction):
+class Ldrh_imm(LdrStrExtraBase):
     """ ldrh rt, [rn, offset].
 
     Load half word and zero extend.
     """
 
     rt = Operand("rt", ArmRegister, write=True)
-    rn = Operand("rn", ArmRegister, read=True)
-    offset = Operand("offset", int)
     syntax = Syntax(
-        ["ldrh", " ", rt, ",", " ", "[", rn, ",", " ", "#", offset, "]"]
+        [
+            "ldrh",
+            " ",
+            rt,
+            ",",
+            " ",
+            "[",
+            LdrStrBase.rn,
+            ",",
+            " ",
+            "#",
+            LdrStrBase.offset,
+            "]",
+        ]
     )
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][25:28] = 0
-        tokens[0][24] = 1  # Index
-        tokens[0][22] = 1
-        tokens[0][21] = 0  # W?
-        tokens[0][20] = 1
-        tokens[0].rn = self.rn.num
-        tokens[0][12:16] = self.rt.num
-        tokens[0][4:8] = 0b1011
-        if self.offset >= 0:
-            tokens[0][23] = 1  # U == 1 'add'
-            offset = self.offset
-        else:
-            tokens[0][23] = 0
-            offset = -self.offset
-        tokens[0].imm4h_imm4l = offset
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "p": 1,  # Index
+        "b": 1,
+        "w": 0,
+        "l": 1,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+        "op2": 0b1011,
+    }
 
 
-class Ldrsh_imm(ArmInstruction):
+class Ldrsh_imm(LdrStrExtraBase):
     """ ldrsh rt, [rn, offset].
 
     Load signed half word and sign extend.
     """
 
     rt = Operand("rt", ArmRegister, write=True)
-    rn = Operand("rn", ArmRegister, read=True)
-    offset = Operand("offset", int)
     syntax = Syntax(
-        ["ldrsh", " ", rt, ",", " ", "[", rn, ",", " ", "#", offset, "]"]
+        [
+            "ldrsh",
+            " ",
+            rt,
+            ",",
+            " ",
+            "[",
+            LdrStrBase.rn,
+            ",",
+            " ",
+            "#",
+            LdrStrBase.offset,
+            "]",
+        ]
     )
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][25:28] = 0
-        tokens[0][24] = 1  # Index
-        tokens[0][22] = 1
-        tokens[0][21] = 0  # W?
-        tokens[0][20] = 1
-        tokens[0].rn = self.rn.num
-        tokens[0][12:16] = self.rt.num
-        tokens[0][4:8] = 0b1111
-        if self.offset >= 0:
-            tokens[0][23] = 1  # U == 1 'add'
-            offset = self.offset
-        else:
-            tokens[0][23] = 0
-            offset = -self.offset
-        tokens[0].imm4h_imm4l = offset
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "p": 1,  # Index
+        "b": 1,
+        "w": 0,
+        "l": 1,
+        "rn": LdrStrBase.rn,
+        "rt": rt,
+        "op2": 0b1111,
+    }
 
 
 class Ldrsh_reg(ArmInstruction):
@@ -755,23 +837,22 @@ class Ldrsh_reg(ArmInstruction):
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
     offset = Operand("offset", int)
+    tokens = [ArmMemToken]
     syntax = Syntax(["ldrsh", " ", rt, ",", " ", "[", rn, ",", " ", rm, "]"])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].cond = AL
-        tokens[0][25:28] = 0
-        tokens[0][24] = 1  # Index
-        tokens[0][23] = 1  # U == 1 'add'
-        tokens[0][22] = 0
-        tokens[0][21] = 0  # W?
-        tokens[0][20] = 1
-        tokens[0].rn = self.rn.num
-        tokens[0][12:16] = self.rt.num
-        tokens[0][8:12] = 0b0000
-        tokens[0][4:8] = 0b1111
-        tokens[0][0:4] = self.rm.num
-        return tokens.encode()
+    patterns = {
+        "cond": AL,
+        "opcode": 0,
+        "p": 1,  # Index
+        "u": 1,  # U == 1 'add'
+        "b": 0,
+        "w": 0,
+        "l": 1,
+        "rn": rn,
+        "rt": rt,
+        "imm4h": 0,
+        "op2": 0b1111,
+        "rm": rm,
+    }
 
 
 class Adr(ArmInstruction):
@@ -818,19 +899,7 @@ class Ldr3(ArmInstruction):
 class McrBase(ArmInstruction):
     """ Mov arm register to coprocessor register """
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:4] = self.crm.num
-        tokens[0][4] = 1
-        tokens[0][5:8] = self.opc2
-        tokens[0][8:12] = self.coproc.num
-        tokens[0][12:16] = self.rt.num
-        tokens[0][16:20] = self.crn.num
-        tokens[0][20] = self.b20
-        tokens[0][21:24] = self.opc1
-        tokens[0][24:28] = 0b1110
-        tokens[0].cond = AL
-        return tokens[0].encode()
+    tokens = [ArmCoprocToken]
 
 
 class Mcr(McrBase):
@@ -842,10 +911,21 @@ class Mcr(McrBase):
     crn = Operand("crn", Coreg, read=True)
     crm = Operand("crm", Coreg, read=True)
     opc2 = Operand("opc2", int)
-    b20 = 0
     syntax = Syntax(
         ["mcr", coproc, ",", opc1, ",", rt, ",", crn, ",", crm, ",", opc2]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b1110,
+        "opc1": opc1,
+        "l": 0,
+        "crn": crn,
+        "rt": rt,
+        "coproc": coproc,
+        "opc2": opc2,
+        "b4": 1,
+        "crm": crm,
+    }
 
 
 class Mrc(McrBase):
@@ -855,10 +935,21 @@ class Mrc(McrBase):
     crn = Operand("crn", Coreg, read=True)
     crm = Operand("crm", Coreg, read=True)
     opc2 = Operand("opc2", int)
-    b20 = 1
     syntax = Syntax(
         ["mrc", coproc, ",", opc1, ",", rt, ",", crn, ",", crm, ",", opc2]
     )
+    patterns = {
+        "cond": AL,
+        "opcode": 0b1110,
+        "opc1": opc1,
+        "l": 1,
+        "crn": crn,
+        "rt": rt,
+        "coproc": coproc,
+        "opc2": opc2,
+        "b4": 1,
+        "crm": crm,
+    }
 
 
 # Instruction selection patterns:
@@ -25,6 +25,8 @@ class ArmToken(Token):
     imm24 = bit_range(0, 24)
     imm8 = bit_range(0, 8)
     imm4h_imm4l = bit_range(8, 12) + bit_range(0, 4)
+    rs = bit_range(8, 12)
+    b7 = bit(7)
 
 
 class ArmImmToken(Token):
@@ -39,8 +41,168 @@ class ArmImmToken(Token):
     imm12 = bit_range(0, 12)
 
 
+class ArmMulToken(Token):
+    """ Token of the multiply and divide instructions """
+
+    class Info:
+        size = 32
+
+    cond = bit_range(28, 32)
+    opcode = bit_range(20, 28)
+    rd = bit_range(16, 20)
+    ra = bit_range(12, 16)
+    rm = bit_range(8, 12)
+    op2 = bit_range(4, 8)
+    rn = bit_range(0, 4)
+
+
+class ArmBranchToken(Token):
+    class Info:
+        size = 32
+
+    cond = bit_range(28, 32)
+    opcode = bit_range(25, 28)
+    link = bit(24)
+    imm24 = bit_range(0, 24, signed=True)
+
+
+class ArmMemToken(Token):
+    """ Token of the load and store instructions """
+
+    class Info:
+        size = 32
+
+    cond = bit_range(28, 32)
+    opcode = bit_range(25, 28)
+    p = bit(24)
+    u = bit(23)
+    b = bit(22)
+    w = bit(21)
+    l = bit(20)
+    rn = bit_range(16, 20)
+    rt = bit_range(12, 16)
+    imm12 = bit_range(0, 12)
+    imm4h = bit_range(8, 12)
+    imm4h_imm4l = bit_range(8, 12) + bit_range(0, 4)
+    op2 = bit_range(4, 8)
+    rm = bit_range(0, 4)
+    reg_list = bit_range(0, 16)
+
+
+class ArmCoprocToken(Token):
+    class Info:
+        size = 32
+
+    cond = bit_range(28, 32)
+    opcode = bit_range(24, 28)
+    opc1 = bit_range(21, 24)
+    l = bit(20)
+    crn = bit_range(16, 20)
+    rt = bit_range(12, 16)
+    coproc = bit_range(8, 12)
+    opc2 = bit_range(5, 8)
+    b4 = bit(4)
+    crm = bit_range(0, 4)
+
+
 class ThumbToken(Token):
     class Info:
         size = 16
 
     rd = bit_range(0, 3)
+
+
+class ThumbImm5Token(ThumbToken):
+    opcode = bit_range(11, 16)
+    imm5 = bit_range(6, 11)
+    rn = bit_range(3, 6)
+    rt = bit_range(0, 3)
+
+
+class ThumbImm8Token(ThumbToken):
+    opcode = bit_range(11, 16)
+    rd = bit_range(8, 11)
+    imm8 = bit_range(0, 8)
+
+
+class ThumbRegToken(ThumbToken):
+    opcode = bit_range(9, 16)
+    rm = bit_range(6, 9)
+    imm3 = bit_range(6, 9)
+    rn = bit_range(3, 6)
+
+
+class ThumbDataToken(ThumbToken):
+    opcode = bit_range(6, 16)
+    rm = bit_range(3, 6)
+
+
+class ThumbHiRegToken(ThumbToken):
+    opcode = bit_range(8, 16)
+    d = bit(7)
+    rm = bit_range(3, 7)
+    rdn = bit(7) + bit_range(0, 3)
+
+
+class ThumbHintToken(ThumbToken):
+    opcode = bit_range(8, 16)
+    op_a = bit_range(4, 8)
+    op_b = bit_range(0, 4)
+
+
+class ThumbSpToken(ThumbToken):
+    opcode = bit_range(7, 16)
+    imm7 = bit_range(0, 7)
+
+
+class ThumbPushPopToken(ThumbToken):
+    opcode = bit_range(9, 16)
+    reg_list = bit_range(0, 9)
+
+
+class ThumbBranchToken(ThumbToken):
+    opcode = bit_range(11, 16)
+    imm11 = bit_range(0, 11, signed=True)
+
+
+class ThumbCondBranchToken(ThumbToken):
+    opcode = bit_range(12, 16)
+    cond = bit_range(8, 12)
+    imm8 = bit_range(0, 8, signed=True)
+
+
+class ThumbLongBranchToken(Token):
+    """ Token of the 32 bit branches.
+
+    The first half word is in the lower bits.
+    """
+
+    class Info:
+        size = 32
+
+    imm6 = bit_range(0, 6)
+    cond = bit_range(6, 10)
+    imm10 = bit_range(0, 10)
+    s = bit(10)
+    opcode = bit_range(11, 16)
+    imm11 = bit_range(16, 27)
+    j2 = bit(27)
+    j1 = bit(29)
+    op2 = bit(31) + bit(30) + bit(28)
+
+
+class ThumbDivToken(Token):
+    """ Token of the 32 bit divide instructions.
+
+    The first half word is in the lower bits.
+    """
+
+    class Info:
+        size = 32
+
+    rn = bit_range(0, 4)
+    opcode = bit_range(4, 16)
+    rm = bit_range(16, 20)
+    op2 = bit_range(20, 24)
+    rd = bit_range(24, 28)
+    ra = bit_range(28, 32)
@@ -1,16 +1,31 @@
 """ Thumb instruction definitions """
 
-from ..encoding import Instruction, Operand, Syntax
+from ..encoding import Instruction, Operand, Syntax, Transform
+from ..encoding import relative_target, target_offset
 from ..token import u16
-from .registers import ArmRegister, LowArmRegister, R7
+from ...utils.bitfun import sign_extend
+from .registers import ArmRegister, LowArmRegister, R7, LR, PC
+from .registers import RegisterSet, registers_low
 from .thumb_relocations import Lit8Relocation, WrapNew11Relocation
 from .thumb_relocations import BImm11Imm6Relocation
 from .thumb_relocations import Rel8Relocation, BlImm11Relocation
-from .isa import thumb_isa, ThumbToken
+from .isa import thumb_isa, ThumbToken, ThumbImm5Token, ThumbImm8Token
+from .isa import ThumbRegToken, ThumbDataToken, ThumbHiRegToken
+from .isa import ThumbHintToken, ThumbSpToken, ThumbPushPopToken
+from .isa import ThumbBranchToken, ThumbCondBranchToken
+from .isa import ThumbLongBranchToken, ThumbDivToken
 
 # pylint: disable=no-member,invalid-name
 
 
+class Shift2(Transform):
+    def forwards(self, value):
+        return value >> 2
+
+    def backwards(self, value):
+        return value << 2
+
+
 # Instructions:
 
 
@@ -41,20 +56,7 @@ class LS_imm5_base(ThumbInstruction):
 
     rn = Operand("rn", LowArmRegister, read=True)
     imm5 = Operand("imm5", int)
-
-    def encode(self):
-        assert self.imm5 % 4 == 0
-        assert self.rn.num < 8
-        assert self.rt.num < 8
-        Rn = self.rn.num
-        Rt = self.rt.num
-        imm5 = self.imm5 >> 2
-        tokens = self.get_tokens()
-        tokens[0][0:3] = Rt
-        tokens[0][3:6] = Rn
-        tokens[0][6:11] = imm5
-        tokens[0][11:16] = self.opcode
-        return tokens[0].encode()
+    tokens = [ThumbImm5Token]
 
 
 class Str2(LS_imm5_base):
@@ -73,7 +75,12 @@ class Str2(LS_imm5_base):
             "]",
         ]
     )
-    opcode = 0xC
+    patterns = {
+        "opcode": 0xC,
+        "imm5": Shift2(LS_imm5_base.imm5),
+        "rn": LS_imm5_base.rn,
+        "rt": rt,
+    }
 
 
 class Ldr2(LS_imm5_base):
@@ -93,7 +100,12 @@ class Ldr2(LS_imm5_base):
             "]",
         ]
     )
-    opcode = 0xD
+    patterns = {
+        "opcode": 0xD,
+        "imm5": Shift2(LS_imm5_base.imm5),
+        "rn": LS_imm5_base.rn,
+        "rt": rt,
+    }
 
 
 class LS_byte_imm5_base(ThumbInstruction):
@@ -101,19 +113,7 @@ class LS_byte_imm5_base(ThumbInstruction):
 
     rn = Operand("rn", LowArmRegister, read=True)
     imm5 = Operand("imm5", int)
-
-    def encode(self):
-        assert self.rn.num < 8
-        assert self.rt.num < 8
-        Rn = self.rn.num
-        Rt = self.rt.num
-        imm5 = self.imm5
-        tokens = self.get_tokens()
-        tokens[0][0:3] = Rt
-        tokens[0][3:6] = Rn
-        tokens[0][6:11] = imm5
-        tokens[0][11:16] = self.opcode
-        return tokens[0].encode()
+    tokens = [ThumbImm5Token]
 
 
 class Strb(LS_byte_imm5_base):
@@ -133,7 +133,12 @@ class Strb(LS_byte_imm5_base):
             "]",
         ]
     )
-    opcode = 0xE
+    patterns = {
+        "opcode": 0xE,
+        "imm5": LS_byte_imm5_base.imm5,
+        "rn": LS_byte_imm5_base.rn,
+        "rt": rt,
+    }
 
 
 class Ldrb(LS_byte_imm5_base):
@@ -153,7 +158,12 @@ class Ldrb(LS_byte_imm5_base):
             "]",
         ]
     )
-    opcode = 0b01111
+    patterns = {
+        "opcode": 0b01111,
+        "imm5": LS_byte_imm5_base.imm5,
+        "rn": LS_byte_imm5_base.rn,
+        "rt": rt,
+    }
 
 
 class Strh(ThumbInstruction):
@@ -162,21 +172,16 @@ class Strh(ThumbInstruction):
     rt = Operand("rt", LowArmRegister, read=True)
     rn = Operand("rn", LowArmRegister, read=True)
     imm5 = Operand("imm5", int)
+    tokens = [ThumbImm5Token]
     syntax = Syntax(["strh", " ", rt, ",", " ", "[", rn, ",", " ", imm5, "]"])
+    patterns = {"opcode": 0x10, "rn": rn, "rt": rt}
 
-    def encode(self):
-        opcode = 0x10
-        assert self.rn.num < 8
-        assert self.rt.num < 8
-        rn = self.rn.num
-        rt = self.rt.num
-        imm5 = self.imm5 << 1
-        tokens = self.get_tokens()
-        tokens[0][0:3] = rt
-        tokens[0][3:6] = rn
-        tokens[0][6:11] = imm5
-        tokens[0][11:16] = opcode
-        return tokens[0].encode()
+    def set_user_patterns(self, tokens):
+        tokens.set_field("imm5", self.imm5 << 1)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.imm5: tokens.get_field("imm5") >> 1}
 
 
 class Ldrh(ThumbInstruction):
@@ -185,33 +190,14 @@ class Ldrh(ThumbInstruction):
     rt = Operand("rt", LowArmRegister, write=True)
     rn = Operand("rn", LowArmRegister, read=True)
     imm5 = Operand("imm5", int)
+    tokens = [ThumbImm5Token]
     syntax = Syntax(["ldrh", " ", rt, ",", " ", "[", rn, ",", " ", imm5, "]"])
-
-    def encode(self):
-        opcode = 0x11
-        assert self.rn.num < 8
-        assert self.rt.num < 8
-        rn = self.rn.num
-        rt = self.rt.num
-        imm5 = self.imm5
-        tokens = self.get_tokens()
-        tokens[0][0:3] = rt
-        tokens[0][3:6] = rn
-        tokens[0][6:11] = imm5
-        tokens[0][11:16] = opcode
-        return tokens[0].encode()
+    patterns = {"opcode": 0x11, "imm5": imm5, "rn": rn, "rt": rt}
 
 
 class ls_sp_base_imm8(ThumbInstruction):
     offset = Operand("offset", int)
-
-    def encode(self):
-        rt = self.rt.num
-        assert rt < 8
-        imm8 = self.offset >> 2
-        assert imm8 < 256
-        h = (self.opcode << 8) | (rt << 8) | imm8
-        return u16(h)
+    tokens = [ThumbImm8Token]
 
 
 class Ldr3(ThumbInstruction):
@@ -232,11 +218,25 @@ class Ldr3(ThumbInstruction):
         return u16(h)
 
 
+class Ldr4(ThumbInstruction):
+    """ ldr Rt, [PC, imm8], load value from pc relative position.
+
+    This is what Ldr3 becomes after linking.
+    """
+
+    rt = Operand("rt", LowArmRegister, write=True)
+    offset = Operand("offset", int)
+    tokens = [ThumbImm8Token]
+    syntax = Syntax(
+        ["ldr", " ", rt, ",", " ", "[", "pc", ",", " ", offset, "]"]
+    )
+    patterns = {"opcode": 0x9, "rd": rt, "imm8": Shift2(offset)}
+
+
 class Ldr1(ls_sp_base_imm8):
     """ ldr Rt, [SP, imm8] """
 
     rt = Operand("rt", LowArmRegister, write=True)
-    opcode = 0x98
     syntax = Syntax(
         [
             "ldr",
@@ -252,13 +252,17 @@ class Ldr1(ls_sp_base_imm8):
             "]",
         ]
     )
+    patterns = {
+        "opcode": 0b10011,
+        "rd": rt,
+        "imm8": Shift2(ls_sp_base_imm8.offset),
+    }
 
 
 class Str1(ls_sp_base_imm8):
     """ str Rt, [SP, imm8] """
 
     rt = Operand("rt", LowArmRegister, read=True)
-    opcode = 0x90
     syntax = Syntax(
         [
             "str",
@@ -274,6 +278,11 @@ class Str1(ls_sp_base_imm8):
             "]",
         ]
     )
+    patterns = {
+        "opcode": 0b10010,
+        "rd": rt,
+        "imm8": Shift2(ls_sp_base_imm8.offset),
+    }
 
 
 class Adr(ThumbInstruction):
@@ -295,18 +304,11 @@ class Adr(ThumbInstruction):
 class Mov3(ThumbInstruction):
     """ mov Rd, imm8, move immediate value into register """
 
-    opcode = 4  # 00100 Rd(3) imm8
     rd = Operand("rd", LowArmRegister, write=True)
     imm = Operand("imm", int)
+    tokens = [ThumbImm8Token]
     syntax = Syntax(["mov", " ", rd, ",", " ", imm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        rd = self.rd.num
-        tokens[0][8:11] = rd
-        tokens[0][0:8] = self.imm
-        tokens[0][11:16] = self.opcode
-        return tokens[0].encode()
+    patterns = {"opcode": 4, "rd": rd, "imm8": imm}  # 00100 Rd(3) imm8
 
 
 # Arithmatics:
@@ -316,16 +318,7 @@ class regregimm3_base(ThumbInstruction):
     rd = Operand("rd", LowArmRegister, write=True)
     rn = Operand("rn", LowArmRegister, read=True)
     imm3 = Operand("imm3", int)
-
-    def encode(self):
-        assert self.imm3 < 8
-        rd = self.rd.num
-        tokens = self.get_tokens()
-        tokens[0][0:3] = rd
-        tokens[0][3:6] = self.rn.num
-        tokens[0][6:9] = self.imm3
-        tokens[0][9:16] = self.opcode
-        return tokens[0].encode()
+    tokens = [ThumbRegToken]
 
 
 class AddImm(regregimm3_base):
@@ -343,7 +336,12 @@ class AddImm(regregimm3_base):
             regregimm3_base.imm3,
         ]
     )
-    opcode = 0b0001110
+    patterns = {
+        "opcode": 0b0001110,
+        "imm3": regregimm3_base.imm3,
+        "rn": regregimm3_base.rn,
+        "rd": regregimm3_base.rd,
+    }
 
 
 class SubImm(regregimm3_base):
@@ -361,7 +359,12 @@ class SubImm(regregimm3_base):
             regregimm3_base.imm3,
         ]
     )
-    opcode = 0b0001111
+    patterns = {
+        "opcode": 0b0001111,
+        "imm3": regregimm3_base.imm3,
+        "rn": regregimm3_base.rn,
+        "rd": regregimm3_base.rd,
+    }
 
 
 class regregreg_base(ThumbInstruction):
@@ -370,16 +373,7 @@ class regregreg_base(ThumbInstruction):
     rd = Operand("rd", LowArmRegister, write=True)
     rn = Operand("rn", LowArmRegister, read=True)
     rm = Operand("rm", LowArmRegister, read=True)
-
-    def encode(self):
-        at = ThumbToken()
-        at.rd = self.rd.num
-        rn = self.rn.num
-        rm = self.rm.num
-        at[3:6] = rn
-        at[6:9] = rm
-        at[9:16] = self.opcode
-        return at.encode()
+    tokens = [ThumbRegToken]
 
 
 class Add3(regregreg_base):
@@ -396,7 +390,12 @@ class Add3(regregreg_base):
             regregreg_base.rm,
         ]
     )
-    opcode = 0b0001100
+    patterns = {
+        "opcode": 0b0001100,
+        "rm": regregreg_base.rm,
+        "rn": regregreg_base.rn,
+        "rd": regregreg_base.rd,
+    }
 
 
 class Sub3(regregreg_base):
@@ -413,7 +412,12 @@ class Sub3(regregreg_base):
             regregreg_base.rm,
         ]
     )
-    opcode = 0b0001101
+    patterns = {
+        "opcode": 0b0001101,
+        "rm": regregreg_base.rm,
+        "rn": regregreg_base.rn,
+        "rd": regregreg_base.rd,
+    }
 
 
 class Mov2(ThumbInstruction):
@@ -421,18 +425,9 @@ class Mov2(ThumbInstruction):
 
     rd = Operand("rd", ArmRegister, write=True)
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ThumbHiRegToken]
     syntax = Syntax(["mov", " ", rd, ",", " ", rm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].rd = self.rd.num & 0x7
-        D = (self.rd.num >> 3) & 0x1
-        Rm = self.rm.num
-        opcode = 0b01000110
-        tokens[0][8:16] = opcode
-        tokens[0][3:7] = Rm
-        tokens[0][7] = D
-        return tokens[0].encode()
+    patterns = {"opcode": 0b01000110, "rdn": rd, "rm": rm}
 
 
 class Mul(ThumbInstruction):
@@ -445,16 +440,9 @@ class Mul(ThumbInstruction):
 
     rn = Operand("rn", LowArmRegister, read=True)
     rdm = Operand("rdm", LowArmRegister, read=True, write=True)
+    tokens = [ThumbDataToken]
     syntax = Syntax(["mul", " ", rn, ",", " ", rdm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        rn = self.rn.num
-        tokens[0].rd = self.rdm.num
-        opcode = 0b0100001101
-        tokens[0][6:16] = opcode
-        tokens[0][3:6] = rn
-        return tokens[0].encode()
+    patterns = {"opcode": 0b0100001101, "rm": rn, "rd": rdm}
 
 
 class Sdiv(LongThumbInstruction):
@@ -465,37 +453,36 @@ class Sdiv(LongThumbInstruction):
     rd = Operand("rd", ArmRegister, write=True)
     rn = Operand("rn", ArmRegister, read=True)
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ThumbDivToken]
     syntax = Syntax(["sdiv", " ", rd, ",", " ", rn, ",", " ", rm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][11:16] = 0b11111
-        tokens[0][4:11] = 0b0111001
-        tokens[0][0:4] = self.rn.num
-        tokens[1][12:16] = 0b1111
-        tokens[1][8:12] = self.rd.num
-        tokens[1][4:8] = 0b1111
-        tokens[1][0:4] = self.rm.num
-        return tokens[0].encode() + tokens[1].encode()
+    patterns = {
+        "rn": rn,
+        "opcode": 0b111110111001,
+        "rm": rm,
+        "op2": 0b1111,
+        "rd": rd,
+        "ra": 0b1111,
+    }
 
 
 class regreg_base(ThumbInstruction):
     """ ??? Rdn, Rm """
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].rd = self.rdn.num
-        rm = self.rm.num
-        tokens[0][3:6] = rm
-        tokens[0][6:16] = self.opcode
-        return tokens[0].encode()
+    tokens = [ThumbDataToken]
 
 
 def make_regreg(mnemonic, opcode):
     rdn = Operand("rdn", LowArmRegister, write=True, read=True)
     rm = Operand("rm", LowArmRegister, read=True)
     syntax = Syntax([mnemonic, rdn, ",", rm])
-    members = {"syntax": syntax, "rdn": rdn, "rm": rm, "opcode": opcode}
+    patterns = {"opcode": opcode, "rm": rm, "rd": rdn}
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "rdn": rdn,
+        "rm": rm,
+        "opcode": opcode,
+    }
     return type(mnemonic + "_ins", (regreg_base,), members)
 
 
@@ -512,108 +499,126 @@ Rsb = make_regreg("rsb", 0b0100001001)
 class Cmp2(ThumbInstruction):
     """ cmp Rn, imm8 """
 
-    opcode = 5  # 00101
     rn = Operand("rn", LowArmRegister, read=True)
     imm = Operand("imm", int)
+    tokens = [ThumbImm8Token]
     syntax = Syntax(["cmp", rn, ",", imm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:8] = self.imm
-        tokens[0][8:11] = self.rn.num
-        tokens[0][11:16] = self.opcode
-        return tokens[0].encode()
+    patterns = {"opcode": 5, "rd": rn, "imm8": imm}  # 00101
 
 
 # Jumping:
 
 
-class B(ThumbInstruction):
+class BranchBase(ThumbInstruction):
+    """ Branch to a label, or to an offset when decoded.
+
+    The offset is relative to the instruction, the field holds it
+    relative to the instruction plus four, in half words.
+    """
+
     target = Operand("target", str)
-    syntax = Syntax(["b", " ", target])
+    offset_bits = None
 
-    def encode(self):
-        h = (0b11100 << 11) | 0
-        # | 1 # 1 to enable thumb mode
-        return u16(h)
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            value = (offset - 4) >> 1
+            self.set_offset(tokens, value & ((1 << self.offset_bits) - 1))
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        value = sign_extend(cls.get_offset(tokens), cls.offset_bits)
+        return {cls.target: relative_target(value * 2 + 4)}
 
     def relocations(self):
-        return [WrapNew11Relocation(self.target)]
+        if target_offset(self.target) is None:
+            return [self.relocation(self.target)]
+        return []
 
 
-class Bw(LongThumbInstruction):
-    """ Encoding T4
-        Same encoding as Bl, longer jumps are possible with this function!
+class B(BranchBase):
+    tokens = [ThumbBranchToken]
+    syntax = Syntax(["b", " ", BranchBase.target])
+    patterns = {"opcode": 0b11100}
+    relocation = WrapNew11Relocation
+    offset_bits = 11
+
+    def set_offset(self, tokens, value):
+        tokens.set_field("imm11", value)
+
+    @classmethod
+    def get_offset(cls, tokens):
+        return tokens.get_field("imm11")
+
+
+class LongBranchBase(BranchBase):
+    """ Encoding T4, with J1 and J2 set.
+
+    Same encoding as Bl, longer jumps are possible with this function!
     """
 
-    target = Operand("target", str)
-    syntax = Syntax(["bw", " ", target])
+    tokens = [ThumbLongBranchToken]
+    relocation = BlImm11Relocation
+    offset_bits = 22
 
-    def encode(self):
-        j1 = 1
-        j2 = 1
-        tokens = self.get_tokens()
-        tokens[0][11:16] = 0b11110
-        tokens[1][13] = j1
-        tokens[1][11] = j2
-        tokens[1][12] = 1
-        tokens[1][15] = 1
-        return tokens[0].encode() + tokens[1].encode()
+    def set_offset(self, tokens, value):
+        tokens.set_field("imm11", value & 0x7FF)
+        tokens.set_field("imm10", (value >> 11) & 0x3FF)
+        tokens.set_field("s", value >> 21)
 
-    def relocations(self):
-        return [BlImm11Relocation(self.target)]
+    @classmethod
+    def get_offset(cls, tokens):
+        return (
+            tokens.get_field("imm11")
+            | (tokens.get_field("imm10") << 11)
+            | (tokens.get_field("s") << 21)
+        )
 
 
-class Bl(LongThumbInstruction):
-    """ Branch with link """
+class Bw(LongBranchBase):
+    syntax = Syntax(["bw", " ", BranchBase.target])
+    patterns = {"opcode": 0b11110, "op2": 0b101, "j1": 1, "j2": 1}
 
-    target = Operand("target", str)
-    syntax = Syntax(["bl", " ", target])
 
-    def encode(self):
-        j1 = 1  # TODO: what do these mean?
-        j2 = 1
-        tokens = self.get_tokens()
-        tokens[0][11:16] = 0b11110
-        tokens[1][13] = j1
-        tokens[1][11] = j2
-        tokens[1][12] = 1
-        tokens[1][14] = 1
-        tokens[1][15] = 1
-        return tokens[0].encode() + tokens[1].encode()
+class Bl(LongBranchBase):
+    """ Branch with link """
 
-    def relocations(self):
-        return [BlImm11Relocation(self.target)]
+    syntax = Syntax(["bl", " ", BranchBase.target])
+    patterns = {"opcode": 0b11110, "op2": 0b111, "j1": 1, "j2": 1}
 
 
 class Blx(ThumbInstruction):
     """ Branch with link with target in a register """
 
     rm = Operand("rm", ArmRegister, read=True)
+    tokens = [ThumbHiRegToken]
     syntax = Syntax(["blx", " ", rm])
+    patterns = {"opcode": 0b01000111, "d": 1, "rm": rm, "rd": 0}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][7:16] = 0b010001111
-        tokens[0][3:7] = self.rm.num
-        tokens[0][0:3] = 0
-        return tokens.encode()
 
+class cond_base_ins(BranchBase):
+    tokens = [ThumbCondBranchToken]
+    relocation = Rel8Relocation
+    offset_bits = 8
 
-class cond_base_ins(ThumbInstruction):
-    def encode(self):
-        imm8 = 0
-        h = (0b1101 << 12) | (self.cond << 8) | imm8
-        return u16(h)
+    def set_offset(self, tokens, value):
+        tokens.set_field("imm8", value)
 
-    def relocations(self):
-        return [Rel8Relocation(self.target)]
+    @classmethod
+    def get_offset(cls, tokens):
+        return tokens.get_field("imm8")
 
 
 def make_cond_branch(mnemonic, cond):
     target = Operand("target", str)
     syntax = Syntax([mnemonic, target])
-    members = {"syntax": syntax, "target": target, "cond": cond}
+    patterns = {"opcode": 0b1101, "cond": cond}
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "target": target,
+        "cond": cond,
+    }
     return type(mnemonic + "_ins", (cond_base_ins,), members)
 
 
@@ -626,24 +631,43 @@ Bge = make_cond_branch("bge", 0b1010)
 
 
 # Long conditional jumps:
-class cond_base_ins_long(LongThumbInstruction):
-    """ Encoding T3 """
-
-    def encode(self):
-        j1 = 0  # TODO: what do these mean?
-        j2 = 0
-        h1 = (0b11110 << 11) | (self.cond << 6)
-        h2 = (0b1000 << 12) | (j1 << 13) | (j2 << 11)
-        return u16(h1) + u16(h2)
-
-    def relocations(self):
-        return [BImm11Imm6Relocation(self.target)]
+class cond_base_ins_long(BranchBase):
+    """ Encoding T3, with J1 and J2 equal to S """
+
+    tokens = [ThumbLongBranchToken]
+    relocation = BImm11Imm6Relocation
+    offset_bits = 18
+
+    def set_offset(self, tokens, value):
+        s = value >> 17
+        tokens.set_field("imm11", value & 0x7FF)
+        tokens.set_field("imm6", (value >> 11) & 0x3F)
+        tokens.set_field("s", s)
+        tokens.set_field("j1", s)
+        tokens.set_field("j2", s)
+
+    @classmethod
+    def get_offset(cls, tokens):
+        s = tokens.get_field("s")
+        if tokens.get_field("j1") != s or tokens.get_field("j2") != s:
+            raise ValueError("Cannot decode {}".format(cls))
+        return (
+            tokens.get_field("imm11")
+            | (tokens.get_field("imm6") << 11)
+            | (s << 17)
+        )
 
 
 def make_long_cond_branch(mnemonic, cond):
     target = Operand("target", str)
     syntax = Syntax([mnemonic, target])
-    members = {"syntax": syntax, "target": target, "cond": cond}
+    patterns = {"opcode": 0b11110, "cond": cond, "op2": 0b100}
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "target": target,
+        "cond": cond,
+    }
     return type(mnemonic + "_ins", (cond_base_ins_long,), members)
 
 
@@ -677,71 +701,78 @@ def pop_bit_pos(n):
         raise NotImplementedError("not implemented for {}".format(n))
 
 
-class Push(ThumbInstruction):
+class PushPopBase(ThumbInstruction):
+    """ Push or pop low registers and one high register """
+
     regs = Operand("regs", set)
-    syntax = Syntax(["push", " ", regs])
+    tokens = [ThumbPushPopToken]
+
+    def set_user_patterns(self, tokens):
+        mask = 0
+        for n in register_numbers(self.regs):
+            mask |= 1 << self.bit_pos(n)
+        tokens.set_field("reg_list", mask)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        mask = tokens.get_field("reg_list")
+        registers = registers_low + (cls.high_register,)
+        regs = RegisterSet(
+            r for i, r in enumerate(registers) if mask & (1 << i)
+        )
+        return {cls.regs: regs}
+
+
+class Push(PushPopBase):
+    syntax = Syntax(["push", " ", PushPopBase.regs])
+    patterns = {"opcode": 0x5A}
+    bit_pos = staticmethod(push_bit_pos)
+    high_register = LR
 
     def __repr__(self):
         return "Push {{{}}}".format(self.regs)
 
-    def encode(self):
-        tokens = self.get_tokens()
-        for n in register_numbers(self.regs):
-            tokens[0][push_bit_pos(n)] = 1
-        tokens[0][9:16] = 0x5A
-        return tokens[0].encode()
-
 
 def register_numbers(regs):
     for r in regs:
         yield r.num
 
 
-class Pop(ThumbInstruction):
-    regs = Operand("regs", set)
-    syntax = Syntax(["pop", " ", regs])
+class Pop(PushPopBase):
+    syntax = Syntax(["pop", " ", PushPopBase.regs])
+    patterns = {"opcode": 0x5E}
+    bit_pos = staticmethod(pop_bit_pos)
+    high_register = PC
 
     def __repr__(self):
         return "Pop {{{}}}".format(self.regs)
 
-    def encode(self):
-        tokens = self.get_tokens()
-        for n in register_numbers(self.regs):
-            tokens[0][pop_bit_pos(n)] = 1
-        tokens[0][9:16] = 0x5E
-        return tokens[0].encode()
-
 
 class Yield(ThumbInstruction):
+    tokens = [ThumbHintToken]
     syntax = Syntax(["yield"])
-
-    def encode(self):
-        return u16(0xBF10)
+    patterns = {"opcode": 0xBF, "op_a": 1, "op_b": 0}
 
 
 class addspsp_base(ThumbInstruction):
     """ add/sub SP with imm7 << 2 """
 
     imm7 = Operand("imm7", int)
-
-    def encode(self):
-        assert self.imm7 < 512
-        assert self.imm7 % 4 == 0
-        return u16((self.opcode << 7) | self.imm7 >> 2)
+    tokens = [ThumbSpToken]
 
 
 class AddSp(addspsp_base):
     syntax = Syntax(
         ["add", " ", "sp", ",", " ", "sp", ",", " ", addspsp_base.imm7]
     )
-    opcode = 0b101100000
+    patterns = {"opcode": 0b101100000, "imm7": Shift2(addspsp_base.imm7)}
 
 
 class SubSp(addspsp_base):
     syntax = Syntax(
         ["sub", " ", "sp", ",", " ", "sp", ",", " ", addspsp_base.imm7]
     )
-    opcode = 0b101100001
+    patterns = {"opcode": 0b101100001, "imm7": Shift2(addspsp_base.imm7)}
 
 
 # instruction selector:
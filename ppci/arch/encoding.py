@@ -2,6 +2,7 @@
 
 
 import abc
+import importlib
 from .registers import Register
 from .token import TokenSequence
 
@@ -133,6 +134,15 @@ class Constructor:
     syntax = None
     patterns = ()
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _register_constructor_class(cls)
+
+    def __reduce__(self):
+        # Many constructor classes are created by factory functions, and
+        # cannot be found back by name. Pickle them by registry key:
+        return (_restore_constructor, (self._class_key,), self.__dict__)
+
     def __init__(self, *args, **kwargs):
         # Generate constructor from args:
         if self.syntax:
@@ -194,6 +204,17 @@ class Constructor:
         """ This is the place for custom patterns """
         pass
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        """ Get the operands set by set_user_patterns from tokens.
+
+        This is the inverse of set_user_patterns, and is used to decode
+        a constructor with custom patterns. Returns a dict from operand
+        to value. Raise a ValueError when the tokens do not hold this
+        constructor.
+        """
+        return {}
+
     @classmethod
     def from_tokens(cls, tokens):
         """ Create this constructor from tokens """
@@ -211,20 +232,20 @@ class Constructor:
                 prop_map[pattern.prop.source] = pattern.prop.from_value(v)
             else:  # pragma: no cover
                 raise NotImplementedError(pattern)
+        prop_map.update(cls.get_user_patterns(tokens))
 
-        # Create constructors:
+        # Create constructors, using the first option which fits:
         fargs = cls.syntax.formal_arguments
         for farg in fargs:
             if isinstance(farg._cls, tuple):
-                options = farg._cls
-
-                for sub_con in options:
+                for sub_con in farg._cls:
                     try:
-                        c = sub_con.from_tokens(tokens)
-                        print(c)
-                        prop_map[farg] = c
-                    except ValueError as e:
-                        print(e)
+                        prop_map[farg] = sub_con.from_tokens(tokens)
+                    except (ValueError, TypeError, KeyError):
+                        continue
+                    break
+                else:
+                    raise ValueError("Cannot decode {}".format(farg))
 
         # Instantiate:
         init_args = [prop_map[a] for a in fargs]
@@ -270,6 +291,28 @@ class Constructor:
         return []
 
 
+# Registry of all constructor classes, keyed by module and name. Since
+# factory functions create several classes with the same name, the
+# order of creation within a module is part of the key.
+_constructor_classes = {}
+
+
+def _register_constructor_class(cls):
+    key = (cls.__module__, cls.__qualname__)
+    classes = _constructor_classes.setdefault(key, [])
+    cls._class_key = key + (len(classes),)
+    classes.append(cls)
+
+
+def _restore_constructor(class_key):
+    """ Create an empty constructor of the class with the given key """
+    module, name, index = class_key
+    if (module, name) not in _constructor_classes:
+        importlib.import_module(module)
+    cls = _constructor_classes[(module, name)][index]
+    return cls.__new__(cls)
+
+
 class InsMeta(type):
     """ Meta class to register an instruction within an isa class. """
 
@@ -440,10 +483,20 @@ class Instruction(Constructor, metaclass=InsMeta):
     def sizes(cls):
         """ Get possible encoding sizes in bytes """
         if hasattr(cls, "tokens"):
-            return [sum(t.size for t in cls.tokens) // 8]
+            return [sum(t.Info.size for t in cls.tokens) // 8]
         else:
             return []
 
+    @classmethod
+    def leading_tokens(cls, size):
+        """ Get the token types at the start of an encoding of some size.
+
+        The disassembler looks up an instruction by the fixed fields in
+        these tokens. Instructions with several sizes override this,
+        together with sizes, encode and decode.
+        """
+        return cls.tokens
+
     def relocations(self):
         """ Determine the total set of relocations for this instruction """
         relocs = []
@@ -588,6 +641,27 @@ class VariablePattern(BitPattern):
         return self.prop.get_value(objref)
 
 
+def relative_target(offset):
+    """ Name the target at an offset from a decoded jump or branch.
+
+    Decoded instructions have no labels, so their jump targets are
+    named relative to the instruction, for example '.-8'.
+    """
+    return ".{:+d}".format(offset)
+
+
+def target_offset(target):
+    """ Get the offset of a target named by relative_target.
+
+    Returns None when the target is a label.
+    """
+    if target.startswith("."):
+        try:
+            return int(target[1:])
+        except ValueError:
+            pass
+
+
 class Relocation:
     """ Baseclass for all relocation types.
 
@@ -89,7 +89,7 @@ class Or1kArch(Architecture):
 
         # setup frame pointer:
         yield instructions.Addi(
-            registers.r2, registers.r1, instructions.Immediate(0)
+            registers.r2, registers.r1, instructions.SignedImmediate(0)
         )
 
         # Save link register:
@@ -107,7 +107,9 @@ class Or1kArch(Architecture):
         # Adjust stack
         stack_size = 8 + frame.stacksize + len(frame.used_regs) * 4
         yield instructions.Addi(
-            registers.r1, registers.r1, instructions.Immediate(-stack_size)
+            registers.r1,
+            registers.r1,
+            instructions.SignedImmediate(-stack_size),
         )
 
     def gen_epilogue(self, frame):
@@ -4,8 +4,9 @@ from .isa import orbis32, Orbis32Token, Orbis32StoreToken
 from .isa import Orbis32ShiftImmediateToken
 from .registers import Or1kRegister
 from ..encoding import Instruction, Syntax, Operand, Constructor
-from ..encoding import Relocation
+from ..encoding import Relocation, relative_target, target_offset
 from ..stack import StackLocation
+from ...utils.bitfun import sign_extend
 from . import registers
 
 
@@ -120,13 +121,24 @@ class Immediate(Constructor):
     patterns = {"imm": imm}
 
 
+class SignedImmediate(Immediate):
+    """ Immediate which is sign extended by the instruction """
+
+    patterns = {"offset": Immediate.imm}
+
+
 immediates = (HighAddressImmediate, LowAddressImmediate, Immediate)
+signed_immediates = (
+    HighAddressImmediate,
+    LowAddressImmediate,
+    SignedImmediate,
+)
 
 
-def regregimm(mnemonic, opcode):
+def regregimm(mnemonic, opcode, signed=False):
     rd = Operand("rd", Or1kRegister, write=True)
     ra = Operand("ra", Or1kRegister, read=True)
-    imm = Operand("imm", immediates)
+    imm = Operand("imm", signed_immediates if signed else immediates)
     syntax = Syntax(["l", ".", mnemonic, " ", rd, ",", " ", ra, ",", " ", imm])
     patterns = {"opcode": opcode, "rd": rd, "ra": ra}
     members = {
@@ -152,8 +164,19 @@ def regb(mnemonic, opcode):
 class JumpInstruction(Orbis32Instruction):
     label = Operand("label", str)
 
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.label)
+        if offset is not None:
+            tokens.set_field("n", offset // 4)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        offset = sign_extend(tokens.get_field("n"), 26) * 4
+        return {cls.label: relative_target(offset)}
+
     def relocations(self):
-        yield JumpRelocation(self.label)
+        if target_offset(self.label) is None:
+            yield JumpRelocation(self.label)
 
 
 def jump(mnemonic, opcode):
@@ -178,7 +201,7 @@ def load(mnemonic, opcode):
     ra = Operand("ra", Or1kRegister, read=True)
     imm = Operand("imm", int)
     syntax = Syntax(["l", ".", mnemonic, " ", rd, ",", " ", imm, "(", ra, ")"])
-    patterns = {"opcode": opcode, "rd": rd, "ra": ra, "imm": imm}
+    patterns = {"opcode": opcode, "rd": rd, "ra": ra, "offset": imm}
     members = {
         "rd": rd,
         "ra": ra,
@@ -248,8 +271,8 @@ def setflag(mnemonic, opcode):
 # Instructions:
 Add = regregreg("add", 0b111000, 0b0000000)
 Addc = regregreg("addc", 0b111000, 0b0000001)
-Addi = regregimm("addi", 0b100111)
-Addic = regregimm("addic", 0b101000)
+Addi = regregimm("addi", 0b100111, signed=True)
+Addic = regregimm("addic", 0b101000, signed=True)
 And = regregreg("and", 0b111000, 0b0000011)
 Andi = regregimm("andi", 0b101001)
 Bf = jump("bf", 0b000100)
@@ -328,12 +351,12 @@ Sub = regregreg("sub", 0b111000, 0b0000010)
 Sw = store("sw", 0b110101)
 Swa = store("swa", 0b110011)
 Xor = regregreg("xor", 0b111000, 0b0000101)
-Xori = regregimm("xori", 0b101011)
+Xori = regregimm("xori", 0b101011, signed=True)
 
 
 # Helpers:
 def mov(dst, src):
-    return Addi(dst, src, Immediate(0), ismove=True)
+    return Addi(dst, src, SignedImmediate(0), ismove=True)
 
 
 # Arithmatic patterns:
@@ -573,7 +596,7 @@ def pattern_mem_fprel(context, tree):
 def pattern_mem_to_reg(context, tree, c0):
     reg, offset = c0
     d = context.new_reg(Or1kRegister)
-    context.emit(Addi(d, reg, Immediate(offset)))
+    context.emit(Addi(d, reg, SignedImmediate(offset)))
     return d
 
 
@@ -22,10 +22,11 @@ class Orbis32Token(Orbis32BaseToken):
     imm = bit_range(0, 16)
     n = bit_range(0, 26)
     k = bit_range(0, 16)
+    offset = bit_range(0, 16, signed=True)
 
 
 class Orbis32StoreToken(Orbis32BaseToken):
-    imm = bit_range(21, 26) + bit_range(0, 11)
+    imm = bit_range(21, 26, signed=True) + bit_range(0, 11)
 
 
 class Orbis32ShiftImmediateToken(Orbis32BaseToken):
@@ -1,3 +1,6 @@
+import zlib
+
+
 class Register:
     """ Baseclass of all registers types """
 
@@ -22,10 +25,28 @@ class Register:
 
         self._num = num
 
+        # Use a hash value which does not depend on the memory address of
+        # the register, so that code generation is reproducible:
+        self._hash = zlib.crc32(name.encode("utf8"))
+
         # If this register interferes with another register:
         self.aliases = aliases
         self.aka = aka
 
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # Real registers are singletons, keep them that way when pickling:
+        if self._num is not None:
+            try:
+                register = self.from_num(self._num)
+            except (NotImplementedError, KeyError, IndexError):
+                register = None
+            if register is self:
+                return (type(self).from_num, (self._num,))
+        return super().__reduce__()
+
     def __repr__(self):
         if self._num is None:
             if self.is_colored:
@@ -3,8 +3,9 @@
 # pylint: disable=no-member,invalid-name
 from ..isa import Isa
 from ..encoding import Instruction, Syntax, Operand
+from ..encoding import relative_target, target_offset
 from ..data_instructions import Dd
-from ...utils.bitfun import inrange
+from ...utils.bitfun import inrange, sign_extend
 from ..generic_instructions import ArtificialInstruction, Alignment
 from ..generic_instructions import SectionInstruction
 from ..generic_instructions import RegisterUseDef, Global
@@ -24,7 +25,7 @@ from .relocations import BImm12Relocation, BImm20Relocation
 from .relocations import Abs32Imm20Relocation
 from .relocations import Abs32Imm12Relocation, RelImm20Relocation
 from .relocations import RelImm12Relocation
-from .tokens import RiscvToken, RiscvIToken
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken, RiscvSBToken
 import struct
 
 isa = Isa()
@@ -225,15 +226,16 @@ Srai = make_si("srai", 0b0100000, 0b101)
 
 
 class IBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        self.offset = self.offset & 0xFFF
-        tokens[0][20:32] = self.offset
-        return tokens[0].encode()
+    """ Base of instructions with a 12 bit signed offset """
+
+    tokens = [RiscvIToken]
+
+    def set_user_patterns(self, tokens):
+        tokens.set_field("imm", self.offset & 0xFFF)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.offset: sign_extend(tokens.get_field("imm"), 12)}
 
 
 def make_i(mnemonic, func):
@@ -243,8 +245,10 @@ def make_i(mnemonic, func):
     offset = Operand("offset", int)
     fprel = False
     syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", offset])
+    patterns = {"opcode": 0b0010011, "rd": rd, "funct3": func, "rs1": rs1}
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "fprel": fprel,
         "rd": rd,
@@ -277,22 +281,25 @@ class Nop(RiscvInstruction):
     }
 
 
-class SmBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1110011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0b010
-        tokens[0][15:20] = 0
-        tokens[0][20:32] = self.code
-        return tokens[0].encode()
-
-
 def make_sm(mnemonic, code):
     rd = Operand("rd", RiscvRegister, write=True)
     syntax = Syntax([mnemonic, " ", rd])
-    members = {"syntax": syntax, "rd": rd, "code": code}
-    return type(mnemonic + "_ins", (SmBase,), members)
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b1110011,
+        "rd": rd,
+        "funct3": 0b010,
+        "rs1": 0,
+        "imm": code,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": tokens,
+        "patterns": patterns,
+        "rd": rd,
+        "code": code,
+    }
+    return type(mnemonic + "_ins", (RiscvInstruction,), members)
 
 
 Rdcyclei = make_sm("rdcycle", 0b110000000000)
@@ -315,63 +322,72 @@ class Ebreak(RiscvInstruction):
     }
 
 
-class Bl(RiscvInstruction):
+class JalBase(RiscvInstruction):
+    """ Jump to a label, or to an offset when decoded """
+
     target = Operand("target", str)
-    rd = Operand("rd", RiscvRegister, write=True)
-    syntax = Syntax(["jal", " ", rd, ",", " ", target])
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1101111
-        tokens[0][7:12] = self.rd.num
-        return tokens[0].encode()
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            imm = offset >> 1
+            tokens[0][21:31] = imm & 0x3FF
+            tokens[0][20:21] = (imm >> 10) & 0x1
+            tokens[0][12:20] = (imm >> 11) & 0xFF
+            tokens[0][31:32] = (imm >> 19) & 0x1
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        token = tokens[0]
+        imm = (
+            token[21:31]
+            | (token[20:21] << 10)
+            | (token[12:20] << 11)
+            | (token[31:32] << 19)
+        )
+        return {cls.target: relative_target(sign_extend(imm, 20) * 2)}
 
     def relocations(self):
-        return [BImm20Relocation(self.target)]
+        if target_offset(self.target) is None:
+            return [BImm20Relocation(self.target)]
+        return []
 
 
-class B(RiscvInstruction):
-    target = Operand("target", str)
-    syntax = Syntax(["j", " ", target])
+class Bl(JalBase):
+    rd = Operand("rd", RiscvRegister, write=True)
+    syntax = Syntax(["jal", " ", rd, ",", " ", JalBase.target])
+    patterns = {"opcode": 0b1101111, "rd": rd}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1101111
-        tokens[0][7:12] = 0
-        return tokens[0].encode()
 
-    def relocations(self):
-        return [BImm20Relocation(self.target)]
+class B(JalBase):
+    syntax = Syntax(["j", " ", JalBase.target])
+    patterns = {"opcode": 0b1101111, "rd": 0}
 
 
-class Blr(RiscvInstruction):
+class Blr(IBase):
     rd = Operand("rd", RiscvRegister, write=True)
     rs1 = Operand("rs1", RiscvRegister, read=True)
     offset = Operand("offset", int)
     syntax = Syntax(["jalr", " ", rd, ",", rs1, ",", " ", offset])
+    patterns = {"opcode": 0b1100111, "rd": rd, "funct3": 0, "rs1": rs1}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1100111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:32] = self.offset
-        return tokens[0].encode()
 
+class UBase(RiscvInstruction):
+    """ Base of instructions with a 20 bit upper immediate """
+
+    def set_user_patterns(self, tokens):
+        tokens[0][12:32] = self.imm & 0xFFFFF
 
-class Lui(RiscvInstruction):
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.imm: tokens[0][12:32]}
+
+
+class Lui(UBase):
     rd = Operand("rd", RiscvRegister, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["lui", " ", rd, ",", " ", imm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        imm20 = self.imm & 0xFFFFF
-        tokens[0][0:7] = 0b0110111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:32] = imm20
-        return tokens[0].encode()
+    patterns = {"opcode": 0b0110111, "rd": rd}
 
 
 class Adru(RiscvInstruction):
@@ -465,17 +481,11 @@ class Adrlrel(RiscvInstruction):
         return [RelImm12Relocation(self.label)]
 
 
-class Auipc(RiscvInstruction):
+class Auipc(UBase):
     rd = Operand("rd", RiscvRegister, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["auipc", " ", rd, ",", " ", imm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:32] = self.imm
-        return tokens[0].encode()
+    patterns = {"opcode": 0b0010111, "rd": rd}
 
 
 class Labelrel(PseudoRiscvInstruction):
@@ -516,22 +526,25 @@ class Li(PseudoRiscvInstruction):
 
 
 class BranchBase(RiscvInstruction):
+    """ Branch to a label, or to an offset when decoded """
+
     target = Operand("target", str)
+    tokens = [RiscvSBToken]
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1100011
-        tokens[0][12:15] = self.cond
-        if self.invert:
-            tokens[0][15:20] = self.rm.num
-            tokens[0][20:25] = self.rn.num
-        else:
-            tokens[0][15:20] = self.rn.num
-            tokens[0][20:25] = self.rm.num
-        return tokens[0].encode()
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            tokens.set_field("imm", offset >> 1)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        offset = sign_extend(tokens.get_field("imm"), 12) * 2
+        return {cls.target: relative_target(offset)}
 
     def relocations(self):
-        return [BImm12Relocation(self.target)]
+        if target_offset(self.target) is None:
+            return [BImm12Relocation(self.target)]
+        return []
 
 
 def make_branch(mnemonic, cond, invert):
@@ -539,9 +552,15 @@ def make_branch(mnemonic, cond, invert):
     rn = Operand("rn", RiscvRegister, read=True)
     rm = Operand("rm", RiscvRegister, read=True)
     syntax = Syntax([mnemonic, " ", rn, ",", " ", rm, ",", " ", target])
+    if invert:
+        patterns = {"rs1": rm, "rs2": rn}
+    else:
+        patterns = {"rs1": rn, "rs2": rm}
+    patterns.update({"opcode": 0b1100011, "funct3": cond})
 
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "target": target,
         "rn": rn,
         "rm": rm,
@@ -570,18 +589,8 @@ def reg_list_to_mask(reg_list):
     return mask
 
 
-class StrBase(RiscvInstruction):
-    def encode(self):
-        imml5 = self.offset & 0x1F
-        immh7 = (self.offset >> 5) & 0x7F
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0100011
-        tokens[0][7:12] = imml5
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:25] = self.rs2.num
-        tokens[0][25:32] = immh7
-        return tokens[0].encode()
+class StrBase(IBase):
+    tokens = [RiscvSToken]
 
 
 def make_str(mnemonic, func):
@@ -590,8 +599,10 @@ def make_str(mnemonic, func):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     fprel = False
     syntax = Syntax([mnemonic, " ", rs2, ",", " ", offset, "(", rs1, ")"])
+    patterns = {"opcode": 0b0100011, "funct3": func, "rs1": rs1, "rs2": rs2}
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "fprel": fprel,
         "offset": offset,
@@ -612,24 +623,16 @@ def make_ldr(mnemonic, func):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     fprel = False
     syntax = Syntax([mnemonic, " ", rd, ",", " ", offset, "(", rs1, ")"])
-    tokens = [RiscvIToken]
-    patterns = {
-        "opcode": 0b0000011,
-        "rd": rd,
-        "funct3": func,
-        "rs1": rs1,
-        "imm": offset,
-    }
+    patterns = {"opcode": 0b0000011, "rd": rd, "funct3": func, "rs1": rs1}
     members = {
         "syntax": syntax,
-        "tokens": tokens,
         "patterns": patterns,
         "fprel": fprel,
         "offset": offset,
         "rd": rd,
         "rs1": rs1,
     }
-    return type(mnemonic.title(), (RiscvInstruction,), members)
+    return type(mnemonic.title(), (IBase,), members)
 
 
 Lb = make_ldr("lb", 0b000)
@@ -639,31 +642,28 @@ Lbu = make_ldr("lbu", 0b100)
 Lhu = make_ldr("lhu", 0b101)
 
 
-class MextBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0110011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:25] = self.rs2.num
-        tokens[0][25:32] = 0b0000001
-        return tokens[0].encode()
-
-
 def make_mext(mnemonic, func):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     rs2 = Operand("rs2", RiscvRegister, read=True)
     rd = Operand("rd", RiscvRegister, write=True)
     syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", rs2])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": rs2,
+        "funct7": 0b0000001,
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "rd": rd,
         "rs1": rs1,
         "rs2": rs2,
     }
-    return type(mnemonic + "_ins", (MextBase,), members)
+    return type(mnemonic + "_ins", (RiscvInstruction,), members)
 
 
 Mul = make_mext("mul", 0b000)
@@ -123,7 +123,7 @@ class Frame:
 
     def live_ranges(self, vreg):
         """ Determine the live range of some register """
-        return self.cfg._live_ranges[vreg]
+        return self.cfg.live_ranges.get(vreg, [])
 
     def new_reg(self, cls, twain=""):
         """ Retrieve a new virtual register """
@@ -1,5 +1,6 @@
 import struct
 from .arch_info import Endianness
+from ..utils.bitfun import sign_extend
 
 
 def u16(h):
@@ -44,9 +45,14 @@ class _p2(property):
 
 
 def bit_range(b, e, signed=False):
-    """ Create a property which sets a bit range """
+    """ Create a property which sets a bit range.
+
+    The value of a signed bit range is sign extended when read.
+    """
 
     def getter(s):
+        if signed:
+            return sign_extend(s[b:e], e - b)
         return s[b:e]
 
     def setter(s, v):
@@ -63,11 +69,16 @@ def bit(b):
 def bit_concat(*partials):
     """ Group several fields together into a single usable field """
 
+    bitsize = sum(at._bitsize for at in partials)
+    signed = partials[0]._signed
+
     def getter(s):
         v = 0
         for at in partials:
             v = v << at._bitsize
             v = v | (at.__get__(s) & at._mask)
+        if signed:
+            v = sign_extend(v, bitsize)
         return v
 
     def setter(s, v):
@@ -75,8 +86,6 @@ def bit_concat(*partials):
             at.__set__(s, v & at._mask)
             v = v >> at._bitsize
 
-    bitsize = sum(at._bitsize for at in partials)
-    signed = partials[0]._signed
     return _p2(getter, setter, bitsize, signed)
 
 
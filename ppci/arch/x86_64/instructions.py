@@ -6,9 +6,10 @@ See for a reference: http://ref.x86asm.net/coder64.html
 from ..generic_instructions import Label, RegisterUseDef
 from ..isa import Isa
 from ..encoding import Instruction, Operand, Syntax, Constructor, Relocation
+from ..encoding import relative_target, target_offset
 from .. import effects
-from ...utils.bitfun import wrap_negative
-from ..token import Token, u8, u16, u32, u64, bit_range, bit
+from ...utils.bitfun import wrap_negative, sign_extend
+from ..token import Token, TokenSequence, u64, bit_range, bit
 from .registers import rcx, al, cl, rax, rdx, rbp, eax, edx, ecx, cx, dx
 from .registers import rsp, ax, Register32
 from .registers import Register64, Register16, Register8
@@ -62,6 +63,16 @@ class SecondaryOpcodeToken(Token):
     opcode2 = bit_range(0, 8)
 
 
+class RegOpcodeToken(Token):
+    """ Primary opcode with a register in the lowest three bits """
+
+    class Info:
+        size = 8
+
+    opcode = bit_range(3, 8)
+    reg = bit_range(0, 3)
+
+
 class ModRmToken(Token):
     """ Construct the modrm byte from its components """
 
@@ -121,6 +132,13 @@ class RexOpcodeRmToken(Token):
     w = bit(1)
 
 
+class Imm16Token(Token):
+    class Info:
+        size = 16
+
+    disp16 = bit_range(0, 16)
+
+
 class Imm32Token(Token):
     class Info:
         size = 32
@@ -179,6 +197,12 @@ class Abs64Relocation(Relocation):
         return wrap_negative(sym_value, 64)
 
 
+def decode_register(operand, tokens, rex_field, field):
+    """ Decode a register operand from a rex bit and three register bits """
+    num = (tokens.get_field(rex_field) << 3) | tokens.get_field(field)
+    return operand.from_value(num)
+
+
 # Actual instructions:
 class X86Instruction(Instruction):
     """ Base instruction for all x86 instructions """
@@ -187,30 +211,48 @@ class X86Instruction(Instruction):
     isa = isa
 
 
-class NearJump(X86Instruction):
-    """ jmp imm32 """
+class RelJumpBase(X86Instruction):
+    """ Jump or call to a label, or to an offset when decoded.
+
+    The 32 bit displacement at the end of the instruction is relative to
+    the next instruction.
+    """
 
     target = Operand("target", str)
-    syntax = Syntax(["jmp", " ", target])
-    tokens = [OpcodeToken, Imm32Token]
-    patterns = {"opcode": 0xE9}
+
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            tokens.set_field("disp32", offset - self.sizes()[0])
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        offset = sign_extend(tokens.get_field("disp32"), 32) + cls.sizes()[0]
+        return {cls.target: relative_target(offset)}
 
     def relocations(self):
-        return [Rel32JmpRelocation(self.target, offset=1, addend=-4)]
+        if target_offset(self.target) is None:
+            offset = self.sizes()[0] - 4
+            return [Rel32JmpRelocation(self.target, offset=offset, addend=-4)]
+        return []
+
+
+class NearJump(RelJumpBase):
+    """ jmp imm32 """
+
+    syntax = Syntax(["jmp", " ", RelJumpBase.target])
+    tokens = [OpcodeToken, Imm32Token]
+    patterns = {"opcode": 0xE9}
 
     def effect(self):
         return [effects.Assign(effects.PC, self.target)]
 
 
-class ConditionalJump(X86Instruction):
+class ConditionalJump(RelJumpBase):
     """ j?? imm32 """
 
-    target = Operand("target", str)
     tokens = [PrefixToken, OpcodeToken, Imm32Token]
 
-    def relocations(self):
-        return [Rel32JmpRelocation(self.target, offset=2, addend=-4)]
-
 
 def make_cjump(mnemonic, opcode):
     syntax = Syntax([mnemonic, " ", ConditionalJump.target])
@@ -241,36 +283,75 @@ class ShortJump(X86Instruction):
     syntax = Syntax(["jmpshort", target])
     patterns = {"opcode": 0xEB}
 
+    def set_user_patterns(self, tokens):
+        offset = target_offset(self.target)
+        if offset is not None:
+            tokens.set_field("disp8", offset - 2)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.target: relative_target(tokens.get_field("disp8") + 2)}
+
     def relocations(self):
-        return [Jmp8Relocation(self.target, offset=1)]
+        if target_offset(self.target) is None:
+            return [Jmp8Relocation(self.target, offset=1)]
+        return []
+
 
+class RegOpcodeBase(X86Instruction):
+    """ Base of instructions with the register in the opcode """
+
+    def set_user_patterns(self, tokens):
+        tokens.set_field("b", self.reg.rexbit)
+        tokens.set_field("reg", self.reg.regbits)
 
-class Push(X86Instruction):
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg: decode_register(cls.reg, tokens, "b", "reg")}
+
+
+class PushPopBase(RegOpcodeBase):
+    """ Push or pop, of which the rex prefix is only encoded for the
+    high registers.
+    """
+
+    tokens = [RexToken, RegOpcodeToken]
+
+    def encode(self):
+        data = super().encode()
+        if self.reg.rexbit == 0:
+            data = data[1:]
+        return data
+
+    @classmethod
+    def decode(cls, data):
+        if len(data) == 1:
+            data = RexToken().encode() + data
+        return super().decode(data)
+
+    @classmethod
+    def sizes(cls):
+        return [1, 2]
+
+    @classmethod
+    def leading_tokens(cls, size):
+        return cls.tokens[-size:]
+
+
+class Push(PushPopBase):
     """ Push a register onto the stack """
 
     reg = Operand("reg", Register64, read=True)
     syntax = Syntax(["push", " ", reg])
+    patterns = {"opcode": 0x50 >> 3}
 
-    def encode(self):
-        code = []
-        if self.reg.rexbit == 1:
-            code.append(0x41)
-        code.append(0x50 + self.reg.regbits)
-        return bytes(code)
 
-
-class Pop(X86Instruction):
+class Pop(PushPopBase):
     """ Pop a register of the stack """
 
     reg = Operand("reg", Register64, write=True)
     syntax = Syntax(["pop", " ", reg])
-
-    def encode(self):
-        code = []
-        if self.reg.rexbit == 1:
-            code.append(0x41)
-        code.append(0x58 + self.reg.regbits)
-        return bytes(code)
+    patterns = {"opcode": 0x58 >> 3}
 
 
 class Int(X86Instruction):
@@ -286,28 +367,24 @@ class CallReg(X86Instruction):
     reg = Operand("reg", Register64, read=True)
     syntax = Syntax(["call", " ", "*", reg])
     tokens = [RexToken, OpcodeToken, ModRmToken]
+    patterns = {"opcode": 0xFF, "mod": 3, "reg": 2}  # 0xFF /2 == call r/m64
 
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].b = self.reg.rexbit
-        tokens[1][0:8] = 0xFF  # 0xFF /2 == call r/m64
-        tokens[2].mod = 3
-        tokens[2].reg = 2
-        tokens[2].rm = self.reg.regbits
-        return tokens.encode()
+    def set_user_patterns(self, tokens):
+        tokens.set_field("b", self.reg.rexbit)
+        tokens.set_field("rm", self.reg.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg: decode_register(cls.reg, tokens, "b", "rm")}
 
-class Call(X86Instruction):
+
+class Call(RelJumpBase):
     """ call a function """
 
-    target = Operand("target", str)
-    syntax = Syntax(["call", " ", target])
+    syntax = Syntax(["call", " ", RelJumpBase.target])
     tokens = [OpcodeToken, Imm32Token]
     patterns = {"opcode": 0xE8}
 
-    def relocations(self):
-        return [Rel32JmpRelocation(self.target, offset=1, addend=-4)]
-
 
 class Ret(X86Instruction):
     syntax = Syntax(["ret"])
@@ -327,13 +404,13 @@ class Inc(X86Instruction):
     tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"w": 1, "opcode": 0xFF, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        # TODO: figure good way for this so that it is in patterns also:
+    def set_user_patterns(self, tokens):
         tokens.set_field("b", self.reg.rexbit)
         tokens.set_field("rm", self.reg.regbits)
-        return tokens.encode()
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg: decode_register(cls.reg, tokens, "b", "rm")}
 
 
 class RmMem(Constructor):
@@ -364,6 +441,17 @@ class RmMem(Constructor):
             tokens.set_field("b", self.reg.rexbit)
             tokens.set_field("rm", self.reg.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        reg = decode_base_register(cls.reg, tokens)
+        mod = tokens.get_field("mod")
+        if reg.regbits == 5:
+            if mod != 1 or tokens.get_field("disp8") != 0:
+                raise ValueError("Cannot decode {}".format(cls))
+        elif mod != 0:
+            raise ValueError("Cannot decode {}".format(cls))
+        return {cls.reg: reg}
+
 
 class RmMemDisp(Constructor):
     """ register with 8 bit displacement """
@@ -393,6 +481,17 @@ class RmMemDisp(Constructor):
             tokens.set_field("b", self.reg.rexbit)
             tokens.set_field("rm", self.reg.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        mod = tokens.get_field("mod")
+        if mod == 1:
+            disp = tokens.get_field("disp8")
+        elif mod == 2:
+            disp = sign_extend(tokens.get_field("disp32"), 32)
+        else:
+            raise ValueError("Cannot decode {}".format(cls))
+        return {cls.reg: decode_base_register(cls.reg, tokens), cls.disp: disp}
+
 
 class RmMemDisp2(Constructor):
     """ memory access with base, index and displacement """
@@ -415,6 +514,14 @@ class RmMemDisp2(Constructor):
         tokens.set_field("base", self.regb.regbits)
         tokens.set_field("disp8", self.disp)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {
+            cls.regb: decode_register(cls.regb, tokens, "b", "base"),
+            cls.regi: decode_register(cls.regi, tokens, "x", "index"),
+            cls.disp: tokens.get_field("disp8"),
+        }
+
 
 class RmRip(Constructor):
     """ rip with 32 bit displacement special case """
@@ -426,6 +533,10 @@ class RmRip(Constructor):
     def set_user_patterns(self, tokens):
         tokens.set_field("disp32", self.disp)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.disp: sign_extend(tokens.get_field("disp32"), 32)}
+
 
 class RmAbsLabel(Constructor):
     """ absolute address access """
@@ -442,9 +553,6 @@ class RmAbsLabel(Constructor):
         "base": 5,
     }
 
-    def set_user_patterns(self, tokens):
-        pass
-
     def gen_relocations(self):
         # TODO: this offset is from the end of all possible tokens..
         yield Abs32Relocation(self.label, offset=-5)
@@ -460,6 +568,10 @@ class RmAbs(Constructor):
     def set_user_patterns(self, tokens):
         tokens.set_field("disp32", self.address)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.address: tokens.get_field("disp32")}
+
 
 class RmReg64(Constructor):
     """ Register access, this case is relatively easy """
@@ -472,6 +584,10 @@ class RmReg64(Constructor):
         tokens.set_field("b", self.reg_rm.rexbit)
         tokens.set_field("rm", self.reg_rm.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg_rm: decode_register(cls.reg_rm, tokens, "b", "rm")}
+
 
 class RmReg32(Constructor):
     """ Register access, this case is relatively easy """
@@ -484,6 +600,10 @@ class RmReg32(Constructor):
         tokens.set_field("b", self.reg_rm.rexbit)
         tokens.set_field("rm", self.reg_rm.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg_rm: decode_register(cls.reg_rm, tokens, "b", "rm")}
+
 
 class RmReg16(Constructor):
     """ Short register access """
@@ -495,6 +615,10 @@ class RmReg16(Constructor):
     def set_user_patterns(self, tokens):
         tokens.set_field("rm", self.reg_rm.num)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg_rm: cls.reg_rm.from_value(tokens.get_field("rm"))}
+
 
 class RmReg8(Constructor):
     """ Low register access """
@@ -507,6 +631,10 @@ class RmReg8(Constructor):
         tokens.set_field("b", self.reg_rm.rexbit)
         tokens.set_field("rm", self.reg_rm.regbits)
 
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg_rm: decode_register(cls.reg_rm, tokens, "b", "rm")}
+
 
 mem_modes = (RmMem, RmMemDisp, RmMemDisp2)
 rm64_modes = mem_modes + (RmReg64, RmRip, RmAbsLabel, RmAbs)
@@ -515,74 +643,82 @@ rm16_modes = mem_modes + (RmReg16,)
 rm32_modes = mem_modes + (RmReg32,)
 
 
-class rmregbase64(X86Instruction):
-    """
-        Base class for legio instructions involving a register and a
-        register / memory location
-    """
-
-    tokens = [
-        RexToken,
-        OpcodeToken,
-        ModRmToken,
-        SibToken,
-        Imm8Token,
-        Imm32Token,
-    ]
-    patterns = {"w": 1}
-
-    def set_user_patterns(self, tokens):
-        tokens.set_field("r", self.reg.rexbit)
-        tokens.set_field("reg", self.reg.regbits)
-        tokens.set_field("opcode", self.opcode)
-
-    def encode(self):
-        # 1. Set patterns:
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-
-        # 2. Encode:
-        # Rex prefix:
-        r = tokens[0].encode()
-
-        # opcode:
-        r += tokens[1].encode()
-        if self.opcode == 0x0F:
-            tokens[1][0:8] = self.opcode2
-            r += tokens[1].encode()
-            tokens[1][0:8] = self.opcode
-
-        # rm byte:
-        r += tokens[2].encode()
-
-        # Encode sib byte:
-        if tokens[2].mod != 3 and tokens[2].rm == 4:
-            r += tokens[3].encode()
-
-        # Encode displacement bytes:
-        if tokens[2].mod == 1:
-            r += tokens[4].encode()
-        if tokens[2].mod == 2:
-            r += tokens[5].encode()
+def rm_tokens(tokens):
+    """ Select the tokens of an r/m instruction which are encoded.
 
+    The tokens up to the mod rm byte are always encoded. The mod rm byte
+    and the sib byte select the tokens which follow them. Tokens are
+    inspected after they are yielded, so this also selects the tokens
+    while they are decoded.
+    """
+    *head, modrm, sib, disp8, disp32 = tokens
+    yield from head
+    yield modrm
+
+    # Encode sib byte:
+    if modrm.mod != 3 and modrm.rm == 4:
+        yield sib
+
+    # Encode displacement bytes:
+    if modrm.mod == 1:
+        yield disp8
+    elif modrm.mod == 2:
+        yield disp32
+    elif modrm.mod == 0 and modrm.rm == 5:
         # Rip relative addressing mode with disp32
-        if tokens[2].mod == 0 and tokens[2].rm == 5:
-            r += tokens[5].encode()
+        yield disp32
+    elif modrm.mod == 0 and modrm.rm == 4 and sib.base == 5:
+        # sib byte and absolute address
+        yield disp32
 
-        # sib byte and ...
-        if tokens[2].mod == 0 and tokens[2].rm == 4:
-            if tokens[3].base == 5:
-                r += tokens[5].encode()
-        return r
 
+def decode_base_register(operand, tokens):
+    """ Decode the register of a memory access without index register """
+    if tokens.get_field("rm") == 4:
+        # A sib byte without index is used for rsp and r12:
+        sib = [tokens.get_field(f) for f in ("ss", "x", "index", "base")]
+        if sib != [0, 0, 4, 4]:
+            raise ValueError("Cannot decode sib byte {}".format(sib))
+        return decode_register(operand, tokens, "b", "base")
+    return decode_register(operand, tokens, "b", "rm")
 
-class RmBase(rmregbase64):
-    def set_user_patterns(self, tokens):
-        tokens.set_field("reg", self.reg)
-        tokens.set_field("opcode", self.opcode)
 
+class rmbase(X86Instruction):
+    """ Base class for instructions with a register / memory location.
 
-class rmregbase32(X86Instruction):
+    The mod rm byte selects if a sib byte and a displacement are
+    encoded, so these instructions have several sizes.
+    """
+
+    def encode(self):
+        tokens = self.get_tokens()
+        self.set_all_patterns(tokens)
+        return TokenSequence(list(rm_tokens(tokens))).encode()
+
+    @classmethod
+    def decode(cls, data):
+        tokens = TokenSequence([tok_cls() for tok_cls in cls.tokens])
+        offset = 0
+        for token in rm_tokens(tokens):
+            size = token.Info.size // 8
+            token.fill(data[offset : offset + size])
+            offset += size
+        if len(data) != offset:
+            raise ValueError("Incorrect amount of data provided")
+        return cls.from_tokens(tokens)
+
+    @classmethod
+    def sizes(cls):
+        size = sum(t.Info.size for t in cls.leading_tokens(None)) // 8
+        # Sib byte and 8 or 32 bit displacement:
+        return [size + extra for extra in (0, 1, 2, 4, 5)]
+
+    @classmethod
+    def leading_tokens(cls, size):
+        return cls.tokens[: cls.tokens.index(ModRmToken) + 1]
+
+
+class rmregbase64(rmbase):
     """
         Base class for legio instructions involving a register and a
         register / memory location
@@ -596,60 +732,41 @@ class rmregbase32(X86Instruction):
         Imm8Token,
         Imm32Token,
     ]
-    patterns = {"w": 0}  # Switch w=0 meaning -> 32 bits
+    patterns = {"w": 1}
 
     def set_user_patterns(self, tokens):
         tokens.set_field("r", self.reg.rexbit)
         tokens.set_field("reg", self.reg.regbits)
-        tokens.set_field("opcode", self.opcode)
 
-    def encode(self):
-        # 1. Set patterns:
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg: decode_register(cls.reg, tokens, "r", "reg")}
 
-        # 2. Encode:
-        # Rex prefix:
-        r = tokens[0].encode()
 
-        # opcode:
-        r += tokens[1].encode()
-        if self.opcode == 0x0F:
-            tokens[1][0:8] = self.opcode2
-            r += tokens[1].encode()
-            tokens[1][0:8] = self.opcode
+class RmBase(rmbase):
+    """ Base class for instructions with an opcode extension in reg """
 
-        # rm byte:
-        r += tokens[2].encode()
+    tokens = rmregbase64.tokens
+    patterns = {"w": 1}
 
-        # Encode sib byte:
-        if tokens[2].mod != 3 and tokens[2].rm == 4:
-            r += tokens[3].encode()
 
-        # Encode displacement bytes:
-        if tokens[2].mod == 1:
-            r += tokens[4].encode()
-        if tokens[2].mod == 2:
-            r += tokens[5].encode()
+class rmregbase32(rmregbase64):
+    """
+        Base class for legio instructions involving a register and a
+        register / memory location
+    """
 
-        # Rip relative addressing mode with disp32
-        if tokens[2].mod == 0 and tokens[2].rm == 5:
-            r += tokens[5].encode()
+    patterns = {"w": 0}  # Switch w=0 meaning -> 32 bits
 
-        # sib byte and ...
-        if tokens[2].mod == 0 and tokens[2].rm == 4:
-            if tokens[3].base == 5:
-                r += tokens[5].encode()
-        return r
 
+class RmBase32(rmbase):
+    """ Base class for 32 bit instructions with an opcode extension """
 
-class RmBase32(rmregbase32):
-    def set_user_patterns(self, tokens):
-        tokens.set_field("reg", self.reg)
-        tokens.set_field("opcode", self.opcode)
+    tokens = rmregbase32.tokens
+    patterns = {"w": 0}
 
 
-class rmregbase16(X86Instruction):
+class rmregbase16(rmbase):
     tokens = [
         PrefixToken,
         RexToken,
@@ -665,57 +782,24 @@ class rmregbase16(X86Instruction):
     def set_user_patterns(self, tokens):
         tokens.set_field("reg", self.reg.num)
 
-    def encode(self):
-        # 1. Set patterns:
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens.set_field("opcode", self.opcode)
-
-        # 2. Encode:
-        # prefixes:
-        r = tokens[0].encode()
-        r += tokens[1].encode()
-
-        # opcode:
-        r += tokens[2].encode()
-
-        # rm byte:
-        rm = tokens[3]
-        r += rm.encode()
-
-        # Encode sib byte:
-        sib = tokens[4]
-        if rm.mod != 3 and rm.rm == 4:
-            r += sib.encode()
-
-        # Encode displacement bytes:
-        if rm.mod == 1:
-            r += tokens[5].encode()
-        if rm.mod == 2:
-            r += tokens[6].encode()
-
-        # Rip relative addressing mode with disp32
-        if rm.mod == 0 and rm.rm == 5:
-            r += tokens[6].encode()
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg: cls.reg.from_value(tokens.get_field("reg"))}
 
-        # sib byte and ...
-        if rm.mod == 0 and rm.rm == 4:
-            if tokens[3].base == 5:
-                r += tokens[6].encode()
-        return r
 
+class RmBase16(rmbase):
+    """ Base class for 16 bit instructions with an opcode extension """
 
-class RmBase16(rmregbase16):
-    def set_user_patterns(self, tokens):
-        tokens.set_field("reg", self.reg)
-        tokens.set_field("opcode", self.opcode)
+    tokens = rmregbase16.tokens
+    patterns = {"prefix": 0x66}
 
 
 def make_rm64(mnemonic, opcode, o):
     """ Create an instruction taking a 64 bit r/m operand """
     rm = Operand("rm", rm64_modes)
     syntax = Syntax([mnemonic, " ", rm], priority=2)
-    members = {"syntax": syntax, "rm": rm, "opcode": opcode, "reg": o}
+    patterns = dict(RmBase.patterns, opcode=opcode, reg=o)
+    members = {"syntax": syntax, "rm": rm, "patterns": patterns}
     return type(mnemonic.title(), (RmBase,), members)
 
 
@@ -723,15 +807,17 @@ def make_rm32(mnemonic, opcode, o):
     """ Create an instruction taking a 32 bit r/m operand """
     rm = Operand("rm", rm32_modes)
     syntax = Syntax([mnemonic, " ", rm], priority=2)
-    members = {"syntax": syntax, "rm": rm, "opcode": opcode, "reg": o}
-    return type(mnemonic.title(), (RmBase,), members)
+    patterns = dict(RmBase32.patterns, opcode=opcode, reg=o)
+    members = {"syntax": syntax, "rm": rm, "patterns": patterns}
+    return type(mnemonic.title(), (RmBase32,), members)
 
 
 def make_rm16(mnemonic, opcode, o):
     """ Create an instruction taking a 16 bit r/m operand """
     rm = Operand("rm", rm16_modes)
     syntax = Syntax([mnemonic, " ", rm], priority=2)
-    members = {"syntax": syntax, "rm": rm, "opcode": opcode, "reg": o}
+    patterns = dict(RmBase16.patterns, opcode=opcode, reg=o)
+    members = {"syntax": syntax, "rm": rm, "patterns": patterns}
     return type(mnemonic.title(), (RmBase16,), members)
 
 
@@ -745,7 +831,13 @@ def make_rm_reg64(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm64_modes)
     reg = Operand("reg", Register64, read=True)
     syntax = Syntax([mnemonic, " ", rm, ",", " ", reg], priority=0)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase64.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase64,), members)
 
 
@@ -754,7 +846,13 @@ def make_rm_reg32(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm32_modes)
     reg = Operand("reg", Register32, read=True)
     syntax = Syntax([mnemonic, " ", rm, ",", " ", reg], priority=0)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase32.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase32,), members)
 
 
@@ -763,7 +861,13 @@ def make_rm_reg16(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm16_modes)
     reg = Operand("reg", Register16, read=True)
     syntax = Syntax([mnemonic, " ", rm, ",", " ", reg], priority=0)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase16.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase16,), members)
 
 
@@ -772,7 +876,13 @@ def make_rm_reg8(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm8_modes)
     reg = Operand("reg", Register8, read=True)
     syntax = Syntax([mnemonic, " ", rm, ",", " ", reg], priority=0)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase64.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase64,), members)
 
 
@@ -780,7 +890,13 @@ def make_reg_rm64(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm64_modes)
     reg = Operand("reg", Register64, write=write_op1, read=read_op1)
     syntax = Syntax([mnemonic, " ", reg, ",", " ", rm], priority=1)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase64.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase64,), members)
 
 
@@ -788,7 +904,13 @@ def make_reg_rm32(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm32_modes)
     reg = Operand("reg", Register32, write=write_op1, read=read_op1)
     syntax = Syntax([mnemonic, " ", reg, ",", " ", rm], priority=1)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase32.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase32,), members)
 
 
@@ -796,7 +918,13 @@ def make_reg_rm16(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm16_modes)
     reg = Operand("reg", Register16, write=write_op1, read=read_op1)
     syntax = Syntax([mnemonic, " ", reg, ",", " ", rm], priority=1)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase16.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins16", (rmregbase16,), members)
 
 
@@ -804,60 +932,73 @@ def make_reg_rm8(mnemonic, opcode, read_op1=True, write_op1=True):
     rm = Operand("rm", rm8_modes)
     reg = Operand("reg", Register8, write=write_op1, read=read_op1)
     syntax = Syntax([mnemonic, " ", reg, ",", " ", rm], priority=1)
-    members = {"syntax": syntax, "rm": rm, "reg": reg, "opcode": opcode}
+    patterns = dict(rmregbase64.patterns, opcode=opcode)
+    members = {
+        "syntax": syntax,
+        "rm": rm,
+        "reg": reg,
+        "patterns": patterns,
+    }
     return type(mnemonic + "_ins", (rmregbase64,), members)
 
 
-class MovsxReg64Rm8(rmregbase64):
+class movx_base(rmregbase64):
+    """ Base class for moves with sign or zero extension """
+
+    tokens = [
+        RexToken,
+        OpcodeToken,
+        SecondaryOpcodeToken,
+        ModRmToken,
+        SibToken,
+        Imm8Token,
+        Imm32Token,
+    ]
+
+
+class MovsxReg64Rm8(movx_base):
     """ Move sign extend, which means take a byte and sign extend it! """
 
     reg = Operand("reg", Register64, write=True)
     rm = Operand("rm", rm8_modes, read=True)
     syntax = Syntax(["movsx", " ", reg, ",", " ", rm])
-    opcode = 0x0F
-    opcode2 = 0xBE
+    patterns = {"w": 1, "opcode": 0x0F, "opcode2": 0xBE}
 
 
-class MovsxRegRm16(rmregbase64):
+class MovsxRegRm16(movx_base):
     """ Move sign extend, which means take a byte and sign extend it! """
 
     reg = Operand("reg", Register64, write=True)
     rm = Operand("rm", rm16_modes, read=True)
     syntax = Syntax(["movsx", " ", reg, ",", " ", rm])
-    opcode = 0x0F
-    opcode2 = 0xBF
+    patterns = {"w": 1, "opcode": 0x0F, "opcode2": 0xBF}
 
 
-class MovsxReg32Rm8(rmregbase64):
+class MovsxReg32Rm8(movx_base):
     """ Move sign extend, which means take a byte and sign extend it! """
 
     reg = Operand("reg", Register32, write=True)
     rm = Operand("rm", rm8_modes, read=True)
     syntax = Syntax(["movsx", " ", reg, ",", " ", rm])
-    patterns = {"w": 0}
-    opcode = 0x0F
-    opcode2 = 0xBE
+    patterns = {"w": 0, "opcode": 0x0F, "opcode2": 0xBE}
 
 
-class MovsxReg32Rm16(rmregbase64):
+class MovsxReg32Rm16(movx_base):
     """ Move sign extend, which means take a byte and sign extend it! """
 
     reg = Operand("reg", Register32, write=True)
     rm = Operand("rm", rm16_modes, read=True)
     syntax = Syntax(["movsx", " ", reg, ",", " ", rm])
-    patterns = {"w": 0}
-    opcode = 0x0F
-    opcode2 = 0xBF
+    patterns = {"w": 0, "opcode": 0x0F, "opcode2": 0xBF}
 
 
-class MovzxRegRm(rmregbase64):
+class MovzxRegRm(movx_base):
     """ Move zero extend """
 
     reg = Operand("reg", Register64, write=True)
     rm = Operand("rm", rm8_modes, read=True)
     syntax = Syntax(["movzx", " ", reg, ",", " ", rm])
-    opcode = 0x0F
-    opcode2 = 0xB6
+    patterns = {"w": 1, "opcode": 0x0F, "opcode2": 0xB6}
 
 
 class InstructionCollection:
@@ -904,7 +1045,7 @@ class InstructionCollection:
         self.MovRmReg = make_rm_reg("mov", 0x89, read_op1=False)
 
         self.ShrRm = make_rm("shr", 0xD1, 5)
-        self.ShlRm = make_rm("shl", 0xD1, 5)
+        self.ShlRm = make_rm("shl", 0xD1, 4)
         self.NotRm = make_rm("not", 0xF7, 2)
         self.NegRm = make_rm("neg", 0xF7, 3)
 
@@ -927,26 +1068,20 @@ class InstructionCollection:
             for k, v in extra_patterns.items():
                 patterns[k] = v
 
-            def encode(self):
-                tokens = self.get_tokens()
-                self.set_all_patterns(tokens)
-                tokens.set_field("reg", self.r)
-                return tokens.encode()
-
         class ShrCl(shift_cl_base):
-            r = 5
+            patterns = dict(shift_cl_base.patterns, reg=5)
             syntax = Syntax(["shr", " ", shift_cl_base.rm, ",", " ", "cl"])
 
         self.ShrCl = ShrCl
 
         class ShlCl(shift_cl_base):
-            r = 6
+            patterns = dict(shift_cl_base.patterns, reg=6)
             syntax = Syntax(["shl", " ", shift_cl_base.rm, ",", " ", "cl"])
 
         self.ShlCl = ShlCl
 
         class SarCl(shift_cl_base):
-            r = 7
+            patterns = dict(shift_cl_base.patterns, reg=7)
             syntax = Syntax(["sar", " ", shift_cl_base.rm, ",", " ", "cl"])
 
         self.SarCl = SarCl
@@ -980,27 +1115,29 @@ class regint32base(X86Instruction):
     tokens = [RexToken, OpcodeToken, ModRmToken, Imm32Token]
     patterns = {"w": 1, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg.rexbit
-        tokens[1][0:8] = self.opcode
-        tokens[2].rm = self.reg.regbits
-        tokens[2].reg = self.reg_code
-        tokens[3][0:32] = wrap_negative(self.imm, 32)
-        return tokens.encode()
+    def set_user_patterns(self, tokens):
+        tokens.set_field("b", self.reg.rexbit)
+        tokens.set_field("rm", self.reg.regbits)
+        tokens.set_field("disp32", wrap_negative(self.imm, 32))
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {
+            cls.reg: decode_register(cls.reg, tokens, "b", "rm"),
+            cls.imm: sign_extend(tokens.get_field("disp32"), 32),
+        }
 
 
 def make_regimm(mnemonic, opcode, reg_code):
     reg = Operand("reg", Register64, write=True, read=True)
     imm = Operand("imm", int)
     syntax = Syntax([mnemonic, " ", reg, ",", " ", imm])
+    patterns = dict(regint32base.patterns, opcode=opcode, reg=reg_code)
     members = {
         "syntax": syntax,
         "reg": reg,
         "imm": imm,
-        "opcode": opcode,
-        "reg_code": reg_code,
+        "patterns": patterns,
     }
     return type(mnemonic + "_ins", (regint32base,), members)
 
@@ -1016,199 +1153,166 @@ class shift8_cl_base(X86Instruction):
     rm = Operand("rm", rm8_modes)
     tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xD2}
-    opcode = 0xD2
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[2].reg = self.r
-        return tokens.encode()
 
 
 class RolCl8(shift8_cl_base):
-    r = 0
+    patterns = dict(shift8_cl_base.patterns, reg=0)
     syntax = Syntax(["rol", " ", shift8_cl_base.rm, ",", " ", "cl"])
 
 
 class RorCl8(shift8_cl_base):
-    r = 1
+    patterns = dict(shift8_cl_base.patterns, reg=1)
     syntax = Syntax(["ror", " ", shift8_cl_base.rm, ",", " ", "cl"])
 
 
 class ShlCl8(shift8_cl_base):
-    r = 4
+    patterns = dict(shift8_cl_base.patterns, reg=4)
     syntax = Syntax(["shl", " ", shift8_cl_base.rm, ",", " ", "cl"])
 
 
 class ShrCl8(shift8_cl_base):
-    r = 5
+    patterns = dict(shift8_cl_base.patterns, reg=5)
     syntax = Syntax(["shr", " ", shift8_cl_base.rm, ",", " ", "cl"])
 
 
 class SarCl8(shift8_cl_base):
-    r = 7
+    patterns = dict(shift8_cl_base.patterns, reg=7)
     syntax = Syntax(["sar", " ", shift8_cl_base.rm, ",", " ", "cl"])
 
 
-class Imul(X86Instruction):
+class ImulBase(X86Instruction):
+    """ Base class for multiplications of two registers """
+
+    tokens = [RexToken, OpcodeToken, SecondaryOpcodeToken, ModRmToken]
+
+    def set_user_patterns(self, tokens):
+        tokens.set_field("r", self.reg1.rexbit)
+        tokens.set_field("b", self.reg2.rexbit)
+        tokens.set_field("rm", self.reg2.regbits)
+        tokens.set_field("reg", self.reg1.regbits)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {
+            cls.reg1: decode_register(cls.reg1, tokens, "r", "reg"),
+            cls.reg2: decode_register(cls.reg2, tokens, "b", "rm"),
+        }
+
+
+class Imul(ImulBase):
     """ Multiply imul r64, r/m64 """
 
     reg1 = Operand("reg1", Register64, write=True, read=True)
     reg2 = Operand("reg2", Register64, read=True)
     syntax = Syntax(["imul", " ", reg1, ",", " ", reg2])
-    tokens = [RexToken, OpcodeToken, SecondaryOpcodeToken, ModRmToken]
     patterns = {"opcode": 0x0F, "opcode2": 0xAF, "w": 1, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].r = self.reg1.rexbit
-        tokens[0].b = self.reg2.rexbit
-        tokens[3].rm = self.reg2.regbits
-        tokens[3].reg = self.reg1.regbits
-        return tokens.encode()
-
 
-class Imul32(X86Instruction):
+class Imul32(ImulBase):
     """ Multiply imul r32, r/m32 """
 
     reg1 = Operand("reg1", Register32, write=True, read=True)
     reg2 = Operand("reg2", Register32, read=True)
     syntax = Syntax(["imul", " ", reg1, ",", " ", reg2])
-    tokens = [RexToken, OpcodeToken, SecondaryOpcodeToken, ModRmToken]
     patterns = {"opcode": 0x0F, "opcode2": 0xAF, "w": 0, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].r = self.reg1.rexbit
-        tokens[0].b = self.reg2.rexbit
-        tokens[3].rm = self.reg2.regbits
-        tokens[3].reg = self.reg1.regbits
-        return tokens.encode()
 
+class DivBase(X86Instruction):
+    """ Base class for divisions by a register """
+
+    tokens = [RexToken, OpcodeToken, ModRmToken]
+
+    def set_user_patterns(self, tokens):
+        tokens.set_field("b", self.reg1.rexbit)
+        tokens.set_field("rm", self.reg1.regbits)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg1: decode_register(cls.reg1, tokens, "b", "rm")}
 
-class Div(X86Instruction):
+
+class Div16Base(X86Instruction):
+    """ Base class for divisions by a 16 bit register """
+
+    tokens = [PrefixToken, OpcodeToken, ModRmToken]
+
+    def set_user_patterns(self, tokens):
+        tokens.set_field("rm", self.reg1.num)
+
+    @classmethod
+    def get_user_patterns(cls, tokens):
+        return {cls.reg1: cls.reg1.from_value(tokens.get_field("rm"))}
+
+
+class Div(DivBase):
     """ div r/m64 divide rdx:rax by the operand, leaving the remainder in
     rdx and the quotient in rax.
     """
 
     reg1 = Operand("reg1", Register64, read=True)
     syntax = Syntax(["div", " ", reg1])
-    tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 6, "w": 1, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg1.rexbit
-        tokens[2].rm = self.reg1.regbits
-        return tokens.encode()
-
 
-class Idiv(X86Instruction):
+class Idiv(DivBase):
     """ idiv r/m64 divide rdx:rax by the operand, leaving the remainder in
     rdx and the quotient in rax.
     """
 
     reg1 = Operand("reg1", Register64, read=True)
     syntax = Syntax(["idiv", " ", reg1])
-    tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 7, "w": 1, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg1.rexbit
-        tokens[2].rm = self.reg1.regbits
-        return tokens.encode()
 
-
-class Div32(X86Instruction):
+class Div32(DivBase):
     """ idiv r/m32 divide rdx:rax by the operand, leaving the remainder in
     rdx and the quotient in rax.
     """
 
     reg1 = Operand("reg1", Register32, read=True)
     syntax = Syntax(["div", " ", reg1])
-    tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 6, "w": 0, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg1.rexbit
-        tokens[2].rm = self.reg1.regbits
-        return tokens.encode()
 
-
-class Idiv32(X86Instruction):
+class Idiv32(DivBase):
     """ idiv r/m32 divide rdx:rax by the operand, leaving the remainder in
     rdx and the quotient in rax.
     """
 
     reg1 = Operand("reg1", Register32, read=True)
     syntax = Syntax(["idiv", " ", reg1])
-    tokens = [RexToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 7, "w": 0, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg1.rexbit
-        tokens[2].rm = self.reg1.regbits
-        return tokens.encode()
-
 
-class Div16(X86Instruction):
+class Div16(Div16Base):
     """ idiv r/m16 divide dx:ax by the operand, leaving the remainder in
     dx and the quotient in ax.
     """
 
     reg1 = Operand("reg1", Register16, read=True)
     syntax = Syntax(["div", " ", reg1])
-    tokens = [PrefixToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 6, "prefix": 0x66, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[2].rm = self.reg1.num
-        return tokens.encode()
-
 
-class Idiv16(X86Instruction):
+class Idiv16(Div16Base):
     """ idiv r/m16 divide dx:ax by the operand, leaving the remainder in
     dx and the quotient in ax.
     """
 
     reg1 = Operand("reg1", Register16, read=True)
     syntax = Syntax(["idiv", " ", reg1])
-    tokens = [PrefixToken, OpcodeToken, ModRmToken]
     patterns = {"opcode": 0xF7, "reg": 7, "prefix": 0x66, "mod": 3}
 
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[2].rm = self.reg1.num
-        return tokens.encode()
 
-
-class MovImm8(X86Instruction):
+class MovImm8(RegOpcodeBase):
     """ Mov immediate into low 8-bit register """
 
     reg = Operand("reg", Register8, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["mov", " ", reg, ",", " ", imm])
-    tokens = [RexToken, OpcodeToken]
-    opcode = 0xB0  # mov r8, imm8
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0].w = 1
-        tokens[0].b = self.reg.rexbit
-        tokens[1][0:8] = self.opcode + self.reg.regbits
-        return tokens.encode() + u8(self.imm)
+    tokens = [RexToken, RegOpcodeToken, Imm8Token]
+    # mov r8, imm8
+    patterns = {"w": 1, "opcode": 0xB0 >> 3, "disp8": imm}
 
 
 class MovImm16(X86Instruction):
@@ -1217,51 +1321,29 @@ class MovImm16(X86Instruction):
     reg = Operand("reg", Register16, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["mov", " ", reg, ",", " ", imm])
-    tokens = [PrefixToken, OpcodeToken]
-    opcode = 0xB8
-    patterns = {"prefix": 0x66}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens.set_field("opcode", self.opcode + self.reg.num)
-        return tokens.encode() + u16(self.imm)
+    tokens = [PrefixToken, RegOpcodeToken, Imm16Token]
+    patterns = {"prefix": 0x66, "opcode": 0xB8 >> 3, "reg": reg, "disp16": imm}
 
 
-class MovImm32(X86Instruction):
+class MovImm32(RegOpcodeBase):
     """ Mov immediate into 32 bits register """
 
     reg = Operand("reg", Register32, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["mov", " ", reg, ",", " ", imm])
-    tokens = [RexToken, OpcodeToken]
-    opcode = 0xB8
-    patterns = {"w": 0}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg.rexbit
-        tokens[1][0:8] = self.opcode + self.reg.regbits
-        return tokens.encode() + u32(self.imm)
+    tokens = [RexToken, RegOpcodeToken, Imm32Token]
+    patterns = {"w": 0, "opcode": 0xB8 >> 3, "disp32": imm}
 
 
-class MovImm(X86Instruction):
+class MovImm(RegOpcodeBase):
     """ Mov immediate into a 64 bits register """
 
     reg = Operand("reg", Register64, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["mov", " ", reg, ",", " ", imm])
-    tokens = [RexToken, OpcodeToken]
-    opcode = 0xB8  # mov r64, imm64
-    patterns = {"w": 1}
-
-    def encode(self):
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        tokens[0].b = self.reg.rexbit
-        tokens[1][0:8] = self.opcode + self.reg.regbits
-        return tokens.encode() + u64(self.imm)
+    tokens = [RexToken, RegOpcodeToken, Imm64Token]
+    # mov r64, imm64
+    patterns = {"w": 1, "opcode": 0xB8 >> 3, "disp64": imm}
 
 
 class MovAdr(X86Instruction):
@@ -1320,18 +1402,16 @@ class Rep(X86Instruction):
     """ Repeat string operation prefix """
 
     syntax = Syntax(["rep"])
-
-    def encode(self):
-        return bytes([0xF3])
+    tokens = [PrefixToken]
+    patterns = {"prefix": 0xF3}
 
 
 class Movsb(X86Instruction):
     """ Move data from string to string """
 
     syntax = Syntax(["movsb"])
-
-    def encode(self):
-        return bytes([0xA4])
+    tokens = [OpcodeToken]
+    patterns = {"opcode": 0xA4}
 
 
 @isa.pattern("stm", "JMP", size=2)
@@ -1,8 +1,24 @@
 """ Grouping of multiple object files into a single archive.
+
+Like object files, archives can be saved in json format or in a binary
+format. The binary format consists of a header, a table with the offset
+and size of each member, a symbol index and the members in the binary
+object format.
+
+The symbol index maps each globally defined symbol to the member which
+defines it, like the symbol table of GNU ar. It allows the linker to find
+the objects it needs without looking at the other members.
+
+Archives in binary format are memory mapped when possible. Members are
+only decoded when they are used.
 """
 
+import io
 import json
 import logging
+import mmap
+import struct
+from ..common import CompilerError, get_file
 from . import objectfile
 
 
@@ -19,34 +35,194 @@ def get_archive(filename):
     return Archive.load(filename)
 
 
+ARCHIVE_MAGIC = b"PPCA"
+
+# magic, version, flags, member count, symbol count and string table size:
+_header = struct.Struct("<4sHHIII")
+# offset and size:
+_member_entry = struct.Struct("<QQ")
+# symbol name offset into the string table, and member index:
+_symbol_entry = struct.Struct("<II")
+
+
 class Archive:
     """ The archive. Holder of object files. Similar to GNU ar.
     """
 
     logger = logging.getLogger("ar")
 
-    def __init__(self, objs):
-        self.objs = objs
+    def __init__(self, objs, symbol_index=None):
+        # Members are either object files, or the encoded object file:
+        self._members = list(objs)
+        if symbol_index is None:
+            symbol_index = self._create_symbol_index()
+        self.symbol_index = symbol_index
+
+    def _create_symbol_index(self):
+        """ Map global symbols to the first member defining them """
+        symbol_index = {}
+        for index, obj in enumerate(self):
+            for name in obj.get_defined_symbols():
+                symbol_index.setdefault(name, index)
+        return symbol_index
+
+    def __getitem__(self, index):
+        """ Get a member, decode it when it was not yet used """
+        member = self._members[index]
+        if not isinstance(member, objectfile.ObjectFile):
+            self.logger.debug("Loading member %s", index)
+            member = objectfile.ObjectFile.from_bytes(member)
+            self._members[index] = member
+        return member
 
     def __iter__(self):
-        return iter(self.objs)
+        for index in range(len(self._members)):
+            yield self[index]
+
+    @property
+    def objs(self):
+        """ All object files in this archive """
+        return list(self)
+
+    def is_loaded(self, index):
+        """ Test if the given member was decoded already """
+        return isinstance(self._members[index], objectfile.ObjectFile)
+
+    def find_symbol(self, name):
+        """ Get the index of the member defining the given symbol.
+
+        Returns None when no member defines the symbol.
+        """
+        return self.symbol_index.get(name, None)
 
     def save(self, output_file):
-        """ Save archive to file. """
+        """ Save archive to file.
+
+        Text files receive the json format, binary files the binary
+        format.
+        """
         self.logger.debug("Saving archive")
-        # Create funky json.
-        objs = [obj.serialize() for obj in self.objs]
+        if isinstance(output_file, io.TextIOBase):
+            # Create funky json.
+            objs = [obj.serialize() for obj in self]
+
+            d = {"objects": objs, "symbols": self.symbol_index}
 
-        d = {"objects": objs}
+            # Save to file:
+            json.dump(d, output_file, indent=2, sort_keys=True)
+            print(file=output_file)
+        else:
+            output_file.write(self.to_bytes())
 
-        # Save to file:
-        json.dump(d, output_file, indent=2, sort_keys=True)
-        print(file=output_file)
+    def to_bytes(self):
+        """ Encode this archive in the binary format """
+        members = []
+        for member in self._members:
+            if isinstance(member, objectfile.ObjectFile):
+                members.append(member.to_bytes())
+            else:
+                members.append(bytes(member))
+
+        strings = bytearray()
+        symbols = bytearray()
+        for name, index in sorted(self.symbol_index.items()):
+            symbols += _symbol_entry.pack(len(strings), index)
+            strings += name.encode("utf8") + bytes([0])
+
+        table = bytearray()
+        offset = (
+            _header.size
+            + _member_entry.size * len(members)
+            + len(symbols)
+            + len(strings)
+        )
+        for member in members:
+            table += _member_entry.pack(offset, len(member))
+            offset += len(member)
+
+        header = _header.pack(
+            ARCHIVE_MAGIC,
+            objectfile.BINARY_FORMAT_VERSION,
+            0,
+            len(members),
+            len(self.symbol_index),
+            len(strings),
+        )
+        return b"".join(
+            [header, bytes(table), bytes(symbols), bytes(strings)] + members
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """ Create an archive from binary data, without decoding members """
+        data = memoryview(data)
+        (
+            magic,
+            version,
+            _,
+            count,
+            symbol_count,
+            strings_size,
+        ) = _header.unpack_from(data)
+        if magic != ARCHIVE_MAGIC:
+            raise CompilerError("Not a binary archive")
+        if version != objectfile.BINARY_FORMAT_VERSION:
+            raise CompilerError(
+                "Unsupported archive format version {}".format(version)
+            )
+        members = []
+        for index in range(count):
+            offset, size = _member_entry.unpack_from(
+                data, _header.size + index * _member_entry.size
+            )
+            members.append(data[offset : offset + size])
+
+        offset = _header.size + count * _member_entry.size
+        symbols_size = symbol_count * _symbol_entry.size
+        symbols = data[offset : offset + symbols_size]
+        offset += symbols_size
+        strings = bytes(data[offset : offset + strings_size])
+        symbol_index = {}
+        for name_offset, index in _symbol_entry.iter_unpack(symbols):
+            end = strings.index(0, name_offset)
+            name = strings[name_offset:end].decode("utf8")
+            symbol_index[name] = index
+        return cls(members, symbol_index=symbol_index)
+
+    @classmethod
+    def from_dict(cls, d):
+        """ Create an archive from its json representation """
+        objs = list(map(objectfile.deserialize, d["objects"]))
+        return cls(objs, symbol_index=d.get("symbols", None))
 
     @classmethod
     def load(cls, f):
         """ Load archive from disk. """
         cls.logger.debug("Loading archive")
-        d = json.load(f)
-        objs = list(map(objectfile.deserialize, d["objects"]))
-        return cls(objs)
+        if isinstance(f, str):
+            # The memory map stays valid when the file is closed:
+            with open(f, "rb") as archive_file:
+                return cls.load(archive_file)
+        f = get_file(f, "rb")
+        if isinstance(f, io.TextIOBase):
+            return cls.from_dict(json.load(f))
+
+        data = map_file(f)
+        if bytes(data[:4]) == ARCHIVE_MAGIC:
+            return cls.from_bytes(data)
+        else:
+            return cls.from_dict(json.loads(bytes(data).decode("utf8")))
+
+
+def map_file(f):
+    """ Memory map a file if possible, otherwise read it """
+    try:
+        fileno = f.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return f.read()
+
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # For example empty files, or files which cannot be mapped.
+        return f.read()
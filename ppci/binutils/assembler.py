@@ -7,12 +7,13 @@
 import re
 from ..lang.tools.grammar import Grammar
 from ..lang.tools.earley import EarleyParser
+from ..lang.tools.trieparser import TrieParser
 from ..lang.tools.baselex import BaseLexer, EPS, EOF
 from ..common import make_num
 from ..arch.generic_instructions import Label, Alignment, SectionInstruction
 from ..arch.generic_instructions import DebugData, Global
 from ..arch.encoding import Operand, Syntax, Register
-from ..common import CompilerError, SourceLocation
+from ..common import CompilerError, ParseError, SourceLocation
 from .debuginfo import DebugLocation, DebugDb
 
 id_regex = r"[A-Za-z_][A-Za-z\d_]*"
@@ -35,7 +36,7 @@ class AsmLexer(BaseLexer):
                 "|".join(re.escape(c) for c in Syntax.GLYPHS),
                 lambda typ, val: (val, val),
             ),
-            ("STRING", r"'.*?'", lambda typ, val: (typ, val[1:-1])),
+            ("STRING", r"'[^'\n]*'", lambda typ, val: (typ, val[1:-1])),
             ("COMMENT", r";.*", None),
         ]
         super().__init__(tok_spec)
@@ -91,10 +92,29 @@ class AsmParser:
             self.emit(i2)
 
     def parse(self, lexer):
-        """ Entry function to parser """
+        """ Entry function to parser.
+
+        Lines are parsed with a trie parser, which dispatches on the
+        mnemonic. Lines which it cannot parse without ambiguity are
+        parsed again with the earley parser.
+        """
         if not hasattr(self, "p"):
             self.p = EarleyParser(self.g)
-        self.p.parse(lexer)
+            self.trie_parser = TrieParser(self.g)
+
+        tokens = []
+        token = lexer.next_token()
+        while token.typ != EOF:
+            tokens.append(token)
+            token = lexer.next_token()
+
+        try:
+            derivation = self.trie_parser.derive(tokens)
+        except ParseError:
+            lexer.tokens = iter(tokens)
+            self.p.parse(lexer)
+        else:
+            self.trie_parser.evaluate(derivation)
 
 
 class BaseAssembler:
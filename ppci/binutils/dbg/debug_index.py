@@ -0,0 +1,157 @@
+""" Address indexes on debug information.
+
+While stepping through a program, the debugger must find the source
+location and the function of the program counter over and over again.
+These lookups are done with indexes which are built once, after the
+debug symbols are loaded.
+"""
+
+import bisect
+from ..debuginfo import DebugAddress
+
+
+class LineTable:
+    """ Sorted table of addresses, to find the source of an address.
+
+    The location of an address is the location with the highest address
+    at or below the given address.
+    """
+
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda e: e[0])
+        self.addresses = [e[0] for e in entries]
+        self.values = [e[1] for e in entries]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def find(self, address):
+        """ Find the entry for the given address.
+
+        Returns a tuple with the address of the entry and the entry, or
+        None when the table is empty. Addresses below the first entry
+        are attributed to the first entry.
+        """
+        if not self.addresses:
+            return
+        index = max(bisect.bisect_right(self.addresses, address) - 1, 0)
+        return self.addresses[index], self.values[index]
+
+
+class IntervalTree:
+    """ Static centered interval tree.
+
+    Intervals are half open [begin, end) ranges of addresses, each with
+    an attached value. All intervals containing an address are found in
+    O(log n + k) time.
+    """
+
+    def __init__(self, intervals):
+        intervals = [i for i in intervals if i[0] < i[1]]
+        self.left = self.right = None
+        if not intervals:
+            self.center = None
+            self.by_begin = self.by_end = []
+            return
+
+        begins = sorted(i[0] for i in intervals)
+        self.center = center = begins[len(begins) // 2]
+        here = [i for i in intervals if i[0] <= center < i[1]]
+        self.by_begin = sorted(here, key=lambda i: i[0])
+        self.by_end = sorted(here, key=lambda i: -i[1])
+        left = [i for i in intervals if i[1] <= center]
+        right = [i for i in intervals if i[0] > center]
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def find(self, address):
+        """ Get the values of all intervals which contain the address """
+        values = []
+        node = self
+        while node is not None and node.center is not None:
+            if address < node.center:
+                for begin, _, value in node.by_begin:
+                    if begin > address:
+                        break
+                    values.append(value)
+                node = node.left
+            else:
+                for _, end, value in node.by_end:
+                    if end <= address:
+                        break
+                    values.append(value)
+                node = node.right
+        return values
+
+    def find_innermost(self, address):
+        """ Get the value of the smallest interval containing address """
+        best = None
+        node = self
+        while node is not None and node.center is not None:
+            if address < node.center:
+                candidates = (i for i in node.by_begin if i[0] <= address)
+                node = node.left
+            else:
+                candidates = (i for i in node.by_end if i[1] > address)
+                node = node.right
+            for interval in candidates:
+                if best is None or (
+                    interval[1] - interval[0] < best[1] - best[0]
+                ):
+                    best = interval
+        if best is not None:
+            return best[2]
+
+
+class DebugIndex:
+    """ Indexes on debug information, with resolved addresses.
+
+    Args:
+        debug_info: the debug information to index.
+        calc_address: a function resolving a debug address into an
+            actual address.
+    """
+
+    def __init__(self, debug_info, calc_address):
+        self.address_map = {}
+        self.row_map = {}
+        self.file_rows = {}
+        for location in debug_info.locations:
+            address = calc_address(location.address)
+            self.address_map[address] = location
+            key = (location.loc.filename, location.loc.row)
+            self.row_map.setdefault(key, address)
+            self.file_rows.setdefault(location.loc.filename, set()).add(
+                location.loc.row
+            )
+        self.lines = LineTable(self.address_map.items())
+
+        intervals = []
+        for function in debug_info.functions:
+            if isinstance(function.begin, DebugAddress) and isinstance(
+                function.end, DebugAddress
+            ):
+                begin = calc_address(function.begin)
+                end = calc_address(function.end)
+                intervals.append((begin, end, function))
+        self.functions = IntervalTree(intervals)
+
+    def find_location(self, address):
+        """ Get the debug location for an address, or None """
+        entry = self.lines.find(address)
+        if entry:
+            return entry[1]
+
+    def find_function(self, address):
+        """ Get the innermost function containing the address, or None """
+        return self.functions.find_innermost(address)
+
+    def find_address(self, filename, row):
+        """ Get the address of a source row, or None """
+        return self.row_map.get((filename, row), None)
+
+    def get_rows(self, filename):
+        """ Get the rows of a file which have an address """
+        return self.file_rows.get(filename, set())
@@ -20,6 +20,7 @@ from ...lang.c3.builder import C3ExprParser
 from ...lang.c3 import astnodes as c3nodes
 from ...lang.c3 import Context as C3Context
 from .debug_driver import DebugState
+from .debug_index import DebugIndex
 
 
 class TmpValue:
@@ -60,6 +61,7 @@ class Debugger:
         self.events = driver.events
         self.variable_map = {}
         self.addr_map = {}
+        self.index = None
 
     def __repr__(self):
         return "Debugger for {} using {}".format(self.arch, self.driver)
@@ -85,12 +87,9 @@ class Debugger:
 
     def get_possible_breakpoints(self, filename):
         """ Return the rows in the file for which breakpoints can be set """
-        options = set()
-        if self.debug_info:
-            for loc in self.debug_info.locations:
-                if loc.loc.filename == filename:
-                    options.add(loc.loc.row)
-        return options
+        if self.index:
+            return set(self.index.get_rows(filename))
+        return set()
 
     def set_breakpoint(self, filename, row):
         """ Set a breakpoint """
@@ -154,11 +153,8 @@ class Debugger:
 
         self.obj = obj
         self.variable_map = {v.name: v for v in self.debug_info.variables}
-        self.addr_map = {}
-        for loc in self.debug_info.locations:
-            addr = self.calc_address(loc.address)
-            self.addr_map[addr] = loc
-            self.logger.debug("%s at 0x%x", loc, addr)
+        self.index = DebugIndex(self.debug_info, self.calc_address)
+        self.addr_map = self.index.address_map
 
     def validate_memory(self, obj):
         """ Validate memory given an object file """
@@ -188,25 +184,20 @@ class Debugger:
     def find_pc(self):
         """ Given the current program counter (pc) determine the source """
         pc = self.get_pc()
-        # if pc in self.addr_map:
-        minkey = min(self.addr_map.keys(), key=lambda k: abs(k - pc))
-        debug = self.addr_map[minkey]
+        if not self.has_symbols:
+            raise ValueError("No debug symbols loaded")
+        address, debug = self.index.lines.find(pc)
         self.logger.info(
-            "Found program counter at %s with delta %i" % (debug, minkey - pc)
+            "Found program counter at %s with delta %i", debug, pc - address
         )
-        # debug = self.addr_map[pc]
         loc = debug.loc
         return loc.filename, loc.row
 
     def current_function(self):
         """ Determine the PC and then determine which function we are in """
         pc = self.get_pc()
-        if self.debug_info:
-            for function in self.debug_info.functions:
-                begin = self.calc_address(function.begin)
-                end = self.calc_address(function.end)
-                if pc in range(begin, end):
-                    return function
+        if self.index:
+            return self.index.find_function(pc)
 
     def local_vars(self):
         """ Return map of local variable names """
@@ -217,11 +208,10 @@ class Debugger:
 
     def find_address(self, filename, row):
         """ Given a filename and a row, determine the address """
-        if self.debug_info:
-            for debug in self.debug_info.locations:
-                loc = debug.loc
-                if loc.filename == filename and loc.row == row:
-                    return self.calc_address(debug.address)
+        if self.index:
+            address = self.index.find_address(filename, row)
+            if address is not None:
+                return address
         self.logger.warning("Could not find address for %s:%i", filename, row)
 
     # Registers:
@@ -10,6 +10,7 @@ import string
 import queue
 from threading import Thread
 from ..debug_driver import DebugDriver, DebugState
+from ..memory_cache import MemoryCache
 from .rsp import RspHandler
 
 INTERRUPT = 2
@@ -69,17 +70,53 @@ class GdbDebugDriver(DebugDriver):
     sending and receiving of bytes. The protocol must be able to
     work using sockets and threads, serial port and threads and asyncio
     sockets.
+
+    While the target is stopped, memory reads are cached in blocks. The
+    cache is invalidated when the target is resumed or memory is written.
+    Since the blocks are larger than the memory which is asked for,
+    the cache should be limited to the RAM of targets with memory
+    mapped peripherals, or it should be turned off.
+
+    Args:
+        arch: the architecture of the target.
+        transport: the connection to the gdb server.
+        pcresval: the program counter value after a reset.
+        swbrkpt: use software breakpoints.
+        memory_cache: True to cache all memory reads, False to read
+            memory exactly as requested, or a list of (address, size)
+            tuples with the memory which may be cached.
+        frame_prefetch: the amount of bytes around the frame pointer
+            which are read into the memory cache when the target stops,
+            so that local variables can be inspected quickly. Zero,
+            the default, disables this.
     """
 
     logger = logging.getLogger("gdbclient")
 
-    def __init__(self, arch, transport, pcresval=0, swbrkpt=False):
+    def __init__(
+        self,
+        arch,
+        transport,
+        pcresval=0,
+        swbrkpt=False,
+        memory_cache=True,
+        frame_prefetch=0,
+    ):
         super().__init__()
         self.arch = arch
         self.transport = transport
         self.status = DebugState.RUNNING
         self.pcresval = pcresval
         self._register_value_cache = {}  # Cached map of register values
+        if memory_cache is True:
+            self.memory_cache = MemoryCache(self._read_memory)
+        elif memory_cache:
+            self.memory_cache = MemoryCache(
+                self._read_memory, ranges=memory_cache
+            )
+        else:
+            self.memory_cache = None
+        self.frame_prefetch = frame_prefetch
         self.swbrkpt = swbrkpt
         self.stopreason = INTERRUPT
 
@@ -120,8 +157,8 @@ class GdbDebugDriver(DebugDriver):
         else:
             self.logger.warning("Already running!")
 
-        self._send_message("c")
         self._start()
+        self._send_message("c")
 
     def restart(self):
         """ restart the device """
@@ -135,8 +172,8 @@ class GdbDebugDriver(DebugDriver):
         """ Single step the device """
         if self.status == DebugState.STOPPED:
             self._prepare_continue()
-            self._send_message("s")
             self._start()
+            self._send_message("s")
         else:
             self.logger.warning("Cannot step, still running!")
 
@@ -144,8 +181,8 @@ class GdbDebugDriver(DebugDriver):
         """ Single step `count` times """
         if self.status == DebugState.STOPPED:
             self._prepare_continue()
-            self._send_message("n %x" % count)
             self._start()
+            self._send_message("n %x" % count)
         else:
             self.logger.warning("Cannot step, still running!")
 
@@ -172,9 +209,22 @@ class GdbDebugDriver(DebugDriver):
         """ Update state to started """
         self.status = DebugState.RUNNING
         self._register_value_cache.clear()
+        if self.memory_cache is not None:
+            self.memory_cache.invalidate()
         self.events.on_start()
 
     def _stop(self):
+        # Only prefetch when the frame pointer is in the `g` reply:
+        fp_register = getattr(self.arch, "fp", None)
+        if (
+            self.memory_cache is not None
+            and self.frame_prefetch
+            and fp_register in self._register_value_cache
+        ):
+            fp = self._register_value_cache[fp_register]
+            self.memory_cache.prefetch(
+                fp - self.frame_prefetch // 2, self.frame_prefetch
+            )
         self.status = DebugState.STOPPED
         self.events.on_stop()
 
@@ -237,14 +287,19 @@ class GdbDebugDriver(DebugDriver):
 
     def get_fp(self):
         """ read the frame pointer """
-        return 0x100
         fp = self._get_register(self.arch.fp)
         self.logger.debug("FP value read:%x", fp)
         return fp
 
     def get_registers(self, registers):
         if self.status == DebugState.STOPPED:
-            regs = self._get_general_registers()
+            if not all(r in self._register_value_cache for r in registers):
+                self._get_general_registers()
+            regs = {
+                r: self._register_value_cache[r]
+                for r in registers
+                if r in self._register_value_cache
+            }
         else:
             self.logger.warning("Cannot read registers while running")
             regs = {}
@@ -287,21 +342,23 @@ class GdbDebugDriver(DebugDriver):
             res = self._send_command("G %s" % data)
             if res == "OK":
                 self.logger.debug("Register written")
+                self._register_value_cache.update(regvalues)
             else:
                 self.logger.warning("Registers writing failed: %s", res)
 
     def _get_register(self, register):
         """ Get a single register """
         if self.status == DebugState.STOPPED:
-            if register in self._register_value_cache:
-                value = self._register_value_cache[register]
-            else:
-                idx = self.arch.gdb_registers.index(register)
-                data = self._send_command("p %x" % idx)
-                data = binascii.a2b_hex(data.encode("ascii"))
-                value = self._unpack_register(register, data)
-                self._register_value_cache[register] = value
-            return value
+            if register not in self._register_value_cache:
+                # Fetch all registers at once with a `g` packet:
+                self._get_general_registers()
+            if register not in self._register_value_cache:
+                raise ValueError(
+                    "Register {} is not in the target registers".format(
+                        register
+                    )
+                )
+            return self._register_value_cache[register]
         else:
             self.logger.warning(
                 "Cannot read register %s while not stopped", register
@@ -317,6 +374,7 @@ class GdbDebugDriver(DebugDriver):
             res = self._send_command("P %x=%s" % (idx, value))
             if res == "OK":
                 self.logger.debug("Register written")
+                self._register_value_cache.pop(register, None)
             else:
                 self.logger.warning("Register write failed: %s", res)
 
@@ -381,9 +439,14 @@ class GdbDebugDriver(DebugDriver):
     def read_mem(self, address: int, size: int):
         """ Read memory from address """
         if self.status == DebugState.STOPPED:
-            res = self._send_command("m %x,%x" % (address, size))
-            ret = binascii.a2b_hex(res.encode("ascii"))
-            return ret
+            if self.memory_cache is not None:
+                data = self.memory_cache.read(address, size)
+            else:
+                data = self._read_memory(address, size)
+            if data is None:
+                self.logger.warning("Could not read memory at %x", address)
+                return bytes()
+            return data
         else:
             self.logger.warning("Cannot read memory, target not stopped!")
             return bytes()
@@ -392,6 +455,8 @@ class GdbDebugDriver(DebugDriver):
         """ Write memory """
         if self.status == DebugState.STOPPED:
             length = len(data)
+            if self.memory_cache is not None:
+                self.memory_cache.invalidate(address, length)
             data = binascii.b2a_hex(data).decode("ascii")
             res = self._send_command("M %x,%x:%s" % (address, length, data))
             if res == "OK":
@@ -401,6 +466,14 @@ class GdbDebugDriver(DebugDriver):
         else:
             self.logger.warning("Cannot write memory, target not stopped!")
 
+    def _read_memory(self, address, size):
+        """ Execute the gdb `m` command. Returns None on an error reply """
+        res = self._send_command("m %x,%x" % (address, size))
+        # Error replies look like 'E01', and never have an even length:
+        if len(res) % 2 or not is_hex(res):
+            return
+        return binascii.a2b_hex(res.encode("ascii"))
+
     def _handle_message(self, message):
         # Filter stop packets:
         if message.startswith(("T", "S")):
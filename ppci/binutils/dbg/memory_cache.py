@@ -0,0 +1,128 @@
+""" Cache of target memory.
+
+Reading memory of a remote target is slow, since each read is a round
+trip over a serial line or network connection. This cache keeps blocks
+of target memory, and coalesces reads of adjacent missing blocks into a
+single read.
+
+The cache must be invalidated when the target runs, since the target
+then changes its memory. Memory which can change or which has side
+effects when read, such as peripheral registers, must not be cached.
+Therefore the cache can be limited to a set of address ranges, for
+example the RAM of the target.
+"""
+
+import logging
+
+
+class MemoryCache:
+    """ Block aligned cache of target memory.
+
+    Args:
+        read: a function which reads target memory given an address and
+            a size. It returns the data, or None when the memory cannot
+            be read.
+        block_size: the size of the cached blocks, a power of two.
+        max_read: the maximum amount of bytes read at once.
+        ranges: a list of (address, size) tuples with the memory which
+            may be cached. Other memory is read exactly as requested.
+            By default all memory is cached.
+    """
+
+    logger = logging.getLogger("memcache")
+
+    def __init__(self, read, block_size=64, max_read=1024, ranges=None):
+        if block_size & (block_size - 1):
+            raise ValueError("block_size must be a power of two")
+        self._read = read
+        self.block_size = block_size
+        self.max_read = max(max_read, block_size)
+        self.ranges = None if ranges is None else list(ranges)
+        self._blocks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def invalidate(self, address=None, size=None):
+        """ Invalidate the whole cache or the blocks in a range """
+        if address is None:
+            self._blocks.clear()
+        else:
+            for block in self._block_range(address, size):
+                self._blocks.pop(block, None)
+
+    def read(self, address, size):
+        """ Read memory, using the cached blocks when possible.
+
+        Returns None when the memory cannot be read.
+        """
+        blocks = self._block_range(address, size)
+        if not all(map(self.is_cacheable, blocks)):
+            return self._read(address, size)
+
+        missing = [b for b in blocks if b not in self._blocks]
+        self.hits += len(blocks) - len(missing)
+        self.misses += len(missing)
+        self._fetch(missing)
+
+        if any(b not in self._blocks for b in blocks):
+            # Blocks around the requested range may not be readable,
+            # so read the exact range from the target:
+            self.logger.debug("Uncached read of %s bytes at %x", size, address)
+            return self._read(address, size)
+
+        data = b"".join(self._blocks[b] for b in blocks)
+        offset = address - blocks[0] if blocks else 0
+        return data[offset : offset + size]
+
+    def prefetch(self, address, size):
+        """ Read a range of memory into the cache, ignoring errors """
+        blocks = self._block_range(max(address, 0), size)
+        self._fetch(
+            [
+                b
+                for b in blocks
+                if b not in self._blocks and self.is_cacheable(b)
+            ]
+        )
+
+    def is_cacheable(self, block):
+        """ Test if the block at the given address may be cached """
+        if self.ranges is None:
+            return True
+        end = block + self.block_size
+        return any(
+            address <= block and end <= address + size
+            for address, size in self.ranges
+        )
+
+    def _block_range(self, address, size):
+        """ Get the addresses of the blocks covering a range """
+        first = address - (address % self.block_size)
+        return list(range(first, address + size, self.block_size))
+
+    def _fetch(self, blocks):
+        """ Read blocks, combining adjacent blocks into one read """
+        run = []
+        for block in blocks:
+            if run and (
+                block != run[-1] + self.block_size
+                or len(run) * self.block_size >= self.max_read
+            ):
+                self._fetch_run(run)
+                run = []
+            run.append(block)
+        if run:
+            self._fetch_run(run)
+
+    def _fetch_run(self, run):
+        size = len(run) * self.block_size
+        data = self._read(run[0], size)
+        if data is None or len(data) != size:
+            self.logger.debug("Could not read %s bytes at %x", size, run[0])
+            return
+        for index, block in enumerate(run):
+            offset = index * self.block_size
+            self._blocks[block] = data[offset : offset + self.block_size]
@@ -1,6 +1,128 @@
-""" Contains disassembler stuff. """
+""" Contains disassembler stuff.
 
+Instructions are decoded with a decoding tree per instruction size.
+The tree is built from the fixed bit patterns of the instructions in
+the isa. Each node of the tree selects the bits which all remaining
+instructions have fixed, and looks up the instructions which have these
+bits set to the value found in the data. The instructions in a leaf
+are tried with :meth:`ppci.arch.encoding.Instruction.decode`.
+
+Fields set by custom patterns are decoded with
+:meth:`ppci.arch.encoding.Constructor.get_user_patterns`, so custom
+patterns should only set the variable fields of an instruction. Its
+fixed fields must be given in the patterns, to place the instruction in
+the decoding tree.
+
+Instructions with several encoding sizes, such as x86 instructions with
+optional displacement bytes, are placed in the tree of each of their
+sizes. Their fixed fields are taken from
+:meth:`ppci.arch.encoding.Instruction.leading_tokens`, which are at the
+start of each encoding.
+
+Instructions which cannot be decoded are emitted as bytes.
+"""
+
+import functools
+import logging
+import math
 from ..arch.data_instructions import DByte
+from ..arch.encoding import Constructor, FixedPattern
+from ..arch.token import TokenSequence
+
+
+logger = logging.getLogger("disasm")
+
+
+class InstructionDecoder:
+    """ Decoding information of a single instruction class.
+
+    The fixed bit patterns of the instruction are combined into a mask
+    and a value. Data can only hold this instruction when the bits
+    selected by the mask are equal to the value.
+    """
+
+    def __init__(self, instruction, size):
+        self.instruction = instruction
+        self.size = size
+        token_types = instruction.leading_tokens(size)
+        mask_tokens = TokenSequence([t() for t in token_types])
+        value_tokens = TokenSequence([t() for t in token_types])
+        for pattern in instruction.dict_to_patterns(instruction.patterns):
+            if isinstance(pattern, FixedPattern):
+                try:
+                    field = field_property(mask_tokens, pattern.field)
+                except KeyError:
+                    # Not in the same place in each encoding:
+                    continue
+                mask_tokens.set_field(pattern.field, field._mask)
+                value_tokens.set_field(pattern.field, pattern.value)
+        self.mask = as_word(mask_tokens.encode())
+        self.value = as_word(value_tokens.encode())
+        self.fixed_bits = bin(self.mask).count("1")
+
+    def __repr__(self):
+        return "InstructionDecoder({})".format(self.instruction.__name__)
+
+    def decode(self, data):
+        """ Decode data into an instruction.
+
+        Returns None when the data does not hold this instruction.
+        """
+        try:
+            instruction = self.instruction.decode(data)
+            # Make sure nothing got lost:
+            encoded = instruction.encode()
+        except (
+            ValueError,
+            TypeError,
+            KeyError,
+            AttributeError,
+            AssertionError,
+            NotImplementedError,
+        ):
+            return
+
+        if encoded == data:
+            return instruction
+
+
+class DecodingNode:
+    """ A node in a decoding tree.
+
+    Inner nodes have a mask, selecting bits which all instructions below
+    the node have fixed. The masked bits of the data word select the
+    child node. Leaves hold the instruction decoders to try, most
+    specific first.
+    """
+
+    def __init__(self, decoders, known_mask=0):
+        mask = -1
+        for decoder in decoders:
+            mask &= decoder.mask
+
+        if len(decoders) > 1 and mask & ~known_mask:
+            self.mask = mask
+            groups = {}
+            for decoder in decoders:
+                groups.setdefault(decoder.value & mask, []).append(decoder)
+            self.children = {
+                value: DecodingNode(group, known_mask=mask)
+                for value, group in groups.items()
+            }
+            self.decoders = ()
+        else:
+            self.mask = 0
+            self.children = None
+            self.decoders = sorted(decoders, key=lambda d: -d.fixed_bits)
+
+    def lookup(self, word):
+        """ Find the decoders which can decode the given data word """
+        node = self
+        while node.children is not None:
+            node = node.children.get(word & node.mask, None)
+            if node is None:
+                return ()
+        return [d for d in node.decoders if word & d.mask == d.value]
 
 
 class Disassembler:
@@ -8,33 +130,101 @@ class Disassembler:
 
     def __init__(self, arch):
         self.arch = arch
+        decoders = {}
         for instruction in arch.isa.instructions:
-            # print(instruction, instruction.patterns)
-            # for nl in instruction.non_leaves:
-            #    print('  ', nl.patterns)
-            pass
+            if not is_decodable(instruction):
+                continue
+            for size in instruction.sizes():
+                decoder = InstructionDecoder(instruction, size)
+                # Without fixed bits, an instruction cannot be recognized:
+                if decoder.mask:
+                    decoders.setdefault(size, []).append(decoder)
+
+        self.trees = [
+            (size, DecodingNode(decoders[size])) for size in sorted(decoders)
+        ]
+        logger.debug(
+            "Decoding trees for sizes %s", [size for size, _ in self.trees]
+        )
 
     def disasm(self, data, outs, address=0):
         """ Disassemble data into an instruction stream """
-        # TODO: implement this!
-
-        # The trial and error method, will be slow as a snail:
-        # for instruction in self.arch.isa.instructions:
-        #    for size in instruction.sizes():
-        #        part = data[:size]
-        #        try:
-        #            print(instruction, part, size)
-        #            i = instruction.decode(part)
-        #            print(i)
-        #        except ValueError:
-        #            pass
-
-        # For now, all is bytes!
-        for byte in data:
-            ins = DByte(byte)
-            ins.address = address
-            outs.emit(ins)
-            address += len(ins.encode())
-
-    def take_one(self):
-        pass
+        # Skip undecodable data in steps which keep instructions aligned:
+        step = functools.reduce(math.gcd, (s for s, _ in self.trees), 0) or 1
+        offset = 0
+        while offset < len(data):
+            ins = self.take_one(data, offset)
+            if ins is None:
+                instructions = [
+                    DByte(byte) for byte in data[offset : offset + step]
+                ]
+            else:
+                instructions = [ins]
+            for ins in instructions:
+                ins.address = address + offset
+                outs.emit(ins)
+                offset += len(ins.encode())
+
+    def take_one(self, data, offset=0):
+        """ Decode a single instruction at the given offset in data.
+
+        When several instructions match the data, the one with the most
+        fixed bits wins. Returns None when no instruction matches.
+        """
+        best = None
+        best_bits = -1
+        for size, tree in self.trees:
+            chunk = bytes(data[offset : offset + size])
+            if len(chunk) < size:
+                break
+            for decoder in tree.lookup(as_word(chunk)):
+                if decoder.fixed_bits <= best_bits:
+                    break
+                instruction = decoder.decode(chunk)
+                if instruction is not None:
+                    best = instruction
+                    best_bits = decoder.fixed_bits
+                    break
+        return best
+
+
+def is_decodable(instruction):
+    """ Test if an instruction class can be decoded from its patterns.
+
+    Constructors with custom patterns can only be decoded when they
+    implement get_user_patterns, the inverse of set_user_patterns.
+    Instructions made of constructors which bring their own tokens
+    cannot be decoded.
+    """
+    if not getattr(instruction, "tokens", None) or not instruction.syntax:
+        return False
+
+    constructors = [instruction]
+    for argument in instruction.syntax.formal_arguments:
+        if isinstance(argument._cls, tuple):
+            for option in argument._cls:
+                if getattr(option, "tokens", None) or not option.syntax:
+                    return False
+                constructors.append(option)
+        elif argument.is_constructor:
+            return False
+
+    return all(
+        c.set_user_patterns is Constructor.set_user_patterns
+        or c.get_user_patterns.__func__
+        is not Constructor.get_user_patterns.__func__
+        for c in constructors
+    )
+
+
+def field_property(tokens, field):
+    """ Get the property of a field in one of the tokens """
+    for token in tokens:
+        if hasattr(token, field):
+            return getattr(type(token), field)
+    raise KeyError(field)
+
+
+def as_word(data):
+    """ Turn bytes into an integer, to compare with masks and values """
+    return int.from_bytes(data, "little")
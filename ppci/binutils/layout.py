@@ -134,7 +134,7 @@ class LayoutLexer(BaseLexer):
                 r":=|[\.,=:\-+*\[\]/\(\)]|>=|<=|<>|>|<|}|{",
                 lambda typ, val: (val, val),
             ),
-            ("STRING", r"'.*?'", lambda typ, val: (typ, val[1:-1])),
+            ("STRING", r"'[^'\n]*'", lambda typ, val: (typ, val[1:-1])),
         ]
         super().__init__(tok_spec)
 
@@ -1,7 +1,7 @@
 """ Linker utility. """
 
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
 from .objectfile import ObjectFile, Image, get_object, RelocationEntry
 from ..common import CompilerError
 from .layout import Layout, Section, SectionData, SymbolDefinition, Align
@@ -374,7 +374,9 @@ class Linker:
         """ Try to fetch extra code from libraries to resolve symbols.
 
         Note that this can be a rabbit hole, since libraries can have undefined
-        symbols as well.
+        symbols as well. Therefore, a worklist of undefined symbols is
+        maintained. Each symbol is looked up in the symbol index of the
+        libraries, so only the objects which are pulled in are inspected.
         """
         undefined_symbols = self.get_undefined_symbols()
         if not undefined_symbols:
@@ -383,21 +385,29 @@ class Linker:
             )
             return
 
-        # Keep adding objects while we have undefined symbols.
-        reloop = True
-        while reloop:
-            reloop = False
-            for library in libraries:
-                self.logger.debug("scanning library for symbols %s", library)
-                for obj in library:
-                    has_sym = any(map(obj.has_symbol, undefined_symbols))
-                    if has_sym:
-                        self.logger.debug(
-                            "Using object file %s from library", obj
-                        )
-                        self.inject_object(obj, False)
-                        undefined_symbols = self.get_undefined_symbols()
-                        reloop = True
+        worklist = deque(undefined_symbols)
+        used_members = set()
+        while worklist:
+            name = worklist.popleft()
+            if self.dst.get_symbol(name).defined:
+                continue
+
+            for library_index, library in enumerate(libraries):
+                member = library.find_symbol(name)
+                if member is not None:
+                    break
+            else:
+                # Not found, this will be reported later on.
+                continue
+
+            if (library_index, member) in used_members:
+                continue
+            used_members.add((library_index, member))
+
+            obj = library[member]
+            self.logger.debug("Using object file %s from library", obj)
+            self.inject_object(obj, False)
+            worklist.extend(obj.get_undefined_symbols())
 
     def get_undefined_symbols(self):
         """ Get a list of currently undefined symbols.
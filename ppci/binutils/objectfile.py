@@ -14,10 +14,21 @@ The hierarchy is as follows:
 - debug data have an offset into a section and contain data.
 - sections cannot overlap
 
+Object files can be stored in two formats:
+
+- a json format, which is easy to inspect and exchange.
+- a compact binary format, which is the default. It consists of a
+  header, a string table, packed tables of sections, symbols,
+  relocations and images, followed by the raw section data. Debug
+  information is stored as a separate blob, which is only decoded
+  when the debug information is used.
+
 """
 
+import io
 import json
 import binascii
+import struct
 from ..common import CompilerError, make_num, get_file
 from ..utils.binary_txt import bin2asc, asc2bin
 from . import debuginfo
@@ -26,7 +37,7 @@ from . import debuginfo
 def get_object(obj):
     """ Try hard to load an object """
     if not isinstance(obj, ObjectFile):
-        f = get_file(obj)
+        f = get_file(obj, "rb")
         obj = ObjectFile.load(f)
         f.close()
     return obj
@@ -236,6 +247,25 @@ class ObjectFile:
         self.arch = arch
         self.entry_symbol_id = None  # object file entry point
 
+    @property
+    def debug_info(self):
+        """ The debug information, decoded on first use """
+        if self._debug_data is not None:
+            data = json.loads(bytes(self._debug_data).decode("utf8"))
+            self._debug_info = debuginfo.deserialize(data)
+            self._debug_data = None
+        return self._debug_info
+
+    @debug_info.setter
+    def debug_info(self, debug_info):
+        self._debug_info = debug_info
+        self._debug_data = None
+
+    @property
+    def has_debug_info(self):
+        """ Test for debug information, without decoding it """
+        return (self._debug_data is not None) or bool(self._debug_info)
+
     def __repr__(self):
         return "CodeObject of {} bytes".format(self.byte_size)
 
@@ -368,14 +398,38 @@ class ObjectFile:
         return serialize(self)
 
     def save(self, output_file):
-        """ Save object file to a file like object """
-        json.dump(self.serialize(), output_file, indent=2, sort_keys=True)
-        print(file=output_file)
+        """ Save object file to a file like object.
+
+        Text files receive the json format, binary files the binary
+        format.
+        """
+        if isinstance(output_file, io.TextIOBase):
+            json.dump(self.serialize(), output_file, indent=2, sort_keys=True)
+            print(file=output_file)
+        else:
+            output_file.write(self.to_bytes())
 
     @staticmethod
     def load(input_file):
-        """ Load object file from file """
-        return deserialize(json.load(input_file))
+        """ Load object file from file, in either format. """
+        if isinstance(input_file, io.TextIOBase):
+            return deserialize(json.load(input_file))
+        return ObjectFile.from_bytes(input_file.read())
+
+    def to_bytes(self):
+        """ Encode this object file in the binary format """
+        return BinaryObjectWriter().write(self)
+
+    @staticmethod
+    def from_bytes(data):
+        """ Decode an object from binary or json encoded bytes """
+        if is_binary_object(data):
+            return BinaryObjectReader(data).read()
+        try:
+            d = json.loads(bytes(data).decode("utf8"))
+        except ValueError:
+            raise CompilerError("Not a ppci object file")
+        return deserialize(d)
 
 
 def print_object(obj):
@@ -411,7 +465,7 @@ def serialize(x):
         for image in x.images:
             res["images"].append(serialize(image))
 
-        if x.debug_info:
+        if x.has_debug_info and x.debug_info:
             res["debug"] = debuginfo.serialize(x.debug_info)
 
         res["arch"] = x.arch.make_id_str()
@@ -505,3 +559,252 @@ def deserialize(data):
     if "debug" in data:
         obj.debug_info = debuginfo.deserialize(data["debug"])
     return obj
+
+
+# Binary format:
+OBJECT_MAGIC = b"PPCO"
+BINARY_FORMAT_VERSION = 1
+NO_STRING = 0xFFFFFFFF
+HAS_ENTRY, HAS_DEBUG = 1, 2
+SYMBOL_DEFINED, SYMBOL_HAS_SIZE = 1, 2
+
+# magic, version, flags, entry symbol, arch, section count, symbol count,
+# relocation count, image count, image section count, string table size,
+# data size and debug data size:
+_header = struct.Struct("<4sHHiIIIIIIIII")
+# name, address, alignment, data offset, size:
+_section_entry = struct.Struct("<IQIII")
+# id, name, binding, section, typ, flags, value, size:
+_symbol_entry = struct.Struct("<IIIIIBqq")
+# type, symbol id, section, offset, addend:
+_relocation_entry = struct.Struct("<IIIQq")
+# name, address, first image section, image section count:
+_image_entry = struct.Struct("<IQII")
+_image_section_entry = struct.Struct("<I")
+
+
+def is_binary_object(data):
+    """ Test if the given data is an object in binary format """
+    return bytes(data[:4]) == OBJECT_MAGIC
+
+
+class BinaryObjectWriter:
+    """ Encode an object file into bytes """
+
+    def __init__(self):
+        self.strings = bytearray()
+        self.string_map = {}
+
+    def string(self, txt):
+        """ Get the offset of a string into the string table """
+        if txt is None:
+            return NO_STRING
+        if txt not in self.string_map:
+            self.string_map[txt] = len(self.strings)
+            self.strings += txt.encode("utf8") + bytes([0])
+        return self.string_map[txt]
+
+    def write(self, obj):
+        tables = bytearray()
+        data = bytearray()
+        flags = 0
+
+        for section in obj.sections:
+            tables += _section_entry.pack(
+                self.string(section.name),
+                section.address,
+                section.alignment,
+                len(data),
+                section.size,
+            )
+            data += section.data
+
+        for symbol in obj.symbols:
+            symbol_flags = 0
+            if symbol.defined:
+                symbol_flags |= SYMBOL_DEFINED
+            if symbol.size is not None:
+                symbol_flags |= SYMBOL_HAS_SIZE
+            tables += _symbol_entry.pack(
+                symbol.id,
+                self.string(symbol.name),
+                self.string(symbol.binding),
+                self.string(symbol.section),
+                self.string(symbol.typ),
+                symbol_flags,
+                symbol.value or 0,
+                symbol.size or 0,
+            )
+
+        for relocation in obj.relocations:
+            tables += _relocation_entry.pack(
+                self.string(relocation.reloc_type),
+                relocation.symbol_id,
+                self.string(relocation.section),
+                relocation.offset,
+                relocation.addend,
+            )
+
+        image_sections = []
+        for image in obj.images:
+            tables += _image_entry.pack(
+                self.string(image.name),
+                image.address,
+                len(image_sections),
+                len(image.sections),
+            )
+            image_sections.extend(s.name for s in image.sections)
+        for name in image_sections:
+            tables += _image_section_entry.pack(self.string(name))
+
+        if obj.entry_symbol_id is None:
+            entry_symbol_id = -1
+        else:
+            entry_symbol_id = obj.entry_symbol_id
+            flags |= HAS_ENTRY
+
+        # Keep encoded debug information as it is:
+        if obj._debug_data is not None:
+            debug_data = bytes(obj._debug_data)
+        elif obj.debug_info:
+            debug_data = json.dumps(
+                debuginfo.serialize(obj.debug_info), separators=(",", ":")
+            ).encode("utf8")
+        else:
+            debug_data = bytes()
+        if debug_data:
+            flags |= HAS_DEBUG
+
+        header = _header.pack(
+            OBJECT_MAGIC,
+            BINARY_FORMAT_VERSION,
+            flags,
+            entry_symbol_id,
+            self.string(obj.arch.make_id_str()),
+            len(obj.sections),
+            len(obj.symbols),
+            len(obj.relocations),
+            len(obj.images),
+            len(image_sections),
+            len(self.strings),
+            len(data),
+            len(debug_data),
+        )
+        return b"".join(
+            [header, bytes(self.strings), bytes(tables), bytes(data),
+             debug_data]
+        )
+
+
+class BinaryObjectReader:
+    """ Decode an object file from bytes, or any other buffer """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+    def string(self, offset):
+        if offset == NO_STRING:
+            return
+        end = self.strings.index(0, offset)
+        return self.strings[offset:end].decode("utf8")
+
+    def table(self, entry, count):
+        """ Unpack a table with the given amount of entries """
+        size = entry.size * count
+        rows = entry.iter_unpack(self.data[self.offset : self.offset + size])
+        self.offset += size
+        return rows
+
+    def read(self):
+        from ..api import get_arch
+
+        (
+            magic,
+            version,
+            flags,
+            entry_symbol_id,
+            arch,
+            n_sections,
+            n_symbols,
+            n_relocations,
+            n_images,
+            n_image_sections,
+            strings_size,
+            data_size,
+            debug_size,
+        ) = _header.unpack_from(self.data)
+        if magic != OBJECT_MAGIC:
+            raise CompilerError("Not a binary object file")
+        if version != BINARY_FORMAT_VERSION:
+            raise CompilerError(
+                "Unsupported object format version {}".format(version)
+            )
+        self.offset = _header.size
+        self.strings = bytes(
+            self.data[self.offset : self.offset + strings_size]
+        )
+        self.offset += strings_size
+        string = self.string
+
+        obj = ObjectFile(get_arch(string(arch)))
+        if flags & HAS_ENTRY:
+            obj.entry_symbol_id = entry_symbol_id
+
+        sections = list(self.table(_section_entry, n_sections))
+        symbols = self.table(_symbol_entry, n_symbols)
+        relocations = self.table(_relocation_entry, n_relocations)
+        images = list(self.table(_image_entry, n_images))
+        image_sections = [
+            string(name)
+            for name, in self.table(_image_section_entry, n_image_sections)
+        ]
+        data = self.data[self.offset : self.offset + data_size]
+        self.offset += data_size
+
+        for name, address, alignment, data_offset, size in sections:
+            section = Section(string(name))
+            section.address = address
+            section.alignment = alignment
+            section.data = bytearray(data[data_offset : data_offset + size])
+            obj.add_section(section)
+
+        for (
+            symbol_id,
+            name,
+            binding,
+            section,
+            typ,
+            symbol_flags,
+            value,
+            size,
+        ) in symbols:
+            obj.add_symbol(
+                symbol_id,
+                string(name),
+                string(binding),
+                value if symbol_flags & SYMBOL_DEFINED else None,
+                string(section),
+                string(typ),
+                size if symbol_flags & SYMBOL_HAS_SIZE else None,
+            )
+
+        for reloc_type, symbol_id, section, offset, addend in relocations:
+            obj.add_relocation(
+                RelocationEntry(
+                    string(reloc_type),
+                    symbol_id,
+                    string(section),
+                    offset,
+                    addend,
+                )
+            )
+
+        for name, address, first, count in images:
+            image = Image(string(name), address)
+            obj.add_image(image)
+            for section_name in image_sections[first : first + count]:
+                image.add_section(obj.get_section(section_name))
+
+        if flags & HAS_DEBUG:
+            obj._debug_data = self.data[self.offset : self.offset + debug_size]
+        return obj
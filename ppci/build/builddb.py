@@ -0,0 +1,124 @@
+"""
+    Persistent record of executed build jobs.
+
+    For every job, the database records a signature of the job
+    arguments and the content hashes of all files read by the job.
+    When none of these changed, the stored result of the job is re-used
+    instead of executing the job again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .. import __version__
+from ..utils.diskcache import DiskCache, make_key
+
+
+class BuildDatabase:
+    """ A directory with job records and job results """
+    logger = logging.getLogger('builddb')
+    database_filename = 'builddb.json'
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.results = DiskCache(os.path.join(self.directory, 'results'))
+        self.filename = os.path.join(self.directory, self.database_filename)
+        self._lock = threading.Lock()
+        self._file_hashes = {}
+        self.entries = {}
+        self.load()
+
+    def __repr__(self):
+        return 'BuildDatabase({!r})'.format(self.directory)
+
+    def load(self):
+        """ Load the job records from disk """
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            self.logger.warning('Ignoring corrupt %s', self.filename)
+            return
+
+        if data.get('version') == __version__:
+            self.entries = data['jobs']
+
+    def save(self):
+        """ Write the job records to disk """
+        data = {'version': __version__, 'jobs': self.entries}
+        tmp_filename = self.filename + '.tmp'
+        with self._lock:
+            with open(tmp_filename, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_filename, self.filename)
+
+    def file_hash(self, filename):
+        """ Get the content hash of a file, or None if it does not exist.
+
+        Hashes are remembered as long as the size and modification time
+        of the file do not change.
+        """
+        filename = os.path.abspath(filename)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if filename in self._file_hashes:
+                old_stamp, value = self._file_hashes[filename]
+                if old_stamp == stamp:
+                    return value
+
+        with open(filename, 'rb') as f:
+            value = hashlib.sha256(f.read()).hexdigest()
+
+        with self._lock:
+            self._file_hashes[filename] = (stamp, value)
+        return value
+
+    def hash_files(self, filenames):
+        """ Get a dictionary with the content hashes of the given files """
+        return {
+            os.path.abspath(filename): self.file_hash(filename)
+            for filename in filenames}
+
+    def lookup(self, key, signature):
+        """ Get the result of the given job if it is still up to date.
+
+        Returns None when the job must be executed.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None or entry['signature'] != signature:
+            return
+
+        for filename, value in entry['inputs'].items():
+            if self.file_hash(filename) != value:
+                self.logger.debug('%s changed', filename)
+                return
+
+        return self.results.get(entry['result'])
+
+    def store(self, key, signature, inputs, result):
+        """ Record the result of a job.
+
+        Args:
+            key: a name which identifies the job.
+            signature: a hash over all job arguments.
+            inputs: a dictionary with the content hashes of the files
+                read by the job.
+            result: the picklable result of the job.
+        """
+        result_key = make_key(
+            key, signature, json.dumps(inputs, sort_keys=True))
+        self.results.put(result_key, result)
+        entry = {
+            'signature': signature, 'inputs': inputs, 'result': result_key}
+        with self._lock:
+            self.entries[key] = entry
@@ -6,13 +6,65 @@ These task are wrappers around the functions provided in the buildfunctions
 module
 """
 
-from .tasks import Task, TaskError, register_task
+from .tasks import Task, TaskError, Job, register_task
 from ..utils.reporting import HtmlReportGenerator, DummyReportGenerator
 from .. import api
+from ..binutils.objectfile import deserialize
+from ..lang.c.builder import CBuilder
 from ..lang.tools.common import ParserException
 from ..common import CompilerError
 
 
+# Job functions. These are executed by the task runner, possibly in
+# another process. They return a serialized object file and a list of
+# other files which were read.
+
+def assemble_job(source, arch, debug):
+    """ Assemble a single source file """
+    try:
+        obj = api.asm(source, arch, debug=debug)
+    except ParserException as err:
+        raise TaskError('Error during assembly:' + str(err))
+    except CompilerError as err:
+        raise TaskError('Error during assembly:' + str(err))
+    except OSError as err:
+        raise TaskError('Error:' + str(err))
+    return obj.serialize(), []
+
+
+def c3_compile_job(sources, includes, arch, opt, debug):
+    """ Compile a set of C3 modules """
+    obj = api.c3c(sources, includes, arch, opt_level=opt, debug=debug)
+    return obj.serialize(), []
+
+
+def c_compile_job(source, arch, includes, opt, debug):
+    """ Compile a single C source file """
+    march = api.get_arch(arch)
+    coptions = api.COptions()
+    coptions.add_include_paths(includes)
+    builder = CBuilder(march.info, coptions)
+    with open(source, 'r') as f:
+        ir_module = builder.build(f, source)
+    api.optimize(ir_module, level=opt)
+    obj = api.ir_to_object([ir_module], march, debug=debug)
+    return obj.serialize(), builder.preprocessor.included_files
+
+
+def pascal_compile_job(sources, arch, opt, debug):
+    """ Compile a set of pascal sources """
+    obj = api.pascal(sources, arch, opt_level=opt)
+    obj = api.link((obj,), partial_link=True, debug=debug)
+    return obj.serialize(), []
+
+
+def wasm_compile_job(source, arch, opt):
+    """ Compile a wasm module """
+    with open(source, 'rb') as f:
+        obj = api.wasmcompile(f, arch, opt_level=opt)
+    return obj.serialize(), []
+
+
 @register_task
 class EmptyTask(Task):
     """ Basic task that does nothing """
@@ -48,11 +100,15 @@ class BuildTask(Task):
 class OutputtingTask(Task):
     """ Base task for tasks that create an object file """
 
+    def run_job(self, job):
+        """ Run a single job, and return the object file it created """
+        return deserialize(self.run_jobs([job])[0])
+
     def store_object(self, obj):
         """ Store the object in the specified file """
         output_filename = self.relpath(self.get_argument('output'))
         self.ensure_path(output_filename)
-        with open(output_filename, 'wt', encoding='utf8') as output_file:
+        with open(output_filename, 'wb') as output_file:
             obj.save(output_file)
 
 
@@ -69,15 +125,8 @@ class AssembleTask(OutputtingTask):
         else:
             debug = False
 
-        try:
-            obj = api.asm(source, arch, debug=debug)
-        except ParserException as err:
-            raise TaskError('Error during assembly:' + str(err))
-        except CompilerError as err:
-            raise TaskError('Error during assembly:' + str(err))
-        except OSError as err:
-            raise TaskError('Error:' + str(err))
-
+        obj = self.run_job(
+            Job(assemble_job, (source, arch, debug), [source]))
         self.store_object(obj)
         self.logger.debug('Assembling finished')
 
@@ -104,10 +153,16 @@ class C3CompileTask(OutputtingTask):
         debug = bool(self.get_argument('debug', default=False))
         opt = int(self.get_argument('optimize', default='0'))
 
-        with reporter:
-            obj = api.c3c(
-                sources, includes, arch, opt_level=opt,
-                reporter=reporter, debug=debug)
+        if isinstance(reporter, DummyReportGenerator):
+            job = Job(
+                c3_compile_job, (sources, includes, arch, opt, debug),
+                sources + includes)
+            obj = self.run_job(job)
+        else:
+            with reporter:
+                obj = api.c3c(
+                    sources, includes, arch, opt_level=opt,
+                    reporter=reporter, debug=debug)
 
         self.store_object(obj)
 
@@ -134,19 +189,28 @@ class CCompileTask(OutputtingTask):
         debug = bool(self.get_argument('debug', default=False))
         opt = int(self.get_argument('optimize', default='0'))
 
-        coptions = api.COptions()
-        coptions.add_include_paths(includes)
-
-        with reporter:
-            objs = []
-            for source in sources:
-                with open(source, 'r') as f:
-                    obj = api.cc(
-                        f, arch, coptions=coptions, opt_level=opt,
-                        reporter=reporter, debug=debug)
-                objs.append(obj)
-            obj = api.link(
-                objs, partial_link=True, reporter=reporter, debug=debug)
+        if isinstance(reporter, DummyReportGenerator):
+            # Compile each source in a separate job:
+            jobs = [
+                Job(c_compile_job, (source, arch, includes, opt, debug),
+                    [source])
+                for source in sources]
+            objs = [deserialize(d) for d in self.run_jobs(jobs)]
+            obj = api.link(objs, partial_link=True, debug=debug)
+        else:
+            coptions = api.COptions()
+            coptions.add_include_paths(includes)
+
+            with reporter:
+                objs = []
+                for source in sources:
+                    with open(source, 'r') as f:
+                        obj = api.cc(
+                            f, arch, coptions=coptions, opt_level=opt,
+                            reporter=reporter, debug=debug)
+                    objs.append(obj)
+                obj = api.link(
+                    objs, partial_link=True, reporter=reporter, debug=debug)
 
         self.store_object(obj)
 
@@ -169,10 +233,15 @@ class PascalCompileTask(OutputtingTask):
         debug = bool(self.get_argument('debug', default=False))
         opt = int(self.get_argument('optimize', default='0'))
 
-        with reporter:
-            obj = api.pascal(sources, arch, opt_level=opt, reporter=reporter)
-            obj = api.link(
-                (obj,), partial_link=True, reporter=reporter, debug=debug)
+        if isinstance(reporter, DummyReportGenerator):
+            obj = self.run_job(
+                Job(pascal_compile_job, (sources, arch, opt, debug), sources))
+        else:
+            with reporter:
+                obj = api.pascal(
+                    sources, arch, opt_level=opt, reporter=reporter)
+                obj = api.link(
+                    (obj,), partial_link=True, reporter=reporter, debug=debug)
 
         self.store_object(obj)
 
@@ -194,10 +263,14 @@ class WasmCompileTask(OutputtingTask):
             reporter = DummyReportGenerator()
 
         self.logger.debug('loading %s', source[0])
-        with reporter:
-            with open(source[0], 'rb') as f:
-                obj = api.wasmcompile(
-                    f, arch, opt_level=opt, reporter=reporter)
+        if isinstance(reporter, DummyReportGenerator):
+            obj = self.run_job(
+                Job(wasm_compile_job, (source[0], arch, opt), source[:1]))
+        else:
+            with reporter:
+                with open(source[0], 'rb') as f:
+                    obj = api.wasmcompile(
+                        f, arch, opt_level=opt, reporter=reporter)
         self.store_object(obj)
 
 
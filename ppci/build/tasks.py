@@ -7,6 +7,12 @@ import logging
 import re
 import os
 import glob
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+from .. import __version__
+from ..utils.diskcache import make_key
 
 
 task_map = {}
@@ -26,6 +32,7 @@ def register_task(cls):
 class TaskError(Exception):
     """ When a task fails, this exception is raised """
     def __init__(self, msg):
+        super().__init__(msg)
         self.msg = msg
 
 
@@ -114,6 +121,55 @@ class Target:
         return 'Target "{}"'.format(self.name)
 
 
+def execute_job(function, args):
+    """ Execute a job function, possibly in a worker process """
+    try:
+        return function(*args)
+    except Exception as ex:
+        # Make sure that the error can be passed to the main process:
+        try:
+            pickle.loads(pickle.dumps(ex))
+        except Exception:
+            raise TaskError('{}: {}'.format(type(ex).__name__, ex)) from None
+        raise
+
+
+class Job:
+    """ A part of a task which can be executed in a worker process.
+
+    Args:
+        function: a module level function which does the work. It must
+            return a tuple with the result and a list of additional files
+            which were read, for example included headers.
+        args: the arguments for the function.
+        inputs: the files which are read by the job.
+    """
+    def __init__(self, function, args, inputs):
+        self.function = function
+        self.args = tuple(args)
+        self.inputs = list(inputs)
+
+    @property
+    def key(self):
+        """ A name which identifies this job """
+        return '{}:{}'.format(
+            self.function.__name__,
+            ';'.join(os.path.abspath(i) for i in self.inputs))
+
+    @property
+    def signature(self):
+        """ A hash over the arguments of this job """
+        return make_key(
+            __version__, self.function.__module__, self.function.__name__,
+            repr(self.args))
+
+    def execute(self):
+        return execute_job(self.function, self.args)
+
+    def __repr__(self):
+        return 'Job "{}"'.format(self.key)
+
+
 class Task:
     """ Task that can run, and depend on other tasks """
     def __init__(self, target, kwargs, sub_elements=[]):
@@ -121,6 +177,7 @@ class Task:
         self.target = target
         self.name = self.__class__.__name__
         self.arguments = kwargs
+        self.runner = None
 
     def get_argument(self, name, default=None):
         if name not in self.arguments:
@@ -159,6 +216,17 @@ class Task:
                 file_names.append(os.path.normpath(filename))
         return file_names
 
+    def run_jobs(self, jobs):
+        """ Execute the given jobs and return their results.
+
+        The task runner can execute jobs in parallel, and can skip jobs
+        which are up to date.
+        """
+        if self.runner:
+            return self.runner.run_jobs(jobs)
+        else:
+            return [job.execute()[0] for job in jobs]
+
     def run(self):  # pragma: no cover
         """ Implement this method when creating a custom task """
         raise NotImplementedError("Implement this abstract method!")
@@ -168,9 +236,18 @@ class Task:
 
 
 class TaskRunner:
-    """ Basic task runner that can run some tasks in sequence """
-    def __init__(self):
+    """ Task runner that can run some tasks.
+
+    Args:
+        jobs: the number of targets and jobs to run at the same time.
+        build_db: a :class:`ppci.build.builddb.BuildDatabase` which is
+            used to skip jobs which are up to date.
+    """
+    def __init__(self, jobs=1, build_db=None):
         self.logger = logging.getLogger('taskrunner')
+        self.jobs = jobs
+        self.build_db = build_db
+        self._executor = None
 
     def get_task(self, name):
         """ Tries to load the task type """
@@ -212,13 +289,85 @@ class TaskRunner:
         self.logger.info('Target sequence: {}'.format(target_list))
 
         # Run tasks:
-        for target in target_list:
-            self.logger.info('Target {} Started'.format(target.name))
-            for tname, props in target.tasks:
-                for arg in props:
-                    props[arg] = project.expand_macros(props[arg])
-                task = self.get_task(tname)(target, props)
-                self.logger.info('Running {}'.format(task))
-                task.run()
-            self.logger.info('Target {} Ready'.format(target.name))
+        try:
+            if self.jobs > 1:
+                # Use spawned processes, since forking a process with
+                # several threads is not safe:
+                mp_context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(
+                        self.jobs, mp_context=mp_context) as executor:
+                    self._executor = executor
+                    self.run_parallel(project, target_list)
+            else:
+                for target in target_list:
+                    self.run_target(project, target)
+        finally:
+            self._executor = None
+            if self.build_db:
+                self.build_db.save()
         self.logger.info('All targets done!')
+
+    def run_parallel(self, project, target_list):
+        """ Run targets as soon as the targets they depend upon are done """
+        names = set(target.name for target in target_list)
+        done = set()
+        running = {}
+        waiting = list(target_list)
+        with ThreadPoolExecutor(self.jobs) as executor:
+            while waiting or running:
+                for target in list(waiting):
+                    if target.dependencies & names <= done:
+                        waiting.remove(target)
+                        future = executor.submit(
+                            self.run_target, project, target)
+                        running[future] = target
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    target = running.pop(future)
+                    future.result()
+                    done.add(target.name)
+
+    def run_target(self, project, target):
+        """ Run all tasks of a single target """
+        self.logger.info('Target {} Started'.format(target.name))
+        for tname, props in target.tasks:
+            for arg in props:
+                props[arg] = project.expand_macros(props[arg])
+            task = self.get_task(tname)(target, props)
+            task.runner = self
+            self.logger.info('Running {}'.format(task))
+            task.run()
+        self.logger.info('Target {} Ready'.format(target.name))
+
+    def run_jobs(self, jobs):
+        """ Execute jobs, and return their results in order """
+        results = [None] * len(jobs)
+        input_hashes = {}
+        pending = []
+        for index, job in enumerate(jobs):
+            if self.build_db:
+                input_hashes[index] = self.build_db.hash_files(job.inputs)
+                result = self.build_db.lookup(job.key, job.signature)
+                if result is not None:
+                    self.logger.info('{} is up to date'.format(job))
+                    results[index] = result
+                    continue
+            pending.append(index)
+
+        if self._executor:
+            futures = [
+                self._executor.submit(
+                    execute_job, jobs[index].function, jobs[index].args)
+                for index in pending]
+            outcomes = [future.result() for future in futures]
+        else:
+            outcomes = [jobs[index].execute() for index in pending]
+
+        for index, (result, dependencies) in zip(pending, outcomes):
+            job = jobs[index]
+            if self.build_db:
+                inputs = input_hashes[index]
+                inputs.update(self.build_db.hash_files(dependencies))
+                self.build_db.store(job.key, job.signature, inputs, result)
+            results[index] = result
+        return results
@@ -35,7 +35,7 @@ def asm(args=None):
         obj = api.asm(args.sourcefile, march, debug=args.debug)
 
         # Write object file to disk:
-        with open(args.output, "w") as output:
+        with open(args.output, "wb") as output:
             obj.save(output)
 
 
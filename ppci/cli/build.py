@@ -5,6 +5,7 @@ Use this to execute build files.
 
 
 import argparse
+import os
 from .base import base_parser, LogSetup
 from .. import api
 
@@ -17,6 +18,25 @@ parser.add_argument(
     help="use buildfile, otherwise build.xml is the default",
     default="build.xml",
 )
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="the number of targets and compilations to run in parallel",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--build-db",
+    metavar="directory",
+    help="directory in which the results of previous builds are kept, "
+    "by default .ppci-build next to the build file",
+)
+parser.add_argument(
+    "--no-build-db",
+    help="rebuild everything, and do not keep the build results",
+    action="store_true",
+    default=False,
+)
 parser.add_argument("targets", metavar="target", nargs="*")
 
 
@@ -24,7 +44,16 @@ def build(args=None):
     """ Run the build command from command line. Used by ppci-build.py """
     args = parser.parse_args(args)
     with LogSetup(args):
-        api.construct(args.buildfile, args.targets)
+        if args.no_build_db:
+            build_db = None
+        elif args.build_db:
+            build_db = args.build_db
+        else:
+            build_dir = os.path.dirname(os.path.abspath(args.buildfile))
+            build_db = os.path.join(build_dir, ".ppci-build")
+        api.construct(
+            args.buildfile, args.targets, jobs=args.jobs, build_db=build_db
+        )
 
 
 if __name__ == "__main__":
@@ -27,6 +27,12 @@ compile_parser.add_argument(
     action="store_true",
     default=False,
 )
+compile_parser.add_argument(
+    "--bitcode",
+    help="Output ppci ir-code as bitcode, do not generate code",
+    action="store_true",
+    default=False,
+)
 compile_parser.add_argument(
     "--wasm",
     help="Output WASM (WebAssembly)",
@@ -39,6 +45,14 @@ compile_parser.add_argument(
 compile_parser.add_argument(
     "-O", help="optimize code", default="0", choices=api.OPT_LEVELS
 )
+compile_parser.add_argument(
+    "-j",
+    "--jobs",
+    help="optimize and generate the functions using the given amount of "
+    "processes",
+    type=int,
+    default=1,
+)
 compile_parser.add_argument(
     "--instrument-functions",
     help="Instrument given functions",
@@ -52,7 +66,9 @@ def do_compile(ir_modules, march, reporter, args):
 
     # Optimize:
     for ir_module in ir_modules:
-        api.optimize(ir_module, level=args.O, reporter=reporter)
+        api.optimize(
+            ir_module, level=args.O, reporter=reporter, jobs=args.jobs
+        )
 
     # Instrument:
     if args.instrument_functions:
@@ -66,11 +82,24 @@ def do_compile(ir_modules, march, reporter, args):
         with open(args.output, "w") as output:
             for ir_module in ir_modules:
                 irutils.Writer(file=output).write(ir_module)
+    elif args.bitcode:  # Stop after ir code generation
+        if len(ir_modules) == 1:
+            ir_module = ir_modules[0]
+        else:
+            ir_module = irutils.ir_link(ir_modules)
+        with open(args.output, "wb") as output:
+            output.write(irutils.to_bitcode(ir_module))
     elif args.S:  # Output assembly code
         with open(args.output, "w") as output:
             stream = TextOutputStream(printer=march.asm_printer, f=output)
             for ir_module in ir_modules:
-                api.ir_to_stream(ir_module, march, stream, reporter=reporter)
+                api.ir_to_stream(
+                    ir_module,
+                    march,
+                    stream,
+                    reporter=reporter,
+                    jobs=args.jobs,
+                )
     elif args.wasm:  # Output web-assembly code
         assert len(ir_modules) == 1
         ir_module = ir_modules[0]
@@ -82,9 +111,9 @@ def do_compile(ir_modules, march, reporter, args):
             api.ir_to_python(ir_modules, output, reporter=reporter)
     else:  # Full object output
         obj = api.ir_to_object(
-            ir_modules, march, reporter=reporter, debug=args.g
+            ir_modules, march, reporter=reporter, debug=args.g, jobs=args.jobs
         )
-        with open(args.output, "w") as output:
+        with open(args.output, "wb") as output:
             obj.save(output)
 
         # TODO: link objects together?
@@ -16,12 +16,12 @@ parser = argparse.ArgumentParser(
     parents=[base_parser, out_parser],
 )
 parser.add_argument(
-    "obj", type=argparse.FileType("r"), nargs="+", help="the object to link"
+    "obj", type=argparse.FileType("rb"), nargs="+", help="the object to link"
 )
 parser.add_argument(
     "--library",
     help="Add library to use when searching for symbols.",
-    type=argparse.FileType("r"),
+    type=argparse.FileType("rb"),
     action="append",
     default=[],
     metavar="library-filename",
@@ -65,7 +65,7 @@ def link(args=None):
             entry=args.entry,
         )
         if relocatable:
-            with open(args.output, "w") as output:
+            with open(args.output, "wb") as output:
                 obj.save(output)
         else:
             create_platform_executable(obj, args.output)
@@ -2,16 +2,21 @@
 
 
 import argparse
+import io
 from .base import base_parser, march_parser, LogSetup
 from .base import get_arch_from_args
 from .compile_base import compile_parser, do_compile
-from .. import api
+from .. import api, irutils
 
 
 parser = argparse.ArgumentParser(
     description=__doc__, parents=[base_parser, march_parser, compile_parser]
 )
-parser.add_argument("source", help="source file", type=argparse.FileType("r"))
+parser.add_argument(
+    "source",
+    help="source file, llvm ir-code or ppci bitcode",
+    type=argparse.FileType("rb"),
+)
 
 
 def llc(args=None):
@@ -19,7 +24,13 @@ def llc(args=None):
     args = parser.parse_args(args)
     with LogSetup(args) as log_setup:
         march = get_arch_from_args(args)
-        ir_module = api.llvm_to_ir(args.source)
+        if irutils.is_bitcode(args.source.peek(4)):
+            ir_module = irutils.from_bitcode(args.source.read())
+        else:
+            source = io.TextIOWrapper(args.source)
+            ir_module = api.llvm_to_ir(source)
+            # Detach, so that the wrapper does not close the source file:
+            source.detach()
         do_compile([ir_module], march, log_setup.reporter, log_setup.args)
 
 
@@ -9,7 +9,7 @@ from ..binutils.objectfile import ObjectFile, print_object
 
 
 parser = argparse.ArgumentParser(description=__doc__, parents=[base_parser])
-parser.add_argument("obj", help="object file", type=argparse.FileType("r"))
+parser.add_argument("obj", help="object file", type=argparse.FileType("rb"))
 parser.add_argument(
     "-d",
     "--disassemble",
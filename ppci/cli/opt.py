@@ -2,23 +2,56 @@
 
 
 import argparse
+import io
 from .base import base_parser, LogSetup
 from .. import api, irutils
 
 
 parser = argparse.ArgumentParser(description=__doc__, parents=[base_parser])
-parser.add_argument("-O", help="Optimization level", default=2, type=int)
-parser.add_argument("input", help="input file", type=argparse.FileType("r"))
-parser.add_argument("output", help="output file", type=argparse.FileType("w"))
+parser.add_argument(
+    "-O", help="Optimization level", default="2", choices=api.OPT_LEVELS
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="optimize the functions using the given amount of processes",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--bitcode",
+    help="write the output as bitcode instead of text",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "input", help="input file, text or bitcode", type=argparse.FileType("rb")
+)
+parser.add_argument(
+    "output", help="output file", type=argparse.FileType("wb")
+)
 
 
 def opt(args=None):
     """ Optimize a single IR-file """
     args = parser.parse_args(args)
-    module = irutils.Reader().read(args.input)
+    if irutils.is_bitcode(args.input.peek(4)):
+        module = irutils.from_bitcode(args.input.read())
+    else:
+        text_input = io.TextIOWrapper(args.input)
+        module = irutils.Reader().read(text_input)
+        # Detach, so that the wrapper does not close the input file:
+        text_input.detach()
     with LogSetup(args):
-        api.optimize(module, level=args.O)
-    irutils.Writer(file=args.output).write(module)
+        api.optimize(module, level=args.O, jobs=args.jobs)
+    if args.bitcode:
+        args.output.write(irutils.to_bitcode(module))
+    else:
+        output = io.TextIOWrapper(args.output)
+        irutils.Writer(file=output).write(module)
+        # Detach, so that the wrapper does not close the output file,
+        # which can be stdout:
+        output.detach()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
-from .codegen import CodeGenerator
+from .codegen import CodeGenerator, warm_up
+from .instructionselector import burg_system_cache
 
-__all__ = ["CodeGenerator"]
+__all__ = ["CodeGenerator", "warm_up", "burg_system_cache"]
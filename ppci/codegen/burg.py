@@ -56,12 +56,14 @@ tree. This strategy consists of two steps:
 
 """
 
+import io
 import sys
 from os import path
 import argparse
 from ppci.lang.common import Token, SourceLocation
 from ppci.lang.tools import baselex, yacc
 from ppci.utils.tree import Tree
+from ppci.codegen.treematcher import State
 
 # Generate parser on the fly:
 spec_file = path.join(path.dirname(path.abspath(__file__)), "burg.grammar")
@@ -145,6 +147,8 @@ class BurgSystem:
         self.non_terminals = set()
         self.rule_map = {}
         self.goal = None
+        self._chain_closures = {}
+        self.selector_namespace = None
 
     def add_rule(self, non_term, tree, cost, acceptance, template):
         if isinstance(template, str):
@@ -154,6 +158,8 @@ class BurgSystem:
         rule = Rule(non_term, tree, cost, acceptance, template)
         if len(tree.children) == 0 and tree.name not in self.terminals:
             self.non_term(tree.name).chain_rules.append(rule)
+            self._chain_closures.clear()
+        self.selector_namespace = None
         self.non_term(rule.non_term)
         self.rules.append(rule)
         rule.nr = len(self.rules)
@@ -186,6 +192,35 @@ class BurgSystem:
         """ Retrieve chain rules for a given non terminal """
         return self.symbols[non_terminal].chain_rules
 
+    def chain_closure(self, non_terminal):
+        """ Retrieve all chain rules reachable from a non terminal.
+
+        Returns a list of (rule, cost) tuples, where cost is the total cost
+        of the chain rules applied to get from the given non terminal to
+        the non terminal of the rule. The closure is computed once and
+        then cached.
+        """
+        if non_terminal not in self._chain_closures:
+            closure = []
+            marked_rules = set()
+
+            def visit(nt, cost):
+                for rule in self.chain_rules_for_nt(nt):
+                    if rule not in marked_rules:
+                        marked_rules.add(rule)
+                        rule_cost = cost + rule.cost
+                        closure.append((rule, rule_cost))
+                        visit(rule.non_term, rule_cost)
+
+            visit(non_terminal, 0)
+            self._chain_closures[non_terminal] = closure
+        return self._chain_closures[non_terminal]
+
+    def prepare(self):
+        """ Pre-compute the chain rule closures of all non terminals. """
+        for non_terminal in self.non_terminals:
+            self.chain_closure(non_terminal)
+
     def install(self, name: str, t):
         assert isinstance(name, str)
         if name in self.symbols:
@@ -413,6 +448,157 @@ class BurgGenerator:
         return tst + child_tests
 
 
+class SelectorGenerator:
+    """ Generate a specialised tree labeler for a burg system.
+
+    Where the :class:`BurgGenerator` creates a matcher from a burg
+    specification file, this generator creates python code for a burg
+    system which was constructed in memory, for example from the
+    patterns of an instruction set. Acceptance functions are referred to
+    by rule number, as ``A<nr>``. The generated code only labels trees,
+    the templates of the rules are not used by it.
+
+    For each terminal a labeling function is generated. The structure
+    of the rule trees is tested inline, and the costs of the chain rules
+    are precomputed, so no rule lookups are required during labeling.
+    """
+
+    def print(self, level, text=""):
+        """ Print helper function that prints to output file """
+        print("    " * level + text, file=self.output_file)
+
+    def generate(self, system, output_file):
+        """ Generate python code which labels trees for the system """
+        self.output_file = output_file
+        self.system = system
+
+        self.print(0, "# Generated tree labeler, do not edit.")
+        for terminal in sorted(system.terminals):
+            self.print(0)
+            self.print(0)
+            self.emit_label_function(terminal)
+
+        self.print(0)
+        self.print(0)
+        self.print(0, "label_functions = {")
+        for terminal in sorted(system.terminals):
+            self.print(1, '"{0}": label_{0},'.format(terminal))
+        self.print(0, "}")
+
+        self.print(0)
+        self.print(0, "kid_functions = {")
+        for rule in system.rules:
+            kids, _ = self.compute_kids(rule.tree, "tree")
+            kids = "".join("{}, ".format(k) for k in kids)
+            self.print(1, "{}: lambda tree: ({}),".format(rule.nr, kids))
+        self.print(0, "}")
+
+        self.print(0)
+        self.print(0, "nts_map = {")
+        for rule in system.rules:
+            _, nts = self.compute_kids(rule.tree, "tree")
+            self.print(1, "{}: {},".format(rule.nr, tuple(nts)))
+        self.print(0, "}")
+
+    def emit_label_function(self, terminal):
+        """ Emit a function which labels a tree with this terminal """
+        self.print(0, "def label_{}(tree):".format(terminal))
+        self.print(1, "state = tree.state = State()")
+        self.print(1, "labels = state.labels")
+        for rule in self.system.get_rules_for_root(terminal):
+            self.print(1, "# {}: {}".format(rule.nr, rule))
+            tests = self.compute_tests(rule.tree, "tree")
+            if tests:
+                self.print(1, "if {}:".format(" and ".join(tests)))
+                self.emit_rule(2, rule)
+            else:
+                self.emit_rule(1, rule)
+        self.print(1, "return state")
+
+    def emit_rule(self, level, rule):
+        """ Emit code which checks for a rule match and records it """
+        kids, nts = self.compute_kids(rule.tree, "tree")
+        for i, kid in enumerate(kids):
+            self.print(level, "k{} = {}.state.labels".format(i, kid))
+
+        conditions = []
+        if rule.acceptance:
+            conditions.append("A{}(tree)".format(rule.nr))
+        for i, nt in enumerate(nts):
+            conditions.append('"{}" in k{}'.format(nt, i))
+        if conditions:
+            self.print(level, "if {}:".format(" and ".join(conditions)))
+            level += 1
+
+        costs = ['k{}["{}"][0]'.format(i, nt) for i, nt in enumerate(nts)]
+        costs.append(str(rule.cost))
+        self.print(level, "c = {}".format(" + ".join(costs)))
+        self.emit_set_cost(level, rule.non_term, "c", rule.nr)
+        for chain_rule, chain_cost in self.system.chain_closure(
+            rule.non_term
+        ):
+            self.emit_set_cost(
+                level,
+                chain_rule.non_term,
+                "c + {}".format(chain_cost),
+                chain_rule.nr,
+            )
+
+    def emit_set_cost(self, level, non_term, cost, nr):
+        """ Emit an inlined version of State.set_cost """
+        self.print(level, 'old = labels.get("{}")'.format(non_term))
+        self.print(level, "if old is None or old[0] > {}:".format(cost))
+        self.print(
+            level + 1, 'labels["{}"] = ({}, {})'.format(non_term, cost, nr)
+        )
+
+    def compute_tests(self, tree, prefix):
+        """ Compute the tests on the terminals below the root of a pattern """
+        tests = []
+        for i, child in enumerate(tree.children):
+            if child.name in self.system.terminals:
+                child_prefix = "{}.children[{}]".format(prefix, i)
+                test = '{}.name == "{}"'.format(child_prefix, child.name)
+                tests.append(test)
+                tests.extend(self.compute_tests(child, child_prefix))
+        return tests
+
+    def compute_kids(self, tree, prefix):
+        """ Compute paths to the open ends of a pattern and their names """
+        if tree.name in self.system.non_terminals:
+            return [prefix], [tree.name]
+        else:
+            kids = []
+            nts = []
+            for i, child in enumerate(tree.children):
+                child_prefix = "{}.children[{}]".format(prefix, i)
+                child_kids, child_nts = self.compute_kids(child, child_prefix)
+                kids.extend(child_kids)
+                nts.extend(child_nts)
+            return kids, nts
+
+
+def compile_selector(system):
+    """ Generate and compile a tree labeler for the given burg system.
+
+    The generated source code is compiled once and cached with the
+    system. Returns a namespace with the ``label_functions``,
+    ``kid_functions`` and ``nts_map`` dictionaries.
+    """
+    if system.selector_namespace is None:
+        f = io.StringIO()
+        SelectorGenerator().generate(system, f)
+        source = f.getvalue()
+        code = compile(source, "<burg-selector>", "exec")
+        namespace = {"State": State}
+        for rule in system.rules:
+            namespace["A{}".format(rule.nr)] = rule.acceptance
+        exec(code, namespace)
+        namespace["source"] = source
+        system.selector_namespace = namespace
+    return system.selector_namespace
+
+
 def make_argument_parser():
     """ Constructs an argument parser """
     parser = argparse.ArgumentParser(
@@ -4,8 +4,12 @@ The architecture is provided when the generator is created.
 """
 
 import logging
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from .. import ir
 from ..irutils import Verifier, split_block
+from ..irutils.bitcode import BitcodeReader, to_bitcode
+from ..arch import get_arch
 from ..arch.arch import Architecture
 from ..arch.generic_instructions import Label, Comment, Global, DebugData
 from ..arch.generic_instructions import RegisterUseDef, VirtualInstruction
@@ -17,13 +21,90 @@ from ..arch import data_instructions
 from ..arch.arch_info import Endianness
 from ..binutils.debuginfo import DebugType, DebugLocation, DebugDb
 from ..binutils.outstream import MasterOutputStream, FunctionOutputStream
+from ..binutils.outstream import OutputStream
 from .irdag import SelectionGraphBuilder
-from .instructionselector import InstructionSelector1
+from .instructionselector import InstructionSelector1, burg_system_cache
+from .burg import compile_selector
 from .instructionscheduler import InstructionScheduler
 from .registerallocator import GraphColoringRegisterAllocator
 from .peephole import PeepHoleStream
 
 
+# Instruction selection cost weights for size, cycles and energy:
+weights_map = {
+    "size": (10, 1, 1),
+    "speed": (3, 10, 1),
+    "co2": (1, 2, 10),
+    "awesome": (13, 13, 13),
+}
+
+
+def get_selection_weights(optimize_for):
+    """ Get instruction selection weights for an optimization goal """
+    return weights_map.get(optimize_for, (1, 1, 1))
+
+
+def warm_up(arch, optimize_for="speed"):
+    """ Prepare the instruction selection tables for the given target.
+
+    This can be used to move the cost of preparing the code generator
+    out of the first compilation, for example when starting a server.
+    """
+    system = burg_system_cache.get(arch, get_selection_weights(optimize_for))
+    if InstructionSelector1.use_generated_selector:
+        compile_selector(system)
+
+
+class RecordingOutputStream(OutputStream):
+    """ Stream which records emitted items, without expanding them """
+
+    def __init__(self):
+        self.items = []
+
+    def emit(self, item):
+        self.items.append(item)
+
+    def do_emit(self, item):  # pragma: no cover
+        self.items.append(item)
+
+
+# Code generator of a worker process, see generate_in_parallel:
+_worker_state = None
+
+
+def _init_worker(arch_id, optimize_for, bitcode):
+    global _worker_state
+    code_generator = CodeGenerator(get_arch(arch_id), optimize_for)
+    code_generator.debug_db = DebugDb()
+    reader = BitcodeReader(bitcode)
+    reader.read_declarations()
+    _worker_state = code_generator, reader
+
+
+def _generate_in_worker(function_name):
+    """ Generate code for a single function, return the emitted items """
+    from ..utils.reporting import DummyReportGenerator
+
+    code_generator, reader = _worker_state
+    stream = RecordingOutputStream()
+    try:
+        # Only decode the functions handled by this worker:
+        function = reader.read_function(function_name)
+        code_generator.generate_function(
+            function, stream, DummyReportGenerator()
+        )
+    except Exception as ex:
+        # Make sure that the error can be passed to the main process:
+        try:
+            pickle.loads(pickle.dumps(ex))
+        except Exception:
+            raise RuntimeError(
+                "Code generation for {} failed: {}".format(function_name, ex)
+            ) from None
+        raise
+    return stream.items
+
+
 class CodeGenerator:
     """ Machine code generator """
 
@@ -32,15 +113,10 @@ class CodeGenerator:
     def __init__(self, arch, optimize_for="size"):
         assert isinstance(arch, Architecture), arch
         self.arch = arch
+        self.optimize_for = optimize_for
         self.verifier = Verifier()
         self.sgraph_builder = SelectionGraphBuilder(arch)
-        weights_map = {
-            "size": (10, 1, 1),
-            "speed": (3, 10, 1),
-            "co2": (1, 2, 10),
-            "awesome": (13, 13, 13),
-        }
-        selection_weights = weights_map.get(optimize_for, (1, 1, 1))
+        selection_weights = get_selection_weights(optimize_for)
         self.instruction_selector = InstructionSelector1(
             arch, self.sgraph_builder, weights=selection_weights
         )
@@ -50,9 +126,14 @@ class CodeGenerator:
         )
 
     def generate(
-        self, ircode: ir.Module, output_stream, reporter, debug=False
+        self, ircode: ir.Module, output_stream, reporter, debug=False, jobs=1
     ):
-        """ Generate machine code from ir-code into output stream """
+        """ Generate machine code from ir-code into output stream.
+
+        When jobs is larger than one, the functions are generated by
+        a pool of worker processes. The output is the same as when
+        generating all functions one after the other.
+        """
         assert isinstance(ircode, ir.Module)
         if ircode.debug_db:
             self.debug_db = ircode.debug_db
@@ -79,10 +160,13 @@ class CodeGenerator:
         # Munch program into a bunch of frames. One frame per function.
         # Each frame has a flat list of abstract instructions.
         output_stream.select_section("code")
-        for function in ircode.functions:
-            self.generate_function(
-                function, output_stream, reporter, debug=debug
-            )
+        if jobs > 1 and self.can_generate_in_parallel(ircode, debug):
+            self.generate_in_parallel(ircode, output_stream, reporter, jobs)
+        else:
+            for function in ircode.functions:
+                self.generate_function(
+                    function, output_stream, reporter, debug=debug
+                )
 
         # Output debug type data:
         if debug:
@@ -91,6 +175,51 @@ class CodeGenerator:
                     # TODO: prevent this from being emitted twice in some way?
                     output_stream.emit(DebugData(di))
 
+    @staticmethod
+    def can_generate_in_parallel(ircode, debug):
+        """ Check if the functions of a module can be generated in parallel.
+
+        Debug information is numbered over the whole module, and inline
+        assembly can create literal labels numbered by the assembler,
+        so these must be generated one after the other.
+        """
+        if debug or len(ircode.functions) < 2:
+            return False
+        for function in ircode.functions:
+            for block in function:
+                for instruction in block:
+                    if isinstance(instruction, ir.InlineAsm):
+                        return False
+        return True
+
+    def generate_in_parallel(self, ircode, output_stream, reporter, jobs):
+        """ Generate code for all functions using a pool of processes.
+
+        Each worker receives the module as bitcode, decodes the functions
+        it is given, and returns the instructions emitted for a function.
+        These are emitted in the order of the functions in the module.
+        """
+        self.logger.info("Generating functions with %s processes", jobs)
+        arch_id = self.arch.make_id_str()
+        initargs = (arch_id, self.optimize_for, to_bitcode(ircode))
+        function_names = [function.name for function in ircode.functions]
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=initargs
+        ) as executor:
+            results = executor.map(_generate_in_worker, function_names)
+            for function, items in zip(ircode.functions, results):
+                reporter.heading(3, "Log for {}".format(function))
+                reporter.dump_ir(function)
+                instruction_list = []
+                function_stream = MasterOutputStream(
+                    [
+                        FunctionOutputStream(instruction_list.append),
+                        output_stream,
+                    ]
+                )
+                function_stream.emit_all(items)
+                reporter.dump_instructions(instruction_list, self.arch)
+
     def generate_global(self, var, output_stream, debug):
         """ Generate code for a global variable """
         alignment = Alignment(var.alignment)
@@ -1,5 +1,12 @@
+""" Control flow graph of machine instructions, used for liveness.
+
+Liveness is calculated on bitsets. Each register in the flowgraph gets
+a number, and a set of registers is a python integer with the bits of
+these numbers set.
+"""
+
 import logging
-from collections import defaultdict
+from collections import deque
 from ..graph.digraph import DiGraph, DiNode
 
 
@@ -11,8 +18,10 @@ class FlowGraphNode(DiNode):
         super().__init__(g)
         self.gen = set()
         self.kill = set()
-        self.live_in = set()
-        self.live_out = set()
+        self.gen_mask = 0
+        self.kill_mask = 0
+        self.live_in_mask = 0
+        self.live_out_mask = 0
         self.instructions = []
 
         # Start with the instruction itself..
@@ -22,11 +31,25 @@ class FlowGraphNode(DiNode):
         """ Bundle the instruction into the current node. """
         ins.gen = set(ins.used_registers)
         ins.kill = set(ins.defined_registers)
+        ins.gen_mask = self.graph.mask_of(ins.gen)
+        ins.kill_mask = self.graph.mask_of(ins.kill)
         self.instructions.append(ins)
 
         # Combine gen and kill effects of the node and the new instruction:
         self.gen = self.gen | (ins.gen - self.kill)
         self.kill = self.kill | ins.kill
+        self.gen_mask |= ins.gen_mask & ~self.kill_mask
+        self.kill_mask |= ins.kill_mask
+
+    @property
+    def live_in(self):
+        """ The registers live at the start of this node """
+        return self.graph.registers_of(self.live_in_mask)
+
+    @property
+    def live_out(self):
+        """ The registers live at the end of this node """
+        return self.graph.registers_of(self.live_out_mask)
 
     def __repr__(self):
         r = "CFG-node({})".format(len(self.instructions))
@@ -52,7 +75,9 @@ class FlowGraph(DiGraph):
         super().__init__()
         self.logger = logging.getLogger("flowgraph")
         self._map = {}
-        self._live_ranges = defaultdict(list)
+        self._live_ranges = None
+        self._register_numbers = {}
+        self._registers = []
 
         # TODO: make this very tricky part of code better readable!!!
 
@@ -102,7 +127,55 @@ class FlowGraph(DiGraph):
             self.add_node(node)
         return self._map[ins]
 
-    # def live_range(
+    @property
+    def registers(self):
+        """ The registers of the flowgraph, in order of their numbers """
+        return self._registers
+
+    def mask_of(self, registers):
+        """ Get the bitset of the given registers, numbering new ones """
+        numbers = self._register_numbers
+        mask = 0
+        for register in registers:
+            if register not in numbers:
+                numbers[register] = len(self._registers)
+                self._registers.append(register)
+            mask |= 1 << numbers[register]
+        return mask
+
+    def registers_of(self, mask):
+        """ Get the set of registers in a bitset """
+        registers = set()
+        while mask:
+            low = mask & -mask
+            registers.add(self._registers[low.bit_length() - 1])
+            mask ^= low
+        return registers
+
+    def postorder(self):
+        """ Get the nodes in postorder, starting from the first node.
+
+        Nodes not reachable from the first node are appended.
+        """
+        order = []
+        visited = set()
+        for root in self._map.values():
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(root.successors))]
+            while stack:
+                node, successors = stack[-1]
+                for successor in successors:
+                    if successor not in visited:
+                        visited.add(successor)
+                        stack.append((successor, iter(successor.successors)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(node)
+        return order
+
     def calculate_liveness(self):
         """ Calculate liveness in CFG: """
         ###
@@ -110,53 +183,55 @@ class FlowGraph(DiGraph):
         #  in[n] = use[n] UNION (out[n] - def[n])
         #  out[n] = for s in n.succ in union in[s]
         ###
-        for node in self:
-            node.live_in = set()
-            node.live_out = set()
-
-        # Sort flowgraph nodes backwards:
-        cfg_nodes = list(self.nodes)
-
-        # Dataflow fixed point iteration over the nodes in the CFG:
-        n_iterations = 0
-        change = True
-        while change:
-            change = False
-            for node in cfg_nodes:
-                _in = node.live_in
-                _out = node.live_out
-                node.live_in = node.gen | (node.live_out - node.kill)
-                if node.successors:
-                    node.live_out = set.union(
-                        *(s.live_in for s in node.successors)
-                    )
-                else:
-                    node.live_out = set()
-
-                # Record for change:
-                change = (
-                    change or (_in != node.live_in) or (_out != node.live_out)
-                )
-            n_iterations += 1
-
-        # In one pass fix all instructions:
-        for node in self:
-            assert len(node.instructions) > 0
-            ins2 = node.instructions[-1]
-            ins2.live_out = node.live_out  # Propagate into last instruction
-            ins2.live_in = ins2.gen | (ins2.live_out - ins2.kill)
-            if len(node.instructions) > 1:
-                for ins in reversed(node.instructions[:-1]):
-                    ins1 = ins
-
-                    ins1.live_out = ins2.live_in
-                    ins1.live_in = ins1.gen | (ins1.live_out - ins1.kill)
+        self._live_ranges = None
+        for node in self._map.values():
+            node.live_in_mask = node.gen_mask
+            node.live_out_mask = 0
+
+        # Liveness flows backwards, so visit successors before their
+        # predecessors, which is postorder:
+        worklist = deque(self.postorder())
+        pending = set(worklist)
+        n_visits = 0
+        while worklist:
+            node = worklist.popleft()
+            pending.discard(node)
+            n_visits += 1
+            live_out = 0
+            for successor in node.successors:
+                live_out |= successor.live_in_mask
+            node.live_out_mask = live_out
+            live_in = node.gen_mask | (live_out & ~node.kill_mask)
+            if live_in != node.live_in_mask:
+                node.live_in_mask = live_in
+                for predecessor in node.predecessors:
+                    if predecessor not in pending:
+                        pending.add(predecessor)
+                        worklist.append(predecessor)
+
+        # Derive the liveness of all instructions:
+        for node in self._map.values():
+            live = node.live_out_mask
+            for ins in reversed(node.instructions):
+                ins.live_out = self.registers_of(live)
+                live = ins.gen_mask | (live & ~ins.kill_mask)
+                ins.live_in = self.registers_of(live)
+
+        self.logger.debug("Visits: %s,  nodes: %s", n_visits, len(self))
 
+    @property
+    def live_ranges(self):
+        """ Map registers to pairs of instructions between which they live
+
+        These ranges are derived once they are requested.
+        """
+        if self._live_ranges is None:
+            self._live_ranges = {}
+            for node in self._map.values():
+                instructions = node.instructions
+                for ins1, ins2 in zip(instructions, instructions[1:]):
                     for vreg in ins2.live_in & ins1.live_out:
-                        self._live_ranges[vreg].append((ins1, ins2))
-
-                    ins2 = ins1
-
-        self.logger.debug(
-            "Iterations: %s,  nodes: %s", n_iterations, len(self)
-        )
+                        self._live_ranges.setdefault(vreg, []).append(
+                            (ins1, ins2)
+                        )
+        return self._live_ranges
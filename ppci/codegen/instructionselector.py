@@ -56,11 +56,12 @@ Memory move operations:
 
 import abc
 import logging
+import time
 from ..utils.tree import Tree
 from .treematcher import State
 from .. import ir
 from ..arch.encoding import Instruction
-from .burg import BurgSystem
+from .burg import BurgSystem, BurgError, compile_selector
 from .irdag import FunctionInfo, prepare_function_info
 from .dagsplit import DagSplitter
 from ..arch.generic_instructions import RegisterUseDef, InlineAssembly
@@ -194,18 +195,15 @@ class TreeSelector:
                     and accept
                 ):
                     cost = sum(x.state.get_cost(y) for x, y in zip(kids, nts))
-                    marked_rules = set()
-                    self.mark_tree(tree, rule, cost, marked_rules)
+                    self.mark_tree(tree, rule, cost)
 
-    def mark_tree(self, tree, rule, cost, marked_rules):
+    def mark_tree(self, tree, rule, cost):
         cost = cost + rule.cost
         tree.state.set_cost(rule.non_term, cost, rule.nr)
-        marked_rules.add(rule)
 
         # Also set cost for chain rules here:
-        for cr in self.sys.chain_rules_for_nt(rule.non_term):
-            if cr not in marked_rules:
-                self.mark_tree(tree, cr, cost, marked_rules)
+        for cr, chain_cost in self.sys.chain_closure(rule.non_term):
+            tree.state.set_cost(cr.non_term, cost + chain_cost, cr.nr)
 
     def apply_rules(self, context, tree, goal):
         """ Apply all selected instructions to the tree """
@@ -234,6 +232,199 @@ class TreeSelector:
         return self.sys.get_nts(template_tree)
 
 
+class GeneratedTreeSelector(TreeSelector):
+    """ Tree selector using python code generated from the burg system.
+
+    This selector gives the same results as the :class:`TreeSelector`,
+    but labels trees using specialised functions for each terminal.
+    """
+
+    def __init__(self, sys):
+        super().__init__(sys)
+        namespace = compile_selector(sys)
+        self.label_functions = namespace["label_functions"]
+        self.kid_functions = namespace["kid_functions"]
+        self.nts_map = namespace["nts_map"]
+
+    def gen(self, context, tree):
+        """ Generate code for a given tree. The tree will be tiled with
+            patterns and the corresponding code will be emitted """
+        state = self.burm_label(tree)
+        if not state.has_goal("stm"):  # pragma: no cover
+            raise RuntimeError("Tree {} not covered".format(tree))
+        return self.apply_rules(context, tree, "stm")
+
+    def burm_label(self, tree):
+        """ Label all nodes in the tree bottom up """
+        for child_tree in tree.children:
+            self.burm_label(child_tree)
+
+        try:
+            label_function = self.label_functions[tree.name]
+        except KeyError:
+            raise BurgError("{} not defined".format(tree.name))
+        return label_function(tree)
+
+    def kids(self, tree, rule):
+        """ Determine the kid trees for a rule """
+        return self.kid_functions[rule](tree)
+
+    def nts(self, rule):
+        """ Get the open ends of this rules pattern """
+        return self.nts_map[rule]
+
+
+def call_function(context, tree):
+    """ Generate a call to a function """
+    label, args, rv = tree.value
+    for instruction in context.arch.gen_call(context.frame, label, args, rv):
+        context.emit(instruction)
+
+
+def inline_asm(context, tree):
+    """ Run assembler on inline assembly code. """
+    template, output_registers, input_registers, clobbers = tree.value
+    context.emit(
+        InlineAssembly(template, output_registers, input_registers, clobbers)
+    )
+
+
+def create_burg_system(arch, weights):
+    """ Create a burg system with the rules of the given architecture. """
+    system = BurgSystem()
+
+    for terminal in terminals:
+        system.add_terminal(terminal)
+
+    # Add special case nodes:
+    system.add_rule("stm", Tree("CALL"), 0, None, call_function)
+    system.add_rule("stm", Tree("ASM"), 0, None, inline_asm)
+
+    # Add undefined value for register classes:
+    _create_undefined_rules(system, arch)
+
+    # Add all isa patterns:
+    for pattern in arch.isa.patterns:
+        cost = (
+            pattern.size * weights[0]
+            + pattern.cycles * weights[1]
+            + pattern.energy * weights[2]
+        )
+        system.add_rule(
+            pattern.non_term,
+            pattern.tree,
+            cost,
+            pattern.condition,
+            pattern.method,
+        )
+
+    system.check()
+    system.prepare()
+    return system
+
+
+def _create_undefined_rules(system, arch):
+    """ Create rules for undefined values based on register classes.
+    """
+    und_map = {}
+    for register_class in arch.info.register_classes:
+        for ir_typ in register_class.ir_types:
+            if ir_typ in ir.value_types:
+                und_map[ir_typ] = (register_class.name, register_class.typ)
+
+    for ir_typ, info in und_map.items():
+        reg_class_name, reg_class = info
+        _mk_undefined_rule(system, reg_class_name, reg_class, ir_typ)
+
+
+def _mk_undefined_rule(system, reg_class_name, reg_class, ir_ty):
+    """ Create rule for undefined value.
+
+    For example, create UNDU16 which defines
+    a 16 bits registers and returns it.
+    """
+    suffix = ir_ty.name.upper()
+
+    def und_pattern(context, tree):
+        r = context.new_reg(reg_class)
+        context.emit(RegisterUseDef(defs=(r,)))
+        return r
+
+    system.add_rule(
+        reg_class_name, Tree("UND{}".format(suffix)), 0, None, und_pattern
+    )
+
+
+class BurgSystemCache:
+    """ Cache of burg systems, one per architecture and cost weights.
+
+    Creating the burg system for an architecture is relatively costly,
+    since every isa pattern must be added to it. The burg system only
+    depends on the architecture, its options and the cost weights, so
+    it can be re-used for every module compiled for the same target.
+
+    The time which was spent building a system is recorded, so that the
+    time saved by re-using it can be reported.
+    """
+
+    logger = logging.getLogger("burg-cache")
+
+    def __init__(self):
+        self._systems = {}
+        self.hits = 0
+        self.misses = 0
+        self.build_time = 0.0
+        self.saved_time = 0.0
+
+    def __len__(self):
+        return len(self._systems)
+
+    @staticmethod
+    def make_key(arch, weights):
+        return (type(arch), arch.make_id_str(), tuple(weights))
+
+    def get(self, arch, weights):
+        """ Get a burg system for the given architecture and weights """
+        key = self.make_key(arch, weights)
+        if key in self._systems:
+            system, build_time = self._systems[key]
+            self.hits += 1
+            self.saved_time += build_time
+            self.logger.debug(
+                "Re-using burg system for %s, saved %.3f seconds",
+                arch,
+                build_time,
+            )
+        else:
+            t0 = time.perf_counter()
+            system = create_burg_system(arch, weights)
+            build_time = time.perf_counter() - t0
+            self._systems[key] = (system, build_time)
+            self.misses += 1
+            self.build_time += build_time
+            self.logger.debug(
+                "Created burg system for %s in %.3f seconds", arch, build_time
+            )
+        return system
+
+    def clear(self):
+        """ Remove all cached systems and reset the statistics """
+        self._systems.clear()
+        self.hits = 0
+        self.misses = 0
+        self.build_time = 0.0
+        self.saved_time = 0.0
+
+    def statistics(self):
+        """ Get a text summary of the cache performance """
+        return (
+            "burg systems: {} created in {:.3f} s, {} re-used saving {:.3f} s"
+        ).format(self.misses, self.build_time, self.hits, self.saved_time)
+
+
+burg_system_cache = BurgSystemCache()
+
+
 class InstructionSelector1:
     """ Instruction selector which takes in a DAG and puts instructions
         into a frame.
@@ -242,6 +433,7 @@ class InstructionSelector1:
     """
 
     verbose = False
+    use_generated_selector = True
 
     def __init__(self, arch, sgraph_builder, weights=(1, 1, 1)):
         """ Create a new instruction selector.
@@ -257,80 +449,12 @@ class InstructionSelector1:
         self.arch = arch
         self.dag_splitter = DagSplitter(arch)
 
-        # Generate burm table of rules:
-        self.sys = BurgSystem()
-
-        for terminal in terminals:
-            self.sys.add_terminal(terminal)
-
-        # Add special case nodes:
-        self.sys.add_rule("stm", Tree("CALL"), 0, None, self.call_function)
-        self.sys.add_rule("stm", Tree("ASM"), 0, None, self.inline_asm)
-
-        # Add undefined value for register classes:
-        self._create_undefined_rules()
-
-        # Add all isa patterns:
-        for pattern in arch.isa.patterns:
-            cost = (
-                pattern.size * weights[0]
-                + pattern.cycles * weights[1]
-                + pattern.energy * weights[2]
-            )
-            self.sys.add_rule(
-                pattern.non_term,
-                pattern.tree,
-                cost,
-                pattern.condition,
-                pattern.method,
-            )
-
-        self.sys.check()
-        self.tree_selector = TreeSelector(self.sys)
-
-    def _create_undefined_rules(self):
-        """ Create rules for undefined values based on register classes.
-        """
-        und_map = {}
-        for register_class in self.arch.info.register_classes:
-            for ir_typ in register_class.ir_types:
-                if ir_typ in ir.value_types:
-                    und_map[ir_typ] = (register_class.name, register_class.typ)
-
-        for ir_typ, info in und_map.items():
-            reg_class_name, reg_class = info
-            self._mk_undefined_rule(reg_class_name, reg_class, ir_typ)
-
-    def _mk_undefined_rule(self, reg_class_name, reg_class, ir_ty):
-        """ Create rule for undefined value.
-
-        For example, create UNDU16 which defines
-        a 16 bits registers and returns it.
-        """
-        suffix = ir_ty.name.upper()
-
-        def und_pattern(context, tree):
-            r = context.new_reg(reg_class)
-            context.emit(RegisterUseDef(defs=(r,)))
-            return r
-
-        self.sys.add_rule(
-            reg_class_name, Tree("UND{}".format(suffix)), 0, None, und_pattern
-        )
-
-    def call_function(self, context, tree):
-        label, args, rv = tree.value
-        for instruction in self.arch.gen_call(context.frame, label, args, rv):
-            context.emit(instruction)
-
-    def inline_asm(self, context, tree):
-        """ Run assembler on inline assembly code. """
-        template, output_registers, input_registers, clobbers = tree.value
-        context.emit(
-            InlineAssembly(
-                template, output_registers, input_registers, clobbers
-            )
-        )
+        # Get the burm table of rules:
+        self.sys = burg_system_cache.get(arch, weights)
+        if self.use_generated_selector:
+            self.tree_selector = GeneratedTreeSelector(self.sys)
+        else:
+            self.tree_selector = TreeSelector(self.sys)
 
     def memcp(self):
         """ Invoke memcpy arch function """
@@ -3,13 +3,17 @@
 .. autoclass:: ppci.codegen.interferencegraph.InterferenceGraph
     :members: get_node, combine, interfere
 
+.. autoclass:: ppci.codegen.interferencegraph.BitMatrixInterferenceGraph
+
 """
 
 import logging
 from collections import defaultdict
 from ..graph.graph import Node
 from ..graph.maskable_graph import MaskableGraph
+from ..graph.bitmatrix_graph import BitMatrixGraph
 from ..arch.registers import Register
+from ..utils.collections import OrderedSet
 
 
 class InterferenceGraphNode(Node):
@@ -18,7 +22,7 @@ class InterferenceGraphNode(Node):
     def __init__(self, graph, vreg):
         super().__init__(graph)
         self.temps = {vreg}
-        self.moves = set()
+        self.moves = OrderedSet()
         self.reg = vreg if vreg.is_colored else None
         self.reg_class = type(vreg)
 
@@ -59,18 +63,7 @@ class InterferenceGraph(MaskableGraph):
 
                 # Live out and zero length defined variables:
                 live_and_def = ins.live_out | ins.kill
-
-                # Add interfering edges:
-                for tmp in live_and_def:
-                    n1 = self.get_node(tmp)
-                    for tmp2 in live_and_def - {tmp}:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
-
-                    # Add clobbered interfering edges:
-                    for tmp2 in ins.clobbers:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
+                self.add_interference(live_and_def, ins.clobbers)
 
                 # Generate usage info:
                 for reg in ins.defined_registers:
@@ -78,6 +71,19 @@ class InterferenceGraph(MaskableGraph):
                 for reg in ins.used_registers:
                     self._use_map[reg].append(ins)
 
+    def add_interference(self, live_and_def, clobbers):
+        """ Add edges between registers live at the same time """
+        for tmp in live_and_def:
+            n1 = self.get_node(tmp)
+            for tmp2 in live_and_def - {tmp}:
+                n2 = self.get_node(tmp2)
+                self.add_edge(n1, n2)
+
+            # Add clobbered interfering edges:
+            for tmp2 in clobbers:
+                n2 = self.get_node(tmp2)
+                self.add_edge(n1, n2)
+
     def has_node(self, tmp):
         """ Check if there exists a node for this temp register """
         assert isinstance(tmp, Register)
@@ -108,7 +114,7 @@ class InterferenceGraph(MaskableGraph):
         """ Combine n and m into n and return n """
         # Copy associated moves and temporaries into n:
         n.temps |= m.temps
-        n.moves.update(m.moves)
+        n.moves |= m.moves
 
         # Update local temp map:
         for tmp in m.temps:
@@ -116,3 +122,25 @@ class InterferenceGraph(MaskableGraph):
 
         super().combine(n, m)
         return n
+
+
+class BitMatrixInterferenceGraph(InterferenceGraph, BitMatrixGraph):
+    """ Interference graph with the edges in a bit matrix.
+
+    Registers live at the same time are connected with a few integer
+    operations instead of an edge at a time, which makes this graph
+    suitable for functions with thousands of virtual registers.
+    """
+
+    def add_interference(self, live_and_def, clobbers):
+        """ Add edges between registers live at the same time """
+        if live_and_def:
+            temp_map = self.temp_map
+            nodes = [
+                temp_map[tmp] if tmp in temp_map else self.get_node(tmp)
+                for tmp in live_and_def
+            ]
+            self.add_clique(nodes)
+            if clobbers:
+                others = [self.get_node(tmp) for tmp in clobbers]
+                self.add_edges(nodes, others)
@@ -116,7 +116,7 @@ The following class can be used to perform register allocation.
 import logging
 from functools import lru_cache
 from .flowgraph import FlowGraph
-from .interferencegraph import InterferenceGraph
+from .interferencegraph import InterferenceGraph, BitMatrixInterferenceGraph
 from ..arch.arch import Architecture, Frame
 from ..arch.registers import Register
 from ..utils.tree import Tree
@@ -200,6 +200,9 @@ class GraphColoringRegisterAllocator:
     logger = logging.getLogger("regalloc")
     verbose = False  # Set verbose to True to get more logging info
 
+    # Above this amount of registers, use a bit matrix interference graph:
+    bit_matrix_threshold = 64
+
     def __init__(self, arch: Architecture, instruction_selector):
         assert isinstance(arch, Architecture), arch
         self.arch = arch
@@ -300,7 +303,10 @@ class GraphColoringRegisterAllocator:
         )
 
         cfg.calculate_liveness()
-        self.frame.ig = InterferenceGraph()
+        if len(cfg.registers) > self.bit_matrix_threshold:
+            self.frame.ig = BitMatrixInterferenceGraph()
+        else:
+            self.frame.ig = InterferenceGraph()
         self.frame.ig.calculate_interference(cfg)
         self.logger.debug(
             "Constructed interferencegraph with %s nodes",
@@ -331,6 +337,7 @@ class GraphColoringRegisterAllocator:
         self.precolored = OrderedSet()
 
         self._num_blocked = {}
+        self._spill_costs = {}
 
         # Divide nodes into categories:
         for node in self.frame.ig.nodes:
@@ -462,7 +469,7 @@ class GraphColoringRegisterAllocator:
         """
         # This check was m.degree == self.K - 1
         if m in self.spill_worklist and self.is_colorable(m):
-            self.enable_moves({m} | m.adjecent)
+            self.enable_moves(OrderedSet([m]) | m.adjecent)
             self.spill_worklist.remove(m)
             if self.is_move_related(m):
                 self.freeze_worklist.add(m)
@@ -577,6 +584,7 @@ class GraphColoringRegisterAllocator:
 
         # Determine new register class:
         u.reg_class = self.common_reg_class(u.reg_class, v.reg_class)
+        self._spill_costs.pop(u, None)
 
         self.frame.ig.combine(u, v)
 
@@ -675,9 +683,7 @@ class GraphColoringRegisterAllocator:
         p = []
         for n in self.spill_worklist:
             assert not n.is_colored
-            d = sum(len(self.frame.ig.defs(t)) for t in n.temps)
-            u = sum(len(self.frame.ig.uses(t)) for t in n.temps)
-            priority = (u + d) / n.degree
+            priority = self.spill_cost(n) / n.degree
             self.logger.debug("%s has spill priority=%s", n, priority)
             p.append((n, priority))
         node = min(p, key=lambda x: x[1])[0]
@@ -687,6 +693,14 @@ class GraphColoringRegisterAllocator:
         self.simplify_worklist.add(node)
         self.freeze_moves(node)
 
+    def spill_cost(self, node):
+        """ Get the number of uses and definitions of a node """
+        if node not in self._spill_costs:
+            d = sum(len(self.frame.ig.defs(t)) for t in node.temps)
+            u = sum(len(self.frame.ig.uses(t)) for t in node.temps)
+            self._spill_costs[node] = u + d
+        return self._spill_costs[node]
+
     def rewrite_program(self, node):
         """ Rewrite program by creating a load and a store for each use """
         # Generate spill code:
@@ -756,8 +770,12 @@ class GraphColoringRegisterAllocator:
 
     def remove_redundant_moves(self):
         """ Remove coalesced moves """
-        for move in self.coalescedMoves:
-            self.frame.instructions.remove(move)
+        if self.coalescedMoves:
+            self.frame.instructions = [
+                i
+                for i in self.frame.instructions
+                if i not in self.coalescedMoves
+            ]
 
     def apply_colors(self):
         """ Assign colors to registers """
@@ -5,6 +5,14 @@
 from .graph import Graph, Node
 from .digraph import DiGraph, DiNode
 from .maskable_graph import MaskableGraph
+from .bitmatrix_graph import BitMatrixGraph
 
 
-__all__ = ("Graph", "Node", "DiGraph", "DiNode", "MaskableGraph")
+__all__ = (
+    "Graph",
+    "Node",
+    "DiGraph",
+    "DiNode",
+    "MaskableGraph",
+    "BitMatrixGraph",
+)
@@ -0,0 +1,219 @@
+""" Graph with edges stored in a bit matrix.
+
+Nodes are numbered densely in order of addition. The bit matrix has a
+row for each node, which is a python integer with a bit set for each
+neighbour of the node. The rows are used for edge queries, and double
+as adjacency vectors when enumerating neighbours.
+
+This representation is faster than adjacency sets for large and dense
+graphs, since many edges can be added with a single integer operation.
+"""
+
+from collections.abc import Set
+from .maskable_graph import MaskableGraph
+from ..utils.collections import OrderedSet
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # pragma: no cover
+
+    def popcount(mask):
+        """ Count the number of bits set in a mask """
+        return bin(mask).count("1")
+
+
+def bit_numbers(mask):
+    """ Get the numbers of the bits set in a mask, from low to high """
+    digits = bin(mask)[:1:-1]
+    numbers = []
+    number = digits.find("1")
+    while number >= 0:
+        numbers.append(number)
+        number = digits.find("1", number + 1)
+    return numbers
+
+
+class NodeSet(Set):
+    """ Ordered set of nodes of a bit matrix graph, backed by a bitset.
+
+    The nodes are ordered by their number. Set operations between node
+    sets of the same graph are done on the bitsets.
+    """
+
+    __slots__ = ("_graph", "mask")
+
+    def __init__(self, graph, mask):
+        self._graph = graph
+        self.mask = mask
+
+    def __len__(self):
+        return popcount(self.mask)
+
+    def __iter__(self):
+        return iter(self._graph._nodes_of(self.mask))
+
+    def __contains__(self, node):
+        number = self._graph._numbers.get(node, None)
+        return number is not None and bool((self.mask >> number) & 1)
+
+    def __or__(self, other):
+        if isinstance(other, NodeSet) and other._graph is self._graph:
+            return NodeSet(self._graph, self.mask | other.mask)
+        return super().__or__(other)
+
+    def __and__(self, other):
+        if isinstance(other, NodeSet) and other._graph is self._graph:
+            return NodeSet(self._graph, self.mask & other.mask)
+        return super().__and__(other)
+
+    def __sub__(self, other):
+        if isinstance(other, NodeSet) and other._graph is self._graph:
+            return NodeSet(self._graph, self.mask & ~other.mask)
+        return super().__sub__(other)
+
+    def _from_iterable(self, iterable):
+        return OrderedSet(iterable)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+class BitMatrixGraph(MaskableGraph):
+    """ A maskable graph with the edges stored in a bit matrix.
+
+    Masked nodes are left out of the present mask, so they are ignored
+    when neighbours are queried, while their edges are kept.
+    """
+
+    __slots__ = ("_numbers", "_members", "_rows", "_present")
+
+    def __init__(self):
+        super().__init__()
+        self._numbers = {}
+        self._members = []
+        self._rows = []
+        self._present = 0
+
+    def add_node(self, node):
+        """ Add a node to the graph """
+        if node not in self._numbers:
+            number = len(self._members)
+            self._numbers[node] = number
+            self._members.append(node)
+            self._rows.append(0)
+            self._present |= 1 << number
+        super().add_node(node)
+
+    def del_node(self, node):
+        """ Remove a node and its edges from the graph """
+        number = self._numbers[node]
+        bit = 1 << number
+        for neighbour in bit_numbers(self._rows[number]):
+            self._rows[neighbour] &= ~bit
+        self._rows[number] = 0
+        self._present &= ~bit
+        self.nodes.remove(node)
+
+    def mask_of(self, nodes):
+        """ Get the bitset of the given nodes """
+        mask = 0
+        for node in nodes:
+            mask |= 1 << self._numbers[node]
+        return mask
+
+    def _nodes_of(self, mask):
+        """ Get the nodes in a bitset, in order of addition """
+        members = self._members
+        return [members[number] for number in bit_numbers(mask)]
+
+    def add_edge(self, n, m):
+        """ Add an edge between n and m """
+        if n == m:
+            return
+        a, b = self._numbers[n], self._numbers[m]
+        self._rows[a] |= 1 << b
+        self._rows[b] |= 1 << a
+
+    def del_edge(self, n, m):
+        """ Delete edge between n and m """
+        assert n != m
+        a, b = self._numbers[n], self._numbers[m]
+        self._rows[a] &= ~(1 << b)
+        self._rows[b] &= ~(1 << a)
+
+    def add_clique(self, nodes):
+        """ Add edges between all pairs of the given nodes """
+        mask = self.mask_of(nodes)
+        rows = self._rows
+        for node in nodes:
+            number = self._numbers[node]
+            rows[number] |= mask ^ (1 << number)
+
+    def add_edges(self, nodes, others):
+        """ Add edges from each of nodes to each of others """
+        rows = self._rows
+        for group, mask in (
+            (nodes, self.mask_of(others)),
+            (others, self.mask_of(nodes)),
+        ):
+            for node in group:
+                number = self._numbers[node]
+                rows[number] |= mask & ~(1 << number)
+
+    def has_edge(self, n, m):
+        """ Test if there exist an edge between n and m """
+        row = self._rows[self._numbers[n]] & self._present
+        return bool((row >> self._numbers[m]) & 1)
+
+    def get_number_of_edges(self):
+        """ Get the number of edges between unmasked nodes """
+        present = self._present
+        n_edges = sum(
+            popcount(self._rows[self._numbers[n]] & present)
+            for n in self.nodes
+        )
+        return n_edges // 2
+
+    def get_degree(self, node):
+        """ Get the number of unmasked neighbours of a node """
+        return popcount(self._rows[self._numbers[node]] & self._present)
+
+    def adjecent(self, n):
+        """ Return all unmasked nodes with edges to n """
+        return NodeSet(self, self._rows[self._numbers[n]] & self._present)
+
+    def mask_node(self, node):
+        """ Add the node into the masked set """
+        assert not self.is_masked(node)
+        self._masked_nodes.add(node)
+        self._present &= ~(1 << self._numbers[node])
+        self.nodes.remove(node)
+
+    def unmask_node(self, node):
+        """ Unmask a node (put it back into the graph """
+        assert self.is_masked(node)
+        self._masked_nodes.remove(node)
+        self._present |= 1 << self._numbers[node]
+        self.nodes.add(node)
+
+    def combine(self, n, m):
+        """ Merge nodes n and m into node n """
+        assert n != m
+        if self.is_masked(m):
+            self.unmask_node(m)
+        assert not self.is_masked(n), "Combining only allowed for non-masked"
+
+        rows = self._rows
+        a, b = self._numbers[n], self._numbers[m]
+        n_bit, m_bit = 1 << a, 1 << b
+
+        # Reroute all edges of m, including those to masked nodes:
+        m_row = rows[b] & ~n_bit
+        for number in bit_numbers(m_row):
+            rows[number] = (rows[number] & ~m_bit) | n_bit
+        rows[a] = (rows[a] | m_row) & ~m_bit
+        rows[b] = 0
+
+        self._present &= ~m_bit
+        self.nodes.remove(m)
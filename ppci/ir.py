@@ -453,9 +453,9 @@ class SubRoutine(GlobalValue):
                     self.logger.debug("updating phi %s", phi)
                     phi.del_incoming(block)
 
-            # Now remove instructions:
+            # Now remove instructions, from the end to keep positions valid:
             il = list(block)
-            for instruction in il:
+            for instruction in reversed(il):
                 block.remove_instruction(instruction)
                 self.logger.debug("deleting %s", instruction)
                 instruction.delete()
@@ -489,6 +489,7 @@ class SubRoutine(GlobalValue):
         assert isinstance(parameter, Parameter)
         parameter.num = len(self.arguments)
         self.arguments.append(parameter)
+        self.make_unique_name(parameter)
         # p.parent = self.entry
 
     def num_instructions(self):
@@ -538,6 +539,11 @@ class Block:
 
     A block is properly terminated if its last instruction is a
     :class:`FinalInstruction`.
+
+    The instructions know their position in the block. Inserting or
+    removing an instruction only invalidates the positions after it,
+    and these are renumbered when a position is requested again.
+    Appending and removing at the end keep all positions valid.
     """
 
     def __init__(self, name):
@@ -545,6 +551,8 @@ class Block:
         self.function = None
         self.instructions = list()
         self.references = OrderedSet()
+        self._numbered = 0  # Number of instructions with a valid position
+        self._phis = None
 
     def dump(self):
         print("  ", self)
@@ -576,7 +584,11 @@ class Block:
             pos = 0
         assert isinstance(instruction, Instruction)
         instruction.block = self
+        instruction._position = pos
         self.instructions.insert(pos, instruction)
+        self._numbered = min(self._numbered, pos)
+        if instruction.is_phi:
+            self._phis = None
         if isinstance(instruction, Value):
             self.function.make_unique_name(instruction)
 
@@ -585,16 +597,41 @@ class Block:
         assert isinstance(instruction, Instruction)
         assert not self.is_closed
         instruction.block = self
+        instruction._position = len(self.instructions)
         self.instructions.append(instruction)
+        if self._numbered == instruction._position:
+            self._numbered += 1
+        if instruction.is_phi:
+            self._phis = None
         if isinstance(instruction, Value):
             self.function.make_unique_name(instruction)
 
     def remove_instruction(self, instruction):
         """ Remove instruction from block """
+        pos = self.position_of(instruction)
+        del self.instructions[pos]
+        self._numbered = min(self._numbered, pos)
+        if instruction.is_phi:
+            self._phis = None
         instruction.block = None
-        self.instructions.remove(instruction)
         return instruction
 
+    def position_of(self, instruction):
+        """ Get the position of an instruction in this block """
+        pos = instruction._position
+        if pos >= self._numbered:
+            # Renumber the instructions after the last valid position:
+            instructions = self.instructions
+            for number in range(self._numbered, len(instructions)):
+                instructions[number]._position = number
+            self._numbered = len(instructions)
+            pos = instruction._position
+        if pos >= len(self.instructions) or (
+            self.instructions[pos] is not instruction
+        ):
+            raise ValueError("{} is not in {}".format(instruction, self))
+        return pos
+
     @property
     def last_instruction(self):
         """ Gets the last instruction from the block """
@@ -624,7 +661,9 @@ class Block:
     @property
     def phis(self):
         """ Return all :class:`Phi` instructions of this block """
-        return [i for i in self.instructions if i.is_phi]
+        if self._phis is None:
+            self._phis = [i for i in self.instructions if i.is_phi]
+        return list(self._phis)
 
     @property
     def successors(self):
@@ -686,9 +725,7 @@ def value_use(name):
             raise TypeError(
                 "Expecting a Value instance, but got {}".format(value)
             )
-        # If value was already set, remove usage
-        if name in self._var_map:
-            self.del_use(self._var_map[name])
+        old_value = self._var_map.get(name, None)
 
         # Place the value in the var map:
         self._var_map[name] = value
@@ -696,6 +733,10 @@ def value_use(name):
         # Add usage:
         self.add_use(value)
 
+        # If value was already set, remove usage, unless it is still used:
+        if old_value is not None and old_value not in self._var_map.values():
+            self.del_use(old_value)
+
     return property(getter, setter)
 
 
@@ -707,6 +748,7 @@ class Instruction:
         # TODO: think of better naming..
         self._var_map = {}
         self.block = None
+        self._position = 0
         self.uses = OrderedSet()
 
     @property
@@ -741,13 +783,14 @@ class Instruction:
         """ replace value usage 'old' with new value, updating the def-use
             information.
         """
-        # TODO: update reference
-        # assert old in self._var_map.values()
+        # An instruction can use the same value more than once, and
+        # all of these uses are replaced:
         for name in self._var_map:
             if self._var_map[name] is old:
-                self.del_use(old)
                 self._var_map[name] = new
-                self.add_use(new)
+        if old in self.uses:
+            self.del_use(old)
+            self.add_use(new)
 
     def remove_from_block(self):
         for use in list(self.uses):
@@ -757,7 +800,7 @@ class Instruction:
     @property
     def position(self):
         """ Return numerical position in block """
-        return self.block.instructions.index(self)
+        return self.block.position_of(self)
 
     @property
     def is_terminator(self):
@@ -892,12 +935,8 @@ class FunctionCall(LocalValue):
             self.add_use(arg)
 
     def replace_use(self, old, new):
+        self.arguments = [new if v is old else v for v in self.arguments]
         super().replace_use(old, new)
-        if old in self.arguments:
-            idx = self.arguments.index(old)
-            self.del_use(old)
-            self.arguments[idx] = new
-            self.add_use(new)
 
     def __str__(self):
         args = ", ".join(arg.name for arg in self.arguments)
@@ -927,12 +966,8 @@ class ProcedureCall(Instruction):
             self.add_use(arg)
 
     def replace_use(self, old, new):
+        self.arguments = [new if v is old else v for v in self.arguments]
         super().replace_use(old, new)
-        if old in self.arguments:
-            idx = self.arguments.index(old)
-            self.del_use(old)
-            self.arguments[idx] = new
-            self.add_use(new)
 
     def __str__(self):
         args = ", ".join(arg.name for arg in self.arguments)
@@ -1037,9 +1072,9 @@ class Phi(LocalValue):
         assert old in self.inputs.values()
         for inp in self.inputs:
             if self.inputs[inp] == old:
-                self.del_use(old)
                 self.inputs[inp] = new
-                self.add_use(new)
+        self.del_use(old)
+        self.add_use(new)
 
     def set_incoming(self, block, value):
         """ Set the value for the phi node when entering through block """
@@ -1049,11 +1084,14 @@ class Phi(LocalValue):
                     value.ty, self.ty
                 )
             )
-        if block in self.inputs:
-            self.del_use(self.inputs[block])
+        old_value = self.inputs.get(block, None)
         self.inputs[block] = value
         self.add_use(value)
 
+        # The same value can come in from multiple blocks:
+        if old_value is not None and old_value not in self.inputs.values():
+            self.del_use(old_value)
+
     def get_value(self, block):
         """ Get the value for the incoming branch """
         return self.inputs[block]
@@ -1061,7 +1099,8 @@ class Phi(LocalValue):
     def del_incoming(self, block):
         """ Remove incoming branch from this phi node and delete the usage """
         value = self.inputs.pop(block)
-        self.del_use(value)
+        if value not in self.inputs.values():
+            self.del_use(value)
 
 
 class Alloc(LocalValue):
@@ -1225,12 +1264,8 @@ class InlineAsm(Instruction):
         self.add_use(value)
 
     def replace_use(self, old, new):
+        self.input_values = [new if v is old else v for v in self.input_values]
         super().replace_use(old, new)
-        if old in self.input_values:
-            idx = self.input_values.index(old)
-            self.del_use(old)
-            self.input_values[idx] = new
-            self.add_use(new)
 
     def __str__(self):
         return 'asm ({})'.format(self.template)
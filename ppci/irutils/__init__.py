@@ -7,6 +7,7 @@ from .reader import Reader, read_module
 from .builder import Builder, split_block
 from .link import ir_link
 from .io import to_json, from_json
+from .bitcode import to_bitcode, from_bitcode, is_bitcode
 from .instrument import add_tracer
 
 __all__ = [
@@ -21,5 +22,8 @@ __all__ = [
     "Writer",
     "to_json",
     "from_json",
+    "to_bitcode",
+    "from_bitcode",
+    "is_bitcode",
     "add_tracer",
 ]
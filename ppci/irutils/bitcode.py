@@ -0,0 +1,818 @@
+""" Binary format of IR-modules, called bitcode.
+
+Bitcode is a compact alternative to the json format of
+:mod:`ppci.irutils.io` and the textual format of :mod:`ppci.irutils.writer`.
+It consists of:
+
+- a header.
+- a string table with the names, referenced by their offset.
+- a table of the types.
+- the declarations of the externals, variables and functions.
+- an index with the offset and size of each function body.
+- the function bodies, which are streams of instructions.
+
+Numbers in the tables and streams are encoded as LEB128 varints.
+Values are referred to by number: first the externals, variables and
+functions of the module, then the parameters and the values defined in
+a function body. Each function body starts with the types of the values
+it defines, so values used before their definition can be decoded in a
+single pass.
+
+Since the index contains the offset of each function body, a single
+function can be decoded without decoding the other functions. This
+makes bitcode suitable to send modules to other processes.
+
+.. doctest::
+
+    >>> import io
+    >>> from ppci.api import c_to_ir
+    >>> from ppci.irutils import to_bitcode, from_bitcode
+    >>> c_src = "int add(int a, int b) { return a + b; }"
+    >>> mod = c_to_ir(io.StringIO(c_src), "x86_64")
+    >>> data = to_bitcode(mod)
+    >>> from_bitcode(data).stats()
+    'functions: 1, blocks: 1, instructions: 10'
+
+Debug information is not stored in bitcode. Inline assembly cannot be
+stored in bitcode, since it refers to the registers of the target machine.
+"""
+
+import struct
+from itertools import chain
+from .. import ir
+from ..common import CompilerError
+from ..utils.collections import OrderedSet
+from ..utils.leb128 import signed_leb128_encode, unsigned_leb128_encode
+
+
+def to_bitcode(module):
+    """ Encode an IR-module as bitcode.
+
+    Args:
+        module: the IR-module to encode.
+
+    Returns:
+        The bitcode as bytes.
+    """
+    return BitcodeWriter().write(module)
+
+
+def from_bitcode(data):
+    """ Decode an IR-module from bitcode.
+
+    Args:
+        data: bytes, or any other buffer, with the bitcode.
+
+    Returns:
+        The decoded IR-module.
+    """
+    return BitcodeReader(data).read()
+
+
+def is_bitcode(data):
+    """ Test if the given data is bitcode """
+    return bytes(data[:4]) == BITCODE_MAGIC
+
+
+BITCODE_MAGIC = b"PPIR"
+BITCODE_VERSION = 1
+
+# magic, version, flags, string table size, type table size,
+# declarations size and function count:
+_header = struct.Struct("<4sHHIIII")
+# offset and size of a function body:
+_function_entry = struct.Struct("<II")
+_double = struct.Struct("<d")
+
+BASIC_TYPE, BLOB_TYPE = 0, 1
+EXTERNAL_VARIABLE, EXTERNAL_FUNCTION, EXTERNAL_PROCEDURE = 0, 1, 2
+FUNCTION, PROCEDURE = 0, 1
+BYTES_PART, REFERENCE_PART = 0, 1
+INT_CONST, FLOAT_CONST = 0, 1
+BINDINGS = (ir.Binding.LOCAL, ir.Binding.GLOBAL)
+BASIC_TYPES = {ty.name: ty for ty in ir.all_types}
+
+(
+    LOAD,
+    STORE,
+    ALLOC,
+    ADDRESSOF,
+    BINOP,
+    UNOP,
+    CAST,
+    CONST,
+    UNDEFINED,
+    COPYBLOB,
+    LITERALDATA,
+    PHI,
+    JUMP,
+    CJUMP,
+    PROCEDURECALL,
+    FUNCTIONCALL,
+    EXIT,
+    RETURN,
+) = range(18)
+
+
+class BitcodeWriter:
+    """ Encode an IR-module into bitcode """
+
+    def __init__(self):
+        self.strings = bytearray()
+        self.string_map = {}
+        self.types = bytearray()
+        self.type_map = {}
+
+    def string(self, txt):
+        """ Get the offset of a string into the string table """
+        if txt not in self.string_map:
+            self.string_map[txt] = len(self.strings)
+            self.strings += txt.encode("utf8") + bytes([0])
+        return self.string_map[txt]
+
+    def string_ref(self, txt):
+        """ Encode a reference to a string """
+        return unsigned_leb128_encode(self.string(txt))
+
+    def type(self, ty):
+        """ Get the number of a type in the type table """
+        if isinstance(ty, ir.BlobDataTyp):
+            key = (ty.size, ty.alignment)
+        else:
+            key = ty
+        if key not in self.type_map:
+            self.type_map[key] = len(self.type_map)
+            if isinstance(ty, ir.BlobDataTyp):
+                self.types.append(BLOB_TYPE)
+                self.types += unsigned_leb128_encode(ty.size)
+                self.types += unsigned_leb128_encode(ty.alignment)
+            elif isinstance(ty, (ir.BasicTyp, ir.PointerTyp)):
+                self.types.append(BASIC_TYPE)
+                self.types += self.string_ref(ty.name)
+            else:  # pragma: no cover
+                raise NotImplementedError(str(ty))
+        return self.type_map[key]
+
+    def write(self, module, functions=None):
+        """ Encode a module.
+
+        Args:
+            module: the IR-module to encode.
+            functions: the functions of which the body is encoded. By
+                default, all function bodies are encoded.
+        """
+        return self.write_module(
+            module.name,
+            module.externals,
+            module.variables,
+            module.functions,
+            module.functions if functions is None else functions,
+        )
+
+    def write_functions(self, module, functions):
+        """ Encode functions, with only the global values they use.
+
+        This is smaller than the whole module, and can be decoded with
+        BitcodeReader.read_function into a module which contains the
+        used global values.
+        """
+        used = set(functions)
+        for function in functions:
+            for instruction in function.get_instructions():
+                used.update(instruction.uses)
+        return self.write_module(
+            module.name,
+            [external for external in module.externals if external in used],
+            [variable for variable in module.variables if variable in used],
+            [function for function in module.functions if function in used],
+            functions,
+        )
+
+    def write_module(self, name, externals, variables, subroutines, bodies):
+        output = bytearray()
+        output += self.string_ref(name)
+        self.global_numbers = {}
+
+        output += unsigned_leb128_encode(len(externals))
+        for external in externals:
+            self.write_external(external, output)
+
+        output += unsigned_leb128_encode(len(variables))
+        for variable in variables:
+            self.write_variable(variable, output)
+
+        output += unsigned_leb128_encode(len(subroutines))
+        for subroutine in subroutines:
+            self.write_declaration(subroutine, output)
+
+        index = bytearray()
+        body_data = bytearray()
+        for subroutine in subroutines:
+            if subroutine in bodies:
+                body = self.write_body(subroutine)
+            else:
+                body = bytes()
+            index += _function_entry.pack(len(body_data), len(body))
+            body_data += body
+
+        header = _header.pack(
+            BITCODE_MAGIC,
+            BITCODE_VERSION,
+            0,
+            len(self.strings),
+            len(self.types),
+            len(output),
+            len(subroutines),
+        )
+        return b"".join(
+            [
+                header,
+                bytes(self.strings),
+                bytes(self.types),
+                bytes(output),
+                bytes(index),
+                bytes(body_data),
+            ]
+        )
+
+    def number_global(self, value):
+        self.global_numbers[value] = len(self.global_numbers)
+
+    def write_external(self, external, output):
+        if isinstance(external, ir.ExternalVariable):
+            output.append(EXTERNAL_VARIABLE)
+            output += self.string_ref(external.name)
+        elif isinstance(external, ir.ExternalSubRoutine):
+            if isinstance(external, ir.ExternalFunction):
+                output.append(EXTERNAL_FUNCTION)
+            else:
+                assert isinstance(external, ir.ExternalProcedure)
+                output.append(EXTERNAL_PROCEDURE)
+            output += self.string_ref(external.name)
+            output += unsigned_leb128_encode(len(external.argument_types))
+            for ty in external.argument_types:
+                output += unsigned_leb128_encode(self.type(ty))
+            if isinstance(external, ir.ExternalFunction):
+                output += unsigned_leb128_encode(self.type(external.return_ty))
+        else:  # pragma: no cover
+            raise NotImplementedError(str(external))
+        self.number_global(external)
+
+    def write_variable(self, variable, output):
+        output += self.string_ref(variable.name)
+        output.append(BINDINGS.index(variable.binding))
+        output += unsigned_leb128_encode(variable.amount)
+        output += unsigned_leb128_encode(variable.alignment)
+
+        # The initial value is a tuple of bytes and references:
+        if variable.value is None:
+            output += unsigned_leb128_encode(0)
+        else:
+            output += unsigned_leb128_encode(len(variable.value) + 1)
+            for part in variable.value:
+                if isinstance(part, bytes):
+                    output.append(BYTES_PART)
+                    output += unsigned_leb128_encode(len(part))
+                    output += part
+                elif isinstance(part, tuple):
+                    ty, name = part
+                    output.append(REFERENCE_PART)
+                    output += unsigned_leb128_encode(self.type(ty))
+                    output += self.string_ref(name)
+                else:  # pragma: no cover
+                    raise NotImplementedError(str(part))
+        self.number_global(variable)
+
+    def write_declaration(self, subroutine, output):
+        """ Write the signature of a function """
+        if isinstance(subroutine, ir.Function):
+            output.append(FUNCTION)
+        else:
+            assert isinstance(subroutine, ir.Procedure)
+            output.append(PROCEDURE)
+        output += self.string_ref(subroutine.name)
+        output.append(BINDINGS.index(subroutine.binding))
+        output += unsigned_leb128_encode(len(subroutine.arguments))
+        for parameter in subroutine.arguments:
+            output += self.string_ref(parameter.name)
+            output += unsigned_leb128_encode(self.type(parameter.ty))
+        if isinstance(subroutine, ir.Function):
+            output += unsigned_leb128_encode(self.type(subroutine.return_ty))
+        self.number_global(subroutine)
+
+    def write_body(self, subroutine):
+        """ Write the blocks of a function """
+        output = bytearray()
+        global_numbers = self.global_numbers
+
+        # Number the values of the function, and write their types:
+        local_numbers = {}
+        for parameter in subroutine.arguments:
+            local_numbers[parameter] = len(global_numbers) + len(
+                local_numbers
+            )
+        value_types = []
+        for block in subroutine.blocks:
+            for instruction in block:
+                if isinstance(instruction, ir.Value):
+                    local_numbers[instruction] = len(global_numbers) + len(
+                        local_numbers
+                    )
+                    value_types.append(self.type(instruction.ty))
+        output += unsigned_leb128_encode(len(value_types))
+        for number in value_types:
+            output += unsigned_leb128_encode(number)
+
+        block_numbers = {}
+        output += unsigned_leb128_encode(len(subroutine.blocks))
+        for block in subroutine.blocks:
+            block_numbers[block] = len(block_numbers)
+            output += self.string_ref(block.name)
+
+        def ref(value):
+            if value in local_numbers:
+                number = local_numbers[value]
+            else:
+                number = global_numbers[value]
+            output.extend(unsigned_leb128_encode(number))
+
+        def block_ref(block):
+            output.extend(unsigned_leb128_encode(block_numbers[block]))
+
+        def name(value):
+            output.extend(self.string_ref(value.name))
+
+        for block in subroutine.blocks:
+            output += unsigned_leb128_encode(len(block))
+            for instruction in block:
+                self.write_instruction(
+                    instruction, output, ref, block_ref, name
+                )
+        return output
+
+    def write_instruction(self, instruction, output, ref, block_ref, name):
+        if isinstance(instruction, ir.Load):
+            output.append(LOAD)
+            name(instruction)
+            ref(instruction.address)
+            output.append(int(instruction.volatile))
+        elif isinstance(instruction, ir.Store):
+            output.append(STORE)
+            ref(instruction.address)
+            ref(instruction.value)
+            output.append(int(instruction.volatile))
+        elif isinstance(instruction, ir.Alloc):
+            output.append(ALLOC)
+            name(instruction)
+        elif isinstance(instruction, ir.Binop):
+            output.append(BINOP)
+            name(instruction)
+            ref(instruction.a)
+            output += self.string_ref(instruction.operation)
+            ref(instruction.b)
+        elif isinstance(instruction, ir.Unop):
+            output.append(UNOP)
+            name(instruction)
+            output += self.string_ref(instruction.operation)
+            ref(instruction.a)
+        elif isinstance(instruction, ir.AddressOf):
+            output.append(ADDRESSOF)
+            name(instruction)
+            ref(instruction.src)
+        elif isinstance(instruction, ir.Exit):
+            output.append(EXIT)
+        elif isinstance(instruction, ir.Return):
+            output.append(RETURN)
+            ref(instruction.result)
+        elif isinstance(instruction, ir.Jump):
+            output.append(JUMP)
+            block_ref(instruction.target)
+        elif isinstance(instruction, ir.CJump):
+            output.append(CJUMP)
+            ref(instruction.a)
+            output += self.string_ref(instruction.cond)
+            ref(instruction.b)
+            block_ref(instruction.lab_yes)
+            block_ref(instruction.lab_no)
+        elif isinstance(instruction, ir.Cast):
+            output.append(CAST)
+            name(instruction)
+            ref(instruction.src)
+        elif isinstance(instruction, ir.Const):
+            output.append(CONST)
+            name(instruction)
+            value = instruction.value
+            if isinstance(value, int):
+                output.append(INT_CONST)
+                output += signed_leb128_encode(value)
+            else:
+                output.append(FLOAT_CONST)
+                output += _double.pack(value)
+        elif isinstance(instruction, ir.Undefined):
+            output.append(UNDEFINED)
+            name(instruction)
+        elif isinstance(instruction, ir.CopyBlob):
+            output.append(COPYBLOB)
+            ref(instruction.dst)
+            ref(instruction.src)
+            output += unsigned_leb128_encode(instruction.amount)
+        elif isinstance(instruction, ir.LiteralData):
+            output.append(LITERALDATA)
+            name(instruction)
+            output += unsigned_leb128_encode(len(instruction.data))
+            output += instruction.data
+        elif isinstance(instruction, ir.ProcedureCall):
+            output.append(PROCEDURECALL)
+            ref(instruction.callee)
+            output += unsigned_leb128_encode(len(instruction.arguments))
+            for argument in instruction.arguments:
+                ref(argument)
+        elif isinstance(instruction, ir.FunctionCall):
+            output.append(FUNCTIONCALL)
+            name(instruction)
+            ref(instruction.callee)
+            output += unsigned_leb128_encode(len(instruction.arguments))
+            for argument in instruction.arguments:
+                ref(argument)
+        elif isinstance(instruction, ir.Phi):
+            output.append(PHI)
+            name(instruction)
+            output += unsigned_leb128_encode(len(instruction.inputs))
+            for block, value in instruction.inputs.items():
+                block_ref(block)
+                ref(value)
+        elif isinstance(instruction, ir.InlineAsm):
+            # The clobbered registers belong to the target machine:
+            raise CompilerError(
+                "Inline assembly cannot be stored in bitcode, in {}".format(
+                    instruction.function.name
+                )
+            )
+        else:  # pragma: no cover
+            raise NotImplementedError(str(instruction))
+
+
+class BitcodeReader:
+    """ Decode an IR-module from bitcode.
+
+    The declarations of the module can be decoded first, after which
+    the function bodies can be decoded one by one, as they are needed.
+    """
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        if not is_bitcode(self.data):
+            raise CompilerError("Not a bitcode file")
+        (
+            _,
+            version,
+            _,
+            strings_size,
+            types_size,
+            declarations_size,
+            n_functions,
+        ) = _header.unpack_from(self.data)
+        if version != BITCODE_VERSION:
+            raise CompilerError(
+                "Unsupported bitcode version {}".format(version)
+            )
+        self.strings_offset = _header.size
+        self.pos = self.strings_offset + strings_size
+        self._strings = {}
+
+        self.types = []
+        end = self.pos + types_size
+        while self.pos < end:
+            self.types.append(self.read_type())
+
+        self.declarations_offset = self.pos
+        index_offset = self.pos + declarations_size
+        self.bodies_offset = index_offset + _function_entry.size * n_functions
+        self.index = list(
+            _function_entry.iter_unpack(
+                self.data[index_offset : self.bodies_offset]
+            )
+        )
+        self.module = None
+
+    def varint(self):
+        """ Read an unsigned LEB128 number """
+        data = self.data
+        pos = self.pos
+        byte = data[pos]
+        pos += 1
+        value = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        self.pos = pos
+        return value
+
+    def signed_varint(self):
+        """ Read a signed LEB128 number """
+        data = self.data
+        pos = self.pos
+        value = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        if byte & 0x40:
+            value -= 1 << shift
+        self.pos = pos
+        return value
+
+    def byte(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def raw(self, size):
+        self.pos += size
+        return self.data[self.pos - size : self.pos]
+
+    def string(self):
+        """ Read a reference to a string, and get the string """
+        offset = self.varint()
+        if offset not in self._strings:
+            start = self.strings_offset + offset
+            end = self.data.index(0, start)
+            self._strings[offset] = self.data[start:end].decode("utf8")
+        return self._strings[offset]
+
+    def read_type(self):
+        kind = self.byte()
+        if kind == BASIC_TYPE:
+            return BASIC_TYPES[self.string()]
+        elif kind == BLOB_TYPE:
+            size = self.varint()
+            alignment = self.varint()
+            return ir.BlobDataTyp(size, alignment)
+        else:  # pragma: no cover
+            raise NotImplementedError(str(kind))
+
+    def type(self):
+        return self.types[self.varint()]
+
+    def read(self):
+        """ Decode the whole module """
+        module = self.read_declarations()
+        for function, (_, size) in zip(module.functions, self.index):
+            if size:
+                self.read_function(function.name)
+        return module
+
+    def read_declarations(self):
+        """ Decode the module, without the function bodies """
+        if self.module is None:
+            self.module = self.parse_declarations()
+            self.global_values = list(
+                chain(
+                    self.module.externals,
+                    self.module.variables,
+                    self.module.functions,
+                )
+            )
+        return self.module
+
+    def parse_declarations(self):
+        self.pos = self.declarations_offset
+        module = ir.Module(self.string())
+        for _ in range(self.varint()):
+            module.add_external(self.read_external())
+        for _ in range(self.varint()):
+            module.add_variable(self.read_variable())
+        for _ in range(self.varint()):
+            module.add_function(self.read_declaration())
+        return module
+
+    def read_external(self):
+        kind = self.byte()
+        name = self.string()
+        if kind == EXTERNAL_VARIABLE:
+            return ir.ExternalVariable(name)
+        argument_types = [self.type() for _ in range(self.varint())]
+        if kind == EXTERNAL_FUNCTION:
+            return ir.ExternalFunction(name, argument_types, self.type())
+        elif kind == EXTERNAL_PROCEDURE:
+            return ir.ExternalProcedure(name, argument_types)
+        else:  # pragma: no cover
+            raise NotImplementedError(str(kind))
+
+    def read_variable(self):
+        name = self.string()
+        binding = BINDINGS[self.byte()]
+        amount = self.varint()
+        alignment = self.varint()
+        n_parts = self.varint()
+        if n_parts:
+            parts = []
+            for _ in range(n_parts - 1):
+                kind = self.byte()
+                if kind == BYTES_PART:
+                    parts.append(self.raw(self.varint()))
+                elif kind == REFERENCE_PART:
+                    ty = self.type()
+                    parts.append((ty, self.string()))
+                else:  # pragma: no cover
+                    raise NotImplementedError(str(kind))
+            value = tuple(parts)
+        else:
+            value = None
+        return ir.Variable(name, binding, amount, alignment, value=value)
+
+    def read_declaration(self):
+        kind = self.byte()
+        name = self.string()
+        binding = BINDINGS[self.byte()]
+        parameters = []
+        for _ in range(self.varint()):
+            parameter_name = self.string()
+            parameters.append(ir.Parameter(parameter_name, self.type()))
+        if kind == FUNCTION:
+            subroutine = ir.Function(name, binding, self.type())
+        elif kind == PROCEDURE:
+            subroutine = ir.Procedure(name, binding)
+        else:  # pragma: no cover
+            raise NotImplementedError(str(kind))
+        for parameter in parameters:
+            subroutine.add_parameter(parameter)
+        return subroutine
+
+    def read_function(self, name, module=None):
+        """ Decode the body of a single function.
+
+        Args:
+            name: the name of the function.
+            module: the module in which the body of the function is
+                replaced. The global values used by the function are
+                looked up by name in this module. By default, the module
+                decoded by read_declarations is used.
+
+        Returns:
+            The function with its new body.
+        """
+        self.read_declarations()
+        if module is None:
+            global_values = self.global_values
+        else:
+            # Look up the global values by name in the given module:
+            names = [value.name for value in self.global_values]
+            values = {
+                value.name: value
+                for value in chain(
+                    module.externals, module.variables, module.functions
+                )
+            }
+            global_values = [values[name] for name in names]
+        functions = global_values[len(global_values) - len(self.index) :]
+        for function, (offset, size) in zip(functions, self.index):
+            if function.name == name:
+                break
+        else:
+            raise KeyError(name)
+        if not size:
+            raise ValueError("No body of function {}".format(name))
+
+        self.pos = self.bodies_offset + offset
+        self.read_body(function, global_values)
+        return function
+
+    def read_body(self, subroutine, global_values):
+        """ Decode the blocks of a function, replacing its old blocks """
+        for block in subroutine.blocks:
+            for instruction in block:
+                for value in list(instruction.uses):
+                    instruction.del_use(value)
+        subroutine.blocks = []
+        subroutine.entry = None
+        subroutine.defined_names = OrderedSet(
+            parameter.name for parameter in subroutine.arguments
+        )
+
+        values = global_values + subroutine.arguments
+        first_local = len(values)
+        value_types = [self.type() for _ in range(self.varint())]
+
+        # Values used before their definition are first undefined:
+        undefined_values = {}
+
+        def ref():
+            number = self.varint()
+            if number < len(values):
+                return values[number]
+            if number not in undefined_values:
+                ty = value_types[number - first_local]
+                undefined_values[number] = ir.Undefined("undefined", ty)
+            return undefined_values[number]
+
+        blocks = []
+        for _ in range(self.varint()):
+            block = ir.Block(self.string())
+            subroutine.add_block(block)
+            blocks.append(block)
+        if blocks:
+            subroutine.entry = blocks[0]
+
+        for block in blocks:
+            for _ in range(self.varint()):
+                if len(values) - first_local < len(value_types):
+                    ty = value_types[len(values) - first_local]
+                else:
+                    ty = None
+                instruction = self.read_instruction(ty, ref, blocks)
+                if isinstance(instruction, ir.Value):
+                    number = len(values)
+                    values.append(instruction)
+                    if number in undefined_values:
+                        undefined_values.pop(number).replace_by(instruction)
+                block.add_instruction(instruction)
+        assert not undefined_values
+
+    def read_instruction(self, ty, ref, blocks):
+        """ Decode an instruction, where ty is the type of its value """
+        opcode = self.byte()
+        if opcode == LOAD:
+            name = self.string()
+            address = ref()
+            volatile = bool(self.byte())
+            instruction = ir.Load(address, name, ty, volatile=volatile)
+        elif opcode == STORE:
+            address = ref()
+            value = ref()
+            volatile = bool(self.byte())
+            instruction = ir.Store(value, address, volatile=volatile)
+        elif opcode == ALLOC:
+            name = self.string()
+            instruction = ir.Alloc(name, ty.size, ty.alignment)
+        elif opcode == BINOP:
+            name = self.string()
+            a = ref()
+            operation = self.string()
+            b = ref()
+            instruction = ir.Binop(a, operation, b, name, ty)
+        elif opcode == UNOP:
+            name = self.string()
+            operation = self.string()
+            instruction = ir.Unop(operation, ref(), name, ty)
+        elif opcode == ADDRESSOF:
+            name = self.string()
+            instruction = ir.AddressOf(ref(), name)
+        elif opcode == EXIT:
+            instruction = ir.Exit()
+        elif opcode == RETURN:
+            instruction = ir.Return(ref())
+        elif opcode == JUMP:
+            instruction = ir.Jump(blocks[self.varint()])
+        elif opcode == CJUMP:
+            a = ref()
+            cond = self.string()
+            b = ref()
+            lab_yes = blocks[self.varint()]
+            lab_no = blocks[self.varint()]
+            instruction = ir.CJump(a, cond, b, lab_yes, lab_no)
+        elif opcode == CAST:
+            name = self.string()
+            instruction = ir.Cast(ref(), name, ty)
+        elif opcode == CONST:
+            name = self.string()
+            kind = self.byte()
+            if kind == INT_CONST:
+                value = self.signed_varint()
+            else:
+                assert kind == FLOAT_CONST
+                (value,) = _double.unpack(self.raw(_double.size))
+            instruction = ir.Const(value, name, ty)
+        elif opcode == UNDEFINED:
+            instruction = ir.Undefined(self.string(), ty)
+        elif opcode == COPYBLOB:
+            dst = ref()
+            src = ref()
+            instruction = ir.CopyBlob(dst, src, self.varint())
+        elif opcode == LITERALDATA:
+            name = self.string()
+            instruction = ir.LiteralData(self.raw(self.varint()), name)
+        elif opcode == PROCEDURECALL:
+            callee = ref()
+            arguments = [ref() for _ in range(self.varint())]
+            instruction = ir.ProcedureCall(callee, arguments)
+        elif opcode == FUNCTIONCALL:
+            name = self.string()
+            callee = ref()
+            arguments = [ref() for _ in range(self.varint())]
+            instruction = ir.FunctionCall(callee, arguments, name, ty)
+        elif opcode == PHI:
+            name = self.string()
+            instruction = ir.Phi(name, ty)
+            for _ in range(self.varint()):
+                block = blocks[self.varint()]
+                instruction.set_incoming(block, ref())
+        else:  # pragma: no cover
+            raise NotImplementedError(str(opcode))
+        return instruction
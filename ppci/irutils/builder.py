@@ -27,8 +27,9 @@ def split_block(block, pos=None, newname="splitblock"):
     # Create new block, and move instructions into it:
     block2 = ir.Block(newname)
     block.function.add_block(block2)
-    for instruction in rest:
+    for instruction in reversed(rest):
         block.remove_instruction(instruction)
+    for instruction in rest:
         block2.add_instruction(instruction)
 
     # Update successor phi nodes:
@@ -59,7 +59,7 @@ def from_json(json_txt):
     Returns:
         The IR-module as represented by JSON.
     """
-    return from_dict(json_txt)
+    return from_dict(json.loads(json_txt))
 
 
 def from_dict(d):
@@ -266,6 +266,19 @@ class DictWriter:
                 "type": self.write_type(instruction.ty),
                 "value": instruction.value,
             }
+        elif isinstance(instruction, ir.Undefined):
+            json_instruction = {
+                "kind": "undefined",
+                "name": instruction.name,
+                "type": self.write_type(instruction.ty),
+            }
+        elif isinstance(instruction, ir.CopyBlob):
+            json_instruction = {
+                "kind": "copyblob",
+                "dst": self.write_value_ref(instruction.dst),
+                "src": self.write_value_ref(instruction.src),
+                "amount": instruction.amount,
+            }
         elif isinstance(instruction, ir.LiteralData):
             json_instruction = {
                 "kind": "literaldata",
@@ -350,9 +363,9 @@ class DictReader:
         # self.subroutines = []
         self.scopes = []
         self.undefined_values = {}
+        self.value_types = {}
 
-    def construct(self, json_txt):
-        d = json.loads(json_txt)
+    def construct(self, d):
         name = d["name"]
         json_externals = d["externals"]
         json_variables = d["variables"]
@@ -443,6 +456,7 @@ class DictReader:
             self.register_value(parameter)
             subroutine.add_parameter(parameter)
 
+        self.collect_value_types(json_blocks)
         for json_block in json_blocks:
             block = self.construct_block(json_block, subroutine)
             if subroutine.entry is None:
@@ -452,6 +466,19 @@ class DictReader:
         # self.subroutines.pop()
         return subroutine
 
+    def collect_value_types(self, json_blocks):
+        """ Determine the types of the values defined in blocks.
+
+        A value can be used in a block before the block which defines
+        it, so the type of such a value is looked up here.
+        """
+        self.value_types = {
+            json_instruction["name"]: json_instruction["type"]
+            for json_block in json_blocks
+            for json_instruction in json_block["instructions"]
+            if "type" in json_instruction
+        }
+
     def construct_block(self, json_block, subroutine):
         name = json_block["name"]
         json_instructions = json_block["instructions"]
@@ -467,12 +494,14 @@ class DictReader:
             name = json_instruction["name"]
             ty = self.get_type(json_instruction["type"])
             address = self.get_value_ref(json_instruction["address"])
-            instruction = ir.Load(address, name, ty)
+            volatile = json_instruction.get("volatile", False)
+            instruction = ir.Load(address, name, ty, volatile=volatile)
             self.register_value(instruction)
         elif itype == "store":
             value = self.get_value_ref(json_instruction["value"])
             address = self.get_value_ref(json_instruction["address"])
-            instruction = ir.Store(value, address)
+            volatile = json_instruction.get("volatile", False)
+            instruction = ir.Store(value, address, volatile=volatile)
         elif itype == "alloc":
             name = json_instruction["name"]
             amount = json_instruction["size"]
@@ -512,6 +541,16 @@ class DictReader:
             value = json_instruction["value"]
             instruction = ir.Const(value, name, ty)
             self.register_value(instruction)
+        elif itype == "undefined":
+            name = json_instruction["name"]
+            ty = self.get_type(json_instruction["type"])
+            instruction = ir.Undefined(name, ty)
+            self.register_value(instruction)
+        elif itype == "copyblob":
+            dst = self.get_value_ref(json_instruction["dst"])
+            src = self.get_value_ref(json_instruction["src"])
+            amount = json_instruction["amount"]
+            instruction = ir.CopyBlob(dst, src, amount)
         elif itype == "literaldata":
             name = json_instruction["name"]
             data = asc2bin(json_instruction["data"])
@@ -592,6 +631,8 @@ class DictReader:
             if name in self.undefined_values:
                 value = self.undefined_values[name]
             else:
+                if name in self.value_types:
+                    ty = self.get_type(self.value_types[name])
                 value = ir.Undefined(name, ty)
                 self.undefined_values[name] = value
         return value
@@ -115,7 +115,7 @@ class Verifier:
 
         # Check that instruction is contained in block:
         assert instruction.block == block
-        assert instruction in block.instructions
+        assert block.instructions[instruction.position] is instruction
 
         # Check if value has unique name string:
         if isinstance(instruction, ir.Value):
@@ -244,7 +244,7 @@ class Verifier:
         # All other instructions must have a containing block:
         if one.block is None:
             raise ValueError("{} has no block".format(one))
-        assert one in one.block.instructions
+        assert one.block.instructions[one.position] is one
 
         # Phis are special case:
         if isinstance(another, ir.Phi):
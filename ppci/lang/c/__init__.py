@@ -3,6 +3,7 @@
 from .context import CContext
 from .builder import CBuilder, create_ast, parse_text, parse_type
 from .lexer import CLexer
+from .fastlexer import FastCLexer
 from .parser import CParser
 from .semantics import CSemantics
 from .synthesize import CSynthesizer
@@ -25,6 +26,7 @@ __all__ = [
     "CBuilder",
     "CContext",
     "CLexer",
+    "FastCLexer",
     "COptions",
     "CPreProcessor",
     "CParser",
@@ -6,6 +6,7 @@ from .parser import CParser
 from .semantics import CSemantics
 from .preprocessor import CPreProcessor, prepare_for_parsing
 from .codegenerator import CCodeGenerator
+from .pch import parse_with_precompiled_header
 from .utils import print_ast
 
 
@@ -18,6 +19,7 @@ class CBuilder:
         self.arch_info = arch_info
         self.coptions = coptions
         self.cgen = None
+        self.preprocessor = None
 
     def build(self, src: io.TextIOBase, filename: str, reporter=None):
         if reporter:
@@ -29,7 +31,8 @@ class CBuilder:
         self.logger.info("Starting C compilation (%s)", cdialect)
 
         context = CContext(self.coptions, self.arch_info)
-        compile_unit = _parse(src, filename, context)
+        self.preprocessor = CPreProcessor(self.coptions)
+        compile_unit = _parse(src, filename, context, self.preprocessor)
 
         if reporter:
             f = io.StringIO()
@@ -63,8 +66,13 @@ def create_ast(src, arch_info, filename="<snippet>", coptions=None):
     return _parse(src, filename, context)
 
 
-def _parse(src, filename, context):
-    preprocessor = CPreProcessor(context.coptions)
+def _parse(src, filename, context, preprocessor=None):
+    if preprocessor is None:
+        preprocessor = CPreProcessor(context.coptions)
+    if context.coptions["precompiled_headers"]:
+        return parse_with_precompiled_header(
+            src, filename, context, preprocessor
+        )
     tokens = preprocessor.process_file(src, filename)
     semantics = CSemantics(context)
     parser = CParser(context.coptions, semantics)
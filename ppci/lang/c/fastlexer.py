@@ -0,0 +1,464 @@
+""" Fast C lexer.
+
+This lexer produces exactly the same tokens as the
+:class:`ppci.lang.c.lexer.CLexer`, but instead of passing each character
+through a series of generators, it scans complete lines with a single
+regular expression. Source locations are only created for the emitted
+tokens.
+
+Lines which contain trigraphs or backslashes are first translated into
+a text and a table with the original column of each character. Lines
+ending with a backslash are glued to the next line.
+
+Rare constructs, such as comments and strings spanning multiple lines,
+are handled by growing the buffer with the next line. Anything which
+is not matched by the regular expression, such as lexical errors, is
+handed over to the character based lexer, so that errors are
+reported in the same way.
+
+The only observable difference is the row of the source file while the
+tokens of a last line without a trailing newline are produced. The
+character based lexer already moved past this line, so that
+``__LINE__`` was one too high, whereas this lexer reports the row of
+the line itself.
+"""
+
+import io
+import logging
+import re
+from bisect import bisect_right
+
+from ..common import SourceLocation
+from ..tools.handlexer import Char
+from .lexer import CLexer, SourceFile
+from .token import CToken
+
+TRIGRAPHS = {
+    "=": "#",
+    "(": "[",
+    ")": "]",
+    "<": "{",
+    ">": "}",
+    "-": "~",
+    "!": "|",
+    "/": "\\",
+    "'": "^",
+}
+
+_escape = (
+    r"""\\(?:['"?\\abfnrtve]|[0-7]{1,3}|x[0-9a-fA-F]{0,2}"""
+    r"""|[uU][0-9a-fA-F]{0,4})"""
+)
+_operators = [
+    "...",
+    "<<=",
+    ">>=",
+    "->",
+    "++",
+    "--",
+    "<<",
+    ">>",
+    "<=",
+    ">=",
+    "==",
+    "!=",
+    "&&",
+    "||",
+    "+=",
+    "-=",
+    "*=",
+    "/=",
+    "%=",
+    "&=",
+    "|=",
+    "^=",
+    "~=",
+    "##",
+]
+_token_regex = re.compile(
+    "|".join(
+        [
+            r"(?P<WS>[ \t]+)",
+            r"(?P<ID>(?!L')[A-Za-z_][A-Za-z0-9_]*)",
+            r"(?P<BOL>\n)",
+            r"(?P<NUMBER>"
+            r"(?:0[xX][0-9a-fA-F]*|0[bB][01]*|0[0-7]*|[1-9][0-9]*)"
+            r"(?:\.[0-9]*(?:[eEpP][+-]?[0-9]*)?|[LlUu]{0,3})"
+            r"|\.[0-9]+(?:[eEpP][+-]?[0-9]*)?)",
+            r'(?P<STRING>"(?:[^"\\]|\\[\'"?\\abfnrtve0-7xuU])*")',
+            r"(?P<CHAR>L?'(?:{}|[^\\])')".format(_escape),
+            r"(?P<COMMENT>/\*[\s\S]*?\*/)",
+            r"(?P<LINECOMMENT>//[^\n]*)",
+            r"(?P<OPEN>/\*|L?'|\")",
+            r"(?P<OP>{}|[-+*/%<>=!&|^~#.;{{}}()\[\],?:\\])".format(
+                "|".join(map(re.escape, _operators))
+            ),
+            r"(?P<FF>\f)",
+        ]
+    )
+)
+_string_prefix = re.compile(r'"(?:[^"\\]|\\[\'"?\\abfnrtve0-7xuU])*\\?')
+_char_prefix = re.compile(r"L?'(?:\\(?:{})?|[^\\])?".format(_escape[2:]))
+
+# The character based lexer emits '<<' for '<<='
+_operator_types = {"<<=": "<<"}
+
+
+def lex_text(text, coptions):
+    """ Lex a piece of text """
+    lexer = FastCLexer(coptions)
+    return list(lexer.lex_text(text))
+
+
+class NeedMoreInput(Exception):
+    """ Raised when a token continues beyond the end of the buffer """
+
+    pass
+
+
+class SourceBuffer:
+    """ A piece of source text and the origin of each character.
+
+    The buffer contains a single line, or more lines when a construct
+    spans multiple lines. The text is split into segments, one for each
+    physical line in the source.
+    """
+
+    def __init__(self, f, source_file, trigraphs, continuations):
+        self.lines = iter(f)
+        self.source_file = source_file
+        self.trigraphs = trigraphs
+        self.continuations = continuations
+        self.at_eof = False
+        self.line_count = 0
+        # The physical line which corresponds to source_file.row:
+        self.physical = 0
+        self.text = ""
+        self.segments = []
+        self.starts = []
+
+    def next_line(self):
+        """ Replace the buffer by the next line.
+
+        Returns False at the end of the input.
+        """
+        self.text = ""
+        self.segments = []
+        self.starts = []
+        if self.extend():
+            self.advance_to(self.segments[0][1])
+            return True
+        else:
+            self.advance_to(self.line_count)
+            return False
+
+    def extend(self):
+        """ Append the next line to the buffer.
+
+        Returns False at the end of the input.
+        """
+        if not self.read_physical_line():
+            return False
+
+        # Glue lines which end with a backslash:
+        if self.continuations:
+            while not self.text.endswith("\n"):
+                if not self.read_physical_line():
+                    break
+        return True
+
+    def read_physical_line(self):
+        line = next(self.lines, None)
+        if line is None:
+            self.at_eof = True
+            return False
+
+        index = self.line_count
+        self.line_count += 1
+        line = line.expandtabs()
+        row = self.source_file.row + index - self.physical
+        if (self.continuations and "\\" in line) or (
+            self.trigraphs and "??" in line
+        ):
+            line, columns = self.filter_line(line)
+        else:
+            columns = None
+
+        start = len(self.text)
+        self.segments.append(
+            (start, index, row, self.source_file.filename, columns)
+        )
+        self.starts.append(start)
+        self.text += line
+        return True
+
+    def filter_line(self, line):
+        """ Replace trigraphs and remove backslash newline sequences """
+        characters = []
+        columns = []
+        i = 0
+        n = len(line)
+        while i < n:
+            char = line[i]
+            if (
+                self.trigraphs
+                and char == "?"
+                and line[i + 1 : i + 2] == "?"
+                and line[i + 2 : i + 3] in TRIGRAPHS
+            ):
+                characters.append(TRIGRAPHS[line[i + 2]])
+                columns.append(i + 1)
+                i += 3
+            else:
+                characters.append(char)
+                columns.append(i + 1)
+                i += 1
+
+        if self.continuations:
+            characters2 = []
+            columns2 = []
+            backslash = None
+            for char, column in zip(characters, columns):
+                if backslash:
+                    if char not in "\r\n":
+                        characters2.extend(("\\", char))
+                        columns2.extend((backslash, column))
+                    backslash = None
+                elif char == "\\":
+                    backslash = column
+                else:
+                    characters2.append(char)
+                    columns2.append(column)
+            characters, columns = characters2, columns2
+
+        return "".join(characters), columns
+
+    @property
+    def is_simple(self):
+        """ Test if the columns are equal to the positions in the text """
+        return len(self.segments) == 1 and self.segments[0][4] is None
+
+    def location(self, pos):
+        """ Create a source location for the character at pos """
+        return locate(self.segments, self.starts, pos)
+
+    def advance(self, pos):
+        """ Advance the source file row up to the character at pos """
+        self.advance_to(find_segment(self.segments, self.starts, pos)[1])
+
+    def advance_to(self, index):
+        if index > self.physical:
+            self.source_file.row += index - self.physical
+            self.physical = index
+
+    def characters(self, pos):
+        """ Generate characters starting at pos """
+        for pos in range(pos, len(self.text)):
+            yield Char(self.text[pos], self.location(pos))
+        if not self.at_eof:
+            raise NeedMoreInput()
+
+
+def find_segment(segments, starts, pos):
+    if len(segments) == 1:
+        return segments[0]
+    else:
+        return segments[bisect_right(starts, pos) - 1]
+
+
+def locate(segments, starts, pos):
+    """ Create a source location for the character at pos """
+    start, _, row, filename, columns = find_segment(segments, starts, pos)
+    if columns is None:
+        column = pos - start + 1
+    else:
+        column = columns[pos - start]
+    return SourceLocation(filename, row, column, 1)
+
+
+class FastCLexer:
+    """ Line based lexer for the preprocessor """
+
+    logger = logging.getLogger("clexer")
+
+    def __init__(self, coptions):
+        self.coptions = coptions
+
+    def lex(self, src, source_file):
+        """ Read a source and generate a series of tokens """
+        self.logger.debug("Lexing %s", source_file.filename)
+        buffer = SourceBuffer(
+            src, source_file, self.coptions["trigraphs"], True
+        )
+        return self.tokenize(buffer)
+
+    def lex_text(self, txt):
+        """ Create tokens from the given text """
+        f = io.StringIO(txt)
+        source_file = SourceFile(None)
+        buffer = SourceBuffer(f, source_file, False, False)
+        return self.tokenize(buffer)
+
+    def tokenize(self, buffer):
+        """ Generate tokens from the lines in the buffer """
+        match = _token_regex.match
+        operator_types = _operator_types
+        c89 = self.coptions["std"] == "c89"
+        space = ""
+        first = True
+        # Location of the last raw token:
+        last_location = last_line = None
+        while buffer.next_line():
+            text = buffer.text
+            multiline = len(buffer.segments) > 1
+            simple = buffer.is_simple
+            _, _, row, filename, _ = buffer.segments[0]
+            pos = 0
+            last_pos = None
+            while pos < len(text):
+                mo = match(text, pos)
+                kind = mo.lastgroup if mo else None
+                if kind == "WS":
+                    space += mo.group()
+                    last_pos = pos
+                    pos = mo.end()
+                elif kind == "BOL":
+                    if first:
+                        if multiline:
+                            buffer.advance(pos)
+                        if simple:
+                            loc = SourceLocation(filename, row, pos + 1, 1)
+                        else:
+                            loc = buffer.location(pos)
+                        yield CToken("BOL", "", "", True, loc)
+                    first = True
+                    space = ""
+                    last_pos = pos
+                    pos += 1
+                elif kind in ("ID", "NUMBER", "OP", "STRING", "CHAR"):
+                    val = mo.group()
+                    if kind == "OP":
+                        typ = operator_types.get(val, val)
+                    else:
+                        typ = kind
+                    end = mo.end()
+                    if simple:
+                        loc = SourceLocation(filename, row, pos + 1, 1)
+                    else:
+                        if multiline:
+                            buffer.advance(end - 1)
+                        loc = buffer.location(pos)
+                    yield CToken(typ, val, space, first, loc)
+                    space = ""
+                    first = False
+                    last_pos = pos
+                    pos = end
+                elif kind == "COMMENT" or kind == "FF":
+                    pos = mo.end()
+                elif kind == "LINECOMMENT" and not c89:
+                    pos = mo.end()
+                elif kind == "OPEN" and self.need_more(buffer, pos):
+                    # Continue the comment, string or character on the next
+                    # line.
+                    if text.startswith("/*", pos):
+                        end = self.find_comment_end(buffer, pos)
+                        if end is None:
+                            # This will raise an error:
+                            self.reference_lex(buffer, pos)
+                        pos = end
+                    else:
+                        buffer.extend()
+                    text = buffer.text
+                    multiline = len(buffer.segments) > 1
+                    simple = buffer.is_simple
+                else:
+                    tokens, end = self.reference_lex(buffer, pos)
+                    text = buffer.text
+                    multiline = len(buffer.segments) > 1
+                    simple = buffer.is_simple
+                    if multiline:
+                        buffer.advance(end - 1)
+                    for token in tokens:
+                        last_location, last_line = token.loc, None
+                        last_pos = None
+                        if token.typ == "BOL":
+                            if first:
+                                yield CToken("BOL", "", "", first, token.loc)
+                            first = True
+                            space = ""
+                        elif token.typ == "WS":
+                            space += token.val
+                        else:
+                            yield CToken(
+                                token.typ, token.val, space, first, token.loc
+                            )
+                            space = ""
+                            first = False
+                    pos = end
+
+            if last_pos is not None:
+                last_location = None
+                last_line = (buffer.segments, buffer.starts, last_pos)
+
+        # Emit last newline:
+        if last_line:
+            last_location = locate(*last_line)
+        if first and last_location:
+            # Yield an extra start of line
+            yield CToken("BOL", "", "", first, last_location)
+
+    @staticmethod
+    def need_more(buffer, pos):
+        """ Test if an unfinished comment, string or character at pos
+        could be completed by the next line.
+        """
+        if buffer.at_eof:
+            return False
+
+        text = buffer.text
+        if text.startswith("/*", pos):
+            return True
+        elif text.startswith('"', pos):
+            mo = _string_prefix.match(text, pos)
+        else:
+            mo = _char_prefix.match(text, pos)
+        return mo.end() == len(text)
+
+    @staticmethod
+    def find_comment_end(buffer, pos):
+        """ Find the end of a comment, extending the buffer if required """
+        start = pos + 2
+        while True:
+            end = buffer.text.find("*/", start)
+            if end >= 0:
+                return end + 2
+            start = max(pos + 2, len(buffer.text) - 1)
+            if not buffer.extend():
+                return
+
+    def reference_lex(self, buffer, pos):
+        """ Lex a single token at pos with the character based lexer.
+
+        Returns the raw tokens and the position after the token.
+        """
+        while True:
+            lexer = CLexer(self.coptions)
+            consumed = [0]
+            lexer.characters = counted(buffer.characters(pos), consumed)
+            try:
+                state = lexer.lex_c()
+                while state is not None and state != lexer.lex_c:
+                    state = state()
+            except NeedMoreInput:
+                buffer.extend()
+                continue
+
+            end = pos + consumed[0] - len(lexer.pushed_back)
+            return lexer.token_buffer, end
+
+
+def counted(characters, consumed):
+    """ Pass characters, and count them """
+    for char in characters:
+        consumed[0] += 1
+        yield char
@@ -15,6 +15,7 @@ class COptions:
         self.set("std", "c99")
         self.disable("verbose")
         self.disable("freestanding")
+        self.set("precompiled_headers", None)
 
         # TODO: temporal default paths:
         # self.add_include_path('/usr/include')
@@ -47,6 +48,7 @@ class COptions:
         self.set("trigraphs", args.trigraphs)
         self.set("std", args.std)
         self.set("freestanding", args.freestanding)
+        self.set("precompiled_headers", args.pch_dir)
 
         for path in args.I:
             self.add_include_path(path)
@@ -73,6 +75,15 @@ class COptions:
     def add_define(self, name, value):
         self.macros.append((name, value))
 
+    def use_precompiled_headers(self, directory):
+        """ Store precompiled headers in the given directory.
+
+        When a source file starts with the same include directives as
+        an earlier compiled source file, the macros and declarations
+        of these headers are loaded from this directory.
+        """
+        self.set("precompiled_headers", directory)
+
 
 # Construct an argument parser for the various C options:
 coptions_parser = ArgumentParser(add_help=False)
@@ -118,6 +129,11 @@ coptions_parser.add_argument(
     default="c99",
     help="The C version you want to use",
 )
+coptions_parser.add_argument(
+    "--pch-dir",
+    metavar="dir",
+    help="Directory in which precompiled headers are cached",
+)
 coptions_parser.add_argument(
     "--super-verbose",
     action="store_true",
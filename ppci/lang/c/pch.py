@@ -0,0 +1,204 @@
+""" Precompiled headers.
+
+Source files often start with the same block of include directives. A
+precompiled header is the state of the preprocessor (the macro table)
+and of the parser (the file scope with all declarations) after such a
+header prefix. The state is stored in a disk cache, and is loaded when
+a later compilation starts with the same prefix and C options.
+
+The header prefix of a source file are the leading lines which are
+empty, contain a line comment or a single line preprocessor directive.
+Conditional directives, such as ``#ifdef``, end the prefix, since they
+can span the rest of the file.
+
+A precompiled header is used only when all files it was made of are
+unchanged.
+"""
+
+import io
+import json
+import logging
+import os
+import pickle
+from ... import __version__
+from ...arch.arch_info import TypeInfo
+from ...common import CompilerError
+from ...utils.diskcache import get_cache, make_key
+from .parser import CParser
+from .preprocessor import CPreProcessor, prepare_for_parsing
+from .semantics import CSemantics
+
+
+logger = logging.getLogger("pch")
+
+# Directives which may not end up in a header prefix:
+UNSAFE_DIRECTIVES = {
+    "if",
+    "ifdef",
+    "ifndef",
+    "elif",
+    "else",
+    "endif",
+    "line",
+}
+
+
+class PrecompiledHeader:
+    """ The state of the preprocessor and parser after a header prefix """
+
+    def __init__(self, preprocessor_state, scope, typedefs, dependencies):
+        self.preprocessor_state = preprocessor_state
+        self.scope = scope
+        self.typedefs = typedefs
+        # Mapping of included file to modification time and size:
+        self.dependencies = dependencies
+
+    def is_up_to_date(self):
+        """ Check that none of the included files changed. """
+        return all(
+            file_stamp(filename) == stamp
+            for filename, stamp in self.dependencies.items()
+        )
+
+
+def file_stamp(filename):
+    """ Get the modification time and size of a file """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def header_prefix_length(lines):
+    """ Determine the amount of lines which form the header prefix.
+
+    Returns 0 when there is no prefix with include directives.
+    """
+    length = 0
+    has_include = False
+    for index, line in enumerate(lines):
+        text = line.strip()
+        if text.endswith("\\") or "??/" in text:
+            # Line continuations are not supported.
+            break
+
+        if text.rfind("/*") > text.rfind("*/"):
+            # Unterminated block comment.
+            break
+
+        if text.startswith("#"):
+            parts = text[1:].split(None, 1)
+            directive = parts[0] if parts else ""
+            if directive in UNSAFE_DIRECTIVES or directive.isdigit():
+                break
+            if directive == "include":
+                has_include = True
+            length = index + 1
+        elif text and not text.startswith("//"):
+            break
+
+    return length if has_include else 0
+
+
+def options_key(coptions, arch_info):
+    """ Create a text describing all options relevant to a header """
+    type_infos = []
+    for typ, info in arch_info.type_infos.items():
+        # Type aliases map to other types:
+        if isinstance(info, TypeInfo):
+            info = (info.size, info.alignment)
+        type_infos.append((str(typ), str(info)))
+    type_infos.sort()
+    return json.dumps(
+        [
+            sorted(coptions.settings.items()),
+            coptions.include_directories,
+            coptions.macros,
+            coptions.undefine_macros,
+            type_infos,
+            arch_info.endianness.name,
+        ],
+        default=str,
+    )
+
+
+def precompile_header(prefix, filename, context):
+    """ Process a header prefix on its own.
+
+    Returns None when the prefix cannot be compiled separately from the
+    rest of the source file.
+    """
+    preprocessor = CPreProcessor(context.coptions)
+    semantics = CSemantics(context)
+    parser = CParser(context.coptions, semantics)
+    tokens = preprocessor.process_file(io.StringIO(prefix), filename)
+    tokens = prepare_for_parsing(tokens, parser.keywords)
+    try:
+        parser.parse(tokens)
+    except CompilerError as ex:
+        logger.debug("Cannot precompile header of %s: %s", filename, ex.msg)
+        return
+
+    dependencies = {
+        os.path.abspath(path): file_stamp(path)
+        for path in preprocessor.included_files
+    }
+    return PrecompiledHeader(
+        preprocessor.save_state(),
+        semantics.scope,
+        parser.typedefs,
+        dependencies,
+    )
+
+
+def parse_with_precompiled_header(src, filename, context, preprocessor):
+    """ Parse a source file, using a precompiled header when possible """
+    coptions = context.coptions
+    cache = get_cache(coptions["precompiled_headers"])
+    text = src.read()
+    lines = text.split("\n")
+    count = header_prefix_length(lines)
+    semantics = CSemantics(context)
+    parser = CParser(coptions, semantics)
+    header = None
+    if count:
+        prefix = "\n".join(lines[:count]) + "\n"
+        directory = os.path.dirname(os.path.abspath(filename or ""))
+        key = make_key(
+            "pch",
+            __version__,
+            prefix,
+            directory,
+            options_key(coptions, context.arch_info),
+        )
+        header = cache.get(key)
+        if header is not None and not header.is_up_to_date():
+            logger.debug("Precompiled header of %s is outdated", filename)
+            header = None
+
+        if header is None:
+            header = precompile_header(prefix, filename, context)
+            if header is not None:
+                try:
+                    cache.put(key, header)
+                except (
+                    pickle.PicklingError,
+                    RecursionError,
+                    TypeError,
+                ) as ex:
+                    logger.warning("Cannot store precompiled header: %s", ex)
+        else:
+            logger.debug("Using precompiled header for %s", filename)
+
+    if header is None:
+        tokens = preprocessor.process_file(io.StringIO(text), filename)
+        tokens = prepare_for_parsing(tokens, parser.keywords)
+        return parser.parse(tokens)
+
+    # Keep the line numbers of the remaining source code intact:
+    body = "\n" * count + "\n".join(lines[count:])
+    preprocessor.restore_state(header.preprocessor_state)
+    tokens = preprocessor.process_file(io.StringIO(body), filename)
+    tokens = prepare_for_parsing(tokens, parser.keywords)
+    return parser.parse(tokens, scope=header.scope, typedefs=header.typedefs)
@@ -17,10 +17,13 @@ Sourcecode of inspiration:
 import os
 import logging
 import operator
+import threading
 import time
+from collections import OrderedDict
 
 from ...common import CompilerError
-from .lexer import CLexer, CToken, lex_text, SourceFile
+from .lexer import CToken, SourceFile
+from .fastlexer import FastCLexer, lex_text
 from .utils import cnum, charval, replace_escape_codes, LineInfo
 from .macro import Macro, FunctionMacro
 from .nodes import types, expressions
@@ -36,6 +39,9 @@ class CPreProcessor:
         self.verbose = coptions["verbose"]
         self.macros = {}  # A mapping of macros
         self.files = []  # Stack of included files.
+        self.included_files = []  # All files included so far.
+        self.include_guards = {}  # Guard macro of included files.
+        self.once_files = set()  # Files with a `#pragma once`.
         self.counter = 0  # For the __COUNTER__ macro
         self._int_type = types.BasicType(types.BasicType.INT)
 
@@ -159,6 +165,41 @@ class CPreProcessor:
         """ Retrieve the given define! """
         return self.macros[name]
 
+    def save_state(self):
+        """ Get the macro table and the bookkeeping of included files.
+
+        Special macros, such as __FILE__, are implemented by methods of
+        this preprocessor. Only their names are part of the state.
+        """
+        return {
+            "macros": {
+                name: macro
+                for name, macro in self.macros.items()
+                if isinstance(macro, Macro)
+            },
+            "special_macros": [
+                name
+                for name, macro in self.macros.items()
+                if isinstance(macro, FunctionMacro)
+            ],
+            "included_files": list(self.included_files),
+            "include_guards": dict(self.include_guards),
+            "once_files": set(self.once_files),
+            "counter": self.counter,
+        }
+
+    def restore_state(self, state):
+        """ Continue with a state created by :meth:`save_state` """
+        macros = {}
+        for name in state["special_macros"]:
+            macros[name] = self.macros[name]
+        macros.update(state["macros"])
+        self.macros = macros
+        self.included_files = list(state["included_files"])
+        self.include_guards = dict(state["include_guards"])
+        self.once_files = set(state["once_files"])
+        self.counter = state["counter"]
+
     def in_hideset(self, name):
         """ Test if the given macro is contained in the current hideset. """
         if self.files[-1].macro_expansions:
@@ -170,8 +211,12 @@ class CPreProcessor:
         """ Process the given open file into tokens. """
         self.logger.debug("Processing %s", filename)
         source_file = SourceFile(filename)
-        clexer = CLexer(self.coptions)
+        clexer = FastCLexer(self.coptions)
         tokens = clexer.lex(f, source_file)
+        yield from self.process_lexed_file(source_file, tokens)
+
+    def process_lexed_file(self, source_file, tokens):
+        """ Process the tokens of a file. """
         ex = FileExpander(source_file, tokens)
         self.files.append(ex)
         yield LineInfo(1, source_file.filename)
@@ -247,11 +292,31 @@ class CPreProcessor:
             filename, loc, use_current_dir, include_next
         )
         self.logger.debug("Including %s", full_path)
+        if full_path not in self.included_files:
+            self.included_files.append(full_path)
         source_file = SourceFile(full_path)
         self.files[-1].dependencies.append(source_file)
-        with open(full_path, "r") as f:
-            for token in self.process_file(f, full_path):
-                yield token
+
+        # Skip files which are already included and may only be included
+        # once:
+        guard = self.include_guards.get(full_path, None)
+        if full_path in self.once_files or (
+            guard is not None and self.is_defined(guard)
+        ):
+            self.logger.debug("Skipping %s", full_path)
+            return
+
+        cached_file = token_cache.get(full_path, self.coptions)
+        if cached_file is None:
+            with open(full_path, "r") as f:
+                for token in self.process_file(f, full_path):
+                    yield token
+        else:
+            self.logger.debug("Processing %s", full_path)
+            tokens = cached_file.replay(source_file)
+            yield from self.process_lexed_file(source_file, tokens)
+            if cached_file.guard is not None:
+                self.include_guards[full_path] = cached_file.guard
 
     # Token consume / peeking:
     @property
@@ -686,7 +751,7 @@ class CPreProcessor:
             elif directive == "warning":
                 yield from self.handle_warning_directive(directive_token)
             elif directive == "pragma":
-                yield from self.handle_warning_directive(directive_token)
+                yield from self.handle_pragma_directive(directive_token)
             else:  # pragma: no cover
                 self.error(
                     "not implemented: {}".format(directive),
@@ -950,7 +1015,10 @@ class CPreProcessor:
         """ Process `#pragma` directive. """
         # Pragma's must be handled, or ignored.
         message = self.tokens_to_string(self.eat_line())
-        self.logger.warning("Ignoring pragma: %s", message)
+        if message == "once":
+            self.once_files.add(self.files[-1].path)
+        else:
+            self.logger.warning("Ignoring pragma: %s", message)
         new_line_token = CToken("WS", "", "", True, directive_token.loc)
         yield new_line_token
 
@@ -1145,6 +1213,7 @@ class FileExpander:
 
     def __init__(self, source_file, tokens):
         self.source_file = source_file
+        self.path = source_file.filename  # Not affected by `#line`
         self.dependencies = []  # List of dependent files.
         self.if_stack = []  # If-def stack
         self.token_buffer = []  # Token undo stack
@@ -1221,6 +1290,156 @@ class FileExpander:
         self.token_buffer.insert(0, token)
 
 
+class CachedFile:
+    """ The lexed tokens of a file """
+
+    def __init__(self, tokens, rows, end_row):
+        self.tokens = tokens
+        self.rows = rows  # The row of the lexer at each token
+        self.end_row = end_row
+        self.guard = find_include_guard(tokens)
+
+    def replay(self, source_file):
+        """ Generate the tokens again, as if the file is lexed. """
+        for token, row in zip(self.tokens, self.rows):
+            source_file.row = row
+            # Tokens are modified later on, so hand out copies:
+            yield token.copy()
+        source_file.row = self.end_row
+
+
+class TokenCache:
+    """ Cache with the lexed tokens of included files.
+
+    The cache is shared by all preprocessors in this process, so
+    headers used by multiple translation units are lexed only once.
+    Files are lexed again when their modification time or size changes.
+    """
+
+    logger = logging.getLogger("preprocessor")
+
+    def __init__(self, max_files=1000):
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename, coptions):
+        """ Get the cached tokens of a file.
+
+        Returns None when the file cannot be cached.
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return
+        key = (
+            stat.st_mtime_ns,
+            stat.st_size,
+            coptions["trigraphs"],
+            coptions["std"],
+        )
+
+        with self._lock:
+            if filename in self._entries:
+                entry_key, cached_file = self._entries[filename]
+                if entry_key == key:
+                    self._entries.move_to_end(filename)
+                    return cached_file
+
+        cached_file = self.lex_file(filename, coptions)
+        with self._lock:
+            self._entries[filename] = (key, cached_file)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+        return cached_file
+
+    def lex_file(self, filename, coptions):
+        self.logger.debug("Lexing %s into the token cache", filename)
+        source_file = SourceFile(filename)
+        lexer = FastCLexer(coptions)
+        tokens = []
+        rows = []
+        try:
+            with open(filename, "r") as f:
+                for token in lexer.lex(f, source_file):
+                    tokens.append(token)
+                    rows.append(source_file.row)
+        except CompilerError:
+            # Report errors at the proper moment by lexing during
+            # preprocessing.
+            return
+
+        # The `#line` directive changes the locations of the lexed tokens:
+        for token, next_token in zip(tokens, tokens[1:]):
+            if (
+                token.first
+                and token.typ == "#"
+                and next_token.typ == "ID"
+                and next_token.val == "line"
+            ):
+                return
+
+        return CachedFile(tokens, rows, source_file.row)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def find_include_guard(tokens):
+    """ Find the macro guarding a file against multiple inclusion.
+
+    This is the macro X when the whole file is enclosed in
+    ``#ifndef X`` or ``#if !defined(X)`` and ``#endif``. When X is defined,
+    including the file again has no effect.
+    """
+    # Split the tokens into lines, without the empty lines:
+    lines = []
+    for token in tokens:
+        if token.typ == "BOL":
+            continue
+        if token.first or not lines:
+            lines.append([])
+        lines[-1].append(token.val)
+
+    if not lines:
+        return
+
+    first_line, last_line = lines[0], lines[-1]
+    if first_line[:2] == ["#", "ifndef"] and len(first_line) == 3:
+        guard = first_line[2]
+    elif first_line[:4] == ["#", "if", "!", "defined"]:
+        if len(first_line) == 5:
+            guard = first_line[4]
+        elif len(first_line) == 7 and first_line[4::2] == ["(", ")"]:
+            guard = first_line[5]
+        else:
+            return
+    else:
+        return
+
+    if last_line != ["#", "endif"]:
+        return
+
+    # The first #if must be closed by the last #endif:
+    nesting = 0
+    for index, line in enumerate(lines):
+        if line[0] == "#" and len(line) > 1:
+            if line[1] in ("if", "ifdef", "ifndef"):
+                nesting += 1
+            elif line[1] == "endif":
+                nesting -= 1
+                if nesting == 0 and index < len(lines) - 1:
+                    return
+            elif line[1] in ("else", "elif") and nesting == 1:
+                return
+
+    return guard
+
+
 class MacroExpansion:
     """ Macro expansion.
 
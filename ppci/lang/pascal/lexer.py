@@ -8,6 +8,8 @@ from ..tools.baselex import SimpleLexer, on
 class Lexer(SimpleLexer):
     """ Generates a sequence of token from an input stream """
 
+    use_scanner = True
+
     keywords = [
         "and",
         "array",
@@ -121,11 +123,11 @@ class Lexer(SimpleLexer):
     def handle_float_number(self, val):
         return "NUMBER", float(val)
 
-    @on(r"\(\*.*?\*\)", flags=re.DOTALL, order=-2)
+    @on(r"\(\*([^*]|\*+[^*)])*\*+\)", order=-2)
     def handle_oldcomment(self, val):
         pass
 
-    @on(r"\{.*?\}", flags=re.DOTALL, order=-1)
+    @on(r"\{[^}]*\}", order=-1)
     def handle_comment(self, val):
         pass
 
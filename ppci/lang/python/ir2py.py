@@ -1,26 +1,64 @@
 """ Python back-end. Generates python code from ir-code. """
 
-import math
+import base64
+import collections
 import contextlib
+import math
 import io
 import logging
 import time
+import zlib
 from ... import ir
 from ...graph import relooper
 
 
+# Struct formats of the types which can be loaded from and stored to memory:
+MEMORY_FORMATS = [
+    (ir.f64, "d"),
+    (ir.f32, "f"),
+    (ir.i64, "q"),
+    (ir.u64, "Q"),
+    (ir.i32, "i"),
+    (ir.u32, "I"),
+    (ir.ptr, "i"),
+    (ir.i16, "h"),
+    (ir.u16, "H"),
+    (ir.i8, "b"),
+    (ir.u8, "B"),
+]
+
+
 def literal_label(lit):
     """ Invent a nice label name for the given literal """
     return "{}_{}".format(lit.function.name, lit.name)
 
 
-def ir_to_python(ir_modules, f, reporter=None):
-    """ Convert ir-code to python code """
+def type_range(ty):
+    """ Get the lowest and highest value of an integer type """
+    if ty.signed:
+        half = 1 << (ty.bits - 1)
+        return (-half, half - 1)
+    else:
+        return (0, (1 << ty.bits) - 1)
+
+
+def ir_to_python(ir_modules, f, reporter=None, stack_limit=0x400000):
+    """ Convert ir-code to python code
+
+    Args:
+        ir_modules: the ir-modules to convert.
+        f: the file to write the python code to.
+        reporter: an optional reporter.
+        stack_limit: the size in bytes of the stack of the generated
+            code. The stack is allocated when the generated code is
+            loaded, and is followed by the heap. Allocating more than this
+            on the stack raises a MemoryError.
+    """
     if reporter:
         f2 = f
         f = io.StringIO()
 
-    generator = IrToPythonCompiler(f, reporter)
+    generator = IrToPythonCompiler(f, reporter, stack_limit=stack_limit)
     generator.header()
     for ir_module in ir_modules:
         if not isinstance(ir_module, ir.Module):
@@ -37,18 +75,25 @@ class IrToPythonCompiler:
     """ Can generate python script from ir-code """
 
     logger = logging.getLogger("ir2py")
+    max_shape_depth = 50
+    max_loop_depth = 15
+    max_inline_depth = 30
+    blob_threshold = 256
 
-    def __init__(self, output_file, reporter):
+    def __init__(self, output_file, reporter, stack_limit=0x400000):
         self.output_file = output_file
         self.reporter = reporter
+        self.stack_limit = stack_limit
         self.stack_size = 0
         self.func_ptr_map = {}
         self._level = 0
+        self._lines = 0
 
     def print(self, level, *args):
         """ Print args to current file with level indents """
         print("    " * level, end="", file=self.output_file)
         print(*args, file=self.output_file)
+        self._lines += 1
 
     def _indent(self):
         self._level += 1
@@ -71,12 +116,15 @@ class IrToPythonCompiler:
         self.emit("# Automatically generated on {}".format(time.ctime()))
         self.emit("# Generator {}".format(__file__))
         self.emit("")
+        self.emit("import base64")
         self.emit("import struct")
         self.emit("import math")
+        self.emit("import zlib")
         self.emit("")
-        self.emit("_irpy_heap = bytearray()")
-        self.emit("_irpy_stack = bytearray()")
-        self.emit("HEAP_START = 0x10000000")
+        # The stack occupies the start of memory, the heap follows it:
+        self.emit("HEAP_START = 0x{:x}".format(self.stack_limit))
+        self.emit("_irpy_memory = bytearray(HEAP_START)")
+        self.emit("_irpy_stack_top = 0")
         self.emit("_irpy_func_pointers = list()")
         self.emit("_irpy_externals = {}")
         self.emit("")
@@ -87,73 +135,54 @@ class IrToPythonCompiler:
     def generate_memory_builtins(self):
         self.emit("def read_mem(address, size):")
         with self.indented():
-            self.emit("mem, address = _irpy_get_memory(address)")
-            self.emit("assert address+size <= len(mem), str(hex(address))")
-            self.emit("return mem[address:address+size]")
+            self.emit("assert address+size <= len(_irpy_memory), hex(address)")
+            self.emit("return _irpy_memory[address:address+size]")
         self.emit("")
 
         self.emit("def write_mem(address, data):")
         with self.indented():
-            self.emit("mem, address = _irpy_get_memory(address)")
             self.emit("size = len(data)")
-            self.emit("assert address+size <= len(mem), str(hex(address))")
-            self.emit("mem[address:address+size] = data")
+            self.emit("assert address+size <= len(_irpy_memory), hex(address)")
+            self.emit("_irpy_memory[address:address+size] = data")
         self.emit("")
 
-        self.emit("def _irpy_get_memory(v):")
-        self.print(1, "if v >= HEAP_START:")
-        self.print(2, "return _irpy_heap, v - HEAP_START")
-        self.print(1, "else:")
-        self.print(2, "return _irpy_stack, v")
+        self.emit("def _irpy_blob(text):")
+        with self.indented():
+            self.emit("return zlib.decompress(base64.b64decode(text))")
         self.emit("")
 
         self.emit("def _irpy_heap_top():")
         with self.indented():
-            self.emit("return len(_irpy_heap) + HEAP_START")
+            self.emit("return len(_irpy_memory)")
         self.emit("")
 
-        # Generate load functions:
-        foo = [
-            (ir.f64, "d", 8),
-            (ir.f32, "f", 4),
-            (ir.i64, "q", 8),
-            (ir.u64, "Q", 8),
-            (ir.i32, "i", 4),
-            (ir.u32, "I", 4),
-            (ir.ptr, "i", 4),
-            (ir.i16, "h", 2),
-            (ir.u16, "H", 2),
-            (ir.i8, "b", 1),
-            (ir.u8, "B", 1),
-        ]
-
-        for ty, fmt, size in foo:
-            # Generate load helpers:
+        # Generate precompiled structs and load and store helpers:
+        for ty, fmt in MEMORY_FORMATS:
+            self.emit(
+                '_irpy_struct_{0} = struct.Struct("<{1}")'.format(ty.name, fmt)
+            )
+            self.emit(
+                "_irpy_unpack_{0} = _irpy_struct_{0}.unpack_from".format(
+                    ty.name
+                )
+            )
+            self.emit(
+                "_irpy_pack_{0} = _irpy_struct_{0}.pack_into".format(ty.name)
+            )
+            self.emit("")
+
             self.emit("def load_{}(p):".format(ty.name))
             self.print(
                 1,
-                'return struct.unpack("{0}", read_mem(p, {1}))[0]'.format(
-                    fmt, size
-                ),
+                "return _irpy_unpack_{}(_irpy_memory, p)[0]".format(ty.name),
             )
             self.emit("")
 
-            # Generate store helpers:
             self.emit("def store_{}(v, p):".format(ty.name))
-            self.print(1, 'write_mem(p, struct.pack("{0}", v))'.format(fmt))
+            self.print(1, "_irpy_pack_{}(_irpy_memory, p, v)".format(ty.name))
             self.emit("")
 
     def generate_builtins(self):
-        # Wrap type helper:
-        self.emit("def _irpy_correct(value, bits, signed):")
-        self.print(1, "base = 1 << bits")
-        self.print(1, "value %= base")
-        self.print(1, "if signed and value.bit_length() == bits:")
-        self.print(2, "return value - base")
-        self.print(1, "else:")
-        self.print(2, "return value")
-        self.emit("")
-
         # More C like integer divide
         self.emit("def _irpy_idiv(x, y):")
         with self.indented():
@@ -193,14 +222,20 @@ class IrToPythonCompiler:
 
         self.emit("def _irpy_alloca(amount):")
         with self.indented():
-            self.emit("ptr = len(_irpy_stack)")
-            self.emit("_irpy_stack.extend(bytes(amount))")
+            self.emit("global _irpy_stack_top")
+            self.emit("ptr = _irpy_stack_top")
+            self.emit("top = ptr + amount")
+            self.emit("if top > HEAP_START:")
+            self.print(2, 'raise MemoryError("Stack overflow")')
+            self.emit("_irpy_memory[ptr:top] = bytes(amount)")
+            self.emit("_irpy_stack_top = top")
             self.emit("return (ptr, amount)")
         self.emit("")
 
         self.emit("def _irpy_free(amount):")
-        self.print(1, "for _ in range(amount):")
-        self.print(2, "_irpy_stack.pop()")
+        with self.indented():
+            self.emit("global _irpy_stack_top")
+            self.emit("_irpy_stack_top -= amount")
         self.emit("")
 
     def generate(self, ir_mod):
@@ -212,16 +247,14 @@ class IrToPythonCompiler:
 
         # Allocate room for global variables:
         for var in ir_mod.variables:
-            self.emit("{} = _irpy_heap_top()".format(var.name))
             if var.value:
                 for part in var.value:
-                    if isinstance(part, bytes):
-                        for byte in part:
-                            self.emit("_irpy_heap.append({})".format(byte))
-                    else:  # pragma: no cover
+                    if not isinstance(part, bytes):  # pragma: no cover
                         raise NotImplementedError()
+                self.emit_data(var.name, b"".join(var.value))
             else:
-                self.emit("_irpy_heap.extend(bytes({}))".format(var.amount))
+                self.emit("{} = _irpy_heap_top()".format(var.name))
+                self.emit("_irpy_memory.extend(bytes({}))".format(var.amount))
 
         # Generate functions:
         for function in ir_mod.functions:
@@ -229,121 +262,281 @@ class IrToPythonCompiler:
 
         # emit labeled literals:
         for lit in self.literals:
-            self.emit("{} = _irpy_heap_top()".format(literal_label(lit)))
-            for val in lit.data:
-                self.emit("_irpy_heap.append({})".format(val))
+            self.emit_data(literal_label(lit), lit.data)
         self.emit("")
 
+    def emit_data(self, name, data):
+        """ Emit a label and the initial data at that label.
+
+        The data is added to memory in one go, large data is stored
+        compressed.
+        """
+        self.emit("{} = _irpy_heap_top()".format(name))
+        if len(data) > self.blob_threshold:
+            blob = base64.b64encode(zlib.compress(data)).decode("ascii")
+            self.emit('_irpy_memory.extend(_irpy_blob("{}"))'.format(blob))
+        else:
+            self.emit("_irpy_memory.extend({!r})".format(bytes(data)))
+
     def generate_function(self, ir_function):
         """ Generate a function to python code """
         self.stack_size = 0
+        self._ranges = {}
         args = ",".join(a.name for a in ir_function.arguments)
         self.emit("def {}({}):".format(ir_function.name, args))
         with self.indented():
-            # TODO: enable shape style:
-            # try:
-            #     # TODO: remove this to enable shape style:
-            #     raise ValueError
-            #     shape, _rmap = relooper.find_structure(ir_function)
-            #     src = io.StringIO()
-            #     relooper.print_shape(shape, file=src)
-            #     self.reporter.dump_source(ir_function.name, src.getvalue())
-            #     self._rmap = _rmap
-            #     self._shape_style = True
-            #     self.generate_shape(shape)
-            # except ValueError:
-            self.logger.debug("Falling back to block-switch-style")
-            # Fall back to block switch stack!
-            self._shape_style = False
-            self.generate_function_fallback(ir_function)
+            try:
+                shape, self._rmap = relooper.find_structure(ir_function)
+                self._shaped_blocks = set()
+                self._shape_budget = 2 * sum(
+                    len(block) for block in ir_function.blocks
+                )
+                self.check_shape(shape, None, [])
+            except ValueError as ex:
+                self.logger.debug(
+                    "Falling back to block-switch-style for %s: %s",
+                    ir_function.name,
+                    ex,
+                )
+                self._shape_style = False
+                self.generate_function_fallback(ir_function)
+            else:
+                self._shape_style = True
+                self.generate_shape(shape)
 
         # Register function for function pointers:
         self.emit("_irpy_func_pointers.append({})".format(ir_function.name))
         self.func_ptr_map[ir_function] = len(self.func_ptr_map)
         self.emit("")
 
+    def shape_entry(self, shape, follow, loops):
+        """ Get the block which is executed first when entering a shape.
+
+        Args:
+            shape: the shape
+            follow: the block executed after the shape is done.
+            loops: a stack of (header, follow) blocks of the loops around
+                this shape.
+        """
+        if shape is None:
+            return follow
+        elif isinstance(shape, (relooper.BasicShape, relooper.IfShape)):
+            return self._rmap[shape.content]
+        elif isinstance(shape, relooper.SequenceShape):
+            for sub_shape in reversed(shape.shapes):
+                follow = self.shape_entry(sub_shape, follow, loops)
+            return follow
+        elif isinstance(shape, relooper.LoopShape):
+            return self.shape_entry(shape.body, follow, loops)
+        elif isinstance(shape, relooper.ContinueShape):
+            if not loops:
+                raise ValueError("Continue outside loop")
+            return loops[-1][0]
+        elif isinstance(shape, relooper.BreakShape):
+            if not loops:
+                raise ValueError("Break outside loop")
+            return loops[-1][1]
+        else:  # pragma: no cover
+            raise NotImplementedError(str(shape))
+
+    def check_shape(self, shape, follow, loops, depth=0):
+        """ Check that a shape implements all jumps of its blocks.
+
+        The structure detection does not guarantee that all jumps
+        end up in the right place. Raise a ValueError if a jump
+        is not implemented by the shape.
+
+        Args:
+            shape: the shape to check
+            follow: the block executed after this shape, or None at the
+                end of the function.
+            loops: a stack of (header, follow) blocks of the loops around
+                this shape.
+        """
+        # Python limits the amount of nested blocks:
+        if depth > self.max_shape_depth or len(loops) > self.max_loop_depth:
+            raise ValueError("Shape nested too deeply")
+
+        if isinstance(shape, (relooper.BasicShape, relooper.IfShape)):
+            # Blocks can be duplicated, for example return blocks, but
+            # stack allocations must be done once:
+            block = self._rmap[shape.content]
+            if block in self._shaped_blocks:
+                if any(isinstance(ins, ir.Alloc) for ins in block):
+                    raise ValueError("Duplicate alloc in {}".format(block))
+            self._shaped_blocks.add(block)
+            self._shape_budget -= len(block)
+            if self._shape_budget < 0:
+                raise ValueError("Too many duplicated blocks")
+
+        if isinstance(shape, relooper.BasicShape):
+            last = block.last_instruction
+            if isinstance(last, ir.Jump):
+                if last.target is not follow:
+                    raise ValueError("Jump to {} lost".format(last.target))
+            elif not isinstance(last, (ir.Return, ir.Exit)):
+                raise ValueError("Unexpected end of {}".format(block))
+        elif isinstance(shape, relooper.SequenceShape):
+            follows = []
+            for sub_shape in reversed(shape.shapes):
+                follows.append(follow)
+                follow = self.shape_entry(sub_shape, follow, loops)
+            for sub_shape, follow in zip(shape.shapes, reversed(follows)):
+                self.check_shape(sub_shape, follow, loops, depth)
+        elif isinstance(shape, relooper.IfShape):
+            last = block.last_instruction
+            if not isinstance(last, ir.CJump):
+                raise ValueError("Unexpected end of {}".format(block))
+            branches = [
+                (last.lab_yes, shape.yes_shape),
+                (last.lab_no, shape.no_shape),
+            ]
+            for target, sub_shape in branches:
+                if self.shape_entry(sub_shape, follow, loops) is not target:
+                    raise ValueError("Jump to {} lost".format(target))
+                self.check_shape(sub_shape, follow, loops, depth + 1)
+        elif isinstance(shape, relooper.LoopShape):
+            # Falling out of the loop body leaves the loop:
+            header = self.shape_entry(shape.body, follow, loops)
+            loops = loops + [(header, follow)]
+            self.check_shape(shape.body, follow, loops, depth + 1)
+        elif isinstance(
+            shape, (relooper.ContinueShape, relooper.BreakShape)
+        ):
+            if shape.level != 0 or not loops:
+                raise ValueError("Invalid {}".format(shape))
+        elif shape is not None:  # pragma: no cover
+            raise NotImplementedError(str(shape))
+
     def generate_shape(self, shape):
         """ Generate python code for a shape structured program """
         if isinstance(shape, relooper.BasicShape):
             self.generate_block(self._rmap[shape.content])
         elif isinstance(shape, relooper.SequenceShape):
-            if shape.shapes:
-                for sub_shape in shape.shapes:
-                    self.generate_shape(sub_shape)
-            else:
-                self.emit("pass")
+            for sub_shape in shape.shapes:
+                self.generate_shape(sub_shape)
         elif isinstance(shape, relooper.IfShape):
-            blk = self._rmap[shape.content]
-            self.generate_block(blk)
+            block = self._rmap[shape.content]
+            self.generate_block(block)
+            last = block.last_instruction
+            with self.indented():
+                self.generate_branch(block, last.lab_yes, shape.yes_shape)
+            self.emit("else:")
             with self.indented():
-                if shape.yes_shape:
-                    self.generate_shape(shape.yes_shape)
-                else:
-                    self.emit("pass")
-            if shape.no_shape:
-                self.emit("else:")
-                with self.indented():
-                    self.generate_shape(shape.no_shape)
+                self.generate_branch(block, last.lab_no, shape.no_shape)
         elif isinstance(shape, relooper.LoopShape):
             self.emit("while True:")
             with self.indented():
                 self.generate_shape(shape.body)
+                # Leave the loop when control falls out of the body:
+                self.emit("break")
         elif isinstance(shape, relooper.ContinueShape):
             self.emit("continue")
         elif isinstance(shape, relooper.BreakShape):
             self.emit("break")
-        elif shape is None:
-            self.emit("pass")
-        else:  # pragma: no cover
+        elif shape is not None:  # pragma: no cover
             raise NotImplementedError(str(shape))
 
+    def generate_branch(self, block, target, shape):
+        """ Generate one branch of an if shape """
+        lines = self._lines
+        self.fill_phis(block, target)
+        self.generate_shape(shape)
+        if self._lines == lines:
+            self.emit("pass")
+
     def generate_function_fallback(self, ir_function):
         """ Generate a while-true with a switch-case on current block.
 
-        This is a non-optimal, but always working strategy.
+        Blocks which can only be reached from one other block are
+        generated at the jump to them. The other blocks are numbered, and
+        the current block number is dispatched by a balanced tree of
+        comparisons. This is a non-optimal, but always working strategy.
         """
-        self.emit("_irpy_prev_block = None")
-        self.emit("_irpy_current_block = '{}'".format(ir_function.entry.name))
+        predecessors = collections.Counter(
+            target for block in ir_function for target in block.successors
+        )
+        blocks = [ir_function.entry]
+        self._block_ids = {ir_function.entry: 0}
+        self._inlined_blocks = set()
+        for block in blocks:
+            self.plan_inlining(block, 0, predecessors, blocks)
+        self.emit("_irpy_current_block = 0")
         self.emit("while True:")
         with self.indented():
-            for block in ir_function.blocks:
-                self.emit('if _irpy_current_block == "{}":'.format(block.name))
-                with self.indented():
-                    self.generate_block(block)
+            self.generate_block_switch(blocks, 0, len(blocks))
         self.emit("")
 
+    def plan_inlining(self, block, depth, predecessors, blocks):
+        """ Determine which successors of a block are generated inline.
+
+        Blocks which are not generated inline are numbered and appended
+        to blocks.
+        """
+        for target in block.successors:
+            if target in self._inlined_blocks or target in self._block_ids:
+                continue
+
+            inline = (
+                predecessors[target] == 1
+                and target is not block.function.entry
+                and depth < self.max_inline_depth
+            )
+            if inline:
+                self._inlined_blocks.add(target)
+                self.plan_inlining(target, depth + 1, predecessors, blocks)
+            else:
+                self._block_ids[target] = len(blocks)
+                blocks.append(target)
+
+    def generate_block_switch(self, blocks, low, high):
+        """ Generate code for the blocks numbered low up to high """
+        if high - low == 1:
+            self.generate_block(blocks[low])
+        else:
+            middle = (low + high) // 2
+            self.emit("if _irpy_current_block < {}:".format(middle))
+            with self.indented():
+                self.generate_block_switch(blocks, low, middle)
+            self.emit("else:")
+            with self.indented():
+                self.generate_block_switch(blocks, middle, high)
+
     def generate_block(self, block):
         """ Generate code for one block """
         for ins in block:
             self.generate_instruction(ins, block)
 
-        if not self._shape_style:
-            self.fill_phis(block)
-
-    def fill_phis(self, block):
-        # Generate eventual phi fill code:
-        phis = [p for s in block.successors for p in s.phis]
+    def fill_phis(self, block, target):
+        """ Generate phi fill code for a jump from block to target """
+        phis = target.phis
         if phis:
             phi_names = ", ".join(p.name for p in phis)
-            value_names = ", ".join(p.inputs[block].name for p in phis)
+            value_names = ", ".join(
+                self.fetch_value(p.inputs[block]) for p in phis
+            )
             self.emit("{} = {}".format(phi_names, value_names))
 
     def reset_stack(self):
         self.emit("_irpy_free({})".format(self.stack_size))
         self.stack_size = 0
 
-    def emit_jump(self, target: ir.Block):
+    def emit_jump(self, block, target: ir.Block):
         """ Perform a jump in block mode. """
         assert isinstance(target, ir.Block)
-        self.emit("_irpy_prev_block = _irpy_current_block")
-        self.emit('_irpy_current_block = "{}"'.format(target.name))
+        self.fill_phis(block, target)
+        if target in self._inlined_blocks:
+            self.generate_block(target)
+        else:
+            block_id = self._block_ids[target]
+            self.emit("_irpy_current_block = {}".format(block_id))
 
     def generate_instruction(self, ins, block):
         """ Generate python code for this instruction """
         if isinstance(ins, ir.CJump):
-            self.gen_cjump(ins)
+            self.gen_cjump(ins, block)
         elif isinstance(ins, ir.Jump):
-            self.gen_jump(ins)
+            self.gen_jump(ins, block)
         elif isinstance(ins, ir.Alloc):
             self.emit("{} = _irpy_alloca({})".format(ins.name, ins.amount))
             self.stack_size += ins.amount
@@ -361,30 +554,11 @@ class IrToPythonCompiler:
                 )
             )
         elif isinstance(ins, ir.Unop):
-            op = ins.operation
-            a = self.fetch_value(ins.a)
-            self.emit("{} = {}{}".format(ins.name, op, ins.a.name))
-            if ins.ty.is_integer:
-                self.emit(
-                    "{0} = _irpy_correct({0}, {1}, {2})".format(
-                        ins.name, ins.ty.bits, ins.ty.signed
-                    )
-                )
+            self.gen_unop(ins)
         elif isinstance(ins, ir.Binop):
             self.gen_binop(ins)
         elif isinstance(ins, ir.Cast):
-            if ins.ty.is_integer:
-                self.emit(
-                    "{} = _irpy_correct(int(round({})), {}, {})".format(
-                        ins.name, ins.src.name, ins.ty.bits, ins.ty.signed
-                    )
-                )
-            elif ins.ty is ir.ptr:
-                self.emit("{} = int(round({}))".format(ins.name, ins.src.name))
-            elif ins.ty in [ir.f32, ir.f64]:
-                self.emit("{} = float({})".format(ins.name, ins.src.name))
-            else:  # pragma: no cover
-                raise NotImplementedError(str(ins))
+            self.gen_cast(ins)
         elif isinstance(ins, ir.Store):
             self.gen_store(ins)
         elif isinstance(ins, ir.Load):
@@ -411,55 +585,171 @@ class IrToPythonCompiler:
             self.emit("not implemented: {}".format(ins))
             raise NotImplementedError(str(type(ins)))
 
-    def gen_cjump(self, ins):
+    def gen_cjump(self, ins, block):
         a = self.fetch_value(ins.a)
         b = self.fetch_value(ins.b)
-        if self._shape_style:
-            self.fill_phis(block)
-            self.emit("if {} {} {}:".format(a, ins.cond, b))
-        else:
-            self.emit("if {} {} {}:".format(a, ins.cond, b))
+        self.emit("if {} {} {}:".format(a, ins.cond, b))
+        if not self._shape_style:
+            # In shape style, the if shape generates the branches.
             with self.indented():
-                self.emit_jump(ins.lab_yes)
+                self.emit_jump(block, ins.lab_yes)
             self.emit("else:")
             with self.indented():
-                self.emit_jump(ins.lab_no)
+                self.emit_jump(block, ins.lab_no)
 
-    def gen_jump(self, ins):
+    def gen_jump(self, ins, block):
         if self._shape_style:
-            self.fill_phis(block)
-            self.emit("pass")
+            self.fill_phis(block, ins.target)
         else:
-            self.emit_jump(ins.target)
+            self.emit_jump(block, ins.target)
+
+    def gen_unop(self, ins):
+        a = self.fetch_value(ins.a)
+        expr = "{}{}".format(ins.operation, a)
+        if ins.ty.is_integer:
+            low, high = self.value_range(ins.a)
+            if ins.operation == "-":
+                result = (-high, -low)
+            else:
+                result = (~high, ~low)
+            self.emit_integer(ins, expr, result)
+        else:
+            self.emit("{} = {}".format(ins.name, expr))
 
     def gen_binop(self, ins):
         a = self.fetch_value(ins.a)
         b = self.fetch_value(ins.b)
-        # Assume int for now.
         op = ins.operation
+        if not ins.ty.is_integer:
+            self.emit("{} = {} {} {}".format(ins.name, a, op, b))
+            return
+
         int_ops = {"/": "_irpy_idiv", "%": "_irpy_irem"}
 
         shift_ops = {">>": "_irpy_ishr", "<<": "_irpy_ishl"}
 
-        if op in int_ops and ins.ty.is_integer:
+        if op in int_ops:
             fname = int_ops[op]
-            self.emit("{} = {}({}, {})".format(ins.name, fname, a, b))
-        elif op in shift_ops and ins.ty.is_integer:
-            fname = shift_ops[op]
-            self.emit(
-                "{} = {}({}, {}, {})".format(
-                    ins.name, fname, a, b, ins.ty.bits
-                )
-            )
+            expr = "{}({}, {})".format(fname, a, b)
+        elif op in shift_ops:
+            amount = self.shift_amount(ins)
+            if amount is None:
+                fname = shift_ops[op]
+                expr = "{}({}, {}, {})".format(fname, a, b, ins.ty.bits)
+            else:
+                expr = "{} {} {}".format(a, op, amount)
         else:
-            self.emit("{} = {} {} {}".format(ins.name, a, op, b))
+            expr = "{} {} {}".format(a, op, b)
+        self.emit_integer(ins, expr, self.binop_range(ins))
 
+    def gen_cast(self, ins):
+        src = self.fetch_value(ins.src)
         if ins.ty.is_integer:
-            self.emit(
-                "{0} = _irpy_correct({0}, {1}, {2})".format(
-                    ins.name, ins.ty.bits, ins.ty.signed
+            if ins.src.ty.is_integer:
+                # Only a change of width or signedness:
+                self.emit_integer(ins, src, self.value_range(ins.src))
+            elif ins.src.ty is ir.ptr:
+                self.emit_integer(ins, src, None)
+            else:
+                self.emit_integer(ins, "int(round({}))".format(src), None)
+        elif ins.ty is ir.ptr:
+            self.emit("{} = int(round({}))".format(ins.name, src))
+        elif ins.ty in [ir.f32, ir.f64]:
+            self.emit("{} = float({})".format(ins.name, src))
+        else:  # pragma: no cover
+            raise NotImplementedError(str(ins))
+
+    def emit_integer(self, ins, expr, result):
+        """ Assign an integer expression to the value of ins.
+
+        The result is wrapped around to the type of ins, unless the
+        range of the expression shows that this is not required.
+        """
+        low, high = type_range(ins.ty)
+        if result is not None and low <= result[0] and result[1] <= high:
+            self.emit("{} = {}".format(ins.name, expr))
+        else:
+            if " " in expr:
+                expr = "({})".format(expr)
+            mask = hex((1 << ins.ty.bits) - 1)
+            if ins.ty.signed:
+                half = hex(-low)
+                self.emit(
+                    "{} = (({} + {}) & {}) - {}".format(
+                        ins.name, expr, half, mask, half
+                    )
                 )
+            else:
+                self.emit("{} = {} & {}".format(ins.name, expr, mask))
+            result = (low, high)
+        self._ranges[ins] = result
+
+    def value_range(self, value):
+        """ Get the lowest and highest possible value of an integer value.
+
+        Returns None when the range is not known.
+        """
+        if value in self._ranges:
+            return self._ranges[value]
+        elif isinstance(value, ir.Const) and isinstance(value.value, int):
+            return (value.value, value.value)
+        elif value.ty.is_integer:
+            return type_range(value.ty)
+
+    def shift_amount(self, ins):
+        """ Get the shift amount of a shift by a constant """
+        if isinstance(ins.b, ir.Const) and isinstance(ins.b.value, int):
+            return ins.b.value % ins.ty.bits
+
+    def binop_range(self, ins):
+        """ Determine the range of the result of a binary operation,
+        before it is wrapped around.
+        """
+        a = self.value_range(ins.a)
+        b = self.value_range(ins.b)
+        if a is None or b is None:
+            return
+
+        (a0, a1), (b0, b1) = a, b
+        op = ins.operation
+        if op == "+":
+            return (a0 + b0, a1 + b1)
+        elif op == "-":
+            return (a0 - b1, a1 - b0)
+        elif op == "*":
+            corners = [a0 * b0, a0 * b1, a1 * b0, a1 * b1]
+            return (min(corners), max(corners))
+        elif op in ["/", "%"]:
+            # The result is never larger than the dividend:
+            m = max(abs(a0), abs(a1))
+            if a0 >= 0 and (op == "%" or b0 >= 0):
+                return (0, m)
+            return (-m, m)
+        elif op in [">>", "<<"]:
+            amount = self.shift_amount(ins)
+            if amount is None:
+                if op == ">>":
+                    return (min(a0, 0), max(a1, 0))
+            elif op == ">>":
+                return (a0 >> amount, a1 >> amount)
+            else:
+                return (a0 << amount, a1 << amount)
+        elif op in ["&", "|", "^"]:
+            if op == "&" and (a0 >= 0 or b0 >= 0):
+                if a0 < 0:
+                    return (0, b1)
+                elif b0 < 0:
+                    return (0, a1)
+                return (0, min(a1, b1))
+
+            # Both operands fit in a two's complement number of this
+            # amount of bits, and so does the result:
+            bits = max(
+                (x if x >= 0 else ~x).bit_length() for x in (a0, a1, b0, b1)
             )
+            if a0 >= 0 and b0 >= 0:
+                return (0, (1 << bits) - 1)
+            return (-(1 << bits), (1 << bits) - 1)
 
     def gen_load(self, ins):
         address = self.fetch_value(ins.address)
@@ -471,21 +761,20 @@ class IrToPythonCompiler:
             )
         else:
             self.emit(
-                "{0} = load_{1}({2})".format(ins.name, ins.ty.name, address)
+                "{0}, = _irpy_unpack_{1}(_irpy_memory, {2})".format(
+                    ins.name, ins.ty.name, address
+                )
             )
 
     def gen_store(self, ins):
+        address = self.fetch_value(ins.address)
+        v = self.fetch_value(ins.value)
         if isinstance(ins.value.ty, ir.BlobDataTyp):
-            self.emit(
-                "write_mem({0}, {1}, {2})".format(
-                    ins.address.name, ins.value.ty.size, ins.value.name
-                )
-            )
+            self.emit("write_mem({0}, {1})".format(address, v))
         else:
-            v = self.fetch_value(ins.value)
             self.emit(
-                "store_{0}({2}, {1})".format(
-                    ins.value.ty.name, ins.address.name, v
+                "_irpy_pack_{0}(_irpy_memory, {1}, {2})".format(
+                    ins.value.ty.name, address, v
                 )
             )
 
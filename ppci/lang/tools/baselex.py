@@ -1,6 +1,7 @@
 import re
 from ...common import CompilerError
 from ..common import Token, SourceLocation
+from .regex import make_scanner
 
 EOF = "EOF"
 EPS = "EPS"
@@ -46,33 +47,51 @@ class SimpleLexer(Lexer, metaclass=LexMeta):
 
     Use this class by subclassing it and decorating handler methods
     with the 'on' function.
+
+    The patterns are tried in order, and the first match is taken. When
+    use_scanner is set, a table driven scanner generated from the
+    patterns finds the longest match in a single pass instead. This
+    gives the same tokens as long as the first matching pattern also
+    matches the longest text. The scanner ignores regular expression
+    flags.
     """
 
+    use_scanner = False
+
     def gettok(self):
         """ Find a match at the given position """
-        for prog, _, func in self.lexmap:
-            mo = prog.match(self.txt, self.pos)
+        mo = None
+        if self.use_scanner:
+            mo = self._scanner.match(self.txt, self.pos)
             if mo:
-                column = mo.start() - self.line_start
-                length = mo.end() - mo.start()
-                loc = SourceLocation(self.filename, self.line, column, length)
-                self.pos = mo.end()
-                val = mo.group(0)
+                func = self._handlers[mo.lastgroup]
+        else:
+            for prog, _, func in self.lexmap:
+                mo = prog.match(self.txt, self.pos)
+                if mo:
+                    break
+
+        if mo:
+            column = mo.start() - self.line_start
+            length = mo.end() - mo.start()
+            loc = SourceLocation(self.filename, self.line, column, length)
+            self.pos = mo.end()
+            val = mo.group(0)
 
-                # Update row and column information:
-                if "\n" in val:
-                    self.line += val.count("\n")
-                    # TODO: this is wrong, and must be improved:
-                    self.line_start = mo.start()
+            # Update row and column information:
+            if "\n" in val:
+                self.line += val.count("\n")
+                # TODO: this is wrong, and must be improved:
+                self.line_start = mo.start()
 
-                # print(func, '"%s"' % val)
+            # print(func, '"%s"' % val)
 
-                res = func(self, val)
-                if res:
-                    typ, val = res
-                    return Token(typ, val, loc)
-                else:
-                    return
+            res = func(self, val)
+            if res:
+                typ, val = res
+                return Token(typ, val, loc)
+            else:
+                return
 
         # No match found!
         char = self.txt[self.pos]
@@ -91,6 +110,10 @@ class SimpleLexer(Lexer, metaclass=LexMeta):
         self.line_start = 0
         self.pos = 0
         self.txt = txt
+        if self.use_scanner:
+            tok_spec = [(f.__name__, p.pattern) for p, _, f in self.lexmap]
+            self._scanner = make_scanner(tok_spec)
+            self._handlers = {f.__name__: f for _, _, f in self.lexmap}
         while len(txt) != self.pos:
             tok = self.gettok()
             if tok:
@@ -108,13 +131,22 @@ class BaseLexer(Lexer):
     This class can be overridden to create a
     lexer. This class handles the regular expression generation and
     source position accounting.
+
+    When use_scanner is set, the tokens are recognized by a table driven
+    scanner generated from the token specification. This scanner
+    matches the longest token, instead of the first matching token.
     """
 
+    use_scanner = False
+
     def __init__(self, tok_spec):
-        tok_re = "|".join(
-            "(?P<{}>{})".format(pair[0], pair[1]) for pair in tok_spec
-        )
-        self.gettok = re.compile(tok_re).match
+        if self.use_scanner:
+            self.gettok = make_scanner(tok_spec).match
+        else:
+            tok_re = "|".join(
+                "(?P<{}>{})".format(pair[0], pair[1]) for pair in tok_spec
+            )
+            self.gettok = re.compile(tok_re).match
         self.func_map = {pair[0]: pair[2] for pair in tok_spec}
         self.filename = None
         self.line = 1
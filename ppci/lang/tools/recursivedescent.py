@@ -40,6 +40,8 @@ class RecursiveDescentParser:
 
     @property
     def current_location(self):
+        if self.token is None:
+            return self._last_loc
         return self.token.loc
 
     # Lexer helpers:
@@ -7,6 +7,16 @@ Implement regular expressions using derivatives.
 
 from .regex import Symbol, SymbolSet, Kleene
 from .parser import parse
+from .compile import compile, compile_tokens
+from .scanner import make_scanner
 
 
-__all__ = ("parse", "Symbol", "SymbolSet", "Kleene")
+__all__ = (
+    "parse",
+    "compile",
+    "compile_tokens",
+    "make_scanner",
+    "Symbol",
+    "SymbolSet",
+    "Kleene",
+)
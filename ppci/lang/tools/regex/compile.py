@@ -1,4 +1,210 @@
+""" Compilation of regular expressions into a DFA.
+
+The DFA is constructed with Brzozowski derivatives. Each state of the
+DFA is a vector of regular expressions, one for each token. The
+derivative classes of the expressions in a state are used to determine
+the outgoing transitions of the state, so only one derivative needs to
+be taken per class of symbols.
+
+After construction, the states are minimized, and the symbols are
+partitioned into character classes, such that all symbols in a class
+have the same transitions in every state.
+"""
+
+import bisect
+from .parser import parse
+from .regex import Regex, NULL, intersect_all
+from .symbol_set import SymbolSet, MAX_SYMBOL
+
+
 def compile(r):
     """ Turn regular expression into a DFA """
-    parse(r)
-    raise NotImplementedError()
+    if not isinstance(r, Regex):
+        r = parse(r)
+    return compile_tokens([(True, r)])
+
+
+def compile_tokens(tokens):
+    """ Create a DFA which recognizes several tokens.
+
+    Args:
+        tokens: a list of (name, regex) pairs. When several tokens
+            match the same text, the first token in the list wins.
+
+    Returns:
+        a DFA whose accepting states are labeled with the name of the
+        token.
+    """
+    names = []
+    expressions = []
+    for name, expression in tokens:
+        if not isinstance(expression, Regex):
+            expression = parse(expression)
+        names.append(name)
+        expressions.append(expression)
+
+    # Build states from derivatives:
+    initial = tuple(expressions)
+    state_numbers = {initial: 0}
+    vectors = [initial]
+    edges = []
+    for number, vector in enumerate(vectors):
+        classes = intersect_all(e.derivative_classes() for e in vector)
+        for symbols in classes:
+            symbol = symbols.first()
+            target = tuple(e.derivative(symbol) for e in vector)
+            if all(e == NULL for e in target):
+                continue
+            if target not in state_numbers:
+                state_numbers[target] = len(vectors)
+                vectors.append(target)
+            edges.append((number, symbols, state_numbers[target]))
+
+    accepts = []
+    for vector in vectors:
+        label = None
+        for name, expression in zip(names, vector):
+            if expression.is_nullable():
+                label = name
+                break
+        accepts.append(label)
+
+    # Express all transitions in terms of atoms, which are the smallest
+    # ranges of symbols that are never split by any transition:
+    boundaries = {0}
+    for _, symbols, _ in edges:
+        for first, last in symbols.ranges:
+            boundaries.add(first)
+            boundaries.add(last + 1)
+    boundaries.discard(MAX_SYMBOL + 1)
+    starts = sorted(boundaries)
+    rows = [[None] * len(starts) for _ in vectors]
+    for source, symbols, target in edges:
+        row = rows[source]
+        for first, last in symbols.ranges:
+            atom = bisect.bisect_left(starts, first)
+            while atom < len(starts) and starts[atom] <= last:
+                row[atom] = target
+                atom += 1
+
+    rows, accepts = minimize(rows, accepts)
+
+    # Merge atoms with equal transitions into character classes:
+    class_numbers = {}
+    atom_classes = []
+    columns = []
+    for atom in range(len(starts)):
+        column = tuple(row[atom] for row in rows)
+        if column not in class_numbers:
+            class_numbers[column] = len(columns)
+            columns.append(column)
+        atom_classes.append(class_numbers[column])
+
+    transitions = [
+        [column[state] for column in columns] for state in range(len(rows))
+    ]
+    return Dfa(starts, atom_classes, transitions, accepts)
+
+
+def minimize(rows, accepts):
+    """ Merge equivalent states, using Moore's partition refinement.
+
+    State 0 is the initial state, and will remain state 0.
+    """
+    blocks = {}
+    partition = [blocks.setdefault(a, len(blocks)) for a in accepts]
+    count = len(blocks)
+    while True:
+        signatures = {}
+        new_partition = []
+        for state, row in enumerate(rows):
+            signature = (
+                partition[state],
+                tuple(None if t is None else partition[t] for t in row),
+            )
+            new_partition.append(
+                signatures.setdefault(signature, len(signatures))
+            )
+        partition = new_partition
+        if len(signatures) == count:
+            break
+        count = len(signatures)
+
+    # Renumber blocks, such that the initial state is state 0:
+    numbers = {}
+    for block in partition:
+        numbers.setdefault(block, len(numbers))
+
+    new_rows = [None] * len(numbers)
+    new_accepts = [None] * len(numbers)
+    for state, row in enumerate(rows):
+        number = numbers[partition[state]]
+        if new_rows[number] is None:
+            new_rows[number] = [
+                None if t is None else numbers[partition[t]] for t in row
+            ]
+            new_accepts[number] = accepts[state]
+    return new_rows, new_accepts
+
+
+class Dfa:
+    """ A deterministic finite automaton.
+
+    Symbols are mapped to character classes. The transitions table is
+    indexed by state and character class, and contains the next state,
+    or None when no match is possible anymore. State 0 is the initial
+    state.
+    """
+
+    def __init__(self, starts, atom_classes, transitions, accepts):
+        self._starts = starts
+        self._atom_classes = atom_classes
+        self.transitions = transitions
+        self.accepts = accepts
+
+    @property
+    def num_states(self):
+        return len(self.transitions)
+
+    @property
+    def num_classes(self):
+        return len(self.transitions[0])
+
+    def classes(self):
+        """ Get the symbols of each character class """
+        ranges = [[] for _ in range(self.num_classes)]
+        ends = self._starts[1:] + [MAX_SYMBOL + 1]
+        for start, end, cls in zip(self._starts, ends, self._atom_classes):
+            ranges[cls].append((start, end - 1))
+        return [SymbolSet.from_ranges(r) for r in ranges]
+
+    def classify(self, symbol):
+        """ Get the character class of a symbol """
+        atom = bisect.bisect_right(self._starts, ord(symbol)) - 1
+        return self._atom_classes[atom]
+
+    def longest_match(self, txt, pos=0):
+        """ Find the longest match in txt starting at pos.
+
+        Returns a tuple with the label of the match and the end position,
+        or None when nothing matches.
+        """
+        state = 0
+        result = None
+        transitions = self.transitions
+        accepts = self.accepts
+        for end in range(pos, len(txt)):
+            state = transitions[state][self.classify(txt[end])]
+            if state is None:
+                break
+            if accepts[state] is not None:
+                result = accepts[state], end + 1
+        return result
+
+    def matches(self, txt):
+        """ Test if the whole text is matched """
+        match = self.longest_match(txt)
+        if txt:
+            return match is not None and match[1] == len(txt)
+        else:
+            return self.accepts[0] is not None
@@ -2,9 +2,15 @@
 
 This module is able to parse regular expressions.
 
+The supported syntax is a subset of the python :mod:`re` syntax:
+alternation, grouping, character sets, the ``.`` wildcard, escapes such
+as ``\\d`` and the ``*``, ``+``, ``?`` and ``{m,n}`` modifiers.
+Anchors, backreferences and lazy modifiers are not supported, since
+they cannot be expressed in a DFA.
 """
 
 from . import regex
+from .symbol_set import SymbolSet
 
 
 def parse(r):
@@ -13,6 +19,32 @@ def parse(r):
     return parser.parse(r)
 
 
+DIGITS = SymbolSet.from_ranges([(ord("0"), ord("9"))])
+WORD = SymbolSet.from_ranges(
+    [(ord("0"), ord("9")), (ord("A"), ord("Z")), (ord("a"), ord("z"))]
+) | SymbolSet("_")
+SPACE = SymbolSet(" \t\n\r\f\v")
+
+CLASS_ESCAPES = {
+    "d": DIGITS,
+    "D": DIGITS.complement(),
+    "w": WORD,
+    "W": WORD.complement(),
+    "s": SPACE,
+    "S": SPACE.complement(),
+}
+
+CHAR_ESCAPES = {
+    "n": "\n",
+    "t": "\t",
+    "r": "\r",
+    "f": "\f",
+    "v": "\v",
+    "a": "\a",
+    "0": "\0",
+}
+
+
 class Parser:
     """ Regular expression program parser """
 
@@ -20,6 +52,10 @@ class Parser:
         self.txt = txt
         self.pos = 0
         expr = self._parse_top()
+        if self.current() is not None:
+            raise ValueError(
+                "Unexpected {} at position {}".format(self.current(), self.pos)
+            )
         return expr
 
     def current(self):
@@ -58,53 +94,134 @@ class Parser:
         while self.did_eat("|"):
             rhs = self._parse_and()
             expr = expr | rhs
+        return expr
 
     def _parse_and(self):
-        return self._parse_element()
+        """ Parse a sequence of elements """
+        expr = regex.EPSILON
+        while self.current() not in (None, "|", ")"):
+            expr = expr + self._parse_element()
+        return expr
 
     def _parse_element(self):
         """ Parse single element of regex """
-        if self.peek("("):
-            self.eat("(")
+        if self.did_eat("("):
+            if self.did_eat("?"):
+                # Only non-capturing groups are supported:
+                self.eat(":")
             expr = self._parse_top()
             self.eat(")")
         elif self.peek("["):
-            return self._parse_set()
+            expr = regex.SymbolSet(self._parse_set())
+        elif self.did_eat("."):
+            expr = regex.SymbolSet(SymbolSet("\n").complement())
+        elif self.did_eat("\\"):
+            expr = regex.SymbolSet(self._parse_escape())
+        elif self.current() in ("^", "$"):
+            raise ValueError("Anchors are not supported")
+        elif self.current() in ("*", "+", "?"):
+            raise ValueError("Nothing to repeat at {}".format(self.pos))
         else:
-            raise NotImplementedError()
-            expr = self._parse_set()
-        return expr
+            expr = regex.Symbol(self.eat())
+        return self._parse_modifier(expr)
+
+    def _parse_escape(self):
+        """ Parse the character after a backslash into a symbol set """
+        c = self.eat()
+        if c in CLASS_ESCAPES:
+            return CLASS_ESCAPES[c]
+        elif c in CHAR_ESCAPES:
+            return SymbolSet(CHAR_ESCAPES[c])
+        elif c == "x":
+            code = self.eat() + self.eat()
+            return SymbolSet(chr(int(code, 16)))
+        elif c.isalnum():
+            raise ValueError("Unsupported escape \\{}".format(c))
+        else:
+            return SymbolSet(c)
 
     def _parse_set(self):
         """ Parse a set of options '[0-9abc]' """
         self.eat("[")
-        options = []
         # Check inversion:
-        if self.peek("^"):
-            self.eat("^")
-            complement = True
-        else:
-            complement = False
+        complement = self.did_eat("^")
+
+        symbols = SymbolSet(())
+        first = True
+        while first or not self.peek("]"):
+            first = False
+            if self.did_eat("\\"):
+                start = self._parse_escape()
+            else:
+                start = SymbolSet(self.eat())
 
-        options.append(complement)
-        while not self.peek("]"):
-            start = self.eat()
-            if self.peek("-"):
+            if self.peek("-") and self.txt[self.pos + 1 : self.pos + 2] != "]":
                 self.eat("-")
-                end = self.eat()
-                options.append((start, end))
-            else:
-                options.append(start)
+                if self.did_eat("\\"):
+                    end = self._parse_escape()
+                else:
+                    end = SymbolSet(self.eat())
+                if len(start.ranges) != 1 or len(end.ranges) != 1:
+                    raise ValueError("Invalid range in set")
+                first_symbol = start.ranges[0][0]
+                last_symbol = end.ranges[0][1]
+                if first_symbol > last_symbol:
+                    raise ValueError("Invalid range in set")
+                start = SymbolSet.from_ranges([(first_symbol, last_symbol)])
+            symbols = symbols | start
         self.eat("]")
 
+        if complement:
+            symbols = symbols.complement()
+        return symbols
+
     def _parse_modifier(self, expr):
         """ Parse any modifiers after an expression """
-        if self.eat("*"):
-            return regex.Kleene(expr)
-        elif self.eat("+"):
-            return expr + regex.Kleene(expr)
-        elif self.eat("?"):
-            raise NotImplementedError()
-            # return expr | eps
-        else:
-            return expr
+        while True:
+            if self.did_eat("*"):
+                expr = regex.Kleene.make(expr)
+            elif self.did_eat("+"):
+                expr = expr + regex.Kleene.make(expr)
+            elif self.did_eat("?"):
+                expr = expr | regex.EPSILON
+            elif self.peek("{") and self._is_repetition():
+                expr = self._parse_repetition(expr)
+            else:
+                return expr
+
+            if self.peek("?"):
+                raise ValueError("Lazy modifiers are not supported")
+
+    def _is_repetition(self):
+        """ Test if a '{' starts a repetition, like in python re """
+        end = self.txt.find("}", self.pos)
+        if end < 0:
+            return False
+        parts = self.txt[self.pos + 1 : end].split(",")
+        return (
+            len(parts) <= 2
+            and parts[0].isdigit()
+            and (len(parts) == 1 or parts[1] == "" or parts[1].isdigit())
+        )
+
+    def _parse_repetition(self, expr):
+        """ Parse a repetition count like {3}, {2,} or {2,4} """
+        end = self.txt.index("}", self.pos)
+        parts = self.txt[self.pos + 1 : end].split(",")
+        self.pos = end + 1
+        minimum = int(parts[0])
+        result = regex.EPSILON
+        for _ in range(minimum):
+            result = result + expr
+        if len(parts) == 1:
+            return result
+        elif parts[1] == "":
+            return result + regex.Kleene.make(expr)
+
+        maximum = int(parts[1])
+        if maximum < minimum:
+            raise ValueError("Invalid repetition")
+        optional = regex.EPSILON
+        for _ in range(maximum - minimum):
+            optional = (expr + optional) | regex.EPSILON
+        return result + optional
@@ -1,4 +1,11 @@
-""" Regular expression descriptions """
+""" Regular expression descriptions
+
+Regular expressions are combined with the ``|``, ``&`` and ``+``
+operators. These operators simplify the result, such that equivalent
+expressions are often equal. This keeps the amount of different
+derivatives of an expression finite, which is required to build a DFA
+from the derivatives.
+"""
 
 import abc
 from . import symbol_set
@@ -14,20 +21,46 @@ class Regex(metaclass=abc.ABCMeta):
     def derivative(self, symbol):
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def derivative_classes(self):
+        """ Partition the symbols into sets with an equal derivative.
+
+        All symbols in a single set give the same derivative of this
+        regular expression.
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def _key(self):
+        raise NotImplementedError()
+
+    def is_nullable(self):
+        """ Test if this regex matches the empty string """
+        return self.nu() == EPSILON
+
+    def __eq__(self, other):
+        return isinstance(other, Regex) and self._key() == other._key()
+
+    def __hash__(self):
+        # Expressions are immutable, so the hash can be cached:
+        if "_hash" not in self.__dict__:
+            self._hash = hash(self._key())
+        return self._hash
+
     def __or__(self, other):
         if not isinstance(other, Regex):
             raise TypeError("Expected Regex but got {}".format(type(other)))
-        return LogicalOr(self, other)
+        return LogicalOr.make([self, other])
 
     def __and__(self, other):
         if not isinstance(other, Regex):
             raise TypeError("Expected Regex but got {}".format(type(other)))
-        return LogicalAnd(self, other)
+        return LogicalAnd.make([self, other])
 
     def __add__(self, other):
         if not isinstance(other, Regex):
             raise TypeError("Expected Regex but got {}".format(type(other)))
-        return Concatenation(self, other)
+        return Concatenation.make(self, other)
 
 
 class Epsilon(Regex):
@@ -39,6 +72,12 @@ class Epsilon(Regex):
     def derivative(self, symbol):
         return NULL
 
+    def derivative_classes(self):
+        return [symbol_set.SymbolSet.everything()]
+
+    def _key(self):
+        return ("eps",)
+
     def __str__(self):
         return ""
 
@@ -50,7 +89,10 @@ class SymbolSet(Regex):
     """ Match a single symbol """
 
     def __init__(self, symbols):
-        self._symbols = symbol_set.SymbolSet(symbols)
+        if isinstance(symbols, symbol_set.SymbolSet):
+            self._symbols = symbols
+        else:
+            self._symbols = symbol_set.SymbolSet(symbols)
 
     def nu(self):
         return NULL
@@ -58,6 +100,13 @@ class SymbolSet(Regex):
     def derivative(self, symbol):
         return EPSILON if symbol in self._symbols else NULL
 
+    def derivative_classes(self):
+        classes = [self._symbols, self._symbols.complement()]
+        return [c for c in classes if c]
+
+    def _key(self):
+        return ("set", self._symbols)
+
     def __str__(self):
         return str(self._symbols)
 
@@ -78,14 +127,29 @@ class Kleene(Regex):
             raise TypeError("Expected Regex but got {}".format(type(expr)))
         self._expr = expr
 
+    @classmethod
+    def make(cls, expr):
+        """ Create a simplified closure of the given expression """
+        if isinstance(expr, Kleene):
+            return expr
+        elif expr == EPSILON or expr == NULL:
+            return EPSILON
+        return cls(expr)
+
     def nu(self):
-        return Epsilon()
+        return EPSILON
 
     def derivative(self, symbol):
         return self._expr.derivative(symbol) + self
 
+    def derivative_classes(self):
+        return self._expr.derivative_classes()
+
+    def _key(self):
+        return ("*", self._expr)
+
     def __str__(self):
-        return "{}*".format(self._expr)
+        return "({})*".format(self._expr)
 
 
 class Concatenation(Regex):
@@ -99,16 +163,39 @@ class Concatenation(Regex):
             raise TypeError("Expected Regex but got {}".format(type(rhs)))
         self._rhs = rhs
 
+    @classmethod
+    def make(cls, lhs, rhs):
+        """ Create a simplified, right associated, concatenation """
+        if lhs == NULL or rhs == NULL:
+            return NULL
+        elif lhs == EPSILON:
+            return rhs
+        elif rhs == EPSILON:
+            return lhs
+        elif isinstance(lhs, Concatenation):
+            return cls(lhs._lhs, cls.make(lhs._rhs, rhs))
+        return cls(lhs, rhs)
+
     def nu(self):
         return self._lhs.nu() & self._rhs.nu()
 
     def derivative(self, symbol):
         nu = self._lhs.nu()
-        return LogicalOr(
-            Concatenation(self._lhs.derivative(symbol), self._rhs),
-            Concatenation(nu, self._rhs.derivative(symbol)),
+        return (self._lhs.derivative(symbol) + self._rhs) | (
+            nu + self._rhs.derivative(symbol)
         )
 
+    def derivative_classes(self):
+        classes = self._lhs.derivative_classes()
+        if self._lhs.is_nullable():
+            classes = intersect_classes(
+                classes, self._rhs.derivative_classes()
+            )
+        return classes
+
+    def _key(self):
+        return (".", self._lhs, self._rhs)
+
     def __str__(self):
         return "{}{}".format(self._lhs, self._rhs)
 
@@ -116,40 +203,129 @@ class Concatenation(Regex):
 class LogicalOr(Regex):
     """ Alternation operator a | b """
 
-    def __init__(self, lhs, rhs):
-        if not isinstance(lhs, Regex):
-            raise TypeError("Expected Regex but got {}".format(type(lhs)))
-        self._lhs = lhs
-        if not isinstance(rhs, Regex):
-            raise TypeError("Expected Regex but got {}".format(type(rhs)))
-        self._rhs = rhs
+    def __init__(self, *options):
+        for option in options:
+            if not isinstance(option, Regex):
+                raise TypeError(
+                    "Expected Regex but got {}".format(type(option))
+                )
+        self._options = frozenset(options)
+
+    @classmethod
+    def make(cls, options):
+        """ Create a simplified alternation of several options """
+        flat = set()
+        symbols = symbol_set.SymbolSet(())
+        for option in options:
+            if isinstance(option, LogicalOr):
+                flat.update(option._options)
+            else:
+                flat.add(option)
+
+        # Merge all single symbol options:
+        for option in list(flat):
+            if isinstance(option, SymbolSet):
+                symbols = symbols | option._symbols
+                flat.remove(option)
+        if symbols:
+            flat.add(SymbolSet(symbols))
+
+        if not flat:
+            return NULL
+        elif len(flat) == 1:
+            return flat.pop()
+        return cls(*flat)
 
     def nu(self):
-        return self._lhs.nu() | self._rhs.nu()
+        if any(option.is_nullable() for option in self._options):
+            return EPSILON
+        return NULL
 
     def derivative(self, symbol):
-        return self._lhs.derivative(symbol) | self._rhs.derivative(symbol)
+        return LogicalOr.make(o.derivative(symbol) for o in self._options)
+
+    def derivative_classes(self):
+        return intersect_all(o.derivative_classes() for o in self._options)
+
+    def _key(self):
+        return ("|", self._options)
 
     def __str__(self):
-        return "({})|({})".format(self._lhs, self._rhs)
+        return "|".join(sorted("({})".format(o) for o in self._options))
 
 
 class LogicalAnd(Regex):
     """ operator a & b """
 
-    def __init__(self, lhs, rhs):
-        if not isinstance(lhs, Regex):
-            raise TypeError("Expected Regex but got {}".format(type(rhs)))
-        self._lhs = lhs
-        if not isinstance(rhs, Regex):
-            raise TypeError("Expected Regex but got {}".format(type(rhs)))
-        self._rhs = rhs
+    def __init__(self, *options):
+        for option in options:
+            if not isinstance(option, Regex):
+                raise TypeError(
+                    "Expected Regex but got {}".format(type(option))
+                )
+        self._options = frozenset(options)
+
+    @classmethod
+    def make(cls, options):
+        """ Create a simplified intersection of several options """
+        flat = set()
+        for option in options:
+            if isinstance(option, LogicalAnd):
+                flat.update(option._options)
+            else:
+                flat.add(option)
+
+        # Intersect all single symbol options:
+        sets = [o for o in flat if isinstance(o, SymbolSet)]
+        if len(sets) > 1:
+            symbols = sets[0]._symbols
+            for option in sets[1:]:
+                symbols = symbols & option._symbols
+            flat.difference_update(sets)
+            flat.add(SymbolSet(symbols))
+
+        if NULL in flat:
+            return NULL
+        elif EPSILON in flat:
+            # Only the empty string can match:
+            if all(o.is_nullable() for o in flat):
+                return EPSILON
+            return NULL
+        elif len(flat) == 1:
+            return flat.pop()
+        return cls(*flat)
 
     def nu(self):
-        return self._lhs.nu() & self._rhs.nu()
+        if all(option.is_nullable() for option in self._options):
+            return EPSILON
+        return NULL
 
     def derivative(self, symbol):
-        return self._lhs.derivative(symbol) & self._rhs.derivative(symbol)
+        return LogicalAnd.make(o.derivative(symbol) for o in self._options)
+
+    def derivative_classes(self):
+        return intersect_all(o.derivative_classes() for o in self._options)
+
+    def _key(self):
+        return ("&", self._options)
 
     def __str__(self):
-        return "({})&({})".format(self._lhs, self._rhs)
+        return "&".join(sorted("({})".format(o) for o in self._options))
+
+
+def intersect_classes(classes1, classes2):
+    """ Create the coarsest partition which refines both partitions """
+    classes = []
+    for c1 in classes1:
+        for c2 in classes2:
+            c = c1 & c2
+            if c:
+                classes.append(c)
+    return classes
+
+
+def intersect_all(partitions):
+    classes = [symbol_set.SymbolSet.everything()]
+    for partition in partitions:
+        classes = intersect_classes(classes, partition)
+    return classes
@@ -0,0 +1,93 @@
+""" Table driven scanner generation.
+
+A scanner recognizes the longest token at a position in a text. It is
+generated from a token specification, which is a list of (name, regex)
+pairs. When several tokens match the longest text, the token first in
+the specification wins.
+
+The scanner can be used as a drop in replacement for the ``match``
+method of a compiled python regular expression which consists of named
+groups, such as ``(?P<ID>[a-z]+)|(?P<NUMBER>\\d+)``.
+"""
+
+import functools
+from .compile import compile_tokens
+
+
+class Match:
+    """ The result of a successful scan """
+
+    __slots__ = ("string", "lastgroup", "_start", "_end")
+
+    def __init__(self, string, lastgroup, start, end):
+        self.string = string
+        self.lastgroup = lastgroup
+        self._start = start
+        self._end = end
+
+    def group(self, name=None):
+        return self.string[self._start : self._end]
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+
+class Scanner:
+    """ Scanner for a set of tokens, driven by a DFA transition table.
+
+    The rows of the transition table are expanded lazily into
+    dictionaries, which map characters directly to the next state.
+    """
+
+    def __init__(self, dfa):
+        self.dfa = dfa
+        self._rows = [{} for _ in range(dfa.num_states)]
+        self._accepts = dfa.accepts
+
+    def _transition(self, state, char):
+        """ Determine the transition for a character not seen before """
+        target = self.dfa.transitions[state][self.dfa.classify(char)]
+        self._rows[state][char] = target
+        return target
+
+    def match(self, txt, pos=0):
+        """ Match the longest token at pos. Returns None on no match """
+        rows = self._rows
+        accepts = self._accepts
+        state = 0
+        lastgroup = None
+        end = pos
+        for index in range(pos, len(txt)):
+            char = txt[index]
+            row = rows[state]
+            if char in row:
+                state = row[char]
+            else:
+                state = self._transition(state, char)
+            if state is None:
+                break
+            if accepts[state] is not None:
+                lastgroup = accepts[state]
+                end = index + 1
+
+        if lastgroup is not None:
+            return Match(txt, lastgroup, pos, end)
+
+
+@functools.lru_cache(maxsize=None)
+def _make_scanner(tokens):
+    return Scanner(compile_tokens(tokens))
+
+
+def make_scanner(tok_spec):
+    """ Create a scanner from a token specification.
+
+    The token specification is a list of tuples, the first two elements
+    of the tuple being the name and the regular expression of the token.
+
+    Scanners are cached, since constructing the DFA takes some time.
+    """
+    return _make_scanner(tuple((t[0], t[1]) for t in tok_spec))
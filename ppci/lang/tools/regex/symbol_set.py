@@ -1,8 +1,117 @@
+""" Sets of symbols, stored as sorted ranges of code points. """
+
+import bisect
+
+MAX_SYMBOL = 0x10FFFF
+
+
 class SymbolSet:
-    """ Ordered series of ranges """
+    """ Ordered series of ranges.
+
+    The ranges are disjoint, sorted and contain the first and last code
+    point of the range.
+    """
 
     def __init__(self, symbols):
-        self._symbols = symbols
+        self._ranges = _normalize([(ord(s), ord(s)) for s in symbols])
+        self._starts = [r[0] for r in self._ranges]
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """ Create a set from (first, last) pairs of code points """
+        symbol_set = cls(())
+        symbol_set._ranges = _normalize(ranges)
+        symbol_set._starts = [r[0] for r in symbol_set._ranges]
+        return symbol_set
+
+    @classmethod
+    def everything(cls):
+        """ Create the set of all symbols """
+        return cls.from_ranges([(0, MAX_SYMBOL)])
+
+    @property
+    def ranges(self):
+        return self._ranges
 
     def __contains__(self, item):
-        return item in self._symbols
+        if isinstance(item, str):
+            item = ord(item)
+        index = bisect.bisect_right(self._starts, item) - 1
+        return index >= 0 and item <= self._ranges[index][1]
+
+    def __bool__(self):
+        return bool(self._ranges)
+
+    def __eq__(self, other):
+        return isinstance(other, SymbolSet) and self._ranges == other._ranges
+
+    def __hash__(self):
+        return hash(tuple(self._ranges))
+
+    def __or__(self, other):
+        return SymbolSet.from_ranges(self._ranges + other._ranges)
+
+    def __and__(self, other):
+        ranges = []
+        i = j = 0
+        while i < len(self._ranges) and j < len(other._ranges):
+            a0, a1 = self._ranges[i]
+            b0, b1 = other._ranges[j]
+            low, high = max(a0, b0), min(a1, b1)
+            if low <= high:
+                ranges.append((low, high))
+            if a1 < b1:
+                i += 1
+            else:
+                j += 1
+        return SymbolSet.from_ranges(ranges)
+
+    def __sub__(self, other):
+        return self & other.complement()
+
+    def complement(self):
+        """ Get all symbols not in this set """
+        ranges = []
+        start = 0
+        for first, last in self._ranges:
+            if first > start:
+                ranges.append((start, first - 1))
+            start = last + 1
+        if start <= MAX_SYMBOL:
+            ranges.append((start, MAX_SYMBOL))
+        return SymbolSet.from_ranges(ranges)
+
+    def first(self):
+        """ Get the first symbol of this set """
+        return chr(self._ranges[0][0])
+
+    def __repr__(self):
+        return "SymbolSet({})".format(self)
+
+    def __str__(self):
+        parts = []
+        for first, last in self._ranges:
+            if first == last:
+                parts.append(_show(first))
+            else:
+                parts.append("{}-{}".format(_show(first), _show(last)))
+        return "[{}]".format("".join(parts))
+
+
+def _show(code_point):
+    char = chr(code_point)
+    if char.isprintable() and char not in "[]-\\^":
+        return char
+    return "\\x{{{:x}}}".format(code_point)
+
+
+def _normalize(ranges):
+    """ Sort and merge overlapping or adjacent ranges """
+    result = []
+    for first, last in sorted(ranges):
+        if result and first <= result[-1][1] + 1:
+            if last > result[-1][1]:
+                result[-1] = (result[-1][0], last)
+        else:
+            result.append((first, last))
+    return result
@@ -0,0 +1,227 @@
+""" Parser which matches the productions of a grammar with tries.
+
+The productions of each nonterminal are merged into a trie, so that
+productions sharing a prefix are matched only once. The next token is
+used to select the edges to follow, and nonterminals are only tried
+when the next token is in their first set. This makes the parser fast
+for grammars with many productions which each start with a distinct
+keyword, such as the grammar of an assembly language.
+
+All derivations of the input are determined, so the parser must be
+given a short input, such as a single line. When there is more than
+one derivation, the derivation with the lowest priorities is chosen.
+The priorities are compared from the last symbol to the first, like
+the earley parser does when building its parse tree. A tie between
+derivations is reported as a parse error.
+
+Left recursive nonterminals are matched by growing a seed: they are
+matched again and again, each time using the derivations found so far
+for the recursive occurrence, until no new derivations are found.
+"""
+
+from ...common import ParseError
+
+
+class TrieNode:
+    """ A node in a trie of production symbols """
+
+    __slots__ = ("terminals", "nonterminals", "productions")
+
+    def __init__(self):
+        self.terminals = {}
+        self.nonterminals = {}
+        self.productions = []
+
+
+class TrieParser:
+    """ Parser for short inputs, using tries of productions.
+
+    Productions added to the grammar after construction of the parser
+    are picked up on the next parse.
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self._num_productions = None
+
+    def _build(self):
+        """ Build the tries and first sets of the grammar """
+        grammar = self.grammar
+        self.tries = {nt: TrieNode() for nt in grammar.nonterminals}
+        for production in grammar.productions:
+            node = self.tries[production.name]
+            for symbol in production.symbols:
+                if grammar.is_nonterminal(symbol):
+                    edges = node.nonterminals
+                else:
+                    edges = node.terminals
+                if symbol not in edges:
+                    edges[symbol] = TrieNode()
+                node = edges[symbol]
+            node.productions.append(production)
+
+        # Determine which terminals can start a nonterminal:
+        self.first = {nt: set() for nt in grammar.nonterminals}
+        self.nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for production in grammar.productions:
+                first = self.first[production.name]
+                size = len(first)
+                for symbol in production.symbols:
+                    if grammar.is_nonterminal(symbol):
+                        first |= self.first[symbol]
+                        if symbol not in self.nullable:
+                            break
+                    else:
+                        first.add(symbol)
+                        break
+                else:
+                    if production.name not in self.nullable:
+                        self.nullable.add(production.name)
+                        changed = True
+                if len(first) != size:
+                    changed = True
+
+        # Determine which nonterminals are left recursive:
+        leftmost = {nt: set() for nt in grammar.nonterminals}
+        for production in grammar.productions:
+            for symbol in production.symbols:
+                if not grammar.is_nonterminal(symbol):
+                    break
+                leftmost[production.name].add(symbol)
+                if symbol not in self.nullable:
+                    break
+        self.left_recursive = set()
+        for nt in grammar.nonterminals:
+            reachable = set()
+            worklist = list(leftmost[nt])
+            while worklist:
+                symbol = worklist.pop()
+                if symbol not in reachable:
+                    reachable.add(symbol)
+                    worklist.extend(leftmost[symbol])
+            if nt in reachable:
+                self.left_recursive.add(nt)
+        self._num_productions = len(grammar.productions)
+
+    def parse(self, tokens):
+        """ Parse a list of tokens, and apply the semantic actions """
+        return self.evaluate(self.derive(tokens))
+
+    def derive(self, tokens):
+        """ Get the derivation of a list of tokens.
+
+        Raises a ParseError when the tokens cannot be parsed, or when
+        the choice between derivations is ambiguous.
+        """
+        if self._num_productions != len(self.grammar.productions):
+            self._build()
+        self._tokens = tokens
+        self._memo = {}
+        try:
+            derivations = [
+                tree
+                for tree, end in self._match(self.grammar.start_symbol, 0)
+                if end == len(tokens)
+            ]
+        finally:
+            self._tokens = self._memo = None
+
+        if not derivations:
+            raise ParseError("Parsing failed")
+        if len(derivations) > 1:
+            keys = sorted(self._priority_key(tree) for tree in derivations)
+            if keys[0] == keys[1]:
+                raise ParseError("Ambiguous parse")
+            return min(derivations, key=self._priority_key)
+        return derivations[0]
+
+    def _match(self, nt, pos):
+        """ Get all derivations of nt at pos, with their end positions """
+        key = (nt, pos)
+        if key in self._memo:
+            derivations = self._memo[key]
+            if derivations is None:
+                raise ParseError("Left recursion on {}".format(nt))
+            return derivations
+
+        if nt in self.left_recursive:
+            return self._grow(nt, pos)
+
+        self._memo[key] = None
+        derivations = self._match_trie(nt, pos)
+        self._memo[key] = derivations
+        return derivations
+
+    def _grow(self, nt, pos):
+        """ Get all derivations of a left recursive nonterminal """
+        key = (nt, pos)
+        derivations = []
+        for _ in range(len(self._tokens) - pos + 2):
+            self._memo[key] = derivations
+            known = set(self._memo)
+            grown = self._match_trie(nt, pos)
+            if len(grown) == len(derivations):
+                return derivations
+
+            # Forget matches which used the incomplete derivations:
+            for other in set(self._memo) - known:
+                del self._memo[other]
+            derivations = grown
+        raise ParseError("Cyclic derivation of {}".format(nt))
+
+    def _match_trie(self, nt, pos):
+        """ Match the trie of a nonterminal at the given position """
+        tokens = self._tokens
+        derivations = []
+        stack = [(self.tries[nt], pos, ())]
+        while stack:
+            node, pos, children = stack.pop()
+            for production in node.productions:
+                derivations.append(((production, children), pos))
+
+            if pos < len(tokens):
+                token = tokens[pos]
+                if token.typ in node.terminals:
+                    stack.append(
+                        (
+                            node.terminals[token.typ],
+                            pos + 1,
+                            children + (token,),
+                        )
+                    )
+            else:
+                token = None
+
+            for symbol, child in node.nonterminals.items():
+                if symbol in self.nullable or (
+                    token is not None and token.typ in self.first[symbol]
+                ):
+                    for tree, end in self._match(symbol, pos):
+                        stack.append((child, end, children + (tree,)))
+        return derivations
+
+    @staticmethod
+    def _is_tree(child):
+        return isinstance(child, tuple)
+
+    def _priority_key(self, tree):
+        """ Get the priorities of a derivation, from the last symbol """
+        production, children = tree
+        return (production.priority,) + tuple(
+            self._priority_key(child)
+            for child in reversed(children)
+            if self._is_tree(child)
+        )
+
+    def evaluate(self, tree):
+        """ Apply the semantic actions of a derivation """
+        production, children = tree
+        args = [
+            self.evaluate(child) if self._is_tree(child) else child
+            for child in children
+        ]
+        if production.f:
+            return production.f(*args)
@@ -6,6 +6,7 @@ from .load_after_store import LoadAfterStorePass
 from .transform import RemoveAddZeroPass
 from .transform import DeleteUnusedInstructionsPass
 from .transform import ModulePass, FunctionPass, BlockPass, InstructionPass
+from .pass_manager import AnalysisManager, PassManager, create_pipeline
 
 
 __all__ = [
@@ -13,6 +14,9 @@ __all__ = [
     "FunctionPass",
     "BlockPass",
     "InstructionPass",
+    "AnalysisManager",
+    "PassManager",
+    "create_pipeline",
     "CleanPass",
     "CommonSubexpressionEliminationPass",
     "ConstantFolder",
@@ -25,8 +25,9 @@ class CleanPass(FunctionPass):
     """
 
     def on_function(self, function):
-        self.remove_empty_blocks(function)
-        self.remove_one_preds(function)
+        removed = self.remove_empty_blocks(function)
+        glued = self.remove_one_preds(function)
+        return removed or glued
 
     def find_empty_blocks(self, function):
         """ Look for all blocks containing only a jump in it """
@@ -42,13 +43,22 @@ class CleanPass(FunctionPass):
         """ Remove empty basic blocks from function. """
         stat = 0
         for block in self.find_empty_blocks(function):
+            # A conditional jump can have the same target twice:
             predecessors = block.predecessors
-            successors = block.successors
+            successors = list(dict.fromkeys(block.successors))
 
             # Do not remove if preceeded by itself:
             if block in predecessors:
                 continue
 
+            # Do not remove if a predecessor also jumps to the target, since
+            # the phi nodes of the target would get two values for it:
+            target = block.last_instruction.target
+            if target.phis and any(
+                p in target.predecessors for p in predecessors
+            ):
+                continue
+
             # Update successor incoming blocks:
             for successor in successors:
                 successor.replace_incoming(block, predecessors)
@@ -64,6 +74,7 @@ class CleanPass(FunctionPass):
             stat += 1
         if stat > 0:
             self.logger.debug("Removed %s empty blocks", stat)
+        return stat > 0
 
     def find_single_predecessor_block(self, function):
         """ Find a block with a single predecessor """
@@ -86,14 +97,14 @@ class CleanPass(FunctionPass):
 
     def remove_one_preds(self, function):
         """ Remove basic blocks with only one predecessor """
-        change = True
-        while change:
-            change = False
+        glued = False
+        while True:
             block = self.find_single_predecessor_block(function)
-            if block is not None:
-                (pred,) = block.predecessors  # Unpack 1 block
-                self.glue_blocks(pred, block)
-                change = True
+            if block is None:
+                return glued
+            (pred,) = block.predecessors  # Unpack 1 block
+            self.glue_blocks(pred, block)
+            glued = True
 
     def glue_blocks(self, block1, block2):
         """ Glue two blocks together into the first block """
@@ -101,6 +112,11 @@ class CleanPass(FunctionPass):
             "Inserting %s at the end of %s", block2.name, block1.name
         )
 
+        # The phi nodes of the second block have only one incoming value:
+        for phi in list(block2.phis):
+            phi.replace_by(phi.get_value(block1))
+            phi.remove_from_block()
+
         # Remove the last jump:
         last_jump = block1.last_instruction
         block1.remove_instruction(last_jump)
@@ -111,7 +127,7 @@ class CleanPass(FunctionPass):
             block1.add_instruction(instruction)
 
         # Replace incoming info:
-        for successor in block2.successors:
+        for successor in dict.fromkeys(block2.successors):
             successor.replace_incoming(block2, [block1])
 
         # Remove block from function:
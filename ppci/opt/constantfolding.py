@@ -1,6 +1,8 @@
+import functools
 import operator
 from .transform import BlockPass
 from .. import ir
+from ..graph.domtree import CfgInfo
 
 
 def cast(value, ty):
@@ -25,12 +27,19 @@ def correct(value, ty):
 
 def enhance(f):
     """ Create a new enhanced method that corrects for the given type """
-    return lambda ty, a, b: correct(f(a, b), ty)
+    # A partial, unlike a lambda, can be pickled to worker processes:
+    return functools.partial(_corrected, f)
+
+
+def _corrected(f, ty, a, b):
+    return correct(f(a, b), ty)
 
 
 class ConstantFolder(BlockPass):
     """ Try to fold common constant expressions """
 
+    preserved_analyses = (CfgInfo,)
+
     def __init__(self):
         super().__init__()
         self.ops = {
@@ -80,8 +89,11 @@ class ConstantFolder(BlockPass):
         instructions = list(block)
         count = 0
         for instruction in instructions:
-            # First of all, skip values that are const already:
-            if isinstance(instruction, ir.Const):
+            # First of all, skip values that are const already, or that
+            # are not used:
+            if isinstance(instruction, ir.Const) or not (
+                isinstance(instruction, ir.Value) and instruction.is_used
+            ):
                 continue
 
             if self.is_const(instruction):
@@ -135,3 +147,4 @@ class ConstantFolder(BlockPass):
                     count += 1
         if count > 0:
             self.logger.debug("Folded %i expressions", count)
+        return count > 0
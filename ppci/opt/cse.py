@@ -1,5 +1,6 @@
 from .transform import BlockPass
 from .. import ir
+from ..graph.domtree import CfgInfo
 
 
 class CommonSubexpressionEliminationPass(BlockPass):
@@ -7,6 +8,8 @@ class CommonSubexpressionEliminationPass(BlockPass):
         Replace common sub expressions (cse) with the previously defined one.
     """
 
+    preserved_analyses = (CfgInfo,)
+
     def on_block(self, block):
         ins_map = {}
         stats = 0
@@ -20,10 +23,11 @@ class CommonSubexpressionEliminationPass(BlockPass):
                 # the python peep-hole optimizer!
                 continue
             if k in ins_map:
-                ins_new = ins_map[k]
-                i.replace_by(ins_new)
-                stats += 1
+                if i.is_used:
+                    i.replace_by(ins_map[k])
+                    stats += 1
             else:
                 ins_map[k] = i
         if stats > 0:
             self.logger.debug("Replaced %i instructions", stats)
+        return stats > 0
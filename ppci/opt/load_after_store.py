@@ -1,5 +1,6 @@
 from .transform import BlockPass
 from .. import ir
+from ..graph.domtree import CfgInfo
 
 
 class LoadAfterStorePass(BlockPass):
@@ -19,13 +20,14 @@ class LoadAfterStorePass(BlockPass):
             c = a + 2
     """
 
+    preserved_analyses = (CfgInfo,)
+
     def find_store_backwards(
         self, i, ty, stop_on=(ir.FunctionCall, ir.ProcedureCall, ir.Store)
     ):
         """ Go back from this instruction to beginning """
-        block = i.block
-        instructions = block.instructions
-        pos = instructions.index(i)
+        instructions = i.block.instructions
+        pos = i.position
         for x in range(pos - 1, 0, -1):
             i2 = instructions[x]
             if isinstance(i2, ir.Store) and ty is i2.value.ty:
@@ -40,15 +42,16 @@ class LoadAfterStorePass(BlockPass):
         return None
 
     def on_block(self, block):
-        self.replace_load_after_store(block)
-        self.remove_redundant_stores(block)
+        replaced = self.replace_load_after_store(block)
+        removed = self.remove_redundant_stores(block)
+        return replaced or removed
 
     def replace_load_after_store(self, block):
         """ Replace load after store with the value of the store """
         load_instructions = [
             ins
             for ins in block
-            if isinstance(ins, ir.Load) and not ins.volatile
+            if isinstance(ins, ir.Load) and not ins.volatile and ins.is_used
         ]
 
         # Replace loads after store of same address by the stored value:
@@ -65,6 +68,7 @@ class LoadAfterStorePass(BlockPass):
                 # reload of instructions required?
         if count > 0:
             self.logger.debug("Replaced %s loads after store", count)
+        return count > 0
 
     def remove_redundant_stores(self, block):
         """ From two stores to the same address remove the previous one """
@@ -83,6 +87,8 @@ class LoadAfterStorePass(BlockPass):
             )
             if store_prev is not None and not store_prev.volatile:
                 store_prev.remove_from_block()
+                count += 1
 
         if count > 0:
             self.logger.debug("Replaced %s redundant stores", count)
+        return count > 0
@@ -6,6 +6,7 @@ also be stored into a register, to improve performance.
 
 from .transform import FunctionPass
 from .. import ir
+from ..utils.collections import OrderedSet
 from ..graph.domtree import CfgInfo
 
 
@@ -61,16 +62,18 @@ class Mem2RegPromotor(FunctionPass):
     """ Tries to find alloc instructions only used by load and store
     instructions and replace them with values and phi nodes """
 
+    preserved_analyses = (CfgInfo,)
+
     def place_phi_nodes(self, stores, phi_ty, name, cfg_info):
         """
          Step 1: place phi-functions where required:
          Each node in the df(x) requires a phi function,
          where x is a block where the variable is defined.
         """
-        defining_blocks = set(st.block for st in stores)
+        defining_blocks = OrderedSet(st.block for st in stores)
 
         # Create worklist:
-        block_backlog = set(defining_blocks)
+        block_backlog = list(defining_blocks)
 
         has_phi = set()
 
@@ -78,10 +81,15 @@ class Mem2RegPromotor(FunctionPass):
         idx = 0
         while block_backlog:
             defining_block = block_backlog.pop()
-            for frontier_block in cfg_info.df[defining_block]:
+            # Visit the frontier in a fixed order, so that the phi names
+            # are reproducible:
+            frontier = sorted(
+                cfg_info.df[defining_block], key=lambda b: b.name
+            )
+            for frontier_block in frontier:
                 if frontier_block not in has_phi:
                     has_phi.add(frontier_block)
-                    block_backlog.add(frontier_block)
+                    block_backlog.append(frontier_block)
                     phi_name = "phi_{}_{}".format(name, idx)
                     idx += 1
                     phi = ir.Phi(phi_name, phi_ty)
@@ -144,16 +152,19 @@ class Mem2RegPromotor(FunctionPass):
 
         search(cfg_info.cfg.root_tree)
 
-    def promote(self, alloc: ir.Alloc, cfg_info):
+    def promote(self, alloc: ir.Alloc, cfg_info, positions):
         """ Promote a single alloc instruction.
 
-        Find load operations and replace them with assignments.
+        Find load operations and replace them with assignments. The loads
+        and stores are visited in the order of their positions, so that
+        the result does not depend on the order of the use lists.
         """
         name = alloc.name
         addr = list(alloc.used_by)[0]
 
-        loads = [i for i in addr.used_by if isinstance(i, ir.Load)]
-        stores = [i for i in addr.used_by if isinstance(i, ir.Store)]
+        uses = sorted(addr.used_by, key=positions.__getitem__)
+        loads = [i for i in uses if isinstance(i, ir.Load)]
+        stores = [i for i in uses if isinstance(i, ir.Store)]
 
         self.logger.debug(
             "Promoting alloc %s used by %s load and %s stores",
@@ -219,9 +230,23 @@ class Mem2RegPromotor(FunctionPass):
         alloc.remove_from_block()
 
     def on_function(self, function):
-        cfg_info = CfgInfo(function)
-        for block in function.blocks:
-            allocs = [i for i in block if isinstance(i, ir.Alloc)]
-            for alloc in allocs:
-                if is_alloc_promotable(alloc):
-                    self.promote(alloc, cfg_info)
+        allocs = [
+            i
+            for block in function.blocks
+            for i in block
+            if isinstance(i, ir.Alloc) and is_alloc_promotable(i)
+        ]
+        if not allocs:
+            return False
+
+        # Promotion inserts no blocks, so the cfg info stays valid:
+        cfg_info = self.get_analysis(CfgInfo, function)
+        positions = {
+            instruction: position
+            for position, instruction in enumerate(
+                function.get_instructions()
+            )
+        }
+        for alloc in allocs:
+            self.promote(alloc, cfg_info, positions)
+        return True
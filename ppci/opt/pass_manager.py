@@ -0,0 +1,349 @@
+""" Run pipelines of optimization passes over the functions of a module.
+
+The pass manager runs a pipeline of function passes over each function,
+until none of the passes changes the function anymore. Passes report
+whether they changed a function. Analyses requested by the passes, such
+as the control flow graph info, are cached per function, and are only
+invalidated when a pass changes the function without preserving them.
+
+Since the passes only look at one function at a time, the functions of
+a module can also be optimized in a pool of processes. The module is
+sent to the workers as bitcode, see :mod:`ppci.irutils.bitcode`, from
+which the workers decode only the functions they optimize. The optimized
+functions are sent back as bitcode as well.
+"""
+
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .. import ir
+from ..binutils.debuginfo import DebugDb
+from ..irutils.bitcode import BitcodeReader, BitcodeWriter, to_bitcode
+from ..utils.collections import OrderedSet
+from .clean import CleanPass
+from .constantfolding import ConstantFolder
+from .cse import CommonSubexpressionEliminationPass
+from .load_after_store import LoadAfterStorePass
+from .mem2reg import Mem2RegPromotor
+from .tailcall import TailCallOptimization
+from .transform import DeleteUnusedInstructionsPass, RemoveAddZeroPass
+
+
+class AnalysisManager:
+    """ Cache of the analyses of functions.
+
+    An analysis is a callable which takes a function, such as CfgInfo.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, analysis, function):
+        """ Get an analysis of a function, calculating it when required """
+        analyses = self._cache.setdefault(function, {})
+        if analysis in analyses:
+            self.hits += 1
+        else:
+            self.misses += 1
+            analyses[analysis] = analysis(function)
+        return analyses[analysis]
+
+    def invalidate(self, function, preserved=()):
+        """ Forget the analyses of a function, except the preserved ones """
+        analyses = self._cache.get(function, None)
+        if analyses:
+            for analysis in list(analyses):
+                if analysis not in preserved:
+                    del analyses[analysis]
+
+    def clear(self):
+        """ Forget all analyses """
+        self._cache.clear()
+
+
+class PassStatistics:
+    """ Counters of a single pass in a pipeline """
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.changes = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        return "{}: {} runs, {} changes, {:.3f} s".format(
+            self.name, self.runs, self.changes, self.time
+        )
+
+
+_worker_state = None
+
+
+def _init_worker(passes, max_iterations, bitcode):
+    """ Create the module without function bodies, and the pass manager """
+    global _worker_state
+    reader = BitcodeReader(bitcode)
+    ir_module = reader.read_declarations()
+    ir_module.debug_db = DebugDb()
+    pass_manager = PassManager(passes, max_iterations)
+    pass_manager.prepare(ir_module)
+    _worker_state = pass_manager, reader
+
+
+def _optimize_in_worker(function_name, state):
+    """ Optimize a single function, and return it as bitcode """
+    pass_manager, reader = _worker_state
+    function = reader.read_function(function_name)
+    ir_module = reader.module
+    mappings = ir_module.debug_db.mappings
+    _set_function_state(function, state, mappings, lambda token: token)
+    pass_manager.statistics = [
+        PassStatistics(statistics.name)
+        for statistics in pass_manager.statistics
+    ]
+    changed = pass_manager.run_on_function(function)
+    pass_manager.analyses.invalidate(function)
+    if changed:
+        bitcode = BitcodeWriter().write_functions(ir_module, [function])
+        state = _get_function_state(function, mappings, lambda info: info)
+    else:
+        bitcode = state = None
+    return bitcode, state, pass_manager.statistics
+
+
+def _get_function_state(function, mappings, get_token):
+    """ Get the state of a function which its bitcode does not contain.
+
+    These are the names used in the function, which are needed to make
+    new names unique, and the debug information of the instructions.
+    The debug information is given by tokens, derived with get_token.
+    """
+    debug_tokens = [
+        (index, get_token(mappings[instruction]))
+        for index, instruction in enumerate(function.get_instructions())
+        if instruction in mappings
+    ]
+    defined_names = list(function.defined_names)
+    return defined_names, function.unique_counter, debug_tokens
+
+
+def _set_function_state(function, state, mappings, get_info):
+    """ Restore the state of a function, as made by _get_function_state """
+    defined_names, unique_counter, debug_tokens = state
+    function.defined_names = OrderedSet(defined_names)
+    function.unique_counter = unique_counter
+    instructions = list(function.get_instructions())
+    for index, token in debug_tokens:
+        mappings[instructions[index]] = get_info(token)
+
+
+class PassManager:
+    """ Run a pipeline of function passes to a fixed point.
+
+    Per function, the passes are run in order, and the pipeline is
+    repeated until every pass has seen the function without changing
+    it. To guard against passes which keep changing a function, at most
+    max_iterations rounds over the pipeline are done.
+
+    When running with multiple jobs, the passes are pickled to the
+    worker processes, together with their configuration, so they must
+    be picklable.
+
+    Args:
+        passes: the function passes of the pipeline.
+        max_iterations: the maximum amount of rounds per function.
+    """
+
+    logger = logging.getLogger("passmanager")
+
+    def __init__(self, passes, max_iterations=10):
+        self.passes = list(passes)
+        self.max_iterations = max_iterations
+        self.analyses = AnalysisManager()
+        self.statistics = [PassStatistics(repr(p)) for p in self.passes]
+
+    def prepare(self, ir_module):
+        """ Prepare the passes to run on the functions of a module """
+        for opt_pass in self.passes:
+            opt_pass.prepare()
+            opt_pass.debug_db = ir_module.debug_db
+            opt_pass.analyses = self.analyses
+
+    def run(self, ir_module: ir.Module, jobs=1):
+        """ Optimize all functions of a module.
+
+        Args:
+            ir_module: the module to optimize in place.
+            jobs: the number of processes used to optimize functions.
+                The result is the same for any number of jobs.
+
+        Returns whether any function was changed.
+        """
+        if jobs > 1 and self.can_run_in_parallel(ir_module):
+            return self.run_in_parallel(ir_module, jobs)
+
+        self.prepare(ir_module)
+        changed = False
+        try:
+            for function in ir_module.functions:
+                if self.run_on_function(function):
+                    changed = True
+        finally:
+            for opt_pass in self.passes:
+                opt_pass.debug_db = None
+                opt_pass.analyses = None
+            self.analyses.clear()
+        return changed
+
+    @staticmethod
+    def can_run_in_parallel(ir_module):
+        """ Check if the functions of a module can be optimized in parallel.
+
+        Inline assembly cannot be sent to another process.
+        """
+        if len(ir_module.functions) < 2:
+            return False
+        for function in ir_module.functions:
+            for instruction in function.get_instructions():
+                if isinstance(instruction, ir.InlineAsm):
+                    return False
+        return True
+
+    def run_in_parallel(self, ir_module, jobs):
+        """ Optimize the functions of a module in a pool of processes.
+
+        Each worker receives the module as bitcode. The names of the
+        functions are sent to the workers one by one, and the workers
+        return the functions they changed. These replace the
+        bodies of the functions, in the order of the functions in the
+        module.
+        """
+        self.logger.info("Optimizing functions with %s processes", jobs)
+        debug_db = ir_module.debug_db
+        mappings = {} if debug_db is None else debug_db.mappings
+
+        # Debug information is sent to the workers as numbers:
+        infos = []
+        tokens = {}
+
+        def get_token(info):
+            if id(info) not in tokens:
+                tokens[id(info)] = len(infos)
+                infos.append(info)
+            return tokens[id(info)]
+
+        states = [
+            _get_function_state(function, mappings, get_token)
+            for function in ir_module.functions
+        ]
+        # The workers decode a function body when it is sent to them:
+        initargs = (self.passes, self.max_iterations, to_bitcode(ir_module))
+        function_names = [function.name for function in ir_module.functions]
+
+        changed = False
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=initargs
+        ) as executor:
+            results = executor.map(
+                _optimize_in_worker, function_names, states
+            )
+            for function, result in zip(ir_module.functions, results):
+                bitcode, state, statistics = result
+                for total, part in zip(self.statistics, statistics):
+                    total.runs += part.runs
+                    total.changes += part.changes
+                    total.time += part.time
+                if bitcode is None:
+                    continue
+
+                changed = True
+                for instruction in function.get_instructions():
+                    mappings.pop(instruction, None)
+                reader = BitcodeReader(bitcode)
+                reader.read_function(function.name, ir_module)
+                _set_function_state(
+                    function, state, mappings, infos.__getitem__
+                )
+        return changed
+
+    def run_on_function(self, function):
+        """ Run the pipeline on a function until it no longer changes """
+        passes = list(zip(self.passes, self.statistics))
+        changed = False
+        unchanged = 0
+        runs = 0
+        while unchanged < len(passes):
+            if runs == self.max_iterations * len(passes):
+                self.logger.warning(
+                    "%s did not converge after %s iterations",
+                    function.name,
+                    self.max_iterations,
+                )
+                break
+            opt_pass, statistics = passes[runs % len(passes)]
+            runs += 1
+
+            start = time.perf_counter()
+            result = opt_pass.on_function(function)
+            statistics.time += time.perf_counter() - start
+            statistics.runs += 1
+
+            # Passes which do not report changes might have changed:
+            if result is False:
+                unchanged += 1
+            else:
+                unchanged = 0
+                changed = True
+                statistics.changes += 1
+                self.analyses.invalidate(
+                    function, opt_pass.preserved_analyses
+                )
+        self.logger.debug("%s passes run on %s", runs, function.name)
+        return changed
+
+    def report(self):
+        """ Get a line of statistics for each pass """
+        return [repr(statistics) for statistics in self.statistics]
+
+
+def create_pipeline(level):
+    """ Create the passes for an optimization level.
+
+    Level 1 does cheap cleanups, level 2 does all optimizations and
+    level s leaves out optimizations which can grow the code.
+    """
+    level = str(level)
+    if level == "1":
+        return [
+            Mem2RegPromotor(),
+            ConstantFolder(),
+            DeleteUnusedInstructionsPass(),
+            CleanPass(),
+        ]
+    elif level == "2":
+        return [
+            Mem2RegPromotor(),
+            RemoveAddZeroPass(),
+            ConstantFolder(),
+            CommonSubexpressionEliminationPass(),
+            TailCallOptimization(),
+            LoadAfterStorePass(),
+            DeleteUnusedInstructionsPass(),
+            CleanPass(),
+        ]
+    elif level == "s":
+        # Tail call optimization adds an entry block and a phi for each
+        # argument, so it is not done when optimizing for size:
+        return [
+            Mem2RegPromotor(),
+            RemoveAddZeroPass(),
+            ConstantFolder(),
+            CommonSubexpressionEliminationPass(),
+            LoadAfterStorePass(),
+            DeleteUnusedInstructionsPass(),
+            CleanPass(),
+        ]
+    else:
+        raise ValueError("Invalid optimization level {}".format(level))
@@ -69,6 +69,7 @@ class TailCallOptimization(FunctionPass):
 
         if tail_calls:
             self.rewrite_tailcalls(function, tail_calls)
+        return bool(tail_calls)
 
     def _replace_entry(self, function):
         """ Replace tail calls by jumps to the old entry of this function.
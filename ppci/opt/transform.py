@@ -3,6 +3,7 @@
 import logging
 import abc
 from .. import ir
+from ..graph.domtree import CfgInfo
 
 
 class ModulePass(metaclass=abc.ABCMeta):
@@ -11,8 +12,12 @@ class ModulePass(metaclass=abc.ABCMeta):
     Subclass this class to implement your own optimization pass.
     """
 
+    #: The analyses which remain valid when this pass changes a function.
+    preserved_analyses = ()
+
     def __init__(self):
         self.logger = logging.getLogger(str(self.__class__.__name__))
+        self.analyses = None
 
     def __repr__(self):
         return self.__class__.__name__
@@ -27,16 +32,36 @@ class ModulePass(metaclass=abc.ABCMeta):
 
 
 class FunctionPass(ModulePass):
-    """ Base pass that loops over all functions in a module """
+    """ Base pass that loops over all functions in a module.
+
+    The on_function method returns whether it changed the function. When
+    it returns None, the function is assumed to be changed.
+    """
 
     def run(self, ir_module: ir.Module):
-        """ Main entry point for the pass """
+        """ Main entry point for the pass.
+
+        Returns whether any function of the module was changed.
+        """
         self.prepare()
         self.debug_db = ir_module.debug_db
         assert isinstance(ir_module, ir.Module)
+        changed = False
         for function in ir_module.functions:
-            self.on_function(function)
+            if self.on_function(function) is not False:
+                changed = True
         self.debug_db = None
+        return changed
+
+    def get_analysis(self, analysis, function):
+        """ Get an analysis of a function, like CfgInfo.
+
+        When the pass is run by a pass manager, the analysis is taken
+        from its cache, otherwise it is calculated.
+        """
+        if self.analyses is None:
+            return analysis(function)
+        return self.analyses.get(analysis, function)
 
     @abc.abstractmethod
     def on_function(self, function: ir.SubRoutine):  # pragma: no cover
@@ -49,8 +74,11 @@ class BlockPass(FunctionPass):
 
     def on_function(self, function):
         """ Loops over each block in the function """
+        changed = False
         for block in function.blocks:
-            self.on_block(block)
+            if self.on_block(block) is not False:
+                changed = True
+        return changed
 
     @abc.abstractmethod
     def on_block(self, block: ir.Block):  # pragma: no cover
@@ -63,8 +91,11 @@ class InstructionPass(BlockPass):
 
     def on_block(self, block):
         """ Loops over each instruction in the block """
+        changed = False
         for instruction in block:
-            self.on_instruction(instruction)
+            if self.on_instruction(instruction) is not False:
+                changed = True
+        return changed
 
     @abc.abstractmethod
     def on_instruction(self, instruction):  # pragma: no cover
@@ -77,42 +108,44 @@ class RemoveAddZeroPass(InstructionPass):
         Replace multiplication by 1 with value itself.
     """
 
+    preserved_analyses = (CfgInfo,)
+
     def on_instruction(self, instruction):
-        if type(instruction) is ir.Binop:
-            if instruction.operation == "+":
-                if (
-                    type(instruction.b) is ir.Const
-                    and instruction.b.value == 0
-                ):
-                    instruction.replace_by(instruction.a)
-                elif (
-                    type(instruction.a) is ir.Const
-                    and instruction.a.value == 0
-                ):
-                    instruction.replace_by(instruction.b)
-            elif instruction.operation == "*":
-                if (
-                    type(instruction.b) is ir.Const
-                    and instruction.b.value == 1
-                ):
-                    instruction.replace_by(instruction.a)
+        if type(instruction) is not ir.Binop or not instruction.is_used:
+            return False
+        if instruction.operation == "+":
+            if type(instruction.b) is ir.Const and instruction.b.value == 0:
+                instruction.replace_by(instruction.a)
+                return True
+            elif (
+                type(instruction.a) is ir.Const and instruction.a.value == 0
+            ):
+                instruction.replace_by(instruction.b)
+                return True
+        elif instruction.operation == "*":
+            if type(instruction.b) is ir.Const and instruction.b.value == 1:
+                instruction.replace_by(instruction.a)
+                return True
+        return False
 
 
 class DeleteUnusedInstructionsPass(BlockPass):
     """ Remove unused variables from a block """
 
+    preserved_analyses = (CfgInfo,)
+
     def on_block(self, block):
-        unused_instructions = [
-            i
-            for i in block
+        # Visit the instructions backwards, so that values used only by
+        # removed instructions are removed as well:
+        count = 0
+        for instruction in reversed(list(block)):
             if (
-                isinstance(i, ir.Value)
-                and (not isinstance(i, ir.FunctionCall))
-                and (not i.is_used)
-            )
-        ]
-        count = len(unused_instructions)
-        for instruction in unused_instructions:
-            instruction.remove_from_block()
+                isinstance(instruction, ir.Value)
+                and (not isinstance(instruction, ir.FunctionCall))
+                and (not instruction.is_used)
+            ):
+                instruction.remove_from_block()
+                count += 1
         if count > 0:
             self.logger.debug("Deleted %i unused instructions", count)
+        return count > 0
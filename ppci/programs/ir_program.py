@@ -22,7 +22,24 @@ class IrProgram(IntermediateProgram):
         return items
 
     def _copy(self):
-        raise NotImplementedError()
+        """ Copy the modules via bitcode.
+
+        Bitcode does not contain debug information, so the debug
+        information of the objects in the old modules is mapped onto
+        the objects in the new modules.
+        """
+        items = []
+        for module in self.items:
+            new_module = irutils.from_bitcode(irutils.to_bitcode(module))
+            new_module.debug_db = module.debug_db
+            pairs = list(zip(_ir_objects(module), _ir_objects(new_module)))
+            for debug_db in {module.debug_db, self.debugdb} - {None}:
+                for old, new in pairs:
+                    debug_db.map(old, new)
+            items.append(new_module)
+        return IrProgram(
+            *items, previous=self._previous, debugdb=self.debugdb
+        )
 
     def _get_report(self, html):
 
@@ -33,6 +50,19 @@ class IrProgram(IntermediateProgram):
             pieces.append(f.getvalue())
         return '\n\n==========\n\n'.join(pieces)
 
+    def as_bitcode(self):
+        """ Convert to bitcode, the binary representation of ir-code.
+
+        Returns a list with the bitcode of each module.
+        """
+        return [irutils.to_bitcode(m) for m in self.items]
+
+    @classmethod
+    def from_bitcode(cls, *items):
+        """ Load a program from the bitcode of one or more modules.
+        """
+        return cls(*[irutils.from_bitcode(d) for d in items])
+
     def optimize(self, level=2):
         """ Optimize the ir program """
         for item in self.items:
@@ -103,3 +133,15 @@ class IrProgram(IntermediateProgram):
         Do this by taking each ir module into a wasm module.
         """
         return self._new('wasm', [ir_to_wasm(c) for c in self.items])
+
+
+def _ir_objects(module):
+    """ Iterate over the objects of a module, in the order of bitcode """
+    yield from module.externals
+    yield from module.variables
+    for function in module.functions:
+        yield function
+        yield from function.arguments
+        for block in function.blocks:
+            yield block
+            yield from block
@@ -14,13 +14,19 @@ from collections import OrderedDict
 
 
 class OrderedSet(MutableSet):
-    """ Set which retains order of elements """
+    """ Set which retains order of elements
+
+    The elements are kept in a doubly linked list. A list of the
+    elements is made when indexing the set, and kept until an element
+    is removed, so that indexing is fast when the set is not changed.
+    """
 
     def __init__(self, iterable=None):
         end = []
         end += [None, end, end]
         self._end = end
         self._map = {}  # key -> [key, prev, next]
+        self._items = None
         if iterable is not None:
             self |= iterable
 
@@ -35,6 +41,8 @@ class OrderedSet(MutableSet):
             end = self._end
             curr = end[1]
             curr[2] = end[1] = self._map[value] = [value, curr, end]
+            if self._items is not None:
+                self._items.append(value)
 
     def discard(self, value):
         """ Remove element from set """
@@ -42,12 +50,13 @@ class OrderedSet(MutableSet):
             value, prev_item, next_item = self._map.pop(value)
             prev_item[2] = next_item
             next_item[1] = prev_item
+            self._items = None
 
     def __getitem__(self, index):
-        """ O(n) implementation for lookups """
-        for i, key in enumerate(self):
-            if i == index:
-                return key
+        """ Get the element at an index """
+        if self._items is None:
+            self._items = list(self)
+        return self._items[index]
 
     def __iter__(self):
         end = self._end
@@ -58,7 +67,7 @@ class OrderedSet(MutableSet):
 
     def __reversed__(self):
         end = self._end
-        curr = end[2]
+        curr = end[1]
         while curr is not end:
             yield curr[0]
             curr = curr[1]
@@ -0,0 +1,172 @@
+""" A persistent, content addressed cache on disk.
+
+The cache is a directory with one file per entry. Entries are keyed
+by a hash over the inputs which determine the cached value, so a
+cache entry never needs to be invalidated, only evicted.
+
+Several processes can share a single cache directory:
+
+- New entries are written to a temporary file and then atomically
+  renamed into place, so readers never see partially written entries.
+- An entry which disappears while reading (because some other process
+  evicted it) is treated as a cache miss.
+- Entries which cannot be unpickled are considered corrupt, and are
+  removed.
+
+The total size of the cache directory is bounded. When the size limit
+is exceeded, the least recently used entries are removed. The
+modification time of an entry is used to record the last usage.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+
+logger = logging.getLogger("diskcache")
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def make_key(*parts):
+    """ Create a cache key by hashing all the given parts.
+
+    Parts can be bytes or strings.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf8")
+        # Include the length, so that parts cannot run into each other:
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def get_cache(cache):
+    """ Get a disk cache from either a directory name or a cache. """
+    if cache is None or isinstance(cache, DiskCache):
+        return cache
+    return DiskCache(cache)
+
+
+class DiskCache:
+    """ A directory holding cached items, evicted in LRU order.
+
+    Args:
+        directory: the directory in which cache entries are stored.
+        max_size: the maximum size in bytes of all entries together.
+    """
+
+    suffix = ".cache"
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return "DiskCache({!r}, max_size={})".format(
+            self.directory, self.max_size
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key, default=None):
+        """ Retrieve the entry with the given key """
+        filename = self._path(key)
+        try:
+            with open(filename, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            logger.warning("Removing corrupt cache entry %s", filename)
+            self._remove(filename)
+            self.misses += 1
+            return default
+
+        # Mark entry as recently used:
+        try:
+            os.utime(filename)
+        except OSError:  # pragma: no cover
+            pass
+
+        self.hits += 1
+        logger.debug("Cache hit %s", key)
+        return value
+
+    def put(self, key, value):
+        """ Store a value under the given key.
+
+        The value is pickled to a temporary file, and then renamed to its
+        final name.
+        """
+        fd, tmp_filename = tempfile.mkstemp(
+            prefix=".tmp-", dir=self.directory
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, self._path(key))
+        except BaseException:
+            self._remove(tmp_filename)
+            raise
+        logger.debug("Stored cache entry %s", key)
+        self.evict()
+
+    def entries(self):
+        """ Get a list of (mtime, size, filename) tuples of all entries """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self.suffix):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    @property
+    def size(self):
+        """ The total size in bytes of all cache entries """
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """ Remove least recently used entries until the size fits. """
+        entries = self.entries()
+        total_size = sum(e[1] for e in entries)
+        if total_size <= self.max_size:
+            return
+
+        entries.sort()
+        for _, size, filename in entries:
+            if total_size <= self.max_size:
+                break
+            logger.debug("Evicting cache entry %s", filename)
+            self._remove(filename)
+            total_size -= size
+
+    def clear(self):
+        """ Remove all entries from the cache """
+        for _, _, filename in self.entries():
+            self._remove(filename)
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            # Another process might have removed it already.
+            pass
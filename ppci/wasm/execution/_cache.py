@@ -0,0 +1,42 @@
+""" Helpers to cache compiled wasm modules on disk.
+
+The compiled code is stored together with the maps from wasm function
+and global indici to their names in the compiled code. These maps are
+needed to populate the exports of the instantiated module.
+"""
+
+from ... import ir
+from ... import __version__ as ppci_version
+from ...utils.diskcache import make_key
+
+
+def make_module_key(module, *parts):
+    """ Create a cache key for the given wasm module.
+
+    The key is made out of the binary wasm, the ppci version and any
+    additional parts which influence the compilation result.
+    """
+    return make_key(module.to_bytes(), ppci_version, *parts)
+
+
+def dump_name_maps(ppci_module):
+    """ Turn the wasm name maps of an ir-module into plain data. """
+    function_names = list(ppci_module._wasm_function_names)
+    global_names = [
+        (ty.name, var.name, isinstance(var, ir.ExternalVariable))
+        for ty, var in ppci_module._wasm_global_names
+    ]
+    return function_names, global_names
+
+
+def load_name_maps(function_names, global_names):
+    """ Re-create the wasm name maps from plain data. """
+    global_names2 = []
+    for ty_name, var_name, is_external in global_names:
+        ty = ir.get_ty(ty_name)
+        if is_external:
+            var = ir.ExternalVariable(var_name)
+        else:
+            var = ir.Variable(var_name, ir.Binding.GLOBAL, ty.size, ty.size)
+        global_names2.append((ty, var))
+    return list(function_names), global_names2
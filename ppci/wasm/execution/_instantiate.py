@@ -30,7 +30,11 @@ def instantiate(
                 Use 'python' to generate python code. This option is slower
                 but more reliable.
         reporter: A reporter which can record detailed compilation information.
-        cache_file: a file to use as cache
+        cache_file: a directory (or :class:`ppci.utils.diskcache.DiskCache`)
+                    in which compiled modules are cached across runs and
+                    processes. The cache is keyed by the binary wasm
+                    module, the target, the ppci version and the host
+                    architecture or python version.
 
     """
     if reporter is None:
@@ -3,16 +3,17 @@
 """
 
 import logging
-import os
-import shelve
 import struct
 
+from ...binutils.objectfile import deserialize
 from ...utils.codepage import load_obj, MemoryPage
+from ...utils.diskcache import get_cache
 from ...irutils import verify_module
 from .. import wasm_to_ir
 from ..components import Table
 from ..util import PAGE_SIZE
 from ._base_instance import ModuleInstance, WasmMemory, WasmGlobal
+from ._cache import make_module_key, dump_name_maps, load_name_maps
 
 
 logger = logging.getLogger("instantiate")
@@ -24,32 +25,41 @@ def native_instantiate(module, imports, reporter, cache_file):
 
     logger.info("Instantiating wasm module as native code")
     arch = get_current_arch()
-    # key = (arch, module)
-    # TODO: think of clever caching trickery:
-    cache_file = None
-    if cache_file and os.path.exists(cache_file):
-        logger.info("Using cached object from %s", cache_file)
-        with shelve.open(cache_file) as s:
-            obj = s["obj"]
-            ppci_module = s["ppci_module"]
+    cache = get_cache(cache_file)
+    if cache:
+        key = make_module_key(module, "native", arch.make_id_str())
+        cached = cache.get(key)
+    else:
+        cached = None
+
+    if cached:
+        logger.info("Using cached object from %s", cache.directory)
+        obj = deserialize(cached["obj"])
+        function_names, global_names = load_name_maps(
+            cached["function_names"], cached["global_names"]
+        )
     else:
-        # TODO: use cache here to short circuit re-compilation
-        # hash(key)
-        # print(hash(key))
-        # hgkfdg
         ppci_module = wasm_to_ir(
             module, arch.info.get_type_info("ptr"), reporter=reporter
         )
         verify_module(ppci_module)
         obj = ir_to_object([ppci_module], arch, debug=True, reporter=reporter)
-        if cache_file:
-            logger.info("Saving object to %s for later use", cache_file)
-            with shelve.open(cache_file) as s:
-                s["obj"] = obj
-                s["ppci_module"] = ppci_module
+        function_names = ppci_module._wasm_function_names
+        global_names = ppci_module._wasm_global_names
+        if cache:
+            logger.info("Saving object to %s for later use", cache.directory)
+            function_names2, global_names2 = dump_name_maps(ppci_module)
+            cache.put(
+                key,
+                {
+                    "obj": obj.serialize(),
+                    "function_names": function_names2,
+                    "global_names": global_names2,
+                },
+            )
     instance = NativeModuleInstance(obj, imports)
-    instance._wasm_function_names = ppci_module._wasm_function_names
-    instance._wasm_global_names = ppci_module._wasm_global_names
+    instance._wasm_function_names = function_names
+    instance._wasm_global_names = global_names
     return instance
 
 
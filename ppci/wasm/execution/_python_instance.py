@@ -3,14 +3,18 @@
 
 import logging
 import io
+import marshal
+import sys
 from types import ModuleType
 from ...arch.arch_info import TypeInfo
 from ...irutils import verify_module
+from ...utils.diskcache import get_cache
 from ... import ir
 from ..components import Table
 from .. import wasm_to_ir
 from ..util import PAGE_SIZE
 from ._base_instance import ModuleInstance, WasmMemory, WasmGlobal
+from ._cache import make_module_key, dump_name_maps, load_name_maps
 
 logger = logging.getLogger("instantiate")
 
@@ -20,22 +24,72 @@ def python_instantiate(module, imports, reporter, cache_file):
     from ...api import ir_to_python
 
     logger.info("Instantiating wasm module as python")
-    ptr_info = TypeInfo(4, 4)
-    ppci_module = wasm_to_ir(module, ptr_info, reporter=reporter)
-    verify_module(ppci_module)
-    f = io.StringIO()
-    ir_to_python([ppci_module], f, reporter=reporter)
-    pysrc = f.getvalue()
-    pycode = compile(pysrc, "<string>", "exec")
+    cache = get_cache(cache_file)
+    if cache and sys.implementation.cache_tag is None:
+        # Bytecode caching is disabled for this python implementation:
+        logger.info("Not caching python code, there is no cache tag")
+        cache = None
+
+    if cache:
+        key = make_module_key(module, "python", sys.implementation.cache_tag)
+        cached = load_cached_code(cache.get(key))
+    else:
+        cached = None
+
+    if cached:
+        logger.info("Using cached python code from %s", cache.directory)
+        pycode, function_names, global_names = cached
+    else:
+        ptr_info = TypeInfo(4, 4)
+        ppci_module = wasm_to_ir(module, ptr_info, reporter=reporter)
+        verify_module(ppci_module)
+        f = io.StringIO()
+        ir_to_python([ppci_module], f, reporter=reporter)
+        pysrc = f.getvalue()
+        pycode = compile(pysrc, "<string>", "exec")
+        function_names = ppci_module._wasm_function_names
+        global_names = ppci_module._wasm_global_names
+        if cache:
+            logger.info("Saving python code to %s", cache.directory)
+            function_names2, global_names2 = dump_name_maps(ppci_module)
+            cache.put(
+                key,
+                {
+                    "code": marshal.dumps(pycode),
+                    "function_names": function_names2,
+                    "global_names": global_names2,
+                },
+            )
+
     _py_module = ModuleType("gen")
     exec(pycode, _py_module.__dict__)
 
     instance = PythonModuleInstance(_py_module, imports)
-    instance._wasm_function_names = ppci_module._wasm_function_names
-    instance._wasm_global_names = ppci_module._wasm_global_names
+    instance._wasm_function_names = function_names
+    instance._wasm_global_names = global_names
     return instance
 
 
+def load_cached_code(cached):
+    """ Unmarshal a cached code object and its name maps.
+
+    Returns None when there is no usable cached code.
+    """
+    if not cached:
+        return
+
+    try:
+        pycode = marshal.loads(cached["code"])
+    except (EOFError, ValueError, TypeError):
+        logger.warning("Ignoring invalid cached python code")
+        return
+
+    function_names, global_names = load_name_maps(
+        cached["function_names"], cached["global_names"]
+    )
+    return pycode, function_names, global_names
+
+
 class PythonModuleInstance(ModuleInstance):
     """ Wasm module loaded a generated python module """
 
@@ -54,7 +108,7 @@ class PythonModuleInstance(ModuleInstance):
                 ptr_size = 4
                 table_byte_size = obj.max * ptr_size
                 table_addr = self._py_module._irpy_heap_top()
-                self._py_module._irpy_heap.extend(bytes(table_byte_size))
+                self._py_module._irpy_memory.extend(bytes(table_byte_size))
                 obj = table_addr
                 magic_key = "func_table"
                 assert magic_key not in self._py_module._irpy_externals
@@ -75,7 +129,7 @@ class PythonModuleInstance(ModuleInstance):
         # Allocate room on top of python heap:
         self.mem0_start = self._py_module._irpy_heap_top()
         initial_data = bytes(min_size * PAGE_SIZE)
-        self._py_module._irpy_heap.extend(initial_data)
+        self._py_module._irpy_memory.extend(initial_data)
 
         # Store pointer to heap top:
         mem0_ptr_ptr = self._py_module.wasm_mem0_address
@@ -94,7 +148,7 @@ class PythonModuleInstance(ModuleInstance):
         if new_size > max_size:
             return -1
         else:
-            self._py_module._irpy_heap.extend(bytes(amount * PAGE_SIZE))
+            self._py_module._irpy_memory.extend(bytes(amount * PAGE_SIZE))
             return old_size
 
     def memory_size(self):
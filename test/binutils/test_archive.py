@@ -1,5 +1,9 @@
-import unittest
+import gc
 import io
+import os
+import tempfile
+import unittest
+import warnings
 
 from ppci.binutils.archive import archive, get_archive
 from ppci.binutils.linker import link
@@ -17,6 +21,43 @@ class ArchiveFileTestCase(unittest.TestCase):
         lib2 = get_archive(f2)
         self.assertTrue(lib2)
 
+    def test_binary_save_load(self):
+        """ Test that binary archive members are decoded on use. """
+        arch = get_arch('msp430')
+        obj1 = ObjectFile(arch)
+        obj1.create_section('foo').add_data(bytes([1, 2, 3]))
+        obj1.add_symbol(0, 'a', 'global', 0, 'foo', 'func', 3)
+        obj2 = ObjectFile(arch)
+        lib = archive([obj1, obj2])
+        f = io.BytesIO()
+        lib.save(f)
+        lib2 = get_archive(io.BytesIO(f.getvalue()))
+        self.assertFalse(lib2.is_loaded(0))
+        self.assertEqual(obj1, lib2[0])
+        self.assertTrue(lib2.is_loaded(0))
+        self.assertFalse(lib2.is_loaded(1))
+        self.assertEqual([obj1, obj2], lib2.objs)
+
+    def test_load_from_path(self):
+        """ Test that loading from a path does not leak the file """
+        arch = get_arch('msp430')
+        obj1 = ObjectFile(arch)
+        obj1.create_section('foo').add_data(bytes([1, 2, 3]))
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        filename = os.path.join(tmpdir.name, 'lib.a')
+        with open(filename, 'wb') as f:
+            archive([obj1]).save(f)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            lib2 = get_archive(filename)
+            gc.collect()
+        self.assertEqual([], [w.message for w in caught])
+
+        # Members are decoded from the memory map of the closed file:
+        self.assertFalse(lib2.is_loaded(0))
+        self.assertEqual(obj1, lib2[0])
+
     def test_linking(self):
         """ Test pull in of undefined symbols from libraries. """
         arch = get_arch('msp430')
@@ -40,7 +81,33 @@ class ArchiveFileTestCase(unittest.TestCase):
         obj5.add_symbol(1, 'putc', 'global', None, None, 'func', 0)  # undefined
         lib2 = archive([obj4, obj5])
 
+        self.assertEqual(1, lib1.find_symbol('syscall'))
+        self.assertIsNone(lib1.find_symbol('printf'))
+
         obj = link([obj1], libraries=[lib1, lib2])
+        for name in ['printf', 'putc', 'syscall']:
+            self.assertTrue(obj.get_symbol(name).defined)
+
+    def test_only_needed_members_are_loaded(self):
+        """ Test that the symbol index is saved along with the archive. """
+        arch = get_arch('msp430')
+        objs = []
+        for name in ['a', 'b', 'c']:
+            obj = ObjectFile(arch)
+            obj.create_section('foo')
+            obj.add_symbol(0, name, 'global', 0, 'foo', 'func', 0)
+            objs.append(obj)
+        f = io.BytesIO()
+        archive(objs).save(f)
+        lib = get_archive(io.BytesIO(f.getvalue()))
+        self.assertEqual({'a': 0, 'b': 1, 'c': 2}, lib.symbol_index)
+
+        obj1 = ObjectFile(arch)
+        obj1.create_section('foo')
+        obj1.add_symbol(0, 'b', 'global', None, None, 'func', 0)
+        link([obj1], libraries=[lib])
+        self.assertEqual(
+            [False, True, False], [lib.is_loaded(i) for i in range(3)])
 
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@ from ppci.binutils.dbg.debugger import Debugger, TmpValue
 from ppci.binutils.dbg.debug_driver import DebugState
 from ppci.binutils.dbg.dummy_driver import DummyDebugDriver
 from ppci.binutils.dbg.cli import DebugCli
+from ppci.binutils.dbg.debug_index import LineTable, IntervalTree
 from ppci.binutils import debuginfo
 from ppci.binutils.objectfile import ObjectFile
 from ppci.api import c3c, link, get_arch
@@ -79,6 +80,16 @@ class DebuggerTestCase(unittest.TestCase):
         addr = self.debugger.find_address('', 7)
         self.assertTrue(addr is not None)
 
+    def test_source_mappings_at_pc(self):
+        """ Test finding the source and function at the program counter """
+        self.debugger.load_symbols(self.obj)
+        addr = self.debugger.find_address('', 7)
+        with patch.object(self.debugger, 'get_pc', return_value=addr):
+            self.assertEqual(('', 7), self.debugger.find_pc())
+            self.assertEqual(
+                'sum', self.debugger.current_function().name)
+        self.assertIn(7, self.debugger.get_possible_breakpoints(''))
+
     def test_expressions_with_globals(self):
         """ See if expressions involving global variables can be evaluated """
         src = """
@@ -133,6 +144,32 @@ class DebuggerTestCase(unittest.TestCase):
         self.debugger.current_function()
 
 
+class DebugIndexTestCase(unittest.TestCase):
+    """ Test the address indexes of the debugger """
+    def test_line_table(self):
+        table = LineTable([(20, 'b'), (10, 'a'), (30, 'c')])
+        self.assertEqual((10, 'a'), table.find(5))
+        self.assertEqual((10, 'a'), table.find(10))
+        self.assertEqual((20, 'b'), table.find(29))
+        self.assertEqual((30, 'c'), table.find(1000))
+        self.assertIsNone(LineTable([]).find(1))
+
+    def test_interval_tree(self):
+        intervals = [
+            (0, 100, 'outer'), (10, 20, 'f1'), (20, 30, 'f2'),
+            (15, 18, 'inner'), (200, 300, 'g'), (5, 5, 'empty')]
+        tree = IntervalTree(intervals)
+        for address in range(-5, 310):
+            expected = sorted(
+                v for b, e, v in intervals if b <= address < e)
+            self.assertEqual(expected, sorted(tree.find(address)))
+        self.assertEqual('inner', tree.find_innermost(16))
+        self.assertEqual('f2', tree.find_innermost(20))
+        self.assertEqual('outer', tree.find_innermost(50))
+        self.assertIsNone(tree.find_innermost(150))
+        self.assertEqual([], IntervalTree([]).find(3))
+
+
 class DebugCliTestCase(unittest.TestCase):
     """ Test the command line interface for the debugger """
     def setUp(self):
@@ -0,0 +1,165 @@
+import io
+import unittest
+from ppci.api import asm, cc, get_arch, link
+from ppci.arch.data_instructions import DByte
+from ppci.binutils.disasm import Disassembler
+from ppci.binutils.outstream import FunctionOutputStream
+
+
+class DisassemblerTestCase(unittest.TestCase):
+    """ Test the disassembler on assembled code """
+    def disasm(self, arch, src, extra=bytes()):
+        obj = link([asm(io.StringIO(src), arch)])
+        data = obj.get_section('code').data + extra
+        instructions = []
+        outs = FunctionOutputStream(instructions.append)
+        Disassembler(get_arch(arch)).disasm(data, outs, address=0x100)
+        return [(i.address, str(i)) for i in instructions]
+
+    def test_riscv(self):
+        """ Test immediates, stores and jumps with negative offsets """
+        src = """
+        start:
+        addi x1, x1, -5
+        loop:
+        sw x2, -8(x1)
+        lw x3, -2048(x4)
+        beq x1, x2, loop
+        bgt x1, x2, start
+        jal x1, end
+        lui x5, 0xfffff
+        jalr x0,x1, -4
+        mul x3, x4, x5
+        end:
+        """
+        self.assertEqual(
+            [
+                (0x100, 'addi x1, x1, -5'),
+                (0x104, 'sw x2, -8(x1)'),
+                (0x108, 'lw x3, -2048(x4)'),
+                (0x10c, 'beq x1, x2, .-8'),
+                (0x110, 'blt x2, x1, .-16'),
+                (0x114, 'jal x1, .+16'),
+                (0x118, 'lui x5, 1048575'),
+                (0x11c, 'jalr x0,x1, -4'),
+                (0x120, 'mul x3, x4, x5'),
+            ],
+            self.disasm('riscv', src))
+
+    def test_or1k(self):
+        """ Test instructions with a constructor operand """
+        src = 'l.add r11, r3, r4\nl.addi r2, r1, 7\nl.nop 0\n'
+        self.assertEqual(
+            [
+                (0x100, 'l.add r11, r3, r4'),
+                (0x104, 'l.addi r2, r1, 7'),
+                (0x108, 'l.nop 0'),
+            ],
+            self.disasm('or1k', src))
+
+    def test_or1k_signed(self):
+        """ Test that signed immediates and offsets are sign extended """
+        src = 'l.sw -8(r1), r2\nl.lws r3, -4(r2)\nl.addi r1, r1, -36\n'
+        self.assertEqual(
+            [
+                (0x100, 'l.sw -8(r1), r2'),
+                (0x104, 'l.lws r3, -4(r2)'),
+                (0x108, 'l.addi r1, r1, -36'),
+            ],
+            self.disasm('or1k', src))
+
+    def test_arm(self):
+        """ Test negative offsets, register lists and branches """
+        src = 'start:\nldr r1, [r2, #-8]\npush {r4,r5,lr}\nbl start\n'
+        self.assertEqual(
+            [
+                (0x100, 'ldr R1, [R2, #-8]'),
+                (0x104, 'push LR, R4, R5'),
+                (0x108, 'bl .-8'),
+            ],
+            self.disasm('arm', src))
+
+    def test_thumb(self):
+        """ Test 16 bit instructions and branches """
+        src = 'start:\nstr r1, [r2, 4]\npush {r4,r5,lr}\nb start\n'
+        self.assertEqual(
+            [
+                (0x100, 'str R1,[R2, 4]'),
+                (0x102, 'push LR, R4, R5'),
+                (0x104, 'b .-4'),
+            ],
+            self.disasm('arm:thumb', src))
+
+    def test_x86_64(self):
+        """ Test instructions of several sizes """
+        src = """
+        start:
+        push rbx
+        push r12
+        mov rax, [rsp]
+        mov rax, [r13, -300]
+        mov [r11, -8], r9
+        add rsp, -8
+        jmp start
+        """
+        self.assertEqual(
+            [
+                (0x100, 'push rbx'),
+                (0x101, 'push r12'),
+                (0x103, 'mov rax, [rsp]'),
+                (0x107, 'mov rax, [r13, -300]'),
+                (0x10e, 'mov [r11, -8], r9'),
+                (0x112, 'add rsp, -8'),
+                (0x119, 'jmp .-25'),
+            ],
+            self.disasm('x86_64', src))
+
+    def test_compiled_code(self):
+        """ Test that compiled code decodes into instructions """
+        src = """
+        int sum(int *a, int n) {
+          int s = 0;
+          for (int i = 0; i < n; i++) { s += a[i] * 3 - 7; }
+          return s;
+        }
+        void fill(char *p, int n) { while (n-- > 0) { p[n] = n; } }
+        """
+        for arch in ['riscv', 'or1k', 'arm', 'arm:thumb', 'x86_64']:
+            with self.subTest(arch=arch):
+                obj = link([cc(io.StringIO(src), arch, opt_level=2)])
+                data = obj.get_section('code').data
+                instructions = []
+                outs = FunctionOutputStream(instructions.append)
+                Disassembler(get_arch(arch)).disasm(data, outs)
+                self.assertGreater(len(data), 50)
+                self.assertEqual(
+                    [],
+                    [i for i in instructions if isinstance(i, DByte)])
+
+    def test_undecodable(self):
+        """ Data which is no instruction is emitted as bytes """
+        instructions = self.disasm(
+            'riscv', 'add x1, x2, x3\n', extra=bytes([0xff, 0xff]))
+        self.assertEqual(
+            [
+                (0x100, 'add x1, x2, x3'),
+                (0x104, '.byte 255'),
+                (0x105, '.byte 255'),
+            ],
+            instructions)
+
+    def test_decoding_tree(self):
+        """ Test that only instructions with matching bits are tried """
+        disassembler = Disassembler(get_arch('or1k'))
+        data = asm(io.StringIO('l.add r11, r3, r4\n'), 'or1k').get_section(
+            'code').data
+        size, tree = disassembler.trees[0]
+        self.assertEqual(4, size)
+        word = int.from_bytes(data, 'little')
+        decoders = tree.lookup(word)
+        self.assertEqual(
+            ['Add'], [d.instruction.__name__ for d in decoders])
+
+
+if __name__ == '__main__':
+    unittest.main()
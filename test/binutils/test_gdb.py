@@ -1,9 +1,16 @@
+import binascii
+import socket
+import threading
+import time
 import unittest
 
 from ppci.api import get_arch
+from ppci.arch.example import R3
 from ppci.binutils.dbg.debug_driver import DebugState
 from ppci.binutils.dbg.gdb.client import GdbDebugDriver
 from ppci.binutils.dbg.gdb.rsp import decoder, RspHandler
+from ppci.binutils.dbg.gdb.transport import TCP
+from ppci.binutils.dbg.memory_cache import MemoryCache
 
 
 class GdbDecoderTestCase(unittest.TestCase):
@@ -133,11 +140,30 @@ class GdbClientTestCase(unittest.TestCase):
         self.check_send(b'$z0,62,4#9E+')
 
     def test_read_mem(self):
-        """ Test reading of memory """
-        self.prepare_response(b'+$01027309#96')
+        """ Test reading of memory, which reads an aligned block """
+        block = bytes(range(64))
+        response = RspHandler.rsp_pack(block.hex()).encode('ascii')
+        self.prepare_response(b'+' + response)
         contents = self.gdbc.read_mem(101, 4)
-        self.assertEqual(bytes([1, 2, 0x73, 9]), contents)
-        self.check_send(b'$m 65,4#58+')
+        self.assertEqual(bytes([37, 38, 39, 40]), contents)
+        self.check_send(b'$m 40,40#81+')
+
+        # Second read is served from the cache:
+        contents = self.gdbc.read_mem(64, 8)
+        self.assertEqual(block[:8], contents)
+        self.check_send(b'$m 40,40#81+')
+        self.assertEqual(1, self.gdbc.memory_cache.hits)
+        self.assertEqual(1, self.gdbc.memory_cache.misses)
+
+    def test_memory_cache_options(self):
+        """ Test that the memory cache can be limited or turned off """
+        gdbc = GdbDebugDriver(
+            self.arch, transport=self.transport_mock, memory_cache=False)
+        self.assertIsNone(gdbc.memory_cache)
+        gdbc = GdbDebugDriver(
+            self.arch, transport=self.transport_mock,
+            memory_cache=[(0, 0x1000)])
+        self.assertEqual([(0, 0x1000)], gdbc.memory_cache.ranges)
 
     def test_write_mem(self):
         """ Test write to memory """
@@ -158,5 +184,213 @@ class GdbClientTestCase(unittest.TestCase):
         self.assertEqual(data, self.transport_mock.send_data)
 
 
+class MemoryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = (bytes(range(256)) * 4)[:1020]
+        self.reads = []
+        self.cache = MemoryCache(self.read, block_size=16, max_read=64)
+
+    def read(self, address, size):
+        self.reads.append((address, size))
+        if address + size > len(self.memory):
+            return
+        return self.memory[address:address + size]
+
+    def test_coalesce(self):
+        """ Test that adjacent missing blocks are read at once """
+        self.assertEqual(self.memory[5:45], self.cache.read(5, 40))
+        self.assertEqual([(0, 48)], self.reads)
+        self.assertEqual(self.memory[20:30], self.cache.read(20, 10))
+        self.assertEqual([(0, 48)], self.reads)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(3, self.cache.misses)
+
+    def test_max_read(self):
+        """ Test that large reads are split """
+        self.assertEqual(self.memory[0:100], self.cache.read(0, 100))
+        self.assertEqual([(0, 64), (64, 48)], self.reads)
+
+    def test_invalidate(self):
+        self.cache.read(0, 32)
+        self.cache.invalidate(20, 1)
+        self.assertEqual(1, len(self.cache))
+        self.cache.read(0, 32)
+        self.assertEqual([(0, 32), (16, 16)], self.reads)
+        self.cache.invalidate()
+        self.assertEqual(0, len(self.cache))
+
+    def test_unreadable(self):
+        """ Test exact reads when blocks cannot be read completely """
+        self.assertEqual(
+            self.memory[1016:1020], self.cache.read(1016, 4))
+        self.assertEqual([(1008, 16), (1016, 4)], self.reads)
+        self.assertIsNone(self.cache.read(1016, 8))
+
+    def test_ranges(self):
+        """ Test that memory outside the cached ranges is read exactly """
+        self.cache.ranges = [(0, 40)]
+        self.assertEqual(self.memory[4:8], self.cache.read(4, 4))
+        self.assertEqual(self.memory[30:34], self.cache.read(30, 4))
+        self.assertEqual(self.memory[30:34], self.cache.read(30, 4))
+        self.cache.prefetch(0, 64)
+        self.assertEqual([(0, 16), (30, 4), (30, 4), (16, 16)], self.reads)
+        self.assertEqual(2, len(self.cache))
+
+
+class GdbStubServer:
+    """ Minimal gdb server, serving memory and registers over tcp """
+    def __init__(self, memory, registers):
+        self.memory = bytearray(memory)
+        self.registers = registers
+        self.packets = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('localhost', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.start()
+
+    def serve(self):
+        conn, _ = self.sock.accept()
+        buffer = b''
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b'#' in buffer:
+                    start = buffer.index(b'$')
+                    end = buffer.index(b'#', start)
+                    if len(buffer) < end + 3:
+                        break
+                    packet = buffer[start + 1:end].decode('ascii')
+                    buffer = buffer[end + 3:]
+                    conn.send(b'+')
+                    self.packets.append(packet)
+                    reply = self.handle(packet)
+                    conn.send(RspHandler.rsp_pack(reply).encode('ascii'))
+        self.sock.close()
+
+    def handle(self, packet):
+        if packet.startswith('m'):
+            address, size = (int(x, 16) for x in packet[1:].split(','))
+            if address + size > len(self.memory):
+                return 'E01'
+            return self.memory[address:address + size].hex()
+        elif packet.startswith('M'):
+            header, data = packet[1:].split(':')
+            address, size = (int(x, 16) for x in header.split(','))
+            self.memory[address:address + size] = bytes.fromhex(data)
+            return 'OK'
+        elif packet == 'g':
+            return binascii.b2a_hex(self.registers).decode('ascii')
+        elif packet in ('s', 'c'):
+            return 'S05'
+        return ''
+
+
+class GdbStubServerTestCase(unittest.TestCase):
+    """ Test the gdb client against a local gdb server """
+    arch = get_arch('example')
+
+    def setUp(self):
+        memory = (bytes(range(256)) * 2)[:500]
+        registers = bytes(range(len(self.arch.gdb_registers) * 4))
+        self.server = GdbStubServer(memory, registers)
+        self.gdbc = GdbDebugDriver(self.arch, transport=TCP(self.server.port))
+        self.gdbc.connect()
+        self.gdbc.status = DebugState.STOPPED
+
+    def tearDown(self):
+        self.gdbc.disconnect()
+        self.server.thread.join()
+
+    def wait_stopped(self):
+        for _ in range(500):
+            if self.gdbc.status == DebugState.STOPPED:
+                return
+            time.sleep(0.01)
+        self.fail('Target did not stop')
+
+    def test_memory(self):
+        packets = self.server.packets
+        self.assertEqual(bytes(range(10, 30)), self.gdbc.read_mem(10, 20))
+        self.assertEqual(bytes(range(32, 40)), self.gdbc.read_mem(32, 8))
+        self.assertEqual(['m 0,40'], packets)
+
+        # Writing invalidates the cached block:
+        self.gdbc.write_mem(12, bytes([1, 2]))
+        self.assertEqual(bytes([1, 2, 14]), self.gdbc.read_mem(12, 3))
+        self.assertEqual(['m 0,40', 'M c,2:0102', 'm 0,40'], packets)
+
+        # The last bytes of memory cannot be read as a full block:
+        self.assertEqual(bytes([242, 243]), self.gdbc.read_mem(498, 2))
+        self.assertEqual(['m 1c0,40', 'm 1f2,2'], packets[3:])
+
+    def test_uncached_memory(self):
+        """ Test memory reads without a memory cache """
+        self.gdbc.memory_cache = None
+        self.assertEqual(bytes(range(10, 30)), self.gdbc.read_mem(10, 20))
+        self.assertEqual(bytes(range(10, 30)), self.gdbc.read_mem(10, 20))
+        self.gdbc.write_mem(12, bytes([1, 2]))
+        self.assertEqual(
+            ['m a,14', 'm a,14', 'M c,2:0102'], self.server.packets)
+
+    def test_uncached_range(self):
+        """ Test that memory outside the cached ranges is read exactly """
+        self.gdbc.memory_cache.ranges = [(0, 0x100)]
+        self.assertEqual(bytes([4, 5, 6, 7]), self.gdbc.read_mem(0x104, 4))
+        self.assertEqual(bytes([4, 5, 6, 7]), self.gdbc.read_mem(0x104, 4))
+        self.assertEqual(bytes([4, 5, 6, 7]), self.gdbc.read_mem(4, 4))
+        self.assertEqual(bytes([4, 5, 6, 7]), self.gdbc.read_mem(4, 4))
+        self.assertEqual(
+            ['m 104,4', 'm 104,4', 'm 0,40'], self.server.packets)
+
+    def test_registers(self):
+        """ Test that all registers are fetched with a single packet """
+        registers = self.arch.gdb_registers
+        self.assertEqual(0x03020100, self.gdbc.get_pc())
+        values = self.gdbc.get_registers(registers)
+        self.assertEqual(0x07060504, values[registers[1]])
+        self.assertEqual(['g'], self.server.packets)
+
+    def test_missing_register(self):
+        """ Test that a register missing from the target is an error """
+        self.arch.fp = R3
+        self.addCleanup(delattr, self.arch, 'fp')
+        with self.assertRaises(ValueError):
+            self.gdbc.get_fp()
+        self.assertEqual(['g'], self.server.packets)
+
+    def test_step(self):
+        """ Test that caches are refreshed when the target runs """
+        self.gdbc.read_mem(0, 4)
+        self.gdbc.get_pc()
+        self.gdbc.step()
+        self.wait_stopped()
+        self.gdbc.read_mem(0, 4)
+        self.assertEqual(
+            ['m 0,40', 'g', 's', 'g', 'm 0,40'], self.server.packets)
+
+    def test_frame_prefetch(self):
+        """ Test that the frame is prefetched when the target stops """
+        self.arch.fp = self.arch.gdb_registers[2]
+        self.addCleanup(delattr, self.arch, 'fp')
+        self.server.registers = bytes(8) + (0x100).to_bytes(4, 'little')
+        self.gdbc.step()
+        self.wait_stopped()
+        self.assertEqual(['s', 'g'], self.server.packets)
+
+        # Prefetching is off by default:
+        self.gdbc.frame_prefetch = 128
+        self.gdbc.step()
+        self.wait_stopped()
+        self.assertEqual(0x100, self.gdbc.get_fp())
+        self.gdbc.read_mem(0x100, 4)
+        self.assertEqual(
+            ['s', 'g', 's', 'g', 'm c0,80'], self.server.packets)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,6 +7,7 @@ from ppci.utils.tree import Tree, from_string
 from ppci.codegen import burg
 from ppci.codegen.burg import BurgSystem
 from ppci.codegen.instructionselector import TreeSelector
+from ppci.codegen.instructionselector import GeneratedTreeSelector
 
 brg_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'sample4.brg')
 
@@ -180,6 +181,64 @@ class TreeMatchingTestCase(unittest.TestCase):
         v = selector.gen(context, tree)
         self.assertEqual((1, '+', 2), v)
 
+        # The generated selector must select the same rules:
+        labels = [t.state.labels for t in (tree,) + tree.children]
+        selector = GeneratedTreeSelector(system)
+        v = selector.gen(context, tree)
+        self.assertEqual((1, '+', 2), v)
+        self.assertEqual(
+            labels, [t.state.labels for t in (tree,) + tree.children])
+
+    def test_generated_selector(self):
+        """ Test a selector generated for nested patterns """
+        class Ctx:
+            pass
+        context = Ctx()
+        tree = Tree(
+            'ADD', Tree('VAL', value=1),
+            Tree('MUL', Tree('VAL', value=2), Tree('VAL', value=3)))
+        system = BurgSystem()
+        for terminal in ['ADD', 'MUL', 'VAL']:
+            system.add_terminal(terminal)
+        system.add_rule(
+            'stm', Tree('reg'), 0, None, lambda ctx, tree, c0: c0)
+        system.add_rule(
+            'reg',
+            Tree('ADD', Tree('reg'), Tree('reg')),
+            1,
+            None,
+            lambda ctx, tree, c0, c1: ('add', c0, c1))
+        system.add_rule(
+            'reg',
+            Tree('ADD', Tree('reg'), Tree('MUL', Tree('reg'), Tree('reg'))),
+            1,
+            None,
+            lambda ctx, tree, c0, c1, c2: ('muladd', c0, c1, c2))
+        system.add_rule(
+            'reg',
+            Tree('MUL', Tree('reg'), Tree('reg')),
+            1,
+            None,
+            lambda ctx, tree, c0, c1: ('mul', c0, c1))
+        system.add_rule(
+            'reg',
+            Tree('VAL'),
+            1,
+            lambda tree: tree.value < 3,
+            lambda ctx, tree: tree.value)
+        system.add_rule(
+            'reg',
+            Tree('VAL'),
+            2,
+            None,
+            lambda ctx, tree: ('big', tree.value))
+        system.check()
+        selector = GeneratedTreeSelector(system)
+        v = selector.gen(context, tree)
+        self.assertEqual(('muladd', 1, 2, ('big', 3)), v)
+        self.assertIn(
+            'def label_ADD(tree):', system.selector_namespace['source'])
+
 
 if __name__ == '__main__':
     unittest.main()
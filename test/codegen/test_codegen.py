@@ -4,12 +4,14 @@ import unittest
 import io
 from ppci import ir
 from ppci.irutils import Builder, Writer
+from ppci.codegen import CodeGenerator, warm_up
 from ppci.codegen.dagsplit import DagSplitter
+from ppci.codegen.instructionselector import BurgSystemCache
 from ppci.codegen.irdag import SelectionGraphBuilder
 from ppci.codegen.irdag import FunctionInfo, prepare_function_info
 from ppci.arch.example import ExampleArch
 from ppci.binutils.debuginfo import DebugDb
-from ppci.api import get_arch
+from ppci.api import get_arch, c_to_ir, ir_to_object
 
 
 def print_module(m):
@@ -189,5 +191,62 @@ class IrDagTestCase(unittest.TestCase):
         # self.assertTrue(sg_value.vreg)
 
 
+class BurgSystemCacheTestCase(unittest.TestCase):
+    """ Test re-use of the instruction selection tables """
+    def test_reuse(self):
+        arch = ExampleArch()
+        cache = BurgSystemCache()
+        system1 = cache.get(arch, (1, 1, 1))
+        self.assertEqual(1, cache.misses)
+        system2 = cache.get(ExampleArch(), (1, 1, 1))
+        self.assertIs(system1, system2)
+        self.assertEqual(1, cache.hits)
+        system3 = cache.get(arch, (10, 1, 1))
+        self.assertIsNot(system1, system3)
+        self.assertEqual(2, len(cache))
+        self.assertIn('1 re-used', cache.statistics())
+
+    def test_code_generator_reuse(self):
+        """ Code generators for the same target share the tables """
+        arch = get_arch('msp430')
+        warm_up(arch)
+        generator1 = CodeGenerator(arch, optimize_for='speed')
+        generator2 = CodeGenerator(arch, optimize_for='speed')
+        self.assertIs(
+            generator1.instruction_selector.sys,
+            generator2.instruction_selector.sys)
+
+
+class ParallelCodeGenerationTestCase(unittest.TestCase):
+    """ Test generation of functions in several processes """
+    source = """
+    int g = 2;
+    int add(int a, int b) { return a + b; }
+    int mul(int a, int b) { return a * b * g; }
+    int calc(int x) {
+        int i, s = 0;
+        for (i = 0; i < x; i++) { s = add(s, mul(i, x)); }
+        return s;
+    }
+    """
+
+    def test_same_as_serial(self):
+        """ Parallel generation must give the same object as serial """
+        for arch in ['arm', 'x86_64']:
+            with self.subTest(arch=arch):
+                ir_module = c_to_ir(io.StringIO(self.source), arch)
+                obj1 = ir_to_object([ir_module], arch)
+                obj2 = ir_to_object([ir_module], arch, jobs=2)
+                self.assertEqual(obj1, obj2)
+
+    def test_debug_is_serial(self):
+        """ Debug information is numbered globally, so is not parallel """
+        ir_module = c_to_ir(io.StringIO(self.source), 'arm')
+        self.assertTrue(
+            CodeGenerator.can_generate_in_parallel(ir_module, False))
+        self.assertFalse(
+            CodeGenerator.can_generate_in_parallel(ir_module, True))
+
+
 if __name__ == '__main__':
     unittest.main()
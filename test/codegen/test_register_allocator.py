@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 from ppci.codegen.registerallocator import GraphColoringRegisterAllocator
+from ppci.codegen.interferencegraph import BitMatrixInterferenceGraph
 from ppci.api import get_arch
 from ppci.arch.arch import Frame
 from ppci.arch.example import Def, Use, Add, Mov, R0, R1, ExampleRegister
@@ -168,5 +169,21 @@ class GraphColoringRegisterAllocatorTestCase(unittest.TestCase):
         assert frame.is_used(xmm6, arch.info.alias)
 
 
+class BitMatrixRegisterAllocatorTestCase(
+        GraphColoringRegisterAllocatorTestCase):
+    """ Run the register allocator tests with a bit matrix graph """
+    def setUp(self):
+        super().setUp()
+        self.register_allocator.bit_matrix_threshold = 0
+
+    def test_bit_matrix_used(self):
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        f.instructions.append(Def(t1))
+        f.instructions.append(Use(t1))
+        self.register_allocator.alloc_frame(f)
+        self.assertIsInstance(f.ig, BitMatrixInterferenceGraph)
+
+
 if __name__ == '__main__':
     unittest.main()
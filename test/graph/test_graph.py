@@ -2,7 +2,9 @@
 
 import unittest
 from ppci.graph import Graph, Node, DiGraph, DiNode, MaskableGraph
+from ppci.graph import BitMatrixGraph
 from ppci.codegen.interferencegraph import InterferenceGraph
+from ppci.codegen.interferencegraph import BitMatrixInterferenceGraph
 from ppci.codegen.flowgraph import FlowGraph
 from ppci.arch.generic_instructions import Nop
 from ppci.arch.example import Def, Use, DefUse, Add, Cmp, Use3, ExampleRegister
@@ -103,6 +105,71 @@ class GraphTestCase(unittest.TestCase):
         self.assertEqual(1, n1.degree)
 
 
+class BitMatrixGraphTestCase(unittest.TestCase):
+    def test_edge(self):
+        g = BitMatrixGraph()
+        n1 = Node(g)
+        n2 = Node(g)
+        n3 = Node(g)
+        g.add_edge(n1, n2)
+        g.add_edge(n1, n1)
+        self.assertTrue(g.has_edge(n2, n1))
+        self.assertFalse(g.has_edge(n1, n1))
+        self.assertFalse(g.has_edge(n2, n3))
+        self.assertEqual(1, g.get_number_of_edges())
+        g.del_edge(n1, n2)
+        self.assertFalse(g.has_edge(n1, n2))
+        g.add_edges([n1, n2], [n3])
+        self.assertEqual({n1, n2}, n3.adjecent)
+        g.del_node(n3)
+        self.assertEqual(0, n1.degree)
+
+    def test_clique(self):
+        g = BitMatrixGraph()
+        nodes = [Node(g) for _ in range(5)]
+        g.add_clique(nodes[:4])
+        self.assertEqual(6, g.get_number_of_edges())
+        self.assertEqual(3, nodes[0].degree)
+        self.assertEqual(0, nodes[4].degree)
+        self.assertEqual(nodes[1:4], list(nodes[0].adjecent))
+
+    def test_node_set(self):
+        g = BitMatrixGraph()
+        n1, n2, n3, n4 = [Node(g) for _ in range(4)]
+        g.add_edge(n1, n2)
+        g.add_edge(n3, n4)
+        union = n1.adjecent | n4.adjecent
+        self.assertEqual([n2, n3], list(union))
+        self.assertIn(n3, union)
+        self.assertNotIn(n1, union)
+        self.assertEqual(2, len(union))
+        self.assertEqual({n2}, union - n4.adjecent)
+        self.assertEqual([n2, n3, n1], list(union | [n1]))
+
+    def test_degree_mask_unmask_combine(self):
+        g = BitMatrixGraph()
+        n1 = Node(g)
+        n2 = Node(g)
+        n3 = Node(g)
+        n4 = Node(g)
+        g.add_edge(n1, n2)
+        g.add_edge(n1, n3)
+        g.add_edge(n1, n4)
+        g.add_edge(n2, n4)
+        self.assertEqual(3, n1.degree)
+        g.mask_node(n2)
+        g.mask_node(n3)
+        g.mask_node(n4)
+        self.assertTrue(g.is_masked(n2))
+        self.assertEqual(0, n1.degree)
+        g.unmask_node(n3)
+        g.combine(n3, n4)
+        g.combine(n3, n2)
+        self.assertEqual(1, n1.degree)
+        self.assertEqual({n1}, n3.adjecent)
+        self.assertEqual([n1, n3], list(g))
+
+
 class DigraphTestCase(unittest.TestCase):
     def test_successor(self):
         g = DiGraph()
@@ -305,6 +372,44 @@ class InterferenceGraphTestCase(unittest.TestCase):
         self.assertEqual({x}, b2.live_out)
         self.assertEqual({x}, b3.live_out)
 
+    def test_register_bitsets(self):
+        """ Test the numbering of registers in bitsets """
+        a = ExampleRegister('a')
+        b = ExampleRegister('b')
+        cfg = FlowGraph([Def(a)])
+        mask = cfg.mask_of([a, b])
+        self.assertEqual(0b11, mask)
+        self.assertEqual(0b10, cfg.mask_of([b]))
+        self.assertEqual({a, b}, cfg.registers_of(mask))
+        self.assertEqual(set(), cfg.registers_of(0))
+
+    def test_postorder(self):
+        """ Successors come before their predecessors in postorder """
+        x = ExampleRegister('x')
+        i3 = Use(x)
+        i2 = Nop(jumps=[i3])
+        i1 = Def(x, jumps=[i2])
+        cfg = FlowGraph([i1, i2, i3])
+        order = cfg.postorder()
+        self.assertEqual(
+            [cfg.get_node(i3), cfg.get_node(i2), cfg.get_node(i1)], order)
+
+    def test_live_ranges(self):
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        i1 = Def(t1)
+        i2 = Def(t2)
+        i3 = Use(t1)
+        i4 = Use(t2)
+        cfg = FlowGraph([i1, i2, i3, i4])
+        cfg.calculate_liveness()
+        self.assertEqual({t1}, i2.live_in)
+        self.assertEqual({t1, t2}, i2.live_out)
+        ranges = cfg.live_ranges
+        self.assertEqual([(i1, i2), (i2, i3)], ranges[t1])
+        self.assertEqual([(i2, i3), (i3, i4)], ranges[t2])
+        self.assertIs(ranges, cfg.live_ranges)
+
     def test_combine(self):
         t1 = ExampleRegister('t1')
         t2 = ExampleRegister('t2')
@@ -328,6 +433,34 @@ class InterferenceGraphTestCase(unittest.TestCase):
         # For repr called:
         self.assertTrue(str(ig.get_node(t4)))
 
+    def test_bit_matrix(self):
+        """ Test that both graph types have the same edges """
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        t3 = ExampleRegister('t3')
+        t4 = ExampleRegister('t4')
+        i3 = DefUse(t3, t2)
+        instrs = [
+            Def(t1), Def(t2), i3, DefUse(t4, t1, jumps=[i3]), Use3(t1, t3, t4)
+        ]
+        cfg = FlowGraph(instrs)
+        cfg.calculate_liveness()
+        ig1 = InterferenceGraph()
+        ig1.calculate_interference(cfg)
+        ig2 = BitMatrixInterferenceGraph()
+        ig2.calculate_interference(cfg)
+        self.assertEqual(
+            ig1.get_number_of_edges(), ig2.get_number_of_edges())
+        temps = [t1, t2, t3, t4]
+        for ta in temps:
+            for tb in temps:
+                self.assertEqual(
+                    ig1.interfere(ta, tb), ig2.interfere(ta, tb))
+        for tmp in temps:
+            self.assertEqual(
+                {frozenset(n.temps) for n in ig1.get_node(tmp).adjecent},
+                {frozenset(n.temps) for n in ig2.get_node(tmp).adjecent})
+
 
 if __name__ == '__main__':
     unittest.main()
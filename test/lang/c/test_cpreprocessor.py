@@ -1,10 +1,14 @@
 import unittest
 import io
+import os
+import tempfile
 from unittest import mock
 from ppci.common import CompilerError
 from ppci.lang.c import CPreProcessor
 from ppci.lang.c import COptions
 from ppci.lang.c import CTokenPrinter
+from ppci.lang.c.preprocessor import token_cache, find_include_guard
+from ppci.lang.c.lexer import lex_text
 
 
 class CPreProcessorTestCase(unittest.TestCase):
@@ -456,6 +460,18 @@ class CPreProcessorTestCase(unittest.TestCase):
         2"""
         self.preprocess(src, expected)
 
+    def test_line_on_last_line(self):
+        """ Test __LINE__ on a last line without a trailing newline.
+
+        The character based lexer reported the row after the last line
+        here, the line based lexer reports the row of the line itself.
+        """
+        src = "a\n__LINE__ __LINE__"
+        expected = """# 1 "dummy.t"
+a
+2 2"""
+        self.preprocess(src, expected)
+
     @mock.patch("time.strftime", lambda fmt: '"mastah"')
     def test_builtin_time_macros(self):
         """ Test builtin macros __DATE__ and __TIME__ """
@@ -631,5 +647,81 @@ class CPreProcessorTestCase(unittest.TestCase):
         self.preprocess(src, expected)
 
 
+class IncludeOnceTestCase(unittest.TestCase):
+    """ Test the handling of files which are included multiple times """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.coptions = COptions()
+        self.coptions.add_include_path(self.directory.name)
+        token_cache.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_file(self, filename, src):
+        with open(os.path.join(self.directory.name, filename), "w") as f:
+            f.write(src)
+
+    def preprocess(self, src):
+        preprocessor = CPreProcessor(self.coptions)
+        tokens = preprocessor.process_file(io.StringIO(src), "main.c")
+        f = io.StringIO()
+        CTokenPrinter().dump(tokens, file=f)
+        return f.getvalue()
+
+    def test_include_guard(self):
+        self.add_file("g.h", "#ifndef G_H\n#define G_H\nint g;\n#endif\n")
+        src = '#include "g.h"\n#include "g.h"\n#include "g.h"\n'
+        with mock.patch.object(
+            token_cache, "get", wraps=token_cache.get
+        ) as get_mock:
+            output = self.preprocess(src)
+        self.assertEqual(1, output.count("int g;"))
+        self.assertEqual(1, get_mock.call_count)
+
+    def test_pragma_once(self):
+        self.add_file("o.h", "#pragma once\nint o;\n")
+        src = '#include "o.h"\n#include "o.h"\n'
+        output = self.preprocess(src)
+        self.assertEqual(1, output.count("int o;"))
+
+    def test_no_include_guard(self):
+        self.add_file("n.h", "#ifndef N_H\n#define N_H\n#endif\nint n;\n")
+        src = '#include "n.h"\n#include "n.h"\n'
+        output = self.preprocess(src)
+        self.assertEqual(2, output.count("int n;"))
+
+    def test_token_cache(self):
+        """ Test that headers are lexed once for all translation units """
+        self.add_file("t.h", "int t = __LINE__;\nint u = __LINE__;\n")
+        src = '#include "t.h"\n'
+        with mock.patch.object(
+            token_cache, "lex_file", wraps=token_cache.lex_file
+        ) as lex_mock:
+            output1 = self.preprocess(src)
+            output2 = self.preprocess(src)
+        self.assertEqual(1, lex_mock.call_count)
+        self.assertEqual(output1, output2)
+        self.assertIn("int t = 1;", output1)
+        self.assertIn("int u = 2;", output1)
+
+    def test_find_include_guard(self):
+        coptions = COptions()
+        test_cases = [
+            ("#ifndef A\n#define A\n#endif\n", "A"),
+            ("\n#if !defined(B)\n#if C\n#endif\n#endif\n\n", "B"),
+            ("#if !defined C\n#endif\n", "C"),
+            ("#ifndef D\n#else\n#endif\n", None),
+            ("#ifndef E\n#endif\n#ifndef F\n#endif\n", None),
+            ("int x;\n#ifndef G\n#endif\n", None),
+            ("", None),
+        ]
+        for src, guard in test_cases:
+            with self.subTest(src=src):
+                tokens = lex_text(src, coptions)
+                self.assertEqual(guard, find_include_guard(tokens))
+
+
 if __name__ == "__main__":
     unittest.main()
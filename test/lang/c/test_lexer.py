@@ -2,7 +2,7 @@ import io
 import unittest
 
 from ppci.common import CompilerError
-from ppci.lang.c import CLexer, lexer
+from ppci.lang.c import CLexer, FastCLexer, lexer
 from ppci.lang.c.lexer import SourceFile
 from ppci.lang.c.options import COptions
 from ppci.lang.c.utils import cnum
@@ -189,5 +189,69 @@ class CLexerTestCase(unittest.TestCase):
             self.assertEqual(src, tokens[0].val)
 
 
+class FastCLexerTestCase(CLexerTestCase):
+    """ Run the same tests with the fast lexer """
+
+    def setUp(self):
+        coptions = COptions()
+        self.lexer = FastCLexer(coptions)
+        coptions.enable("trigraphs")
+
+
+class FastCLexerEquivalenceTestCase(unittest.TestCase):
+    """ Check that the fast lexer produces the same tokens as the
+    character based lexer.
+    """
+
+    snippets = [
+        "",
+        "\n\n",
+        "a /* \n */ b\n",
+        "x\n/* trailing comment */",
+        "#define X a \\\n  b\n",
+        "\tint\tx;\n",
+        '"multi\nline" L"s" L\'a\' xL\'b\'',
+        "0x1f 0b101 017 089 1.5e+3 .5 .. ... 1e5 0x1.5p3 12ULL\n",
+        "<<= >>= -> ++ -- ## # ~= \\ \f;\n",
+        "a??/\n??/\nb ???= ??\n",
+        "a\\\r\nb",
+        "// comment \\\n continued\nx",
+    ]
+
+    def lex(self, lexer_class, src):
+        coptions = COptions()
+        coptions.enable("trigraphs")
+        source_file = SourceFile("a.h")
+        tokens = lexer_class(coptions).lex(io.StringIO(src), source_file)
+        return [
+            (t.typ, t.val, t.space, t.first, t.loc.row, t.loc.col)
+            for t in tokens
+        ]
+
+    @staticmethod
+    def position(loc):
+        return None if loc is None else (loc.row, loc.col)
+
+    def test_same_tokens(self):
+        for src in self.snippets:
+            with self.subTest(src=src):
+                self.assertEqual(
+                    self.lex(CLexer, src), self.lex(FastCLexer, src)
+                )
+
+    def test_same_errors(self):
+        for src in ["'ab'", '"\\q"', "/* open", "'"]:
+            with self.subTest(src=src):
+                with self.assertRaises(CompilerError) as cm1:
+                    self.lex(CLexer, src)
+                with self.assertRaises(CompilerError) as cm2:
+                    self.lex(FastCLexer, src)
+                self.assertEqual(cm1.exception.msg, cm2.exception.msg)
+                self.assertEqual(
+                    self.position(cm1.exception.loc),
+                    self.position(cm2.exception.loc),
+                )
+
+
 if __name__ == "__main__":
     unittest.main()
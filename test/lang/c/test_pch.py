@@ -0,0 +1,139 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from ppci.lang.c import CBuilder, COptions
+from ppci.lang.c import pch
+from ppci.lang.c.preprocessor import token_cache
+from ppci.arch.example import ExampleArch
+from ppci.irutils import print_module
+
+
+class HeaderPrefixTestCase(unittest.TestCase):
+    """ Test which leading lines of a file are a header prefix """
+
+    def prefix_length(self, src):
+        return pch.header_prefix_length(src.split("\n"))
+
+    def test_includes(self):
+        src = '#include <a.h>\n\n// b\n#include "b.h"\nint x;\n'
+        self.assertEqual(4, self.prefix_length(src))
+
+    def test_defines(self):
+        src = "#define A 1\n#include <a.h>\n#define B 2\nint x;\n"
+        self.assertEqual(3, self.prefix_length(src))
+
+    def test_no_includes(self):
+        self.assertEqual(0, self.prefix_length("#define A 1\nint x;\n"))
+
+    def test_conditional(self):
+        src = "#include <a.h>\n#ifdef A\n#include <b.h>\n#endif\n"
+        self.assertEqual(1, self.prefix_length(src))
+
+    def test_continuation(self):
+        src = "#include <a.h>\n#define A \\\n  1\n"
+        self.assertEqual(1, self.prefix_length(src))
+
+    def test_block_comment(self):
+        src = "#include <a.h>\n#include <b.h> /* a\n#define A 1 */\n"
+        self.assertEqual(1, self.prefix_length(src))
+
+
+class PrecompiledHeaderTestCase(unittest.TestCase):
+    """ Test the loading and storing of precompiled headers """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.include_dir = os.path.join(self.directory.name, "include")
+        self.pch_dir = os.path.join(self.directory.name, "pch")
+        os.mkdir(self.include_dir)
+        self.arch = ExampleArch()
+        token_cache.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_file(self, filename, src):
+        with open(os.path.join(self.include_dir, filename), "w") as f:
+            f.write(src)
+
+    def compile(self, src, use_pch=True):
+        coptions = COptions()
+        coptions.add_include_path(self.include_dir)
+        if use_pch:
+            coptions.use_precompiled_headers(self.pch_dir)
+        builder = CBuilder(self.arch.info, coptions)
+        ir_module = builder.build(io.StringIO(src), "main.c")
+        f = io.StringIO()
+        print_module(ir_module, file=f)
+        return f.getvalue(), builder.preprocessor
+
+    def test_reuse(self):
+        self.add_file(
+            "a.h",
+            "#define A 3\ntypedef int a_t;\nstruct s { int x; };\n"
+            "static int twice(int x) { return 2 * x; }\n",
+        )
+        src = (
+            "#include <a.h>\n"
+            "a_t f(struct s *p) { return twice(p->x + A) + __LINE__; }\n"
+        )
+        expected, _ = self.compile(src, use_pch=False)
+        with mock.patch.object(
+            pch, "precompile_header", wraps=pch.precompile_header
+        ) as precompile_mock:
+            output1, _ = self.compile(src)
+            output2, preprocessor = self.compile(src)
+        self.assertEqual(1, precompile_mock.call_count)
+        self.assertEqual(expected, output1)
+        self.assertEqual(expected, output2)
+        self.assertEqual(
+            [os.path.join(self.include_dir, "a.h")],
+            preprocessor.included_files,
+        )
+
+    def test_other_body(self):
+        """ Test that another file with the same prefix uses the header """
+        self.add_file("b.h", "#define B 7\nint b(int);\n")
+        self.compile("#include <b.h>\nint f(void) { return b(B); }\n")
+        with mock.patch.object(pch, "precompile_header") as precompile_mock:
+            output, _ = self.compile(
+                "#include <b.h>\nint g(void) { return b(B + 1); }\n"
+            )
+        self.assertFalse(precompile_mock.called)
+        self.assertIn("function i32 g()", output)
+
+    def test_changed_header(self):
+        self.add_file("c.h", "#define C 1\n")
+        src = "#include <c.h>\nint c(void) { return C; }\n"
+        output1, _ = self.compile(src)
+
+        # Make sure the modification time changes:
+        time.sleep(0.01)
+        self.add_file("c.h", "#define C 22\n")
+        output2, _ = self.compile(src)
+        self.assertNotEqual(output1, output2)
+        self.assertEqual(self.compile(src, use_pch=False)[0], output2)
+
+    def test_options_key(self):
+        coptions = COptions()
+        coptions.add_define("D", "1")
+        key1 = pch.options_key(coptions, self.arch.info)
+        coptions.add_define("E", "1")
+        key2 = pch.options_key(coptions, self.arch.info)
+        self.assertNotEqual(key1, key2)
+
+    def test_prefix_error(self):
+        """ A header which cannot be compiled on its own is not used """
+        self.add_file("e.h", "struct e {\n")
+        src = "#include <e.h>\nint x; };\nstruct e e1;\n"
+        expected, _ = self.compile(src, use_pch=False)
+        output, _ = self.compile(src)
+        self.assertEqual(expected, output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
 import unittest
+from unittest import mock
 from unittest.mock import Mock
 import io
 from ppci import api, irutils
-from ppci.lang.python import load_py, python_to_ir
+from ppci.graph import relooper
+from ppci.lang.python import load_py, python_to_ir, ir_to_python
 from ppci.utils.reporting import HtmlReportGenerator
 
 
@@ -130,5 +132,158 @@ class PythonToIrCompilerTestCase(unittest.TestCase):
         self.do(src6)
 
 
+ir2py_src = """
+int fib(int n) {
+    int a = 0, b = 1;
+    while (n > 0) {
+        int t = a + b;
+        a = b;
+        b = t;
+        n--;
+    }
+    return a;
+}
+
+int collatz(int n) {
+    int steps = 0;
+    while (n != 1) {
+        if (n % 2 == 0) {
+            n = n / 2;
+        } else {
+            n = 3 * n + 1;
+        }
+        steps++;
+    }
+    return steps;
+}
+"""
+
+
+class IrToPythonTestCase(unittest.TestCase):
+    """ Check the generation of python code from ir code """
+    def compile(self, level):
+        ir_module = api.c_to_ir(io.StringIO(ir2py_src), 'arm')
+        api.optimize(ir_module, level=level)
+        f = io.StringIO()
+        ir_to_python([ir_module], f)
+        code = f.getvalue()
+        namespace = {}
+        exec(code, namespace)
+        return code, namespace
+
+    def check_functions(self, namespace):
+        self.assertEqual(55, namespace['fib'](10))
+        self.assertEqual(111, namespace['collatz'](27))
+
+    def test_structured(self):
+        for level in (0, 2):
+            code, namespace = self.compile(level)
+            self.assertNotIn('_irpy_current_block', code)
+            self.check_functions(namespace)
+
+    def test_fallback(self):
+        with mock.patch.object(
+                relooper, 'find_structure', side_effect=ValueError):
+            for level in (0, 2):
+                code, namespace = self.compile(level)
+                self.assertIn('_irpy_current_block = 0', code)
+                self.check_functions(namespace)
+
+
+wrap_src = """
+int add(int a, int b) { return a + b; }
+unsigned char low_byte(int x) { return x; }
+int widen(unsigned char a, unsigned char b) { return (a & 15) | (b >> 2); }
+long mul(short a, short b) { return (long)a * b; }
+"""
+
+
+class IntegerWrapTestCase(unittest.TestCase):
+    """ Check that integers are wrapped around only when required """
+    def setUp(self):
+        ir_module = api.c_to_ir(io.StringIO(wrap_src), 'x86_64')
+        f = io.StringIO()
+        ir_to_python([ir_module], f)
+        self.code = f.getvalue()
+        self.namespace = {}
+        exec(self.code, self.namespace)
+
+    def function_code(self, name):
+        start = self.code.index('def {}('.format(name))
+        return self.code[start:self.code.index('\n\n', start)]
+
+    def test_overflow(self):
+        self.assertEqual(-2**31, self.namespace['add'](2**31 - 1, 1))
+        self.assertIn('0xffffffff', self.function_code('add'))
+
+    def test_truncate(self):
+        self.assertEqual(255, self.namespace['low_byte'](-1))
+        self.assertIn('& 0xff', self.function_code('low_byte'))
+
+    def test_no_correction(self):
+        self.assertEqual(63, self.namespace['widen'](255, 255))
+        self.assertEqual(2**30, self.namespace['mul'](-2**15, -2**15))
+        self.assertNotIn('0xff', self.function_code('widen'))
+        self.assertNotIn('0xff', self.function_code('mul'))
+
+
+data_src = """
+char small[] = "abc";
+int big[5000] = {1, 2, 3, [4999] = 7};
+int get_big(int i) { return big[i]; }
+char get_small(int i) { return small[i]; }
+"""
+
+
+class InitialDataTestCase(unittest.TestCase):
+    """ Check the generation of initialized global data """
+    def test_data(self):
+        ir_module = api.c_to_ir(io.StringIO(data_src), 'x86_64')
+        f = io.StringIO()
+        ir_to_python([ir_module], f)
+        code = f.getvalue()
+        namespace = {}
+        exec(code, namespace)
+        self.assertEqual(3, namespace['get_big'](2))
+        self.assertEqual(0, namespace['get_big'](3))
+        self.assertEqual(7, namespace['get_big'](4999))
+        self.assertEqual(ord('c'), namespace['get_small'](2))
+        self.assertIn("_irpy_memory.extend(b'abc\\x00')", code)
+        self.assertIn('_irpy_blob(', code)
+        self.assertLess(len(code), 20000)
+
+
+stack_src = """
+int fill(int n) {
+  char buf[4096];
+  buf[n] = n;
+  return buf[n] + (n > 0 ? fill(n - 1) : 0);
+}
+"""
+
+
+class StackLimitTestCase(unittest.TestCase):
+    """ Check that the stack of the generated code is limited """
+    def compile(self, **kwargs):
+        ir_module = api.c_to_ir(io.StringIO(stack_src), 'x86_64')
+        f = io.StringIO()
+        ir_to_python([ir_module], f, **kwargs)
+        namespace = {}
+        exec(f.getvalue(), namespace)
+        return namespace
+
+    def test_stack_limit(self):
+        namespace = self.compile(stack_limit=0x10000)
+        self.assertEqual(0x10000, namespace['HEAP_START'])
+        self.assertEqual(55, namespace['fill'](10))
+        with self.assertRaises(MemoryError):
+            namespace['fill'](20)
+
+    def test_default_stack_limit(self):
+        namespace = self.compile()
+        self.assertEqual(0x400000, len(namespace['_irpy_memory']))
+        self.assertEqual(210, namespace['fill'](20))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -8,10 +8,11 @@ from ppci.lang.tools.lr import Item
 from ppci.lang.tools.common import ParserException
 from ppci.lang.tools.yacc import load_as_module, transform
 from ppci.lang.tools.lr import calculate_first_sets
-from ppci.common import CompilerError
+from ppci.common import CompilerError, ParseError
 from ppci.lang.common import Token, SourceLocation
 from ppci.lang.tools.lr import LrParserBuilder
 from ppci.lang.tools.earley import EarleyParser
+from ppci.lang.tools.trieparser import TrieParser
 from ppci.lang.tools.baselex import EOF
 
 
@@ -404,6 +405,118 @@ class EarleyParserTestCase(unittest.TestCase):
         p.parse(tokens, debug_dump=True)
 
 
+def token_list(lst):
+    """ Create a list of tokens from a list of strings """
+    loc = SourceLocation('', 0, 0, 0)
+    tokens = []
+    for t in lst:
+        if isinstance(t, tuple):
+            t, v = t
+        else:
+            t, v = t, t
+        tokens.append(Token(t, v, loc))
+    return tokens
+
+
+class TrieParserTestCase(unittest.TestCase):
+    def test_expression_grammar(self):
+        """ Test a left recursive grammar """
+        grammar = Grammar()
+        grammar.add_terminals(
+            ['identifier', '(', ')', '+', '*', 'num'])
+        grammar.add_production(
+            'input', ['expression'], lambda rhs: rhs)
+        grammar.add_production(
+            'expression', ['term'], lambda rhs: rhs)
+        grammar.add_production(
+            'expression', ['expression', '+', 'term'],
+            lambda rh1, rh2, rh3: rh1 + rh3)
+        grammar.add_production('term', ['factor'], lambda rhs: rhs)
+        grammar.add_production(
+            'term', ['term', '*', 'factor'], lambda rh1, rh2, rh3: rh1 * rh3)
+        grammar.add_production(
+            'factor', ['(', 'expression', ')'], lambda rh1, rh2, rh3: rh2)
+        grammar.add_production('factor', ['num'], lambda rhs: rhs.val)
+        grammar.start_symbol = 'input'
+        parser = TrieParser(grammar)
+        result = parser.parse(token_list(
+            [('num', 7), '*', ('num', 11), '+', ('num', 3)]))
+        self.assertEqual(80, result)
+        result = parser.parse(token_list(
+            [('num', 7), '*', '(', ('num', 11), '+', ('num', 3), ')']))
+        self.assertEqual(98, result)
+
+    def test_ambiguous_grammar(self):
+        """ Test that the derivation with the lowest priority is chosen """
+        grammar = Grammar()
+        grammar.add_terminals(['mov', 'num', '+'])
+        grammar.add_production(
+            'expr', ['num', '+', 'num'],
+            lambda rh1, _, rh3: rh1.val + rh3.val,
+            priority=3)
+        grammar.add_production(
+            'expr', ['num', '+', 'num'],
+            lambda rh1, _, rh3: rh1.val + rh3.val + 1,
+            priority=2)
+        grammar.add_production(
+            'ins', ['mov', 'expr'],
+            lambda _, rh2: rh2,
+            priority=2)
+        grammar.start_symbol = 'ins'
+        parser = TrieParser(grammar)
+        result = parser.parse(token_list(['mov', ('num', 1), '+', ('num', 1)]))
+        self.assertEqual(3, result)
+
+    def test_tie(self):
+        """ Test that equal priorities are reported as a parse error """
+        grammar = Grammar()
+        grammar.add_terminals(['a'])
+        grammar.add_production('goal', ['x'])
+        grammar.add_production('goal', ['y'])
+        grammar.add_production('x', ['a'])
+        grammar.add_production('y', ['a'])
+        grammar.start_symbol = 'goal'
+        parser = TrieParser(grammar)
+        with self.assertRaises(ParseError):
+            parser.parse(token_list(['a']))
+
+    def test_invalid_parse(self):
+        grammar = Grammar()
+        grammar.add_terminals(['a', 'b', 'c'])
+        grammar.add_production('goal', ['a', 'c', 'b'])
+        grammar.start_symbol = 'goal'
+        parser = TrieParser(grammar)
+        with self.assertRaises(ParseError):
+            parser.parse(token_list(['a', 'c']))
+        with self.assertRaises(ParseError):
+            parser.parse(token_list(['a', 'c', 'b', 'b']))
+
+    def test_added_production(self):
+        """ Test that productions added after construction are used """
+        grammar = Grammar()
+        grammar.add_terminals(['a', 'b'])
+        grammar.add_production('goal', ['a'], lambda rh1: 1)
+        grammar.start_symbol = 'goal'
+        parser = TrieParser(grammar)
+        self.assertEqual(1, parser.parse(token_list(['a'])))
+        grammar.add_production('goal', ['a', 'b'], lambda rh1, rh2: 2)
+        self.assertEqual(2, parser.parse(token_list(['a', 'b'])))
+
+    def test_nullable(self):
+        """ Test a left recursive list which can be empty """
+        grammar = Grammar()
+        grammar.add_terminals(['a'])
+        grammar.add_production('goal', ['list'], lambda rh1: rh1)
+        grammar.add_production('list', [], lambda: [])
+        grammar.add_production(
+            'list', ['list', 'a'], lambda rh1, rh2: rh1 + [rh2.val])
+        grammar.start_symbol = 'goal'
+        parser = TrieParser(grammar)
+        self.assertEqual([], parser.parse([]))
+        self.assertEqual(
+            ['a', 'a', 'a'], parser.parse(token_list(['a', 'a', 'a'])))
+
+
 class GrammarParserTestCase(unittest.TestCase):
     def test_load_as_module(self):
         grammar = """
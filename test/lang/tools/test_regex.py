@@ -1,24 +1,196 @@
+import re
 import unittest
 from ppci.lang.tools import regex
+from ppci.lang.tools.regex.symbol_set import SymbolSet
+from ppci.binutils.assembler import AsmLexer
+from ppci.binutils.layout import LayoutLexer
+from ppci.lang.c3.lexer import Lexer as C3Lexer
+from ppci.lang.pascal.lexer import Lexer as PascalLexer
+from ppci.lang.tools.yacc import XaccLexer
+from ppci.codegen.burg import BurgLexer
+from ppci.common import DiagnosticsManager
 
 
 class RegexTestCase(unittest.TestCase):
     def test_derivatives(self):
         ab = regex.Symbol('a') + regex.Symbol('b')
+        self.assertFalse(ab.is_nullable())
+        self.assertEqual(regex.Symbol('b'), ab.derivative('a'))
+        self.assertFalse(ab.derivative('a').is_nullable())
+        self.assertTrue(ab.derivative('a').derivative('b').is_nullable())
+        self.assertEqual(regex.SymbolSet([]), ab.derivative('b'))
 
-        # TODO: work in progress
-        print(ab)
-        print(ab.derivative('a'))
-        print(ab.derivative('b'))
-        print(ab.derivative('a').derivative('b'))
+    def test_simplification(self):
+        """ Equivalent expressions must be equal to keep a DFA finite """
+        a = regex.Symbol('a')
+        b = regex.Symbol('b')
+        self.assertEqual(a | b, b | a)
+        self.assertEqual(a | b, (a | b) | a)
+        self.assertEqual(regex.Kleene(a), regex.Kleene.make(
+            regex.Kleene(a)))
 
     def test_parse(self):
         re_txt = '[0-9]+'
-        regex.parse(re_txt)
+        expr = regex.parse(re_txt)
+        self.assertTrue(expr.derivative('7').is_nullable())
+        self.assertFalse(expr.is_nullable())
+
+    def test_parse_errors(self):
+        for re_txt in ['(a', 'a)', '[a-', '*', 'a*?', '^a', r'\q']:
+            with self.assertRaises(ValueError):
+                regex.parse(re_txt)
+
+
+class CompileTestCase(unittest.TestCase):
+    """ Compare compiled expressions with the python re module """
+    patterns = [
+        r'[0-9]+',
+        r'a|b*c',
+        r'(ab)*',
+        r'x{2,3}y?',
+        r'\d+\.\d+',
+        r'(0b|%)[0-1]+',
+        r'[^a-c]+',
+        r'.*',
+        r'\w+\s',
+        r"'[^'\n]*'",
+        r'a(b|c)*d|ab',
+        r'[-a]x',
+    ]
+    texts = [
+        '', 'a', 'ab', 'abab', 'c', 'bbc', 'xx', 'xxxy', 'xxxxy', '12',
+        '1.5', '0b101', '%2', 'dd', 'a\n', "'x'", "'\n'", 'abcbd', '-x',
+    ]
+
+    def test_compare_with_re(self):
+        for pattern in self.patterns:
+            dfa = regex.compile(pattern)
+            prog = re.compile(pattern)
+            for text in self.texts:
+                self.assertEqual(
+                    bool(prog.fullmatch(text)), dfa.matches(text),
+                    msg='{} on {!r}'.format(pattern, text))
+
+    def test_minimal(self):
+        """ Test that equivalent states are merged """
+        dfa = regex.compile('(a|b)*abb')
+        self.assertEqual(4, dfa.num_states)
+
+    def test_character_classes(self):
+        """ Symbols with the same transitions share a class """
+        dfa = regex.compile('[a-z][a-z0-9]*')
+        self.assertEqual(3, dfa.num_classes)
+        self.assertEqual(dfa.classify('b'), dfa.classify('q'))
+        self.assertNotEqual(dfa.classify('b'), dfa.classify('5'))
+        self.assertEqual(dfa.classify('#'), dfa.classify('A'))
+        classes = dfa.classes()
+        self.assertIn('x', classes[dfa.classify('a')])
+
+    def test_token_priority(self):
+        """ The first token wins if several match the longest text """
+        dfa = regex.compile_tokens([('kw', 'if'), ('id', '[a-z]+')])
+        self.assertEqual(('kw', 2), dfa.longest_match('if'))
+        self.assertEqual(('id', 3), dfa.longest_match('iff'))
+        self.assertEqual(None, dfa.longest_match('9'))
+
+
+class ScannerTestCase(unittest.TestCase):
+    def test_longest_match(self):
+        scanner = regex.make_scanner([
+            ('REAL', r'\d+\.\d+'),
+            ('NUMBER', r'\d+'),
+            ('GLYPH', r'\.'),
+        ])
+        match = scanner.match('x12.', 1)
+        self.assertEqual('NUMBER', match.lastgroup)
+        self.assertEqual('12', match.group())
+        self.assertEqual(1, match.start())
+        self.assertEqual(3, match.end())
+        self.assertEqual('REAL', scanner.match('12.5').lastgroup)
+        self.assertIsNone(scanner.match('x'))
+
+    def test_cached(self):
+        spec = [('A', 'a+', None)]
+        self.assertIs(regex.make_scanner(spec), regex.make_scanner(spec))
+
+    def check_lexer(self, lexer_class, text, *args):
+        """ Check a lexer gives the same tokens with a scanner """
+        class ScannerLexer(lexer_class):
+            use_scanner = True
+
+        def tokens(lexer):
+            return [
+                (t.typ, t.val, t.loc.row, t.loc.col)
+                for t in lexer.tokenize(text)]
+
+        expected = tokens(lexer_class(*args))
+        self.assertEqual(expected, tokens(ScannerLexer(*args)))
+
+    def test_asm_lexer(self):
+        self.check_lexer(
+            AsmLexer, "ld.b %10, [r2+1.5], 0x12, 'a' ; comment 'x'")
+
+    def test_layout_lexer(self):
+        self.check_lexer(
+            LayoutLexer,
+            "MEMORY flash LOCATION=0x8000 SIZE=0x10000 {\n"
+            "  SECTION(code) ALIGN(4) DEFINESYMBOL('x')\n}\n")
+
+    def test_c3_lexer(self):
+        self.check_lexer(
+            C3Lexer,
+            'module x; /* "a" */\nvar int a = 0x1F >> 2; // x\n'
+            'function void f() { a += 1.5; b -> c; s = "hi"; }\n',
+            DiagnosticsManager())
+
+    def test_burg_lexer(self):
+        self.check_lexer(
+            BurgLexer,
+            "%terminal ADDI4\n%%\nreg: ADDI4(reg, reg) 2 'a = 1'\n")
+
+    def test_yacc_lexer(self):
+        self.check_lexer(
+            XaccLexer,
+            "%tokens a b\n%%\nexpr: expr 'a' | b { return 1 };\n")
+
+    def test_pascal_lexer(self):
+        """ Check the pascal lexer gives the same tokens without scanner """
+        text = (
+            "program p; { a\n comment } (* old (*) * style\n *)\n"
+            "var a: array (.1..10.) of integer; x := 'it''s' + 1.5e3;\n"
+            "IF a[2] <> 2E5 then b := (a^ >= @c) (*) x *)\n")
+
+        def tokens(use_scanner):
+            lexer = PascalLexer(DiagnosticsManager())
+            lexer.filename = 'a.pas'
+            lexer.use_scanner = use_scanner
+            return [
+                (t.typ, t.val, t.loc.row, t.loc.col)
+                for t in lexer.tokenize(text)]
+
+        self.assertTrue(PascalLexer.use_scanner)
+        self.assertEqual(tokens(False), tokens(True))
 
 
 class SymbolSetTestCase(unittest.TestCase):
-    pass
+    def test_operations(self):
+        ab = SymbolSet('ab')
+        bc = SymbolSet('bc')
+        self.assertEqual(SymbolSet('abc'), ab | bc)
+        self.assertEqual(SymbolSet('b'), ab & bc)
+        self.assertEqual(SymbolSet('a'), ab - bc)
+        self.assertIn('a', ab)
+        self.assertNotIn('c', ab)
+        self.assertIn('c', ab.complement())
+        self.assertEqual(ab, ab.complement().complement())
+
+    def test_ranges(self):
+        digits = SymbolSet.from_ranges([(ord('0'), ord('9'))])
+        self.assertEqual([(ord('0'), ord('9'))], digits.ranges)
+        self.assertEqual(
+            [(ord('0'), ord('9'))], (digits | SymbolSet('5')).ranges)
+        self.assertEqual('0', digits.first())
+        self.assertFalse(SymbolSet(''))
 
 
 if __name__ == '__main__':
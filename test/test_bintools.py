@@ -3,6 +3,8 @@ import io
 from unittest.mock import patch
 
 from ppci.binutils.objectfile import ObjectFile, serialize, deserialize, Image
+from ppci.binutils.objectfile import RelocationEntry
+from ppci.binutils.debuginfo import DebugInfo, DebugBaseType
 from ppci.binutils.outstream import DummyOutputStream, TextOutputStream
 from ppci.binutils.outstream import binary_and_logging_stream
 from ppci.common import CompilerError
@@ -171,6 +173,34 @@ class ObjectFileTestCase(unittest.TestCase):
         object3 = ObjectFile.load(f2)
         self.assertEqual(object3, object1)
 
+    def test_binary_save_and_load(self):
+        object1, object2 = self.make_twins()
+        object1.add_relocation(
+            RelocationEntry('abs32', 0, 'code', 4, 2))
+        f1 = io.BytesIO()
+        object1.save(f1)
+        self.assertTrue(f1.getvalue().startswith(b'PPCO'))
+        object3 = ObjectFile.load(io.BytesIO(f1.getvalue()))
+        self.assertEqual(object3, object1)
+
+    def test_binary_debug_info_is_lazy(self):
+        """ Debug info is only decoded when it is accessed """
+        object1, object2 = self.make_twins()
+        object1.debug_info = DebugInfo()
+        object1.debug_info.add(DebugBaseType('int', 4, 1))
+        object3 = ObjectFile.from_bytes(object1.to_bytes())
+        self.assertTrue(object3.has_debug_info)
+        self.assertIsNone(object3._debug_info)
+        self.assertEqual(1, len(object3.debug_info.types))
+
+    def test_load_json_from_binary_file(self):
+        """ Json objects can still be read from binary streams """
+        object1, object2 = self.make_twins()
+        f1 = io.StringIO()
+        object1.save(f1)
+        f2 = io.BytesIO(f1.getvalue().encode('utf8'))
+        self.assertEqual(ObjectFile.load(f2), object1)
+
     def test_serialization(self):
         object1, object2 = self.make_twins()
         object3 = deserialize(serialize(object1))
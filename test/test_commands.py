@@ -1,5 +1,6 @@
 """ Test cases for the various commandline utilities. """
 
+import gc
 import unittest
 import tempfile
 import io
@@ -13,6 +14,7 @@ from ppci.cli.cc import cc
 from ppci.cli.hexdump import hexdump
 from ppci.cli.java import java
 from ppci.cli.link import link
+from ppci.cli.llc import llc
 from ppci.cli.objdump import objdump
 from ppci.cli.objcopy import objcopy
 from ppci.cli.ocaml import ocaml
@@ -22,6 +24,7 @@ from ppci.cli.yacc import yacc
 from ppci import api
 from ppci.common import DiagnosticsManager, SourceLocation
 from ppci.binutils.objectfile import ObjectFile, Section, Image
+from ppci.irutils import from_bitcode, is_bitcode, read_module
 from helper_util import relpath, do_long_tests
 
 
@@ -121,6 +124,18 @@ class CcTestCase(unittest.TestCase):
         oj_file = new_temp_file('.oj')
         cc(['-m', 'arm', '--ir', self.c_file, '-o', oj_file])
 
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_cc_command_bitcode(self, mock_stdout, mock_stderr):
+        bc_file = new_temp_file('.bc')
+        cc(['-m', 'arm', '--bitcode', self.c_file, '-o', bc_file])
+        with open(bc_file, 'rb') as f:
+            self.assertTrue(is_bitcode(f.read()))
+
+        # Compile the bitcode further with llc:
+        asm_file = new_temp_file('.asm')
+        llc(['-m', 'arm', '-S', bc_file, '-o', asm_file])
+
     @patch('sys.stdout', new_callable=io.StringIO)
     def test_cc_command_help(self, mock_stdout):
         with self.assertRaises(SystemExit) as cm:
@@ -226,6 +241,31 @@ class OptimizeCommandTestCase(unittest.TestCase):
         out = new_temp_file('.ir')
         opt([in_file, out])
 
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_optimize_bitcode(self, mock_stdout, mock_stderr):
+        in_file = relpath('data', 'add.pi')
+        bc_file = new_temp_file('.bc')
+        opt(['--bitcode', in_file, bc_file])
+        out = new_temp_file('.ir')
+        opt([bc_file, out])
+        with open(bc_file, 'rb') as f:
+            module = from_bitcode(f.read())
+        with open(out) as f:
+            module2 = read_module(f)
+        self.assertEqual(module.stats(), module2.stats())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_optimize_to_stdout(self, mock_stderr):
+        """ Test that writing to stdout does not close stdout """
+        in_file = relpath('data', 'add.pi')
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with patch('sys.stdout', stdout):
+            opt([in_file, '-'])
+            gc.collect()
+        self.assertFalse(stdout.closed)
+        self.assertIn(b'module', stdout.buffer.getvalue())
+
 
 @unittest.skipUnless(do_long_tests('any'), 'skipping slow tests')
 class LinkCommandTestCase(unittest.TestCase):
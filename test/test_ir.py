@@ -2,6 +2,11 @@ import unittest
 import io
 from ppci import ir
 from ppci import irutils
+from ppci.api import c_to_ir, optimize
+from ppci.common import CompilerError
+from ppci.irutils.io import to_dict, from_dict
+from ppci.irutils.bitcode import BitcodeReader, BitcodeWriter
+from ppci.programs import IrProgram
 from ppci.opt import ConstantFolder
 from ppci.binutils.debuginfo import DebugDb
 from helper_util import relpath
@@ -32,6 +37,23 @@ class IrCodeTestCase(unittest.TestCase):
         self.assertEqual({c3, c4}, add.uses)
         self.assertEqual(c4, add.b)
 
+    def test_use_twice(self):
+        """ Check replacing a value which is used twice by an instruction """
+        c1 = ir.Const(1, "one", ir.i32)
+        c2 = ir.Const(2, "two", ir.i32)
+        add = ir.add(c1, c1, "add", ir.i32)
+        self.assertEqual({c1}, add.uses)
+        add.a = c2
+        self.assertEqual({c1, c2}, add.uses)
+        self.assertEqual({add}, c1.used_by)
+        add.replace_use(c2, c1)
+        self.assertEqual({c1}, add.uses)
+        c1.replace_by(c2)
+        self.assertEqual({c2}, add.uses)
+        self.assertEqual(c2, add.a)
+        self.assertEqual(c2, add.b)
+        self.assertFalse(c1.is_used)
+
 
 class IrBuilderTestCase(unittest.TestCase):
     def setUp(self):
@@ -39,6 +61,33 @@ class IrBuilderTestCase(unittest.TestCase):
         self.m = ir.Module("test")
         self.b.set_module(self.m)
 
+    def test_positions(self):
+        """ Test that positions are kept up to date """
+        function = self.b.new_procedure("func1", ir.Binding.GLOBAL)
+        self.b.set_function(function)
+        block = self.b.new_block()
+        function.entry = block
+        self.b.set_block(block)
+        consts = [self.b.emit(ir.Const(i, "c", ir.i32)) for i in range(5)]
+        self.assertEqual([0, 1, 2, 3, 4], [c.position for c in consts])
+        phi = ir.Phi("phi", ir.i32)
+        block.insert_instruction(phi)
+        self.assertEqual([phi], block.phis)
+        self.assertEqual(3, consts[2].position)
+        block.insert_instruction(
+            ir.Const(7, "seven", ir.i32), before_instruction=consts[3]
+        )
+        self.assertEqual([3, 5], [consts[2].position, consts[3].position])
+        block.remove_instruction(consts[1])
+        self.assertEqual([1, 2], [consts[0].position, consts[2].position])
+        block.remove_instruction(phi)
+        self.assertEqual([], block.phis)
+        self.assertEqual(
+            list(range(len(block))), [i.position for i in block]
+        )
+        with self.assertRaises(ValueError):
+            block.position_of(consts[1])
+
     def test_builder(self):
         f = self.b.new_procedure("add", ir.Binding.GLOBAL)
         self.b.set_function(f)
@@ -119,6 +168,144 @@ class TestReader(unittest.TestCase):
             self.assertTrue(m)
 
 
+class DictTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        """ Test a value used in a block before the block defining it """
+        builder = irutils.Builder()
+        module = ir.Module("mod1")
+        builder.set_module(module)
+        function = builder.new_procedure("func1", ir.Binding.GLOBAL)
+        builder.set_function(function)
+        entry = builder.new_block("entry")
+        block2 = builder.new_block("block2")
+        block1 = builder.new_block("block1")
+        function.entry = entry
+
+        builder.set_block(entry)
+        alloc1 = builder.emit(ir.Alloc("alloc1", 8, 4))
+        alloc2 = builder.emit(ir.Alloc("alloc2", 8, 4))
+        addr1 = builder.emit(ir.AddressOf(alloc1, "addr1"))
+        addr2 = builder.emit(ir.AddressOf(alloc2, "addr2"))
+        builder.emit(ir.CopyBlob(addr1, addr2, 8))
+        builder.emit_jump(block1)
+        builder.set_block(block1)
+        value = builder.emit(ir.Undefined("value", ir.i16))
+        builder.emit_jump(block2)
+        builder.set_block(block2)
+        added = builder.emit(ir.add(value, value, "added", ir.i16))
+        builder.emit(ir.Store(added, addr2, volatile=True))
+        builder.emit_exit()
+        irutils.verify_module(module)
+
+        module2 = from_dict(to_dict(module))
+        irutils.verify_module(module2)
+        self.assertEqual(to_dict(module), to_dict(module2))
+
+
+class BitcodeTestCase(unittest.TestCase):
+    c_src = """
+    int counter = 3;
+    int *counter_ptr = &counter;
+    extern int get(int);
+    void put(int);
+    double scale(double x) { return x * 2.5; }
+    int sum(int n) {
+      int s = -7;
+      for (int i = 0; i < n; i++) { s += get(i); }
+      put(s);
+      return s + *counter_ptr;
+    }
+    char *message(void) { return "hello"; }
+    """
+
+    def make_module(self):
+        module = c_to_ir(io.StringIO(self.c_src), "x86_64")
+        optimize(module, level="2")
+        return module
+
+    def to_text(self, module):
+        f = io.StringIO()
+        irutils.Writer(file=f).write(module)
+        return f.getvalue()
+
+    def test_round_trip(self):
+        module = self.make_module()
+        module2 = irutils.from_bitcode(irutils.to_bitcode(module))
+        irutils.verify_module(module2)
+        self.assertEqual(self.to_text(module), self.to_text(module2))
+
+    def test_round_trip_forward_reference(self):
+        """ Test a value used in a block before the block defining it """
+        module = from_dict(to_dict(self.make_module()))
+        for function in module.functions:
+            function.blocks.reverse()
+            function.blocks.insert(0, function.entry)
+            function.blocks.pop()
+        data = irutils.to_bitcode(module)
+        module2 = irutils.from_bitcode(data)
+        irutils.verify_module(module2)
+        self.assertEqual(self.to_text(module), self.to_text(module2))
+
+    def test_read_single_function(self):
+        module = self.make_module()
+        reader = BitcodeReader(irutils.to_bitcode(module))
+        module2 = reader.read_declarations()
+        self.assertEqual(
+            ["scale", "sum", "message"],
+            [function.name for function in module2.functions],
+        )
+        self.assertTrue(all(not f.blocks for f in module2.functions))
+        function = reader.read_function("sum")
+        self.assertIs(module2.functions[1], function)
+        self.assertTrue(function.blocks)
+        self.assertFalse(module2.functions[0].blocks)
+
+    def test_replace_function(self):
+        """ Decode a function into another module """
+        module = self.make_module()
+        module2 = self.make_module()
+        function = module2.functions[1]
+        data = BitcodeWriter().write_functions(module2, [function])
+        reader = BitcodeReader(data)
+        reader.read_function("sum", module)
+        irutils.verify_module(module)
+        self.assertEqual(self.to_text(module2), self.to_text(module))
+
+    def test_not_bitcode(self):
+        self.assertFalse(irutils.is_bitcode(b"module x;"))
+        with self.assertRaises(CompilerError):
+            BitcodeReader(b"module x;")
+
+    def test_program(self):
+        program = IrProgram(self.make_module())
+        program2 = IrProgram.from_bitcode(*program.as_bitcode())
+        self.assertEqual(program.get_report(), program2.get_report())
+        self.assertEqual(program.get_report(), program.copy().get_report())
+
+    def test_program_copy_debug_info(self):
+        """ Test that a copied program keeps the debug information """
+        module = self.make_module()
+        program2 = IrProgram(module).copy()
+        module2 = program2.items[0]
+        self.assertIs(module.debug_db, module2.debug_db)
+        for function, function2 in zip(module.functions, module2.functions):
+            self.assertIsNot(function, function2)
+            self.assertIs(
+                module.debug_db.get(function), module2.debug_db.get(function2)
+            )
+
+    def test_inline_asm(self):
+        """ Inline assembly refers to target registers, and is refused """
+        src = """
+        void main(int a) {
+          asm ("mov rax, rbx" : : "r" (a) : "rax");
+        }
+        """
+        module = c_to_ir(io.StringIO(src), "x86_64")
+        with self.assertRaises(CompilerError):
+            irutils.to_bitcode(module)
+
+
 class TestIrToPython(unittest.TestCase):
     def test_add_example(self):
         reader = irutils.Reader()
@@ -8,10 +8,14 @@ from ppci import ir
 from ppci import irutils
 from ppci.binutils.debuginfo import DebugDb
 from ppci.irutils import verify_module
+from ppci.irutils.io import to_dict, from_dict
 from ppci.opt import Mem2RegPromotor
 from ppci.opt import CleanPass
 from ppci.opt.constantfolding import correct
 from ppci.opt.tailcall import TailCallOptimization
+from ppci.opt.transform import FunctionPass
+from ppci.opt.pass_manager import PassManager, create_pipeline
+from ppci.graph.domtree import CfgInfo
 
 
 class OptTestCase(unittest.TestCase):
@@ -199,6 +203,127 @@ class TailCallTestCase(unittest.TestCase):
         self.assertTrue(function.is_leaf())
 
 
+class AnalysisCountingPass(FunctionPass):
+    """ Pass which requests the cfg info and optionally changes code """
+    def __init__(self, changes=0):
+        super().__init__()
+        self.changes = changes
+        self.cfg_infos = []
+
+    def on_function(self, function):
+        self.cfg_infos.append(self.get_analysis(CfgInfo, function))
+        if self.changes > 0:
+            self.changes -= 1
+            return True
+        return False
+
+
+class PassManagerTestCase(OptTestCase):
+    """ Test the pass manager """
+    def build_add_zero(self):
+        alloc = self.builder.emit(ir.Alloc('A', 4, 4))
+        addr = self.builder.emit(ir.AddressOf(alloc, 'addr'))
+        zero = self.builder.emit(ir.Const(0, 'zero', ir.i32))
+        one = self.builder.emit(ir.Const(1, 'one', ir.i32))
+        self.builder.emit(ir.Store(one, addr))
+        value = self.builder.emit(ir.Load(addr, 'value', ir.i32))
+        added = self.builder.emit(ir.add(value, zero, 'added', ir.i32))
+        self.builder.emit(ir.Store(added, addr))
+        self.builder.emit(ir.Exit())
+        return alloc
+
+    def test_fixed_point(self):
+        """ Test that the pipeline is repeated until nothing changes """
+        alloc = self.build_add_zero()
+        pass_manager = PassManager(create_pipeline(2))
+        self.assertTrue(pass_manager.run(self.module))
+        self.assertNotIn(alloc, self.function.entry.instructions)
+        self.assertEqual(1, len(self.function.entry.instructions))
+
+        # Every pass runs once more to see that nothing changes:
+        for statistics in pass_manager.statistics:
+            self.assertGreaterEqual(statistics.runs, 1)
+        self.assertFalse(pass_manager.run(self.module))
+
+    def test_statistics(self):
+        self.build_add_zero()
+        pass_manager = PassManager(create_pipeline(1))
+        pass_manager.run(self.module)
+        statistics = {s.name: s for s in pass_manager.statistics}
+        self.assertEqual(1, statistics['Mem2RegPromotor'].changes)
+        self.assertEqual(2, statistics['Mem2RegPromotor'].runs)
+        self.assertEqual(4, len(pass_manager.report()))
+
+    def test_analysis_cache(self):
+        """ Test that analyses are only recalculated after changes """
+        self.builder.emit(ir.Exit())
+        analyse = AnalysisCountingPass()
+        change = AnalysisCountingPass(changes=1)
+        change.preserved_analyses = ()
+        pass_manager = PassManager([analyse, change])
+        pass_manager.run(self.module)
+        self.assertEqual(2, len(analyse.cfg_infos))
+        self.assertEqual(analyse.cfg_infos, change.cfg_infos)
+        self.assertIsNot(analyse.cfg_infos[0], analyse.cfg_infos[1])
+        self.assertEqual(2, pass_manager.analyses.hits)
+
+    def test_preserved_analysis(self):
+        self.builder.emit(ir.Exit())
+        change = AnalysisCountingPass(changes=1)
+        change.preserved_analyses = (CfgInfo,)
+        pass_manager = PassManager([change])
+        pass_manager.run(self.module)
+        self.assertEqual(2, len(change.cfg_infos))
+        self.assertIs(change.cfg_infos[0], change.cfg_infos[1])
+        self.assertEqual(1, pass_manager.analyses.hits)
+
+    def test_max_iterations(self):
+        """ Test that a pass which always changes code is stopped """
+        self.builder.emit(ir.Exit())
+        change = AnalysisCountingPass(changes=100)
+        pass_manager = PassManager([change], max_iterations=3)
+        pass_manager.run(self.module)
+        self.assertEqual(3, pass_manager.statistics[0].runs)
+
+    def test_parallel(self):
+        """ Test that optimizing in processes gives the same result """
+        self.build_add_zero()
+        function = self.builder.new_procedure('other', ir.Binding.GLOBAL)
+        self.builder.set_function(function)
+        function.entry = self.builder.new_block()
+        self.builder.set_block(function.entry)
+        self.build_add_zero()
+        module = from_dict(to_dict(self.module))
+        self.assertTrue(PassManager(create_pipeline(2)).run(module))
+
+        pass_manager = PassManager(create_pipeline(2))
+        self.assertTrue(pass_manager.run(self.module, jobs=2))
+        self.assertEqual(to_dict(module), to_dict(self.module))
+        self.assertEqual(2, pass_manager.statistics[0].changes)
+
+    def test_parallel_configured_pass(self):
+        """ Test that passes keep their configuration in processes """
+        self.builder.emit(ir.Exit())
+        function = self.builder.new_procedure('other', ir.Binding.GLOBAL)
+        self.builder.set_function(function)
+        function.entry = self.builder.new_block()
+        self.builder.set_block(function.entry)
+        self.builder.emit(ir.Exit())
+        pass_manager = PassManager([AnalysisCountingPass(changes=1)])
+        self.assertTrue(pass_manager.run(self.module, jobs=2))
+        self.assertGreaterEqual(pass_manager.statistics[0].changes, 1)
+
+    def test_pipelines(self):
+        self.builder.emit(ir.Exit())
+        levels = ['1', '2', 's']
+        pipelines = [
+            [repr(p) for p in create_pipeline(level)] for level in levels]
+        for pipeline in pipelines:
+            self.assertEqual(1, pipelines.count(pipeline))
+        with self.assertRaises(ValueError):
+            create_pipeline('x')
+
+
 if __name__ == '__main__':
     unittest.main()
     sys.exit()
@@ -3,6 +3,10 @@ import unittest
 import tempfile
 
 from ppci.build.tasks import TaskRunner, TaskError, Project, Target, Task
+from ppci.build.tasks import Job
+from ppci.build.builddb import BuildDatabase
+from ppci.build import buildtasks  # noqa: F401, registers the tasks
+from ppci.api import construct
 
 
 class TaskTestCase(unittest.TestCase):
@@ -67,6 +71,109 @@ class TaskTestCase(unittest.TestCase):
         with self.assertRaisesRegex(TaskError, 'not found'):
             task.open_file_set('*.asm')
 
+    def test_parallel_targets(self):
+        """ Run independent targets in parallel """
+        proj = Project('testproject')
+        for name in ['t1', 't2', 't3']:
+            target = Target(name, proj)
+            target.add_task(('property', {'name': name, 'value': 'done'}))
+            proj.add_target(target)
+        proj.get_target('t1').add_dependency('t2')
+        proj.get_target('t1').add_dependency('t3')
+        runner = TaskRunner(jobs=2)
+        runner.run(proj, ['t1'])
+        for name in ['t1', 't2', 't3']:
+            self.assertEqual('done', proj.get_property(name))
+
+
+executed_jobs = []
+
+
+def count_lines(filename):
+    executed_jobs.append(filename)
+    with open(filename, 'r') as f:
+        return len(f.readlines()), []
+
+
+class BuildDatabaseTestCase(unittest.TestCase):
+    """ Test skipping of jobs which are up to date """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.filename = os.path.join(self.directory, 'a.txt')
+        with open(self.filename, 'w') as f:
+            f.write('a\nb\n')
+        del executed_jobs[:]
+
+    def run_job(self):
+        build_db = BuildDatabase(os.path.join(self.directory, 'db'))
+        runner = TaskRunner(build_db=build_db)
+        job = Job(count_lines, (self.filename,), [self.filename])
+        results = runner.run_jobs([job])
+        build_db.save()
+        return results[0]
+
+    def test_up_to_date(self):
+        self.assertEqual(2, self.run_job())
+        self.assertEqual(2, self.run_job())
+        self.assertEqual(1, len(executed_jobs))
+
+    def test_changed_input(self):
+        self.assertEqual(2, self.run_job())
+        with open(self.filename, 'a') as f:
+            f.write('c\n')
+        self.assertEqual(3, self.run_job())
+        self.assertEqual(2, len(executed_jobs))
+
+
+BUILD_XML = """
+<project name="c" default="c">
+    <target name="c">
+        <ccompile arch="x86_64" sources="a.c;b.c" includes="inc"
+            output="c.oj" />
+    </target>
+</project>
+"""
+
+
+class CCompileBuildTestCase(unittest.TestCase):
+    """ Test an incremental and parallel build of C sources """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        os.mkdir(os.path.join(self.directory, 'inc'))
+        self.write('build.xml', BUILD_XML)
+        self.write(os.path.join('inc', 'a.h'), '#define A 1\n')
+        self.write('a.c', '#include "a.h"\nint a(void) { return A; }\n')
+        self.write('b.c', 'int b(void) { return 2; }\n')
+
+    def write(self, filename, text):
+        with open(os.path.join(self.directory, filename), 'w') as f:
+            f.write(text)
+
+    def build(self):
+        """ Build with two jobs, and return the sources compiled again """
+        with self.assertLogs('taskrunner', level='INFO') as cm:
+            construct(
+                os.path.join(self.directory, 'build.xml'), jobs=2,
+                build_db=os.path.join(self.directory, '.ppci-build'))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, 'c.oj')))
+        compiled = {'a.c', 'b.c'}
+        for message in cm.output:
+            if 'is up to date' in message:
+                compiled -= {n for n in compiled if n in message}
+        return compiled
+
+    def test_changed_header(self):
+        self.assertEqual({'a.c', 'b.c'}, self.build())
+        self.assertEqual(set(), self.build())
+        self.write(os.path.join('inc', 'a.h'), '#define A 3\n')
+        self.assertEqual({'a.c'}, self.build())
+        self.assertEqual(set(), self.build())
+
 
 if __name__ == '__main__':
     unittest.main()
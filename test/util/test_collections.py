@@ -26,3 +26,11 @@ class OrderedSetTestCase(unittest.TestCase):
         self.assertEqual(s[1], "b")
         s -= {"b"}
         self.assertEqual(s[1], "r")
+        s.add("x")
+        self.assertEqual(s[-1], "x")
+        with self.assertRaises(IndexError):
+            s[5]
+
+    def test_reversed(self):
+        s = OrderedSet("abracadabra")
+        self.assertSequenceEqual("dcrba", list(reversed(s)))
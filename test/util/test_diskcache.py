@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from ppci.utils.diskcache import DiskCache, make_key
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self._tmpdir.name
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_make_key(self):
+        self.assertEqual(make_key("a", b"bc"), make_key(b"a", "bc"))
+        self.assertNotEqual(make_key("ab", "c"), make_key("a", "bc"))
+
+    def test_put_and_get(self):
+        cache = DiskCache(self.directory)
+        key = make_key("x")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {"a": [1, 2, 3]})
+        self.assertIn(key, cache)
+        self.assertEqual({"a": [1, 2, 3]}, cache.get(key))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_shared_directory(self):
+        """ Entries written by one cache are visible to another """
+        key = make_key("x")
+        DiskCache(self.directory).put(key, 42)
+        self.assertEqual(42, DiskCache(self.directory).get(key))
+
+    def test_corrupt_entry(self):
+        cache = DiskCache(self.directory)
+        key = make_key("x")
+        cache.put(key, 42)
+        with open(cache._path(key), "wb") as f:
+            f.write(b"garbage")
+        self.assertIsNone(cache.get(key))
+        self.assertNotIn(key, cache)
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.directory, max_size=3500)
+        keys = [make_key(str(i)) for i in range(3)]
+        for age, key in enumerate(keys):
+            cache.put(key, bytes(1000))
+            # Make sure modification times differ:
+            os.utime(cache._path(key), (age, age))
+
+        # Use the oldest entry, so that the second entry is evicted:
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.put(make_key("3"), bytes(1000))
+        self.assertIn(keys[0], cache)
+        self.assertNotIn(keys[1], cache)
+        self.assertIn(keys[2], cache)
+        self.assertLessEqual(cache.size, 3500)
+
+    def test_clear(self):
+        cache = DiskCache(self.directory)
+        cache.put(make_key("x"), 1)
+        cache.clear()
+        self.assertEqual(0, cache.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
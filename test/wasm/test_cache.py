@@ -0,0 +1,108 @@
+""" Test caching of compiled wasm modules. """
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ppci.api import is_platform_supported
+from ppci.utils.diskcache import DiskCache
+from ppci.wasm import Module, instantiate
+
+
+CODE = """
+(module
+  (global $counter (export "counter") (mut i32) (i32.const 7))
+  (func (export "add") (param i32 i32) (result i32)
+    local.get 0
+    local.get 1
+    i32.add)
+)
+"""
+
+
+class NativeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        if not is_platform_supported():
+            self.skipTest("Native code not supported on this platform")
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_native_cache(self):
+        module = Module(CODE)
+        cache = DiskCache(self._tmpdir.name)
+        instance1 = instantiate(module, {}, target="native", cache_file=cache)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        instance2 = instantiate(module, {}, target="native", cache_file=cache)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(5, instance2.exports["add"](2, 3))
+        self.assertEqual(7, instance2.exports["counter"].read())
+        instance2.exports["counter"].write(11)
+        self.assertEqual(11, instance2.exports["counter"].read())
+        self.assertEqual(7, instance1.exports["counter"].read())
+
+    def test_cache_directory(self):
+        """ Test that a plain directory name can be used as cache """
+        module = Module(CODE)
+        for _ in range(2):
+            instance = instantiate(
+                module, {}, target="native", cache_file=self._tmpdir.name
+            )
+            self.assertEqual(9, instance.exports["add"](4, 5))
+        self.assertEqual(1, len(DiskCache(self._tmpdir.name).entries()))
+
+
+class PythonCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_python_cache(self):
+        module = Module(CODE)
+        cache = DiskCache(self._tmpdir.name)
+        instance1 = instantiate(module, {}, target="python", cache_file=cache)
+        self.assertEqual(1, cache.misses)
+
+        with mock.patch("ppci.api.ir_to_python") as ir_to_python_mock:
+            instance2 = instantiate(
+                module, {}, target="python", cache_file=cache
+            )
+        self.assertFalse(ir_to_python_mock.called)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(5, instance2.exports["add"](2, 3))
+        self.assertEqual(7, instance2.exports["counter"].read())
+        self.assertEqual(7, instance1.exports["counter"].read())
+
+    def test_corrupt_code(self):
+        """ Test that invalid cached code is compiled again """
+        module = Module(CODE)
+        cache = DiskCache(self._tmpdir.name)
+        instantiate(module, {}, target="python", cache_file=cache)
+        (key,) = [
+            os.path.basename(e[2])[: -len(cache.suffix)]
+            for e in cache.entries()
+        ]
+        entry = cache.get(key)
+        entry["code"] = b"garbage"
+        cache.put(key, entry)
+        instance = instantiate(module, {}, target="python", cache_file=cache)
+        self.assertEqual(9, instance.exports["add"](4, 5))
+
+    @mock.patch("sys.implementation.cache_tag", None)
+    def test_no_cache_tag(self):
+        """ Test that the cache is skipped without a bytecode cache tag """
+        module = Module(CODE)
+        cache = DiskCache(self._tmpdir.name)
+        instance = instantiate(module, {}, target="python", cache_file=cache)
+        self.assertEqual(9, instance.exports["add"](4, 5))
+        self.assertEqual([], list(cache.entries()))
+
+
+if __name__ == "__main__":
+    unittest.main()
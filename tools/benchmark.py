@@ -11,11 +11,15 @@ python -m pytest benchmark.py
 """
 
 import time
+import io
 import os
 import logging
 from glob import glob
+import pytest
 from ppci import api
-from ppci.lang.c import COptions
+from ppci.codegen.flowgraph import FlowGraph
+from ppci.lang.c import COptions, CLexer, FastCLexer
+from ppci.lang.c.lexer import SourceFile
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 
@@ -28,6 +32,167 @@ def test_compile_8cc(benchmark):
     benchmark(compile_8cc)
 
 
+def test_c_lexer(benchmark):
+    benchmark(lex_c_sources, CLexer)
+
+
+def test_fast_c_lexer(benchmark):
+    benchmark(lex_c_sources, FastCLexer)
+
+
+ASM_SOURCES = {
+    "arm": ["blinky/startup_stm32f4.asm", "realview-pb-a8/startup_a9.asm"],
+    "avr": ["avr/glue.asm"],
+    "microblaze": ["microblaze/crt0.asm"],
+    "msp430": ["msp430/boot.asm"],
+    "or1k": ["or1k/crt0.asm"],
+    "riscv": ["riscvmurax/start.s", "riscvmurax/nOSPortasm.s"],
+    "x86_64": ["linux64/glue.asm"],
+    "xtensa": ["xtensa/glue.asm"],
+}
+
+
+@pytest.mark.parametrize("arch", sorted(ASM_SOURCES))
+def test_assembler(benchmark, arch):
+    sources = read_asm_sources(arch)
+    benchmark.extra_info["lines"] = sum(s.count("\n") for s in sources)
+    benchmark(assemble_sources, sources, arch)
+
+
+def test_liveness(benchmark):
+    frames = select_wasm_benchmark("x86_64")
+    benchmark(calculate_liveness, frames)
+
+
+def test_wasm_on_python(benchmark):
+    instance = instantiate_wasm_benchmark()
+    benchmark(run_wasm_benchmark, instance)
+
+
+WASM_BENCHMARK = """
+(module
+  (memory 1)
+  (func $sieve (export "sieve") (param $n i32) (result i32)
+    (local $i i32) (local $j i32) (local $count i32)
+    (local.set $i (i32.const 2))
+    (block $done (loop $clear
+      (br_if $done (i32.ge_u (local.get $i) (local.get $n)))
+      (i32.store8 (local.get $i) (i32.const 1))
+      (local.set $i (i32.add (local.get $i) (i32.const 1)))
+      (br $clear)))
+    (local.set $i (i32.const 2))
+    (block $done (loop $outer
+      (br_if $done (i32.ge_u (local.get $i) (local.get $n)))
+      (if (i32.load8_u (local.get $i))
+        (then
+          (local.set $count (i32.add (local.get $count) (i32.const 1)))
+          (local.set $j (i32.mul (local.get $i) (local.get $i)))
+          (block $inner_done (loop $inner
+            (br_if $inner_done (i32.ge_u (local.get $j) (local.get $n)))
+            (i32.store8 (local.get $j) (i32.const 0))
+            (local.set $j (i32.add (local.get $j) (local.get $i)))
+            (br $inner)))))
+      (local.set $i (i32.add (local.get $i) (i32.const 1)))
+      (br $outer)))
+    (local.get $count))
+  (func $checksum (export "checksum") (param $n i32) (result i64)
+    (local $i i32) (local $sum i64)
+    (block $done (loop $body
+      (br_if $done (i32.ge_u (local.get $i) (local.get $n)))
+      (i32.store (i32.shl (local.get $i) (i32.const 2))
+        (i32.mul (local.get $i) (i32.const 2654435761)))
+      (local.set $sum (i64.add (local.get $sum)
+        (i64.extend_i32_u (i32.load (i32.shl (local.get $i) (i32.const 2))))))
+      (local.set $i (i32.add (local.get $i) (i32.const 1)))
+      (br $body)))
+    (local.get $sum))
+)
+"""
+
+
+def instantiate_wasm_benchmark():
+    """ Load the wasm benchmark program as python code. """
+    from ppci import wasm
+
+    module = wasm.Module(WASM_BENCHMARK)
+    return wasm.instantiate(module, {}, target="python")
+
+
+def run_wasm_benchmark(instance):
+    """ Run memory intensive wasm code in the python target. """
+    primes = instance.exports["sieve"](20000)
+    checksum = instance.exports["checksum"](10000)
+    return primes, checksum
+
+
+def select_wasm_benchmark(arch):
+    """ Select instructions for the wasm benchmark functions.
+
+    Returns the frames with virtual register instructions, which are
+    the input of the register allocator.
+    """
+    from ppci import wasm
+    from ppci.binutils.debuginfo import DebugDb
+    from ppci.codegen.codegen import CodeGenerator
+    from ppci.utils.reporting import DummyReportGenerator
+
+    arch = api.get_arch(arch)
+    ir_module = wasm.wasm_to_ir(
+        wasm.Module(WASM_BENCHMARK), arch.info.get_type_info("ptr")
+    )
+    api.optimize(ir_module, level=2)
+    codegen = CodeGenerator(arch)
+    frames = []
+    for ir_function in ir_module.functions:
+        frame = arch.new_frame(ir_function.name, ir_function)
+        frame.debug_db = DebugDb()
+        codegen.select_and_schedule(
+            ir_function, frame, DummyReportGenerator()
+        )
+        frames.append(frame)
+    return frames
+
+
+def calculate_liveness(frames):
+    """ Calculate liveness of the instructions of the frames. """
+    for frame in frames:
+        FlowGraph(frame.instructions).calculate_liveness()
+
+
+def read_asm_sources(arch):
+    """ Read the example assembly sources of an architecture.
+
+    The throughput in lines per second is the amount of lines times
+    the amount of operations per second reported by the benchmark.
+    """
+    sources = []
+    for filename in ASM_SOURCES[arch]:
+        with open(os.path.join(this_dir, "..", "examples", filename)) as f:
+            sources.append(f.read())
+    return sources
+
+
+def assemble_sources(sources, arch):
+    """ Assemble assembly sources for the given architecture. """
+    for source in sources:
+        api.asm(io.StringIO(source), arch)
+
+
+def lex_c_sources(lexer_class):
+    """ Lex the C sources of the examples and the C library. """
+    srcs = []
+    for folder in ["examples", os.path.join("librt", "libc")]:
+        path = os.path.join(this_dir, "..", folder)
+        srcs.extend(get_sources(path, "*.c")[1])
+        srcs.extend(get_sources(path, "*.h")[1])
+
+    coptions = COptions()
+    for src in srcs:
+        with open(src) as f:
+            for token in lexer_class(coptions).lex(f, SourceFile(src)):
+                pass
+
+
 def compile_nos_for_riscv():
     """ Compile nOS for riscv architecture. """
     logging.basicConfig(level=logging.INFO)